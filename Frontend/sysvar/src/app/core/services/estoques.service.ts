@@ -16,7 +16,7 @@ export interface Estoque {
 
 export interface MatrizReferenciaResponse {
   referencia: string;
-  resumo: { estoque: number; reserva: number; disponivel: number };
+  resumo: { estoque: number; reserva: number; disponivel: number; em_pedido?: number };
   eixos: {
     lojas: Array<{ id: number; nome: string }>;
     cores: Array<{ id: number; nome: string }>;
@@ -38,6 +38,15 @@ export interface MatrizReferenciaResponse {
       geral: number;
     };
   };
+  /** Só com em_pedido=true: saldo pendente de pedidos de compra nas mesmas células */
+  em_pedido?: {
+    por_loja: Array<{
+      loja_id: number;
+      cores: Array<{ cor_id: number; tamanhos: Record<string, number> }>;
+      sem_sku: number;
+      total_loja: number;
+    }>;
+  };
 }
 
 @Injectable({ providedIn: 'root' })
@@ -90,15 +99,16 @@ export class EstoquesService {
 
   /**
    * Matriz por Referência
-   * GET /api/estoques/matriz-referencia/?ref=<REF>&lojas=1,2&incluir_inativos=false
+   * GET /api/estoques/matriz-referencia/?ref=<REF>&lojas=1,2&incluir_inativos=false&em_pedido=true
    */
   matrizReferencia(
     ref: string,
-    opts?: { lojas?: number[]; incluir_inativos?: boolean }
+    opts?: { lojas?: number[]; incluir_inativos?: boolean; em_pedido?: boolean }
   ): Observable<MatrizReferenciaResponse> {
     let params = new HttpParams().set('ref', ref);
     if (opts?.lojas?.length) params = params.set('lojas', opts.lojas.join(','));
     if (opts?.incluir_inativos) params = params.set('incluir_inativos', 'true');
+    if (opts?.em_pedido) params = params.set('em_pedido', 'true');
     return this.http.get<MatrizReferenciaResponse>(`${this.base}matriz-referencia/`, { params });
   }
 
@@ -37,7 +37,7 @@ export class ConsultaReferenciaComponent {
     if (!v) { this.error = 'Informe a referência.'; return; }
 
     this.loading = true;
-    this.api.matrizReferencia(v).subscribe({
+    this.api.matrizReferencia(v, { em_pedido: true }).subscribe({
       next: (res) => {
         this.loading = false;
         this.data = res;
@@ -62,6 +62,19 @@ export class ConsultaReferenciaComponent {
     return typeof v === 'number' ? v : 0;
   }
 
+  /** Saldo pendente em pedidos de compra na célula (loja x cor x tamanho). */
+  emPedido(lid:number, cid:number, tid:number): number {
+    const loja = (this.data?.em_pedido?.por_loja || []).find((l:any)=>l.loja_id===lid);
+    const cor = loja?.cores?.find((c:any)=>c.cor_id===cid);
+    const v = cor?.tamanhos?.[String(tid)];
+    return typeof v === 'number' ? v : 0;
+  }
+
+  emPedidoLoja(lid:number): number {
+    const loja = (this.data?.em_pedido?.por_loja || []).find((l:any)=>l.loja_id===lid);
+    return loja?.total_loja ?? 0;
+  }
+
   totalCorLoja(lid:number, cid:number): number {
     const loja = (this.data?.matriz?.por_loja || []).find((l:any)=>l.loja_id===lid);
     const cor = loja?.cores?.find((c:any)=>c.cor_id===cid);
@@ -0,0 +1,137 @@
+# auditoria/fila.py
+"""
+Pipeline de gravação da auditoria.
+
+write_audit() não grava mais na hora: o registro entra com
+transaction.on_commit, então só existe se a transação do chamador confirmar
+(rollback descarta, como antes). Depois do COMMIT ele vai para o buffer da
+requisição (AuditBufferMiddleware), que é gravado com um único bulk_create
+depois que a resposta foi entregue ao cliente (HttpResponse.close(), chamado
+pelo servidor) — ou passado a uma thread em segundo plano quando
+AUDIT_ASYNC=True.
+
+Fora de requisição (shell, management commands) o registro é gravado logo
+após o COMMIT.
+"""
+import atexit
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 500
+
+_local = threading.local()
+
+
+def _gravar(entradas):
+    for entrada in entradas:
+        entrada.preparar_busca()  # bulk_create não passa pelo save()
+    try:
+        AuditLog.objects.bulk_create(entradas, batch_size=TAMANHO_LOTE)
+    except Exception:
+        # um registro ruim não derruba o lote inteiro
+        for entrada in entradas:
+            try:
+                entrada.save(force_insert=True)
+            except Exception:
+                logger.exception("Falha ao gravar auditoria %s/%s (%s)", entrada.model, entrada.object_id, entrada.action)
+
+
+class _GravadorAssincrono:
+    """Thread única que consome a fila e grava em lotes."""
+
+    _FIM = object()
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="auditoria-gravador", daemon=True)
+                self._thread.start()
+
+    def enviar(self, entradas):
+        self._iniciar()
+        self._fila.put(list(entradas))
+
+    def _loop(self):
+        while True:
+            item = self._fila.get()
+            lote = []
+            fim = item is self._FIM
+            if not fim:
+                lote.extend(item)
+            # junta o que mais estiver esperando num só INSERT
+            while not fim and len(lote) < TAMANHO_LOTE:
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._FIM:
+                    fim = True
+                else:
+                    lote.extend(item)
+            if lote:
+                _gravar(lote)
+            if self._fila.empty():
+                connection.close()
+            if fim:
+                return
+
+    def drenar(self, timeout=30):
+        """Grava o que estiver na fila e encerra a thread (saída do processo)."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._fila.put(self._FIM)
+        self._thread.join(timeout)
+
+
+gravador = _GravadorAssincrono()
+atexit.register(gravador.drenar)
+
+
+def descarregar(entradas):
+    if not entradas:
+        return
+    if getattr(settings, "AUDIT_ASYNC", False):
+        gravador.enviar(entradas)
+    else:
+        _gravar(entradas)
+
+
+def _apos_commit(entrada):
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        descarregar([entrada])
+    else:
+        buffer.append(entrada)
+
+
+def registrar(entrada):
+    """Agenda a gravação de um AuditLog (não salvo) para depois do COMMIT."""
+    transaction.on_commit(partial(_apos_commit, entrada))
+
+
+@contextmanager
+def escopo_auditoria(ao_sair=descarregar):
+    """Acumula os registros confirmados dentro do bloco e os entrega a `ao_sair` (grava) no fim."""
+    anterior = getattr(_local, "buffer", None)
+    _local.buffer = []
+    try:
+        yield
+    finally:
+        buffer = _local.buffer
+        _local.buffer = anterior
+        ao_sair(buffer)
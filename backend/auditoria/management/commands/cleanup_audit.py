@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from auditoria.retencao import descartar_arquivos_anteriores, lotes_antigos, processar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove registros de auditoria mais antigos que N dias (padrão: 365), em lotes por faixa de PK. "
+        "Opcionalmente exporta cada lote para JSONL.gz e/ou arquiva em tabelas mensais audit_log_arch_AAAAMM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--chunk", type=int, default=5000, help="Linhas por lote (padrão: 5000).")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pausa em segundos entre lotes.")
+        parser.add_argument("--export-dir", default=None, help="Exporta cada lote para <dir>/audit_log_<ini>_<fim>.jsonl.gz antes de apagar.")
+        parser.add_argument("--archive", action="store_true", help="Copia cada lote para a tabela do mês (audit_log_arch_AAAAMM) antes de apagar.")
+        parser.add_argument("--drop-archives-before", default=None, metavar="AAAAMM", help="Descarta (DROP) as tabelas de arquivo anteriores a este mês.")
+
+    def handle(self, *args, **opts):
+        days = int(opts["days"])
+        chunk = int(opts["chunk"])
+        if chunk <= 0:
+            raise CommandError("--chunk deve ser maior que zero.")
+        cutoff = timezone.now() - timedelta(days=days)
+
+        total = 0
+        inicio = time.monotonic()
+        for n, lote in enumerate(lotes_antigos(cutoff, chunk), start=1):
+            removidos, caminho, meses = processar_lote(lote, exportar_em=opts["export_dir"], arquivar=opts["archive"])
+            total += removidos
+            msg = f"  lote {n}: ids {lote[0][0]}–{lote[-1][0]}, {removidos} removidos (total {total}, {total / max(time.monotonic() - inicio, 0.001):.0f}/s)"
+            if caminho:
+                msg += f" -> {caminho}"
+            if meses:
+                msg += f" [arquivo: {', '.join(meses)}]"
+            self.stdout.write(msg)
+            if opts["sleep"]:
+                time.sleep(opts["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Removidos {total} registros anteriores a {days} dias."))
+
+        if opts["drop_archives_before"]:
+            try:
+                removidas = descartar_arquivos_anteriores(opts["drop_archives_before"])
+            except ValueError:
+                raise CommandError("--drop-archives-before deve estar no formato AAAAMM.")
+            for tabela in removidas:
+                self.stdout.write(f"  DROP {tabela}")
+            self.stdout.write(self.style.SUCCESS(f"{len(removidas)} tabela(s) de arquivo descartada(s)."))
@@ -1,6 +1,10 @@
 import uuid
+from functools import partial
+
 from django.utils.deprecation import MiddlewareMixin
 
+from .fila import descarregar, escopo_auditoria
+
 class RequestIDMiddleware(MiddlewareMixin):
     """
     Garante que cada request tenha um X-Request-ID (para correlação).
@@ -21,3 +25,25 @@ class RequestIDMiddleware(MiddlewareMixin):
         except Exception:
             pass
         return response
+
+
+class AuditBufferMiddleware:
+    """
+    Abre o buffer de auditoria da requisição: os registros confirmados durante
+    o request são gravados juntos (bulk_create) no close() da resposta, que o
+    servidor chama depois de enviá-la — o INSERT não atrasa o cliente.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pendentes = []
+        try:
+            with escopo_auditoria(ao_sair=pendentes.extend):
+                response = self.get_response(request)
+        except BaseException:
+            descarregar(pendentes)
+            raise
+        if pendentes:
+            response._resource_closers.append(partial(descarregar, pendentes))
+        return response
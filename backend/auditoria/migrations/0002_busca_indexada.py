@@ -0,0 +1,67 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:59
+
+import json
+
+import auditoria.models
+from django.db import migrations, models
+
+
+def preencher_busca(apps, schema_editor):
+    AuditLog = apps.get_model('auditoria', 'AuditLog')
+    ultimo = 0
+    while True:
+        lote = list(AuditLog.objects.filter(pk__gt=ultimo).order_by('pk')[:2000])
+        if not lote:
+            break
+        for log in lote:
+            extra = log.extra
+            if extra and not isinstance(extra, str):
+                extra = json.dumps(extra, ensure_ascii=False, default=str)
+            log.model_norm = (log.model or '').strip().lower()
+            log.search_text = auditoria.models.normalizar_busca(f"{log.reason or ''} {extra or ''}")
+        AuditLog.objects.bulk_update(lote, ['model_norm', 'search_text'])
+        ultimo = lote[-1].pk
+
+
+def criar_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX audit_search_ft ON audit_log (search_text)')
+
+
+def remover_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX audit_search_ft ON audit_log')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='model_norm',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='search_text',
+            field=auditoria.models.CampoBusca(blank=True, default=''),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_norm', 'object_id', 'ts'], name='audit_mnorm_obj_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_norm', 'ts'], name='audit_mnorm_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', 'ts'], name='audit_action_ts'),
+        ),
+        migrations.RunPython(preencher_busca, migrations.RunPython.noop),
+        migrations.RunPython(criar_fulltext, remover_fulltext),
+    ]
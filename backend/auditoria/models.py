@@ -1,8 +1,44 @@
+import json
+
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
 
+class CampoBusca(models.TextField):
+    """TextField com o lookup `__busca`: FULLTEXT no MySQL, LIKE nos demais bancos."""
+
+
+@CampoBusca.register_lookup
+class Busca(models.Lookup):
+    lookup_name = "busca"
+
+    def as_mysql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"MATCH ({lhs}) AGAINST ({rhs} IN BOOLEAN MODE)", lhs_params + rhs_params
+
+    def get_db_prep_lookup(self, value, connection):
+        if connection.vendor == "mysql":
+            # cada palavra obrigatória, por prefixo: "nota 123" -> "+nota* +123*"
+            return "%s", [" ".join(f"+{t}*" for t in termos_busca(value))]
+        return "%s", [f"%{connection.ops.prep_for_like_query(normalizar_busca(value))}%"]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} LIKE {rhs}", lhs_params + rhs_params
+
+
+def normalizar_busca(texto) -> str:
+    return " ".join(str(texto or "").lower().split())
+
+
+def termos_busca(texto) -> list:
+    """Palavras (só letras/dígitos) de uma busca; vazia = nada para o AGAINST."""
+    return "".join(c if c.isalnum() else " " for c in str(texto or "")).split()
+
+
 class AuditLog(models.Model):
     ACTION_CHOICES = (
         ("create", "Create"),
@@ -33,13 +69,32 @@ class AuditLog(models.Model):
     reason = models.TextField(null=True, blank=True)
     extra = models.JSONField(null=True, blank=True)
 
+    # colunas de busca (preenchidas por preparar_busca): model em minúsculas e
+    # texto de reason + extra normalizado (índice FULLTEXT no MySQL)
+    model_norm = models.CharField(max_length=100, blank=True, default="")
+    search_text = CampoBusca(blank=True, default="")
+
     class Meta:
         db_table = "audit_log"
         indexes = [
             models.Index(fields=["model", "object_id", "ts"], name="audit_model_obj_ts"),
             models.Index(fields=["user", "ts"], name="audit_user_ts"),
+            models.Index(fields=["model_norm", "object_id", "ts"], name="audit_mnorm_obj_ts"),
+            models.Index(fields=["model_norm", "ts"], name="audit_mnorm_ts"),
+            models.Index(fields=["action", "ts"], name="audit_action_ts"),
         ]
         ordering = ["-ts"]
 
+    def preparar_busca(self):
+        self.model_norm = (self.model or "").strip().lower()
+        extra = self.extra
+        if extra and not isinstance(extra, str):
+            extra = json.dumps(extra, ensure_ascii=False, default=str)
+        self.search_text = normalizar_busca(f"{self.reason or ''} {extra or ''}")
+
+    def save(self, *args, **kwargs):
+        self.preparar_busca()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"[{self.ts:%Y-%m-%d %H:%M:%S}] {self.model}#{self.object_id} {self.action}"
@@ -0,0 +1,104 @@
+# auditoria/rastreio.py
+"""
+Rastreio de campos alterados para a auditoria.
+
+O modelo que herda CamposRastreadosMixin guarda o valor original de cada campo
+na primeira atribuição depois de carregado/salvo. No save() o diff
+{campo: [antes, depois]} fica em `alteracoes_salvas` e o rastreio recomeça, de
+modo que a auditoria grava só as colunas que mudaram, sem snapshot completo
+antes e depois.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+
+def valor_json(v):
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    if isinstance(v, (Decimal, UUID)):
+        return str(v)
+    return v
+
+
+class CamposRastreadosMixin:
+    # attnames que não entram no diff
+    campos_nao_rastreados = ()
+
+    @classmethod
+    def _campos_rastreados(cls):
+        """{attname: nome do campo} dos campos rastreados (inativado_por_id -> inativado_por)."""
+        cache = cls.__dict__.get('_campos_rastreados_cache')
+        if cache is None:
+            cache = {
+                f.attname: f.name for f in cls._meta.concrete_fields
+                if not f.primary_key and f.attname not in cls.campos_nao_rastreados
+            }
+            cls._campos_rastreados_cache = cache
+        return cache
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        object.__setattr__(self, '_originais', {})
+        object.__setattr__(self, 'alteracoes_salvas', {})
+
+    def __setattr__(self, nome, valor):
+        originais = self.__dict__.get('_originais')
+        if originais is not None and nome not in originais and nome in self._campos_rastreados():
+            originais[nome] = self.__dict__.get(nome)
+        super().__setattr__(nome, valor)
+
+    def campos_alterados(self) -> dict:
+        """Diff {campo: [antes, depois]} desde o último load/save (chave = nome do campo, não attname)."""
+        campos = self._campos_rastreados()
+        out = {}
+        for attname, antes in self._originais.items():
+            depois = self.__dict__.get(attname)
+            if antes != depois:
+                out[campos[attname]] = [valor_json(antes), valor_json(depois)]
+        return out
+
+    def campos_preenchidos(self) -> dict:
+        """Diff de criação: só os campos com valor (None/'' ficam de fora)."""
+        out = {}
+        for attname, nome in self._campos_rastreados().items():
+            v = self.__dict__.get(attname)
+            if v is not None and v != '':
+                out[nome] = [None, valor_json(v)]
+        return out
+
+    def _reiniciar_rastreio(self):
+        object.__setattr__(self, '_originais', {})
+
+    def save(self, *args, **kwargs):
+        adicionando = self._state.adding
+        super().save(*args, **kwargs)
+        if adicionando:
+            object.__setattr__(self, 'alteracoes_salvas', self.campos_preenchidos())
+            self._reiniciar_rastreio()
+            return
+
+        alteracoes = self.campos_alterados()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._reiniciar_rastreio()
+        else:
+            # só o que foi gravado sai do rastreio; o resto continua pendente
+            salvos = {self._meta.get_field(nome) for nome in update_fields}
+            nomes = {f.name for f in salvos}
+            alteracoes = {k: v for k, v in alteracoes.items() if k in nomes}
+            self._esquecer(f.attname for f in salvos)
+        object.__setattr__(self, 'alteracoes_salvas', alteracoes)
+
+    def _esquecer(self, attnames):
+        for attname in attnames:
+            self._originais.pop(attname, None)
+
+    def refresh_from_db(self, using=None, fields=None, *args, **kwargs):
+        super().refresh_from_db(using, fields, *args, **kwargs)
+        if fields is None:
+            self._reiniciar_rastreio()
+        else:
+            # recarga parcial (inclusive a leitura de um campo adiado): só os
+            # campos relidos perdem a alteração pendente
+            self._esquecer(self._meta.get_field(nome).attname for nome in fields)
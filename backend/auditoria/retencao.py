@@ -0,0 +1,120 @@
+# auditoria/retencao.py
+"""
+Retenção do audit_log: remoção em lotes por faixa de PK, exportação opcional
+para JSONL comprimido e arquivo mensal em tabelas audit_log_arch_AAAAMM.
+
+As tabelas de arquivo têm a mesma estrutura do audit_log e não são modelos do
+Django; descartar um mês inteiro é um DROP TABLE.
+"""
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+
+from django.db import connection, transaction
+
+from .models import AuditLog
+
+PREFIXO_ARQUIVO = f"{AuditLog._meta.db_table}_arch_"
+_RE_ARQUIVO = re.compile(rf"^{re.escape(PREFIXO_ARQUIVO)}(\d{{6}})$")
+
+
+def lotes_antigos(cutoff, tamanho):
+    """Gera listas de (pk, ts) com ts < cutoff, em ordem de PK, no máximo `tamanho` por vez."""
+    ultimo = 0
+    while True:
+        lote = list(
+            AuditLog.objects.filter(ts__lt=cutoff, pk__gt=ultimo)
+            .order_by("pk").values_list("pk", "ts")[:tamanho]
+        )
+        if not lote:
+            return
+        yield lote
+        ultimo = lote[-1][0]
+
+
+def exportar_lote(pks, diretorio) -> str:
+    """Grava as linhas do lote em <diretorio>/audit_log_<pk_ini>_<pk_fim>.jsonl.gz."""
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"{AuditLog._meta.db_table}_{pks[0]}_{pks[-1]}.jsonl.gz")
+    linhas = AuditLog.objects.filter(pk__in=pks).order_by("pk").values()
+    with gzip.open(caminho, "wt", encoding="utf-8") as fh:
+        for row in linhas.iterator(chunk_size=2000):
+            fh.write(json.dumps(row, default=str, ensure_ascii=False))
+            fh.write("\n")
+    return caminho
+
+
+def _tabela_arquivo(ano_mes: str) -> str:
+    return f"{PREFIXO_ARQUIVO}{ano_mes}"
+
+
+def _garantir_tabela_arquivo(cursor, tabela):
+    q = connection.ops.quote_name
+    origem = q(AuditLog._meta.db_table)
+    if connection.vendor == "mysql":
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {q(tabela)} LIKE {origem}")
+    else:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {q(tabela)} AS SELECT * FROM {origem} WHERE 1 = 0")
+
+
+def arquivar_lote(lote):
+    """Copia as linhas do lote para a tabela do mês correspondente (não apaga do audit_log)."""
+    q = connection.ops.quote_name
+    origem = q(AuditLog._meta.db_table)
+    # colunas por nome: uma tabela de arquivo criada antes de uma migração do
+    # audit_log falha no INSERT em vez de receber valores na coluna errada
+    colunas = ", ".join(q(f.column) for f in AuditLog._meta.concrete_fields)
+    coluna_pk = q(AuditLog._meta.pk.column)
+    por_mes = {}
+    for pk, ts in lote:
+        por_mes.setdefault(ts.strftime("%Y%m"), []).append(pk)
+
+    with connection.cursor() as cur:
+        for ano_mes, pks in por_mes.items():
+            tabela = _tabela_arquivo(ano_mes)
+            _garantir_tabela_arquivo(cur, tabela)
+            marcadores = ", ".join(["%s"] * len(pks))
+            cur.execute(
+                f"INSERT INTO {q(tabela)} ({colunas}) SELECT {colunas} FROM {origem} WHERE {coluna_pk} IN ({marcadores})",
+                pks,
+            )
+    return sorted(por_mes)
+
+
+def remover_lote(pks) -> int:
+    # AuditLog não tem dependentes nem sinais: o Django apaga com um único DELETE ... WHERE pk IN (...)
+    num, _ = AuditLog.objects.filter(pk__in=pks).delete()
+    return num
+
+
+def processar_lote(lote, exportar_em=None, arquivar=False):
+    pks = [pk for pk, _ in lote]
+    caminho = exportar_lote(pks, exportar_em) if exportar_em else None
+    with transaction.atomic():
+        meses = arquivar_lote(lote) if arquivar else []
+        removidos = remover_lote(pks)
+    return removidos, caminho, meses
+
+
+def tabelas_arquivo() -> dict:
+    """{'AAAAMM': nome_tabela} das tabelas de arquivo existentes."""
+    out = {}
+    for nome in connection.introspection.table_names():
+        m = _RE_ARQUIVO.match(nome)
+        if m:
+            out[m.group(1)] = nome
+    return dict(sorted(out.items()))
+
+
+def descartar_arquivos_anteriores(ano_mes_limite: str) -> list:
+    """DROP das tabelas de arquivo de meses anteriores a AAAAMM."""
+    datetime.strptime(ano_mes_limite, "%Y%m")  # valida o formato
+    removidas = []
+    with connection.cursor() as cur:
+        for ano_mes, tabela in tabelas_arquivo().items():
+            if ano_mes < ano_mes_limite:
+                cur.execute(f"DROP TABLE {connection.ops.quote_name(tabela)}")
+                removidas.append(tabela)
+    return removidas
@@ -1,3 +1,172 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .middleware import AuditBufferMiddleware
+from .models import AuditLog
+from .retencao import descartar_arquivos_anteriores, exportar_lote, tabelas_arquivo
+from .utils import write_audit
+
+
+def _auditar(request, object_id, reason=""):
+    write_audit(request=request, model_name="Produto", object_id=object_id, action="update", reason=reason)
+
+
+class FilaAuditoriaTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get("/")
+
+    def test_grava_so_depois_do_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _auditar(self.request, 1, "Ajuste de preço")
+            self.assertFalse(AuditLog.objects.exists())
+
+        log = AuditLog.objects.get()
+        self.assertEqual((log.object_id, log.model_norm, log.search_text), ("1", "produto", "ajuste de preço"))
+
+    def test_rollback_descarta(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    _auditar(self.request, 1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_middleware_grava_o_lote_no_close_da_resposta(self):
+        def view(request):
+            with self.captureOnCommitCallbacks(execute=True):
+                _auditar(request, 1)
+                _auditar(request, 2)
+            return HttpResponse("ok")
+
+        response = AuditBufferMiddleware(view)(self.request)
+        self.assertFalse(AuditLog.objects.exists())
+
+        with self.assertNumQueries(1):  # um único INSERT para o lote
+            response.close()
+        self.assertEqual(sorted(AuditLog.objects.values_list("object_id", flat=True)), ["1", "2"])
+
+    def test_middleware_grava_na_hora_se_a_view_falhar(self):
+        def view(request):
+            with self.captureOnCommitCallbacks(execute=True):
+                _auditar(request, 1)
+            raise ValueError("falhou")
+
+        with self.assertRaises(ValueError):
+            AuditBufferMiddleware(view)(self.request)
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+
+
+def _log(ts, object_id, reason=""):
+    return AuditLog.objects.create(
+        ts=datetime(*ts, tzinfo=dt_timezone.utc), model="Produto", object_id=object_id, reason=reason
+    )
+
+
+class RetencaoAuditoriaTests(TransactionTestCase):
+    # CREATE/DROP TABLE das tabelas de arquivo fazem COMMIT implícito no MySQL
+    def setUp(self):
+        self.jan = _log((2024, 1, 10), "1", "janeiro")
+        self.fev = [_log((2024, 2, 5), "2", "fevereiro"), _log((2024, 2, 6), "3", "fevereiro")]
+        self.recente = _log((2099, 1, 1), "4")
+
+    def tearDown(self):
+        descartar_arquivos_anteriores("999912")
+
+    def _arquivadas(self, tabela):
+        q = connection.ops.quote_name
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT id, object_id, reason FROM {q(tabela)} ORDER BY id")
+            return cur.fetchall()
+
+    def test_cleanup_arquiva_por_mes_e_apaga_em_lotes(self):
+        out = StringIO()
+        call_command("cleanup_audit", days=30, chunk=2, archive=True, stdout=out)
+
+        self.assertEqual(list(AuditLog.objects.values_list("pk", flat=True)), [self.recente.pk])
+        self.assertIn("lote 2", out.getvalue())
+        tabelas = tabelas_arquivo()
+        self.assertEqual(list(tabelas), ["202401", "202402"])
+        self.assertEqual(self._arquivadas(tabelas["202401"]), [(self.jan.pk, "1", "janeiro")])
+        self.assertEqual(
+            self._arquivadas(tabelas["202402"]), [(l.pk, l.object_id, "fevereiro") for l in self.fev]
+        )
+
+        self.assertEqual(descartar_arquivos_anteriores("202402"), [tabelas["202401"]])
+        self.assertEqual(list(tabelas_arquivo()), ["202402"])
+
+    def test_exportar_lote_em_jsonl(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = exportar_lote([self.jan.pk, self.fev[0].pk], pasta)
+            with gzip.open(caminho, "rt", encoding="utf-8") as fh:
+                linhas = [json.loads(l) for l in fh]
+        self.assertEqual([l["id"] for l in linhas], [self.jan.pk, self.fev[0].pk])
+        self.assertEqual(linhas[0]["reason"], "janeiro")
+
+    def test_mes_invalido(self):
+        with self.assertRaises(ValueError):
+            descartar_arquivos_anteriores("2024-01")
+
+
+class AuditoriaLogViewSetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="auditor", password="123456")
+        cls.nota = AuditLog.objects.create(
+            ts=datetime(2025, 1, 10, 12, tzinfo=dt_timezone.utc), user=cls.user, model="NFeEntrada",
+            object_id="7", action="status_change", reason="Lançamento da nota", extra={"numero": "4512"},
+        )
+        cls.produto = AuditLog.objects.create(
+            ts=datetime(2025, 2, 1, 12, tzinfo=dt_timezone.utc), model="Produto", object_id="7",
+            action="update", reason="Reajuste",
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("auditoria-logs-list")
+
+    def _ids(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return [r["id"] for r in resp.data["results"]]
+
+    def test_filtros(self):
+        self.assertEqual(self._ids(model="nfeentrada"), [self.nota.pk])
+        self.assertEqual(self._ids(object_id="7"), [self.produto.pk, self.nota.pk])
+        self.assertEqual(self._ids(action="update"), [self.produto.pk])
+        self.assertEqual(self._ids(user=str(self.user.pk)), [self.nota.pk])
+        self.assertEqual(self._ids(ts_from="2025-01-15"), [self.produto.pk])
+        self.assertEqual(self._ids(ts_to="2025-01-10"), [self.nota.pk])  # data sem hora vai até o fim do dia
+        self.assertEqual(self._ids(ordering="ts"), [self.nota.pk, self.produto.pk])
+
+    def test_busca_em_reason_e_extra(self):
+        self.assertEqual(self._ids(search="LANÇAMENTO"), [self.nota.pk])
+        self.assertEqual(self._ids(search="4512"), [self.nota.pk])
+        # só pontuação não filtra
+        self.assertEqual(self._ids(search="?!"), [self.produto.pk, self.nota.pk])
+
+    def test_filtro_invalido_400(self):
+        for params in ({"user": "joao"}, {"ts_from": "ontem"}, {"ts_to": "2025-02-30"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_paginacao_por_cursor(self):
+        resp = self.client.get(self.url, {"page_size": 1})
+        self.assertEqual([r["id"] for r in resp.data["results"]], [self.produto.pk])
+        resp = self.client.get(resp.data["next"])
+        self.assertEqual([r["id"] for r in resp.data["results"]], [self.nota.pk])
+        self.assertIsNone(resp.data["next"])
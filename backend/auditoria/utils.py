@@ -2,6 +2,7 @@
 from typing import Any, Dict
 from django.utils import timezone
 from django.forms.models import model_to_dict
+from .fila import registrar
 from .models import AuditLog
 
 AUDIT_SAFE_KEYS = {"HTTP_X_FORWARDED_FOR", "REMOTE_ADDR"}
@@ -37,15 +38,17 @@ def write_audit(
     after: Dict[str, Any] | None = None,
     reason: str | None = None,
     extra: Dict[str, Any] | None = None,
+    changes: Dict[str, list] | None = None,
 ):
     user = getattr(request, "user", None)
     username_snapshot = (user.get_full_name() if user and user.is_authenticated else None) or (user.username if user and user.is_authenticated else None)
 
-    changes = None
-    if before is not None or after is not None:
+    # `changes` já calculado (ex.: CamposRastreadosMixin.alteracoes_salvas) dispensa os snapshots
+    if changes is None and (before is not None or after is not None):
         changes = _build_diff(before or {}, after or {})
 
-    return AuditLog.objects.create(
+    # gravado depois do COMMIT, em lote (ver auditoria/fila.py)
+    entrada = AuditLog(
         ts=timezone.now(),
         user=user if (user and user.is_authenticated) else None,
         username_snapshot=username_snapshot,
@@ -58,3 +61,5 @@ def write_audit(
         reason=reason or "",
         extra=extra or {},
     )
+    registrar(entrada)
+    return entrada
@@ -1,28 +1,69 @@
-from django.db.models import Q
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 
-from .models import AuditLog
+from .models import AuditLog, termos_busca
 from .serializers import AuditLogSerializer
 
 
+class AuditLogCursorPagination(CursorPagination):
+    """Paginação por chave (ts, id): custo constante em qualquer página."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        if (request.query_params.get('ordering') or '').strip() == 'ts':
+            return ('ts', 'id')
+        return ('-ts', '-id')
+
+
 class AuditoriaLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Leitura de logs de auditoria com filtros via querystring:
-      ?model=Produto
+      ?model=Produto           (sem diferença de maiúsculas; usa model_norm indexado)
       &object_id=13
       &action=status_change|create|update|delete|custom
-      &search=texto   (procura em reason e extra)
-      &ordering=-ts   (opcional; default já ordena por -ts,-id)
-      &page=1&page_size=20 (se paginação DRF estiver ativa)
+      &user=5
+      &ts_from=2025-01-01      (ts >=; data ou data/hora ISO)
+      &ts_to=2025-01-31T23:59  (ts <=)
+      &search=texto            (procura em reason e extra — FULLTEXT no MySQL)
+      &ordering=-ts|ts         (default -ts,-id)
+      &cursor=...&page_size=50 (paginação por cursor em (ts, id))
 
     Extra:
       POST /auditoria-logs/test-create/  -> cria um log de teste
     """
-    queryset = AuditLog.objects.all().order_by('-ts', '-id')
+    queryset = AuditLog.objects.select_related('user').all()
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AuditLogCursorPagination
+    # filtros e ordenação ficam em get_queryset/paginação (precisam bater com os índices)
+    filter_backends = []
+
+    @staticmethod
+    def _data_hora(valor, fim=False):
+        # parse_* devolvem None para formato desconhecido e levantam ValueError
+        # para data impossível no formato certo (2025-02-30). A data pura é
+        # testada antes: no Python 3.11+ parse_datetime também a aceita (meia-noite)
+        try:
+            d = parse_date(valor)
+            dt = parse_datetime(valor) if d is None else None
+        except ValueError:
+            dt = d = None
+        if d is not None:
+            dt = datetime.combine(d, time.max if fim else time.min)
+        elif dt is None:
+            raise ValidationError({'detail': f'Data inválida: {valor!r}.'})
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt)
+        return dt
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -30,7 +71,7 @@ class AuditoriaLogViewSet(viewsets.ReadOnlyModelViewSet):
 
         model = (p.get('model') or '').strip()
         if model:
-            qs = qs.filter(model__iexact=model)
+            qs = qs.filter(model_norm=model.lower())
 
         object_id = (p.get('object_id') or '').strip()
         if object_id:
@@ -40,13 +81,24 @@ class AuditoriaLogViewSet(viewsets.ReadOnlyModelViewSet):
         if action:
             qs = qs.filter(action=action)
 
-        search = (p.get('search') or '').strip()
-        if search:
-            qs = qs.filter(Q(reason__icontains=search) | Q(extra__icontains=search))
+        user = (p.get('user') or '').strip()
+        if user:
+            if not user.isdigit():
+                raise ValidationError({'detail': f'Usuário inválido: {user!r} (use o id numérico).'})
+            qs = qs.filter(user_id=int(user))
+
+        ts_from = (p.get('ts_from') or '').strip()
+        if ts_from:
+            qs = qs.filter(ts__gte=self._data_hora(ts_from))
 
-        ordering = (p.get('ordering') or '').strip()
-        if ordering:
-            qs = qs.order_by(ordering)
+        ts_to = (p.get('ts_to') or '').strip()
+        if ts_to:
+            qs = qs.filter(ts__lte=self._data_hora(ts_to, fim=True))
+
+        # só pontuação/espaços não filtra (no MySQL viraria AGAINST(''))
+        search = (p.get('search') or '').strip()
+        if termos_busca(search):
+            qs = qs.filter(search_text__busca=search)
 
         return qs
 
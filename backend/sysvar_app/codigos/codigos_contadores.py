@@ -0,0 +1,69 @@
+# sysvar_app/codigos/codigos_contadores.py
+"""
+Mapa (colecao, estacao) -> valor_var dos contadores de Codigos, mantido em
+memória por processo.
+
+A tela de cadastro de produto consulta /api/colecoes/ o tempo todo; o mapa é
+carregado com uma consulta e reaproveitado enquanto a versão guardada no cache
+do Django não mudar. Alterações em Codigos (sinais) e as reservas por F()
+(codigos_referencia) trocam a versão depois do COMMIT.
+
+Sem cache compartilhado (transacoes.memoria_por_processo) essa versão não
+chega aos outros workers, e dentro da transação que alterou os contadores ela
+ainda não mudou: nesses casos o mapa é lido do banco a cada chamada.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+from ..models import Codigos
+from ..transacoes import ColetorPosCommit, memoria_por_processo
+
+CHAVE_VERSAO = 'codigos:contadores:versao'
+
+_estado = {'versao': None, 'mapa': {}}
+_lock = threading.Lock()
+
+
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def _carregar() -> dict:
+    return {
+        ((colecao or '').strip(), (estacao or '').strip()): valor
+        for colecao, estacao, valor in Codigos.objects.values_list('colecao', 'estacao', 'valor_var')
+    }
+
+
+def mapa_contadores() -> dict:
+    # a versão só muda no COMMIT: a transação que alterou os contadores lê do banco
+    if _coletor.pendente() or not memoria_por_processo():
+        return _carregar()
+    versao = _versao()
+    with _lock:
+        if _estado['versao'] == versao:
+            return _estado['mapa']
+
+    mapa = _carregar()
+    with _lock:
+        _estado['versao'] = versao
+        _estado['mapa'] = mapa
+    return mapa
+
+
+def invalidar_contadores(*_):
+    cache.set(CHAVE_VERSAO, time.time_ns(), None)
+
+
+_coletor = ColetorPosCommit(invalidar_contadores)
+
+
+def marcar_contadores():
+    """Invalida o mapa em todos os processos depois do COMMIT."""
+    _coletor.marcar('contadores')
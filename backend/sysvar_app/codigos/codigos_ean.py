@@ -0,0 +1,253 @@
+# sysvar_app/codigos/codigos_ean.py
+"""
+Sequência de EAN-13 interno (789 + 1234 + seq5 + DV).
+
+Cada processo reserva um bloco de números do contador Codigos('EA', '13') com
+um único UPDATE curto e passa a servir EANs da memória, sem manter a linha do
+contador travada durante a requisição. Números que não chegam a ser usados
+(exceção dentro de `reservar_eans`, fim do processo) voltam para o pool ou para
+CodigosFaixaLivre e são servidos antes de o contador avançar de novo.
+
+O bloco em memória também fica gravado em CodigosFaixaLivre, em nome do
+processo (reservado_por) e com validade (reservado_ate, EAN_RESERVA_VALIDADE),
+renovada enquanto o processo serve números. Se o processo morre sem passar
+pelo atexit (kill -9, OOM), a reserva vence e os números voltam a ser
+oferecidos; os que chegaram a virar ProdutoDetalhe são pulados como sempre. Um
+processo cuja reserva venceu descarta o pool antes de servir de novo.
+
+O seq5 é circular (n % 100000); EANs já cadastrados em ProdutoDetalhe são
+pulados, então uma volta completa nunca gera duplicidade.
+"""
+import atexit
+import heapq
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import Codigos, CodigosFaixaLivre, ProdutoDetalhe
+
+PREFIXO_PAIS = '789'
+PREFIXO_EMPRESA = '1234'
+ESPACO_SEQ = 100000  # seq5
+
+# pesos do EAN-13 (posições 1..12 -> 1,3,1,3...)
+_PESOS = [1 if i % 2 == 0 else 3 for i in range(12)]
+
+
+class FaixaEANEsgotada(Exception):
+    pass
+
+
+# -------------------------------------------------------------------
+# dígito verificador
+# -------------------------------------------------------------------
+def eans_da_sequencia(seqs, prefixo=PREFIXO_PAIS + PREFIXO_EMPRESA) -> list:
+    """
+    EAN-13 completos para uma lista de seq5. A soma ponderada do prefixo é
+    calculada uma vez; por número só entram os 5 dígitos variáveis.
+    """
+    n_pref = len(prefixo)
+    soma_pref = sum(int(ch) * p for ch, p in zip(prefixo, _PESOS))
+    pesos_seq = _PESOS[n_pref:]
+    largura = len(pesos_seq)
+
+    out = []
+    for seq in seqs:
+        s = str(seq % ESPACO_SEQ).zfill(largura)
+        soma = soma_pref + sum(int(ch) * p for ch, p in zip(s, pesos_seq))
+        out.append(f'{prefixo}{s}{(10 - soma % 10) % 10}')
+    return out
+
+
+# -------------------------------------------------------------------
+# sequência com blocos por processo
+# -------------------------------------------------------------------
+class SequenciaEAN:
+    def __init__(self, colecao='EA', estacao='13', bloco=None):
+        self.colecao = colecao
+        self.estacao = estacao
+        self.bloco = bloco or getattr(settings, 'EAN_BLOCO_RESERVA', 20)
+        self.validade = timedelta(seconds=getattr(settings, 'EAN_RESERVA_VALIDADE', 900))
+        self._pool = []  # heap de números reservados e ainda não servidos
+        self._lock = threading.Lock()
+        self._pid = None
+        self._dono = ''
+        self._renovar_em = None
+
+    # --- dono da reserva ---
+    def _processo(self):
+        """Identidade deste processo; depois de um fork o filho começa sem pool."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._dono = f'{socket.gethostname()[:50]}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            self._pool = []
+            self._renovar_em = None
+
+    def _faixas(self, nums):
+        nums = sorted(nums)
+        if not nums:
+            return []
+        faixas = []
+        ini = ant = nums[0]
+        for n in nums[1:]:
+            if n != ant + 1:
+                faixas.append((ini, ant))
+                ini = n
+            ant = n
+        faixas.append((ini, ant))
+        return faixas
+
+    def _gravar_faixas(self, nums, dono='', ate=None):
+        CodigosFaixaLivre.objects.bulk_create([
+            CodigosFaixaLivre(colecao=self.colecao, estacao=self.estacao, inicio=i, fim=f,
+                              reservado_por=dono, reservado_ate=ate)
+            for i, f in self._faixas(nums)
+        ])
+
+    def _minhas_faixas(self):
+        return CodigosFaixaLivre.objects.filter(colecao=self.colecao, estacao=self.estacao,
+                                                reservado_por=self._dono)
+
+    def _renovar(self):
+        """Estende a validade da reserva; se ela já venceu, o pool pode estar com outro processo."""
+        agora = timezone.now()
+        if not self._pool or (self._renovar_em and agora < self._renovar_em):
+            return
+        vivas = self._minhas_faixas().filter(reservado_ate__gte=agora).update(reservado_ate=agora + self.validade)
+        if not vivas:
+            # venceu: o que ainda não foi assumido por outro processo fica livre
+            self._minhas_faixas().update(reservado_por='', reservado_ate=None)
+            self._pool = []
+        self._renovar_em = agora + self.validade / 2
+
+    # --- banco ---
+    def _faixas_livres(self, qtd) -> list:
+        """Consome faixas devolvidas ou de reservas vencidas (a linha trava só nesta transação curta)."""
+        nums = []
+        faixas = (CodigosFaixaLivre.objects
+                  .select_for_update(skip_locked=True)
+                  .filter(colecao=self.colecao, estacao=self.estacao)
+                  .filter(Q(reservado_por='') | Q(reservado_ate__lt=timezone.now()))
+                  .order_by('inicio'))
+        for fx in faixas[:10]:
+            falta = qtd - len(nums)
+            if falta <= 0:
+                break
+            tam = fx.fim - fx.inicio + 1
+            if tam <= falta:
+                nums.extend(range(fx.inicio, fx.fim + 1))
+                fx.delete()
+            else:
+                nums.extend(range(fx.inicio, fx.inicio + falta))
+                fx.inicio += falta
+                fx.reservado_por, fx.reservado_ate = '', None
+                fx.save(update_fields=['inicio', 'reservado_por', 'reservado_ate'])
+        return nums
+
+    def _avancar_contador(self, qtd) -> list:
+        filtro = Codigos.objects.filter(colecao=self.colecao, estacao=self.estacao)
+        if not filtro.update(valor_var=F('valor_var') + qtd):
+            Codigos.objects.get_or_create(colecao=self.colecao, estacao=self.estacao, defaults={'valor_var': 0})
+            filtro.update(valor_var=F('valor_var') + qtd)
+        fim = filtro.values_list('valor_var', flat=True).get()
+        return list(range(fim - qtd + 1, fim + 1))
+
+    def _buscar_bloco(self, minimo):
+        """Traz pelo menos `minimo` números livres (já sem os EANs em uso) para o pool."""
+        obtidos = 0
+        percorridos = 0
+        while obtidos < minimo:
+            qtd = max(self.bloco, minimo - obtidos)
+            with transaction.atomic():
+                nums = self._faixas_livres(qtd)
+                if len(nums) < qtd:
+                    nums += self._avancar_contador(qtd - len(nums))
+                # a reserva deste processo passa a ser o pool atual + o bloco novo
+                agora = timezone.now()
+                self._minhas_faixas().delete()
+                self._gravar_faixas(set(self._pool) | set(nums), self._dono, agora + self.validade)
+                self._renovar_em = agora + self.validade / 2
+            percorridos += len(nums)
+
+            eans = dict(zip(eans_da_sequencia(nums), nums))
+            usados = set(
+                ProdutoDetalhe.objects.filter(CodigodeBarra__in=list(eans)).values_list('CodigodeBarra', flat=True)
+            )
+            for ean, n in eans.items():
+                if ean not in usados:
+                    heapq.heappush(self._pool, n)
+                    obtidos += 1
+
+            if obtidos < minimo and percorridos >= ESPACO_SEQ:
+                raise FaixaEANEsgotada('Não há mais EANs livres na faixa 789.1234.xxxxx.')
+
+    # --- API ---
+    def reservar(self, qtd: int) -> list:
+        """Retira `qtd` números do pool (busca outro bloco no banco se faltar)."""
+        if qtd <= 0:
+            return []
+        with self._lock:
+            self._processo()
+            self._renovar()
+            if len(self._pool) < qtd:
+                self._buscar_bloco(qtd - len(self._pool))
+            return [heapq.heappop(self._pool) for _ in range(qtd)]
+
+    def devolver(self, nums):
+        """
+        Números reservados e não usados voltam para o pool deste processo (e
+        para a reserva gravada na próxima busca de bloco).
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for n in nums:
+                heapq.heappush(self._pool, n)
+
+    def proximos_eans(self, qtd: int) -> list:
+        return eans_da_sequencia(self.reservar(qtd))
+
+    @contextmanager
+    def reservar_eans(self, qtd: int):
+        """
+        Reserva EANs para uso dentro do bloco `with`. Se o bloco terminar com
+        exceção (ex.: rollback da transação), os números voltam para o pool.
+        Chame fora do transaction.atomic() da operação para não prender o contador.
+        """
+        nums = self.reservar(qtd)
+        try:
+            yield eans_da_sequencia(nums)
+        except BaseException:
+            self.devolver(nums)
+            raise
+
+    def devolver_ao_banco(self):
+        """Troca a reserva deste processo pelo pool como faixas livres — usado na saída do processo."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            nums = self._pool
+            self._pool = []
+            with transaction.atomic():
+                self._minhas_faixas().delete()
+                self._gravar_faixas(nums)
+
+
+sequencia_ean = SequenciaEAN()
+
+
+@atexit.register
+def _devolver_pool_na_saida():
+    try:
+        sequencia_ean.devolver_ao_banco()
+    except Exception:
+        # banco indisponível no encerramento: a reserva vence e os números voltam a ser livres
+        pass
@@ -0,0 +1,36 @@
+# sysvar_app/codigos/codigos_referencia.py
+"""
+Contador de referências de produto por (colecao, estacao) em Codigos.
+
+A reserva é um único UPDATE valor_var = valor_var + N em transação própria:
+a linha fica travada só pelo tempo desse comando, e não durante toda a
+criação do produto. Chame fora do transaction.atomic() da operação; números
+de uma criação que falhar depois da reserva não são reaproveitados (a
+sequência de referências pode ter lacunas, nunca repetições).
+"""
+from django.db import transaction
+from django.db.models import F
+
+from ..models import Codigos
+from .codigos_contadores import marcar_contadores
+
+
+def reservar_numeros(colecao: str, estacao: str, qtd: int = 1) -> range:
+    """Reserva `qtd` números consecutivos do contador (colecao, estacao)."""
+    filtro = Codigos.objects.filter(colecao=colecao, estacao=estacao)
+    with transaction.atomic():
+        if not filtro.update(valor_var=F('valor_var') + qtd):
+            Codigos.objects.get_or_create(colecao=colecao, estacao=estacao, defaults={'valor_var': 0})
+            filtro.update(valor_var=F('valor_var') + qtd)
+        fim = filtro.values_list('valor_var', flat=True).get()
+        # UPDATE por F() não dispara sinal
+        marcar_contadores()
+    return range(fim - qtd + 1, fim + 1)
+
+
+def formatar_referencia(colecao: str, estacao: str, grupo: str, numero: int) -> str:
+    return f"{colecao}.{estacao}.{grupo}{numero:03d}"
+
+
+def reservar_referencias(colecao: str, estacao: str, grupo: str, qtd: int = 1) -> list:
+    return [formatar_referencia(colecao, estacao, grupo, n) for n in reservar_numeros(colecao, estacao, qtd)]
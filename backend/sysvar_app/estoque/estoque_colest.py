@@ -0,0 +1,286 @@
+# sysvar_app/estoque/estoque_colest.py
+"""
+Matriz de Estoque por (Coleção + Estação) x Loja (/api/estoques/matriz-colest/).
+
+O resultado é guardado no cache do Django, chaveado por
+(colecoes, lojas, tabela_preco_id, ativo) normalizados. Qualquer alteração em
+Estoque, TabelaPrecoItem, Colecao, Produto, ProdutoDetalhe ou Loja troca a
+versão (sysvar_app/signals.py) e invalida todas as combinações de uma vez.
+
+Sem cache compartilhado (transacoes.memoria_por_processo) a troca de versão
+feita num worker não chega aos outros: o resultado então vale só
+TTL_SEM_CACHE_COMPARTILHADO segundos, como o índice de nfe_sugestoes.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+from ..models import Loja
+from ..transacoes import ColetorPosCommit, memoria_por_processo
+
+CHAVE_VERSAO = 'matriz_colest:versao'
+CHAVE_COMBOS = 'matriz_colest:combos'            # {hash: params} das combinações conhecidas
+CHAVE_CONTADOR = 'matriz_colest:combo:{}'        # consultas de cada combinação
+CHAVE_TRAVA_COMBOS = 'matriz_colest:combos:trava'
+TTL_RESULTADO = 60 * 60 * 12
+TTL_SEM_CACHE_COMPARTILHADO = 60
+# quantas combinações distintas guardamos para o aquecimento
+MAX_COMBOS = 200
+
+
+# -------------------------------------------------------------------
+# versão / invalidação
+# -------------------------------------------------------------------
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def invalidar_matriz_colest(*_):
+    cache.set(CHAVE_VERSAO, time.time_ns(), None)
+
+
+_coletor = ColetorPosCommit(invalidar_matriz_colest)
+
+
+def marcar_matriz_colest():
+    """Invalida o cache da matriz depois do COMMIT (uma vez por transação)."""
+    _coletor.marcar('colest')
+
+
+# -------------------------------------------------------------------
+# parâmetros
+# -------------------------------------------------------------------
+def normalizar_ativo(ativo) -> str:
+    ativo = (ativo or 'true').strip().lower()
+    if ativo in {'true', '1', ''}:
+        return 'true'
+    if ativo in {'false', '0'}:
+        return 'false'
+    return 'all'
+
+
+def _parametros(colecoes, lojas, tabela_preco_id, ativo):
+    return (
+        tuple(sorted({str(c) for c in colecoes})),
+        tuple(sorted({int(l) for l in (lojas or [])})),
+        int(tabela_preco_id),
+        normalizar_ativo(ativo),
+    )
+
+
+def _hash(params):
+    bruto = json.dumps(params, separators=(',', ':'))
+    return hashlib.sha1(bruto.encode()).hexdigest()
+
+
+def _chave(params):
+    return f"matriz_colest:{_versao()}:{_hash(params)}"
+
+
+def _ttl():
+    return TTL_RESULTADO if memoria_por_processo() else TTL_SEM_CACHE_COMPARTILHADO
+
+
+def _registrar_combo(params):
+    """
+    Conta a consulta. O contador de cada combinação é incrementado com
+    cache.incr (atômico no Redis/Memcached); a lista de combinações só é
+    reescrita quando aparece uma nova, sob trava (cache.add).
+    """
+    h = _hash(params)
+    contador = CHAVE_CONTADOR.format(h)
+    if not cache.add(contador, 1, None):
+        try:
+            cache.incr(contador)
+        except ValueError:  # removido entre o add e o incr (poda/expiração)
+            pass
+        return
+
+    if not cache.add(CHAVE_TRAVA_COMBOS, 1, 5):
+        # outro processo está gravando a lista: a próxima consulta tenta de novo
+        cache.delete(contador)
+        return
+    try:
+        combos = cache.get(CHAVE_COMBOS) or {}
+        combos[h] = params
+        if len(combos) > MAX_COMBOS:
+            contagens = cache.get_many([CHAVE_CONTADOR.format(k) for k in combos])
+            ordem = sorted(combos, key=lambda k: -contagens.get(CHAVE_CONTADOR.format(k), 0))
+            cache.delete_many([CHAVE_CONTADOR.format(k) for k in ordem[MAX_COMBOS:]])
+            combos = {k: combos[k] for k in ordem[:MAX_COMBOS]}
+        cache.set(CHAVE_COMBOS, combos, None)
+    finally:
+        cache.delete(CHAVE_TRAVA_COMBOS)
+
+
+def combinacoes_frequentes(limite=20):
+    """Combinações mais consultadas (mais usadas primeiro)."""
+    combos = cache.get(CHAVE_COMBOS) or {}
+    contagens = cache.get_many([CHAVE_CONTADOR.format(k) for k in combos])
+    ordem = sorted(
+        (k for k in combos if CHAVE_CONTADOR.format(k) in contagens),
+        key=lambda k: -contagens[CHAVE_CONTADOR.format(k)],
+    )
+    return [combos[k] for k in ordem[:limite]]
+
+
+# -------------------------------------------------------------------
+# cálculo
+# -------------------------------------------------------------------
+def calcular_matriz_colest(colecoes, lojas, tabela_preco_id, ativo) -> dict:
+    """Executa a agregação no banco (sem cache)."""
+    colecoes, lojas, tabela_preco_id, ativo_out = _parametros(colecoes, lojas, tabela_preco_id, ativo)
+
+    # uma passada: estoque ⨝ sku ⨝ produto ⨝ coleção, preço por LEFT JOIN;
+    # nome das lojas vem de uma consulta à parte (tabela pequena)
+    params = [tabela_preco_id]
+    sql = [
+        "SELECT",
+        "  e.Idloja_id                               AS loja_id,",
+        "  c.Idcolecao                               AS colecao_id,",
+        "  c.Codigo                                  AS colecao_codigo,",
+        "  c.Descricao                               AS colecao_descricao,",
+        "  c.Estacao                                 AS colecao_estacao,",
+        "  SUM(e.Estoque)                            AS itens,",
+        "  SUM(e.Estoque * COALESCE(tpi.preco, 0))   AS valor",
+        "FROM sysvar_app_estoque e",
+        "JOIN sysvar_app_produtodetalhe pd",
+        "  ON pd.CodigodeBarra = e.CodigodeBarra",
+        "JOIN sysvar_app_produto p",
+        "  ON p.Idproduto = pd.Idproduto_id",
+        "JOIN sysvar_app_colecao c",
+        "  ON c.Codigo = p.colecao",
+        "LEFT JOIN sysvar_app_tabelaprecoitem tpi",
+        "  ON tpi.codigodebarra = e.CodigodeBarra AND tpi.idtabela_id = %s",
+        "WHERE c.Codigo IN (" + ", ".join(["%s"] * len(colecoes)) + ")",
+    ]
+    params.extend(colecoes)
+
+    if ativo_out == 'true':
+        sql.append("AND p.Ativo = 1")
+    elif ativo_out == 'false':
+        sql.append("AND p.Ativo = 0")
+    if lojas:
+        sql.append("AND e.Idloja_id IN (" + ", ".join(["%s"] * len(lojas)) + ")")
+        params.extend(lojas)
+
+    sql.append("GROUP BY e.Idloja_id, c.Idcolecao, c.Codigo, c.Descricao, c.Estacao")
+
+    with connection.cursor() as cur:
+        cur.execute("\n".join(sql), params)
+        rows = cur.fetchall()
+
+    lojas_nome = {
+        lid: nome or apelido
+        for lid, nome, apelido in Loja.objects.filter(pk__in={r[0] for r in rows})
+        .values_list('Idloja', 'nome_loja', 'Apelido_loja')
+    } if rows else {}
+
+    # --- montagem da matriz ---
+    colest_cols_map = {}  # key = colecao_id
+    por_loja = {}         # loja_id -> { 'nome':..., 'colest': {colecao_id: {itens, valor}}, totals... }
+    total_por_colest = {} # colecao_id -> {itens, valor}
+    geral_itens = 0
+    geral_valor = 0.0
+
+    for loja_id, colecao_id, colecao_codigo, colecao_desc, colecao_est, itens, valor in rows:
+        loja_id = int(loja_id)
+        colecao_id = int(colecao_id)
+        itens = float(itens or 0)
+        valor = float(valor or 0)
+
+        if loja_id not in por_loja:
+            por_loja[loja_id] = {
+                "nome": lojas_nome.get(loja_id) or f"Loja {loja_id}",
+                "colest": {},
+                "total_itens": 0.0,
+                "total_valor": 0.0,
+            }
+
+        if colecao_id not in colest_cols_map:
+            colest_cols_map[colecao_id] = {
+                "colecao_id": colecao_id,
+                "codigo": str(colecao_codigo),
+                "estacao": str(colecao_est) if colecao_est is not None else None,
+                "rotulo": colecao_desc or f"Código {colecao_codigo}",
+                "key": str(colecao_id),
+            }
+
+        slot = por_loja[loja_id]["colest"].setdefault(colecao_id, {"itens": 0.0, "valor": 0.0})
+        slot["itens"] += itens
+        slot["valor"] += valor
+        por_loja[loja_id]["total_itens"] += itens
+        por_loja[loja_id]["total_valor"] += valor
+
+        tcol = total_por_colest.setdefault(colecao_id, {"itens": 0.0, "valor": 0.0})
+        tcol["itens"] += itens
+        tcol["valor"] += valor
+
+        geral_itens += itens
+        geral_valor += valor
+
+    def _fmt(v):
+        return {"itens": round(v["itens"], 0), "valor": round(v["valor"], 2)}
+
+    return {
+        "meta": {
+            "colecoes": list(colecoes),
+            "tabela_preco_id": tabela_preco_id,
+            "ativo": ativo_out,
+            "moeda": "BRL",
+        },
+        "eixos": {
+            "lojas": [{"id": lid, "nome": por_loja[lid]["nome"]} for lid in sorted(por_loja)],
+            "colest": [colest_cols_map[k] for k in sorted(colest_cols_map)],  # {colecao_id, codigo, estacao, rotulo, key}
+        },
+        "matriz": {
+            "por_loja": [
+                {
+                    "loja_id": lid,
+                    "loja_nome": por_loja[lid]["nome"],
+                    "colest": {str(cid): _fmt(v) for cid, v in por_loja[lid]["colest"].items()},  # chave = Idcolecao
+                    "total_itens": round(por_loja[lid]["total_itens"], 0),
+                    "total_valor": round(por_loja[lid]["total_valor"], 2),
+                }
+                for lid in sorted(por_loja)
+            ],
+            "totais": {
+                "por_colest": {str(cid): _fmt(v) for cid, v in total_por_colest.items()},
+                "geral": {"itens": round(geral_itens, 0), "valor": round(geral_valor, 2)},
+            },
+        },
+    }
+
+
+def matriz_colest(colecoes, lojas, tabela_preco_id, ativo, usar_cache=True) -> dict:
+    """Matriz com cache; recalcula só quando a versão mudou ou a chave expirou."""
+    params = _parametros(colecoes, lojas, tabela_preco_id, ativo)
+    if not usar_cache:
+        return calcular_matriz_colest(*params)
+
+    _registrar_combo(params)
+    chave = _chave(params)
+    out = cache.get(chave)
+    if out is None:
+        out = calcular_matriz_colest(*params)
+        cache.set(chave, out, _ttl())
+    return out
+
+
+def aquecer_matriz_colest(combinacoes) -> int:
+    """Pré-calcula as combinações informadas que ainda não estão no cache."""
+    feitas = 0
+    for colecoes, lojas, tabela_preco_id, ativo in combinacoes:
+        params = _parametros(colecoes, lojas, tabela_preco_id, ativo)
+        chave = _chave(params)
+        if cache.get(chave) is None:
+            cache.set(chave, calcular_matriz_colest(*params), _ttl())
+            feitas += 1
+    return feitas
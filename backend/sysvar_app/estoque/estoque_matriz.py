@@ -0,0 +1,138 @@
+# sysvar_app/estoque/estoque_matriz.py
+"""
+Manutenção do cubo EstoqueMatrizReferencia (referencia × loja × cor × tamanho).
+
+Quem altera Estoque/ProdutoDetalhe via save()/delete() é coberto pelos sinais em
+sysvar_app/signals.py. Rotinas em lote (bulk_create, queryset.update) não disparam
+sinais e devem chamar marcar_matriz() para as referências/lojas que tocaram.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..models import Estoque, EstoqueMatrizReferencia, Loja, ProdutoDetalhe
+from ..transacoes import ColetorPosCommit
+
+# quantas referências por rodada de recálculo (limita o tamanho do WHERE)
+LOTE_REFERENCIAS = 200
+
+
+def _agrupar(chaves):
+    """(ref, loja_id|None) -> {ref: set(lojas)}; set vazio = todas as lojas."""
+    por_ref = defaultdict(set)
+    todas = set()
+    for ref, loja_id in chaves:
+        if not ref:
+            continue
+        if loja_id is None:
+            todas.add(ref)
+        por_ref[ref].add(loja_id)
+    for ref in todas:
+        por_ref[ref] = set()
+    return por_ref
+
+
+def _filtro(por_ref, campo_ref):
+    filtro = Q()
+    for ref, lojas in por_ref.items():
+        if lojas:
+            filtro |= Q(**{campo_ref: ref, 'Idloja_id__in': lojas})
+        else:
+            filtro |= Q(**{campo_ref: ref})
+    return filtro
+
+
+def _recalcular(por_ref):
+    with transaction.atomic():
+        # apagar primeiro: serializa recálculos concorrentes da mesma célula
+        # e garante que a leitura do estoque abaixo veja os commits anteriores
+        EstoqueMatrizReferencia.objects.filter(_filtro(por_ref, 'referencia')).delete()
+
+        estoques = list(
+            Estoque.objects.filter(_filtro(por_ref, 'codigoproduto'))
+            .values_list('codigoproduto', 'Idloja_id', 'CodigodeBarra', 'Estoque', 'reserva')
+        )
+        if not estoques:
+            return 0
+
+        skus = {
+            row[0]: row[1:]
+            for row in ProdutoDetalhe.objects
+            .filter(CodigodeBarra__in={e[2] for e in estoques})
+            .values_list('CodigodeBarra', 'Idcor_id', 'Idtamanho_id', 'Ativo',
+                         'Idcor__Descricao', 'Idtamanho__Tamanho', 'Idtamanho__Descricao')
+        }
+        lojas_nome = dict(
+            Loja.objects.filter(pk__in={e[1] for e in estoques}).values_list('Idloja', 'nome_loja')
+        )
+
+        celulas = {}
+        for ref, loja_id, ean, est, res in estoques:
+            sku = skus.get(ean)
+            if sku is None:
+                # EAN sem SKU mapeado (cor/tamanho) não entra na matriz
+                continue
+            cor_id, tam_id, ativo, cor_desc, tam_sigla, tam_desc = sku
+            chave = (ref, loja_id, cor_id, tam_id)
+            cel = celulas.get(chave)
+            if cel is None:
+                cel = celulas[chave] = EstoqueMatrizReferencia(
+                    referencia=ref,
+                    Idloja_id=loja_id,
+                    Idcor_id=cor_id,
+                    Idtamanho_id=tam_id,
+                    loja_nome=lojas_nome.get(loja_id) or '',
+                    cor_descricao=cor_desc or '',
+                    tamanho_sigla=tam_sigla or '',
+                    tamanho_descricao=tam_desc or '',
+                )
+            est = int(est or 0)
+            res = int(res or 0)
+            cel.estoque_total += est
+            cel.reserva_total += res
+            if ativo:
+                cel.estoque += est
+                cel.reserva += res
+                cel.skus_ativos += 1
+
+        EstoqueMatrizReferencia.objects.bulk_create(celulas.values(), batch_size=1000)
+        return len(celulas)
+
+
+def atualizar_matriz(chaves) -> int:
+    """
+    Recalcula as células das chaves (referencia, loja_id) informadas.
+    loja_id=None recalcula a referência em todas as lojas.
+    """
+    por_ref = _agrupar(chaves)
+    refs = list(por_ref)
+    total = 0
+    for i in range(0, len(refs), LOTE_REFERENCIAS):
+        total += _recalcular({r: por_ref[r] for r in refs[i:i + LOTE_REFERENCIAS]})
+    return total
+
+
+def atualizar_matriz_referencias(referencias, lojas=None) -> int:
+    lojas = list(lojas or [None])
+    return atualizar_matriz((ref, lj) for ref in referencias for lj in lojas)
+
+
+_coletor = ColetorPosCommit(atualizar_matriz)
+
+
+def marcar_matriz(referencia, loja_id=None):
+    """Agenda o recálculo de (referencia, loja) para depois do COMMIT."""
+    if referencia:
+        _coletor.marcar((referencia, loja_id))
+
+
+def marcar_matriz_por_eans(eans):
+    """Agenda o recálculo de todas as (referencia, loja) que têm estoque destes EANs."""
+    eans = [e for e in eans if e]
+    if not eans:
+        return
+    chaves = set(
+        Estoque.objects.filter(CodigodeBarra__in=eans).values_list('codigoproduto', 'Idloja_id')
+    )
+    _coletor.marcar(*chaves)
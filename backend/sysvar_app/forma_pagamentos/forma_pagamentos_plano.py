@@ -0,0 +1,148 @@
+# sysvar_app/forma_pagamentos/forma_pagamentos_plano.py
+"""
+Planos de pagamento compilados (FormaPagamento + FormaPagamentoParcela).
+
+Cada forma vira um PlanoPagamento com os prazos, os fatores (percentual/100) e
+os valores fixos já convertidos para Decimal. Todos os planos são carregados
+com duas consultas e mantidos em memória por processo enquanto a versão
+guardada no cache do Django não mudar; alterações nas formas/parcelas (sinais e
+as gravações em lote de forma_pagamentos_views/serializers) trocam a versão
+depois do COMMIT.
+
+A memória só é usada com cache compartilhado (transacoes.memoria_por_processo);
+sem ele, e dentro da transação que acabou de alterar formas/parcelas, os planos
+são compilados do banco.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from ..models import FormaPagamento, FormaPagamentoParcela
+from ..transacoes import ColetorPosCommit, memoria_por_processo
+
+CHAVE_VERSAO = 'forma_pagamento:planos:versao'
+
+ZERO = Decimal("0")
+CENTAVO = Decimal("0.01")
+CEM = Decimal("100")
+
+_estado = {'versao': None, 'planos': {}}
+_lock = threading.Lock()
+
+
+def _quantize(v: Decimal) -> Decimal:
+    return (v or ZERO).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+class PlanoPagamento:
+    """
+    Forma de pagamento pronta para dividir totais.
+
+    Regras (as mesmas de sempre): parcela com percentual > 0 recebe
+    total * percentual / 100; senão, o valor fixo; a diferença de arredondamento
+    vai para a última parcela. Sem parcelas cadastradas = à vista (100% em 0 dias).
+    """
+
+    def __init__(self, forma_id, codigo, descricao, num_parcelas, defs):
+        self.forma_id = forma_id
+        self.codigo = codigo
+        self.descricao = descricao
+        self.num_parcelas = num_parcelas
+        if not defs:
+            defs = [(1, 0, CEM, ZERO)]
+        # (ordem, dias, fator | None, valor fixo quantizado)
+        self.parcelas = tuple(
+            (
+                int(ordem or i),
+                int(dias or 0),
+                (Decimal(str(perc)) / CEM) if perc and Decimal(str(perc)) > 0 else None,
+                _quantize(Decimal(str(fixo))) if fixo and Decimal(str(fixo)) > 0 else ZERO,
+            )
+            for i, (ordem, dias, perc, fixo) in enumerate(defs, start=1)
+        )
+        self.prazos = tuple(p[1] for p in self.parcelas)
+
+    def dividir(self, total) -> list:
+        """Valores das parcelas para um total."""
+        total = total or ZERO
+        valores = [_quantize(total * fator) if fator is not None else fixo for _, _, fator, fixo in self.parcelas]
+        if total > ZERO and valores:
+            valores[-1] = _quantize(valores[-1] + _quantize(total - sum(valores)))
+        return valores
+
+    def vencimentos(self, base) -> list:
+        return [base + timedelta(days=d) for d in self.prazos]
+
+    def __repr__(self):
+        return f"<PlanoPagamento {self.codigo} {len(self.parcelas)}x>"
+
+
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def _compilar() -> dict:
+    defs = defaultdict(list)
+    for forma_id, ordem, dias, perc, fixo in (
+        FormaPagamentoParcela.objects.order_by("forma_id", "ordem")
+        .values_list("forma_id", "ordem", "dias", "percentual", "valor_fixo")
+    ):
+        defs[forma_id].append((ordem, dias, perc, fixo))
+    return {
+        codigo: PlanoPagamento(pk, codigo, descricao, num_parcelas, defs.get(pk))
+        for pk, codigo, descricao, num_parcelas in
+        FormaPagamento.objects.values_list("Idformapagamento", "codigo", "descricao", "num_parcelas")
+    }
+
+
+def compilar_forma(forma: FormaPagamento) -> PlanoPagamento:
+    """Compila uma forma direto do banco, sem passar pelo cache."""
+    defs = list(
+        FormaPagamentoParcela.objects.filter(forma=forma).order_by("ordem")
+        .values_list("ordem", "dias", "percentual", "valor_fixo")
+    )
+    return PlanoPagamento(forma.pk, forma.codigo, forma.descricao, forma.num_parcelas, defs)
+
+
+def planos() -> dict:
+    """{codigo: PlanoPagamento} de todas as formas cadastradas."""
+    # a versão só muda no COMMIT: a transação que alterou as formas lê do banco
+    if _coletor.pendente() or not memoria_por_processo():
+        return _compilar()
+    versao = _versao()
+    with _lock:
+        if _estado['versao'] == versao:
+            return _estado['planos']
+
+    compilados = _compilar()
+    with _lock:
+        _estado['versao'] = versao
+        _estado['planos'] = compilados
+    return compilados
+
+
+def plano(codigo):
+    """PlanoPagamento da forma `codigo`, ou None se não existir."""
+    if not codigo:
+        return None
+    return planos().get(codigo)
+
+
+def invalidar_planos(*_):
+    cache.set(CHAVE_VERSAO, time.time_ns(), None)
+
+
+_coletor = ColetorPosCommit(invalidar_planos)
+
+
+def marcar_planos():
+    """Invalida os planos em todos os processos depois do COMMIT."""
+    _coletor.marcar('planos')
@@ -3,6 +3,7 @@ from django.db import transaction
 from rest_framework import serializers
 
 from ..models import FormaPagamento, FormaPagamentoParcela
+from .forma_pagamentos_plano import marcar_planos
 
 
 # ==============
@@ -108,6 +109,7 @@ class FormaPagamentoCreateUpdateSerializer(serializers.ModelSerializer):
 
         forma.num_parcelas = len(linhas) if linhas else 1
         forma.save(update_fields=["num_parcelas"])
+        marcar_planos()  # bulk_create não dispara sinais
 
     @transaction.atomic
     def create(self, validated_data):
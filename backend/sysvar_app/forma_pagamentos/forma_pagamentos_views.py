@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 from ..models import FormaPagamento, FormaPagamentoParcela
+from .forma_pagamentos_plano import marcar_planos
 from .forma_pagamentos_serializers import (
     FormaPagamentoListSerializer,
     FormaPagamentoDetailSerializer,
@@ -83,6 +84,8 @@ class FormaPagamentoViewSet(viewsets.ModelViewSet):
         # atualiza num_parcelas e devolve detalhe
         forma.num_parcelas = len(novas) if novas else 1
         forma.save(update_fields=["num_parcelas"])
+        # bulk_create não dispara sinais: invalida os planos compilados no COMMIT
+        marcar_planos()
 
         detail = FormaPagamentoDetailSerializer(instance=forma, context={"request": request})
         return Response(detail.data, status=status.HTTP_200_OK)
@@ -0,0 +1,49 @@
+# sysvar_app/management/commands/aquecer_matriz_colest.py
+from django.core.management.base import BaseCommand, CommandError
+
+from ...estoque.estoque_colest import aquecer_matriz_colest, combinacoes_frequentes
+from ...models import Colecao
+from ...transacoes import cache_compartilhado
+
+
+class Command(BaseCommand):
+    help = (
+        "Pré-calcula no cache a matriz Coleção/Estação x Loja das combinações mais consultadas "
+        "(agende no cron antes da abertura das lojas)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Quantas combinações mais consultadas aquecer.")
+        parser.add_argument(
+            "--tabela", type=int, action="append", default=[],
+            help="Também aquece todas as coleções (todas as lojas, só ativos) nesta tabela de preço. Pode repetir.",
+        )
+
+    def handle(self, *args, **opts):
+        if not cache_compartilhado():
+            # LocMem/Dummy: o que este processo calcular morre com ele
+            raise CommandError(
+                "O cache default não é compartilhado entre processos (LocMem/Dummy); aquecer daqui não "
+                "tem efeito nos workers. Configure CACHE_BACKEND/CACHE_LOCATION (Redis, Memcached, banco)."
+            )
+
+        combos = list(combinacoes_frequentes(opts["top"]))
+
+        if opts["tabela"]:
+            codigos = sorted(set(
+                Colecao.objects.exclude(Codigo__isnull=True).exclude(Codigo="")
+                .values_list("Codigo", flat=True)
+            ))
+            if not codigos:
+                raise CommandError("Nenhuma coleção com código cadastrada.")
+            for tabela_id in opts["tabela"]:
+                combos.append((codigos, [], tabela_id, "true"))
+
+        if not combos:
+            self.stdout.write("Nada para aquecer (nenhuma consulta registrada e nenhuma --tabela).")
+            return
+
+        feitas = aquecer_matriz_colest(combos)
+        self.stdout.write(self.style.SUCCESS(
+            f"OK: {feitas} combinação(ões) calculada(s), {len(combos) - feitas} já estavam no cache."
+        ))
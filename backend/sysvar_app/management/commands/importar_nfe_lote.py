@@ -0,0 +1,50 @@
+# sysvar_app/management/commands/importar_nfe_lote.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Fornecedor, Loja
+from ...nfe.nfe_lote import arquivos_diretorio, arquivos_zip, importar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa NF-e de entrada em lote a partir de um ZIP ou de um diretório de XMLs. "
+        "Duplicadas (mesma chave ou mesmo arquivo) são ignoradas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("caminho", help="Arquivo .zip ou diretório com os XMLs.")
+        parser.add_argument("--loja", type=int, required=True, help="Idloja de destino.")
+        parser.add_argument("--fornecedor", type=int, help="Idfornecedor (padrão: pelo CNPJ do emitente).")
+        parser.add_argument("--processos", type=int, help="Processos de parse (padrão: até 4).")
+        parser.add_argument("--detalhe", action="store_true", help="Lista o resultado de cada arquivo.")
+
+    def handle(self, *args, **opts):
+        loja = Loja.objects.filter(pk=opts["loja"]).first()
+        if loja is None:
+            raise CommandError(f"Loja {opts['loja']} não encontrada.")
+        fornecedor = None
+        if opts["fornecedor"]:
+            fornecedor = Fornecedor.objects.filter(pk=opts["fornecedor"]).first()
+            if fornecedor is None:
+                raise CommandError(f"Fornecedor {opts['fornecedor']} não encontrado.")
+
+        caminho = opts["caminho"]
+        if os.path.isdir(caminho):
+            arquivos = arquivos_diretorio(caminho)
+        elif os.path.isfile(caminho):
+            arquivos = arquivos_zip(caminho)
+        else:
+            raise CommandError(f"{caminho} não existe.")
+
+        resultado = importar_lote(arquivos, loja, fornecedor, processos=opts["processos"])
+
+        if opts["detalhe"]:
+            for linha in resultado["arquivos"]:
+                extra = linha.get("detail") or linha.get("chave") or ""
+                self.stdout.write(f"  {linha['status']:<9} {linha['arquivo']} {extra}")
+        r = resultado["resumo"]
+        self.stdout.write(self.style.SUCCESS(
+            f"OK: {r['criadas']} criada(s), {r['duplicadas']} duplicada(s), {r['erros']} erro(s)."
+        ))
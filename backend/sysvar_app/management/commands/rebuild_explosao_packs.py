@@ -0,0 +1,31 @@
+# sysvar_app/management/commands/rebuild_explosao_packs.py
+from django.core.management.base import BaseCommand
+
+from ...models import PedidoCompraItem
+from ...pedido_compra.pedido_compra_explosao import LOTE_PEDIDOS, gravar_explosao
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava PedidoCompraItemSku (itens de pack explodidos em SKUs) para os pedidos com pack. "
+        "Use para materializar pedidos antigos ou após cargas em massa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pedido", type=int, action="append", default=[], help="Explode só este pedido (pode repetir).")
+
+    def handle(self, *args, **opts):
+        pedidos = opts["pedido"] or sorted(
+            PedidoCompraItem.objects.filter(pack__isnull=False)
+            .order_by().values_list("Idpedidocompra_id", flat=True).distinct()
+        )
+
+        total = len(pedidos)
+        linhas = pendencias = 0
+        for i in range(0, total, LOTE_PEDIDOS):
+            l, p = gravar_explosao(pedidos[i:i + LOTE_PEDIDOS])
+            linhas += len(l)
+            pendencias += len(p)
+            self.stdout.write(f"  {min(i + LOTE_PEDIDOS, total)}/{total} pedidos")
+
+        self.stdout.write(self.style.SUCCESS(f"OK: {total} pedido(s), {linhas} linha(s), {pendencias} pendência(s)."))
@@ -0,0 +1,41 @@
+# sysvar_app/management/commands/rebuild_matriz_referencia.py
+from django.core.management.base import BaseCommand
+
+from ...estoque.estoque_matriz import LOTE_REFERENCIAS, atualizar_matriz_referencias
+from ...models import Estoque, EstoqueMatrizReferencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o cubo EstoqueMatrizReferencia a partir de Estoque/ProdutoDetalhe. "
+        "Use após cargas em massa que não passam pelos sinais (SQL direto, bulk_create)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ref", action="append", default=[], help="Recalcula só esta referência (pode repetir).")
+        parser.add_argument("--limpar", action="store_true", help="Apaga o cubo inteiro antes de recalcular.")
+
+    def handle(self, *args, **opts):
+        refs = opts["ref"]
+        if opts["limpar"] and not refs:
+            num, _ = EstoqueMatrizReferencia.objects.all().delete()
+            self.stdout.write(f"Cubo limpo: {num} linha(s) removida(s).")
+
+        if not refs:
+            refs = list(
+                Estoque.objects.order_by().values_list("codigoproduto", flat=True).distinct()
+            )
+            # referências que sumiram do estoque também precisam sair do cubo
+            refs += list(
+                EstoqueMatrizReferencia.objects.exclude(referencia__in=refs)
+                .order_by().values_list("referencia", flat=True).distinct()
+            )
+
+        total = len(refs)
+        celulas = 0
+        for i in range(0, total, LOTE_REFERENCIAS):
+            lote = refs[i:i + LOTE_REFERENCIAS]
+            celulas += atualizar_matriz_referencias(lote)
+            self.stdout.write(f"  {min(i + LOTE_REFERENCIAS, total)}/{total} referências")
+
+        self.stdout.write(self.style.SUCCESS(f"OK: {total} referência(s), {celulas} célula(s) no cubo."))
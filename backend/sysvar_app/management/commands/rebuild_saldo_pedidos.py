@@ -0,0 +1,31 @@
+# sysvar_app/management/commands/rebuild_saldo_pedidos.py
+from django.core.management.base import BaseCommand
+
+from ...models import PedidoCompraItem, SaldoPedidoCompra
+from ...pedido_compra.pedido_compra_saldos import LOTE_PRODUTOS, atualizar_saldos
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula SaldoPedidoCompra (saldo em pedido por loja/produto/SKU) a partir dos itens "
+        "de pedidos e dos recebimentos. Use após cargas em massa que não passam pelos sinais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--produto", type=int, action="append", default=[], help="Recalcula só este produto (pode repetir).")
+
+    def handle(self, *args, **opts):
+        produtos = opts["produto"]
+        if not produtos:
+            produtos = set(PedidoCompraItem.objects.order_by().values_list("Idproduto_id", flat=True).distinct())
+            # produtos que saíram de todos os pedidos também precisam sair do saldo
+            produtos |= set(SaldoPedidoCompra.objects.order_by().values_list("Idproduto_id", flat=True).distinct())
+            produtos = sorted(produtos)
+
+        total = len(produtos)
+        linhas = 0
+        for i in range(0, total, LOTE_PRODUTOS):
+            linhas += atualizar_saldos(produtos[i:i + LOTE_PRODUTOS])
+            self.stdout.write(f"  {min(i + LOTE_PRODUTOS, total)}/{total} produtos")
+
+        self.stdout.write(self.style.SUCCESS(f"OK: {total} produto(s), {linhas} linha(s) de saldo."))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0011_remove_pack_uq_pack_grade_nome_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstoqueMatrizReferencia',
+            fields=[
+                ('Idmatriz', models.BigAutoField(primary_key=True, serialize=False)),
+                ('referencia', models.CharField(max_length=11)),
+                ('loja_nome', models.CharField(blank=True, default='', max_length=50)),
+                ('cor_descricao', models.CharField(blank=True, default='', max_length=100)),
+                ('tamanho_sigla', models.CharField(blank=True, default='', max_length=10)),
+                ('tamanho_descricao', models.CharField(blank=True, default='', max_length=100)),
+                ('estoque', models.IntegerField(default=0)),
+                ('reserva', models.IntegerField(default=0)),
+                ('skus_ativos', models.IntegerField(default=0)),
+                ('estoque_total', models.IntegerField(default=0)),
+                ('reserva_total', models.IntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('Idcor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.cor')),
+                ('Idloja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.loja')),
+                ('Idtamanho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.tamanho')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='estoquematrizreferencia',
+            constraint=models.UniqueConstraint(fields=('referencia', 'Idloja', 'Idcor', 'Idtamanho'), name='uq_estoquematriz_ref_loja_cor_tam'),
+        ),
+    ]
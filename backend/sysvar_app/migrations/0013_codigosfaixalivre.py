@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0012_estoquematrizreferencia_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigosFaixaLivre',
+            fields=[
+                ('Idfaixa', models.BigAutoField(primary_key=True, serialize=False)),
+                ('colecao', models.CharField(max_length=2)),
+                ('estacao', models.CharField(max_length=2)),
+                ('inicio', models.IntegerField()),
+                ('fim', models.IntegerField()),
+                ('data_cadastro', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['colecao', 'estacao', 'inicio'], name='idx_codfaixa_col_est_ini')],
+            },
+        ),
+    ]
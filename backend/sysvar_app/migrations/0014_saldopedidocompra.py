@@ -0,0 +1,39 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0013_codigosfaixalivre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoPedidoCompra',
+            fields=[
+                ('Idsaldopc', models.BigAutoField(primary_key=True, serialize=False)),
+                ('referencia', models.CharField(blank=True, default='', max_length=20)),
+                ('ean', models.CharField(blank=True, default='', max_length=20)),
+                ('qtd_pedida', models.IntegerField(default=0)),
+                ('qtd_recebida', models.IntegerField(default=0)),
+                ('qtd_pendente', models.IntegerField(default=0)),
+                ('valor_pedido', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('valor_pendente', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('Idloja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.loja')),
+                ('Idproduto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.produto')),
+                ('Idprodutodetalhe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sysvar_app.produtodetalhe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['Idproduto', 'Idloja'], name='ix_saldopc_prod_loja'), models.Index(fields=['referencia', 'Idloja'], name='ix_saldopc_ref_loja')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='saldopedidocompra',
+            constraint=models.UniqueConstraint(fields=('Idloja', 'Idproduto', 'Idprodutodetalhe'), name='uq_saldopc_loja_prod_sku'),
+        ),
+    ]
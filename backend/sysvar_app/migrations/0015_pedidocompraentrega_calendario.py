@@ -0,0 +1,50 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_cabecalho(apps, schema_editor):
+    PedidoCompra = apps.get_model('sysvar_app', 'PedidoCompra')
+    PedidoCompraEntrega = apps.get_model('sysvar_app', 'PedidoCompraEntrega')
+    pedido = PedidoCompra.objects.filter(pk=OuterRef('pedido_id'))
+    PedidoCompraEntrega.objects.update(
+        Idloja_id=Subquery(pedido.values('Idloja_id')[:1]),
+        Idfornecedor_id=Subquery(pedido.values('Idfornecedor_id')[:1]),
+        status_pedido=Subquery(pedido.values('Status')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0014_saldopedidocompra'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidocompraentrega',
+            name='Idfornecedor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.fornecedor'),
+        ),
+        migrations.AddField(
+            model_name='pedidocompraentrega',
+            name='Idloja',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.loja'),
+        ),
+        migrations.AddField(
+            model_name='pedidocompraentrega',
+            name='status_pedido',
+            field=models.CharField(blank=True, max_length=2, null=True),
+        ),
+        migrations.RunPython(preencher_cabecalho, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pedidocompraentrega',
+            index=models.Index(fields=['Idloja', 'data_entrega', 'status_pedido'], name='ix_pcentrega_loja_data_st'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidocompraentrega',
+            index=models.Index(fields=['data_entrega', 'status_pedido'], name='ix_pcentrega_data_st'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0015_pedidocompraentrega_calendario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoCompraItemSku',
+            fields=[
+                ('Idpcitemsku', models.BigAutoField(primary_key=True, serialize=False)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('Idcor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.cor')),
+                ('Idproduto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.produto')),
+                ('Idprodutodetalhe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.produtodetalhe')),
+                ('Idtamanho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.tamanho')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skus', to='sysvar_app.pedidocompraitem')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sysvar_app.pedidocompra')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pedido'], name='ix_pcitemsku_pedido'), models.Index(fields=['Idprodutodetalhe', 'pedido'], name='ix_pcitemsku_sku_pedido')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pedidocompraitemsku',
+            constraint=models.UniqueConstraint(fields=('item', 'Idtamanho'), name='uq_pcitemsku_item_tamanho'),
+        ),
+    ]
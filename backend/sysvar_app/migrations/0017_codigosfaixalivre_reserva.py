@@ -0,0 +1,27 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sysvar_app', '0016_pedidocompraitemsku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codigosfaixalivre',
+            name='reservado_ate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codigosfaixalivre',
+            name='reservado_por',
+            field=models.CharField(blank=True, default='', max_length=80),
+        ),
+        migrations.AddIndex(
+            model_name='codigosfaixalivre',
+            index=models.Index(fields=['reservado_por'], name='idx_codfaixa_reservado_por'),
+        ),
+    ]
@@ -7,6 +7,8 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
 
+from auditoria.rastreio import CamposRastreadosMixin
+
 # =========================
 # Usuário customizado
 # =========================
@@ -282,7 +284,7 @@ class ContaBancaria(models.Model):
 # =========================
 # Produtos
 # =========================
-class Produto(models.Model):
+class Produto(CamposRastreadosMixin, models.Model):
     Idproduto = models.BigAutoField(primary_key=True)
     Tipoproduto = models.CharField(max_length=1)
     Descricao = models.CharField(max_length=100)
@@ -387,6 +389,45 @@ class Estoque(models.Model):
         ]
 
 
+class EstoqueMatrizReferencia(models.Model):
+    """
+    Cubo de estoque pré-calculado: uma linha por (referencia, loja, cor, tamanho).
+    Alimenta /api/estoques/matriz-referencia/ e é mantido por sysvar_app/estoque/estoque_matriz.py.
+    """
+    Idmatriz = models.BigAutoField(primary_key=True)
+    referencia = models.CharField(max_length=11)
+    Idloja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    Idcor = models.ForeignKey(Cor, on_delete=models.CASCADE)
+    Idtamanho = models.ForeignKey(Tamanho, on_delete=models.CASCADE)
+
+    # rótulos dos eixos (denormalizados para a consulta não precisar de JOIN)
+    loja_nome = models.CharField(max_length=50, blank=True, default='')
+    cor_descricao = models.CharField(max_length=100, blank=True, default='')
+    tamanho_sigla = models.CharField(max_length=10, blank=True, default='')
+    tamanho_descricao = models.CharField(max_length=100, blank=True, default='')
+
+    # somente SKUs ativos
+    estoque = models.IntegerField(default=0)
+    reserva = models.IntegerField(default=0)
+    skus_ativos = models.IntegerField(default=0)
+    # todos os SKUs (ativos + inativos)
+    estoque_total = models.IntegerField(default=0)
+    reserva_total = models.IntegerField(default=0)
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['referencia', 'Idloja', 'Idcor', 'Idtamanho'],
+                name='uq_estoquematriz_ref_loja_cor_tam',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.referencia} - loja {self.Idloja_id} - {self.cor_descricao}/{self.tamanho_sigla}'
+
+
 # =========================
 # Vendas / Movimentações
 # =========================
@@ -688,10 +729,12 @@ class PedidoCompraItem(models.Model):
 
     # Helper opcional (não persiste nada; apenas calcula em memória)
     def calcular_qtd_total_pack(self) -> int:
-        if not self.pack or not self.n_packs:
+        from .pack.pack_composicao import qtd_total_pack
+        if not self.pack_id or not self.n_packs:
             return 0
-        soma_pack = sum(pi.qtd for pi in self.pack.itens.all())
-        return soma_pack * int(self.n_packs)
+        # com o Pack já carregado, a composição em cache é conferida pelo atualizado_em
+        pack = self.pack if self._meta.get_field('pack').is_cached(self) else self.pack_id
+        return qtd_total_pack(pack, self.n_packs)
 
 
 
@@ -705,8 +748,18 @@ class PedidoCompraEntrega(models.Model):
     observacao = models.CharField(max_length=200, null=True, blank=True)
     data_cadastro = models.DateTimeField(default=timezone.now)
 
+    # cópia do cabeçalho para o calendário de recebimento (sem JOIN com PedidoCompra);
+    # mantida por sysvar_app/pedido_compra/pedido_compra_calendario.py
+    Idloja = models.ForeignKey(Loja, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    Idfornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    status_pedido = models.CharField(max_length=2, null=True, blank=True)
+
     class Meta:
-        indexes = [models.Index(fields=['pedido', 'data_entrega'])]
+        indexes = [
+            models.Index(fields=['pedido', 'data_entrega']),
+            models.Index(fields=['Idloja', 'data_entrega', 'status_pedido'], name='ix_pcentrega_loja_data_st'),
+            models.Index(fields=['data_entrega', 'status_pedido'], name='ix_pcentrega_data_st'),
+        ]
 
     def __str__(self):
         return f'{self.pedido_id} -> {self.data_entrega}'
@@ -736,6 +789,71 @@ class PedidoCompraParcela(models.Model):
         return f'{self.pedido_id} - parcela {self.parcela}'
 
 
+class SaldoPedidoCompra(models.Model):
+    """
+    Saldo em pedido (open-to-buy) por (loja, produto, SKU), somando os itens de
+    pedidos em aberto. Mantido por sysvar_app/pedido_compra/pedido_compra_saldos.py.
+    """
+    Idsaldopc = models.BigAutoField(primary_key=True)
+    Idloja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    Idproduto = models.ForeignKey(Produto, on_delete=models.CASCADE)
+    Idprodutodetalhe = models.ForeignKey('ProdutoDetalhe', on_delete=models.CASCADE, null=True, blank=True)  # null = item sem SKU
+
+    # denormalizados para cruzar com a matriz de estoque sem JOIN
+    referencia = models.CharField(max_length=20, blank=True, default='')
+    ean = models.CharField(max_length=20, blank=True, default='')
+
+    qtd_pedida = models.IntegerField(default=0)
+    qtd_recebida = models.IntegerField(default=0)
+    qtd_pendente = models.IntegerField(default=0)
+    valor_pedido = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    valor_pendente = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    pedidos = models.IntegerField(default=0)
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # não cobre Idprodutodetalhe NULL (MySQL aceita NULL repetido): a linha
+            # sem SKU é protegida pelo lock em Produto de pedido_compra_saldos._recalcular
+            models.UniqueConstraint(fields=['Idloja', 'Idproduto', 'Idprodutodetalhe'], name='uq_saldopc_loja_prod_sku'),
+        ]
+        indexes = [
+            models.Index(fields=['Idproduto', 'Idloja'], name='ix_saldopc_prod_loja'),
+            models.Index(fields=['referencia', 'Idloja'], name='ix_saldopc_ref_loja'),
+        ]
+
+    def __str__(self):
+        return f'{self.referencia} - loja {self.Idloja_id} - pendente {self.qtd_pendente}'
+
+
+class PedidoCompraItemSku(models.Model):
+    """
+    Explosão dos itens de pack em SKUs (tamanho x cor do item). Gravada sob
+    demanda por sysvar_app/pedido_compra/pedido_compra_explosao.py.
+    """
+    Idpcitemsku = models.BigAutoField(primary_key=True)
+    item = models.ForeignKey(PedidoCompraItem, on_delete=models.CASCADE, related_name='skus')
+    pedido = models.ForeignKey(PedidoCompra, on_delete=models.CASCADE, related_name='+')
+    Idproduto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='+')
+    Idtamanho = models.ForeignKey(Tamanho, on_delete=models.CASCADE, related_name='+')
+    Idcor = models.ForeignKey(Cor, on_delete=models.CASCADE, null=True, blank=True, related_name='+')  # null = cor não definida
+    Idprodutodetalhe = models.ForeignKey('ProdutoDetalhe', on_delete=models.CASCADE, null=True, blank=True, related_name='+')  # null = SKU não cadastrado
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'Idtamanho'], name='uq_pcitemsku_item_tamanho'),
+        ]
+        indexes = [
+            models.Index(fields=['pedido'], name='ix_pcitemsku_pedido'),
+            models.Index(fields=['Idprodutodetalhe', 'pedido'], name='ix_pcitemsku_sku_pedido'),
+        ]
+
+    def __str__(self):
+        return f'{self.item_id} · {self.Idtamanho_id}/{self.Idcor_id} · {self.quantidade}'
+
+
 
 
 # =========================
@@ -778,6 +896,32 @@ class Codigos(models.Model):
         return f'{self.colecao}{self.estacao}: {self.valor_var}'
 
 
+class CodigosFaixaLivre(models.Model):
+    """
+    Faixas [inicio, fim] de um contador de Codigos fora do contador (ver
+    sysvar_app/codigos/codigos_ean.py): devolvidas sem uso (reservado_por
+    vazio) ou em poder de um processo até reservado_ate. São consumidas antes
+    de avançar o contador; reserva vencida conta como livre.
+    """
+    Idfaixa = models.BigAutoField(primary_key=True)
+    colecao = models.CharField(max_length=2)
+    estacao = models.CharField(max_length=2)
+    inicio = models.IntegerField()
+    fim = models.IntegerField()
+    data_cadastro = models.DateTimeField(default=timezone.now)
+    reservado_por = models.CharField(max_length=80, blank=True, default='')
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['colecao', 'estacao', 'inicio'], name='idx_codfaixa_col_est_ini'),
+            models.Index(fields=['reservado_por'], name='idx_codfaixa_reservado_por'),
+        ]
+
+    def __str__(self):
+        return f'{self.colecao}{self.estacao}: {self.inicio}-{self.fim}'
+
+
 class Imposto(models.Model):
     idloja = models.ForeignKey(Loja, on_delete=models.CASCADE)
     icms = models.DecimalField(max_digits=5, decimal_places=2)
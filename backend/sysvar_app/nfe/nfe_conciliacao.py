@@ -0,0 +1,281 @@
+# sysvar_app/nfe/nfe_conciliacao.py
+"""
+Conciliação dos itens de uma NF-e de entrada com SKUs/produtos.
+
+Todos os candidatos da nota são carregados de uma vez — mapas do fornecedor
+(FornecedorSkuMap por cProd ou EAN), EAN principal do SKU
+(ProdutoDetalhe.CodigodeBarra), EANs adicionais (ProdutoEAN) e itens de pedido
+em aberto do fornecedor na loja — e indexados em dicionários; cada linha é
+resolvida numa única passada. O número de consultas não depende do número de
+itens da nota.
+
+O resultado vai para NFeConciliacaoItem (origem_match='auto'); linhas
+conciliadas à mão (origem_match='manual') são preservadas e o saldo de pedido
+que elas já ocupam é descontado antes da alocação automática. Cada linha vai
+para o item de pedido mais antigo que comporta a quantidade inteira; se nenhum
+comporta, fica sem item de pedido e com saldo_pedido_insuficiente no destino.
+Linha cuja quantidade convertida (qCom × fator) não é inteira mantém o destino,
+com quantidade_fracionada, mas continua pendente até o fator ser corrigido.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from ..models import (
+    FornecedorSkuMap,
+    NFeConciliacaoItem,
+    NFeEntrada,
+    NFeItem,
+    PedidoCompra,
+    PedidoCompraItem,
+    ProdutoDetalhe,
+    ProdutoEAN,
+)
+
+UM = Decimal("1")
+
+STATUS_CONCILIAVEIS = ("importada", "conciliada")
+
+# pedidos que ainda aceitam recebimento
+STATUS_RECEBIVEIS = (
+    PedidoCompra.StatusChoices.AP,
+    PedidoCompra.StatusChoices.RC,
+    PedidoCompra.StatusChoices.PA,
+)
+
+
+class NFeNaoConciliavel(Exception):
+    pass
+
+
+def quantidade_convertida(qcom, fator):
+    """
+    Quantidade da nota na unidade de estoque (qCom × fator), ou None se não for
+    inteira: o estoque é inteiro e truncar 2,5 perderia mercadoria em silêncio.
+    """
+    qtd = (qcom or 0) * (fator or UM)
+    if qtd != int(qtd):
+        return None
+    return int(qtd)
+
+
+class _Indices:
+    """Dicionários de busca montados para uma nota."""
+
+    def __init__(self, nfe, itens):
+        eans = {it.cean for it in itens if it.cean}
+        cprods = {it.cProd for it in itens if it.cProd}
+
+        # FornecedorSkuMap: cProd do fornecedor e EAN do fornecedor
+        self.mapa_cprod, self.mapa_ean = {}, {}
+        if nfe.Idfornecedor_id and (cprods or eans):
+            for cprod, ean, sku_id, prod_id, sku_prod_id, fator in (
+                FornecedorSkuMap.objects
+                .filter(Idfornecedor_id=nfe.Idfornecedor_id, ativo=True)
+                .filter(Q(cprod_fornecedor__in=cprods) | Q(ean_fornecedor__in=eans))
+                .values_list("cprod_fornecedor", "ean_fornecedor", "Idprodutodetalhe_id", "Idproduto_id",
+                             "Idprodutodetalhe__Idproduto_id", "fator_conversao")
+            ):
+                destino = (sku_id, prod_id or sku_prod_id, fator or UM)
+                if cprod in cprods:
+                    self.mapa_cprod[cprod] = destino
+                if ean and ean in eans:
+                    self.mapa_ean.setdefault(ean, destino)
+
+        # EAN principal do SKU e EANs adicionais
+        self.sku_por_ean = {}
+        if eans:
+            self.sku_por_ean = {
+                ean: (sku_id, prod_id)
+                for sku_id, ean, prod_id in ProdutoDetalhe.objects.filter(CodigodeBarra__in=eans)
+                .values_list("Idprodutodetalhe", "CodigodeBarra", "Idproduto_id")
+            }
+        self.sku_por_ean_adicional = {}
+        restantes = eans - set(self.sku_por_ean)
+        if restantes:
+            for ean, sku_id, prod_id in (
+                ProdutoEAN.objects.filter(ean__in=restantes)
+                .values_list("ean", "Idprodutodetalhe_id", "Idprodutodetalhe__Idproduto_id")
+            ):
+                self.sku_por_ean_adicional.setdefault(ean, (sku_id, prod_id))
+
+    def resolver(self, item):
+        """(tipo, origem, sku_id, produto_id, fator) ou None."""
+        d = self.mapa_cprod.get(item.cProd)
+        if d is not None:
+            return ("sku" if d[0] else "produto", "mapa_cprod") + d
+        if item.cean:
+            s = self.sku_por_ean.get(item.cean)
+            if s is not None:
+                return ("sku", "ean") + s + (UM,)
+            s = self.sku_por_ean_adicional.get(item.cean)
+            if s is not None:
+                return ("sku", "ean_adicional") + s + (UM,)
+            d = self.mapa_ean.get(item.cean)
+            if d is not None:
+                return ("sku" if d[0] else "produto", "mapa_ean") + d
+        return None
+
+
+def _itens_pedido(nfe, skus, produtos):
+    """
+    Itens de pedido recebíveis do fornecedor na loja, mais antigos primeiro:
+    ({sku: [[item_id, saldo], ...]}, {produto: [...]}) para alocação em memória.
+    """
+    por_sku, por_produto = {}, {}
+    if not nfe.Idfornecedor_id or not (skus or produtos):
+        return por_sku, por_produto
+    for item_id, sku_id, prod_id, saldo in (
+        PedidoCompraItem.objects
+        .filter(
+            Idpedidocompra__Idfornecedor_id=nfe.Idfornecedor_id,
+            Idpedidocompra__Idloja_id=nfe.Idloja_id,
+            Idpedidocompra__Status__in=STATUS_RECEBIVEIS,
+            Qtp_pc__gt=F("Qtd_recebida"),
+        )
+        .filter(Q(Idprodutodetalhe_id__in=skus) | Q(Idprodutodetalhe__isnull=True, Idproduto_id__in=produtos))
+        .annotate(saldo=F("Qtp_pc") - F("Qtd_recebida"))
+        .order_by("Idpedidocompra__Datapedido", "Idpedidocompra_id", "pk")
+        .values_list("pk", "Idprodutodetalhe_id", "Idproduto_id", "saldo")
+    ):
+        if sku_id:
+            por_sku.setdefault(sku_id, []).append([item_id, saldo])
+        else:
+            por_produto.setdefault(prod_id, []).append([item_id, saldo])
+    return por_sku, por_produto
+
+
+def _alocar(filas, chave, qtd):
+    """
+    Item de pedido mais antigo cujo saldo cobre a linha inteira; desconta a
+    quantidade da fila. None se nenhum cobre (a linha não é empurrada para
+    um item menor, o que lançaria recebimento acima do pedido).
+    """
+    if qtd <= 0:
+        return None
+    for entrada in filas.get(chave, ()):
+        if entrada[1] >= qtd:
+            entrada[1] -= qtd
+            return entrada[0]
+    return None
+
+
+def _tem_saldo(filas, chave) -> bool:
+    return any(entrada[1] > 0 for entrada in filas.get(chave, ()))
+
+
+@transaction.atomic
+def conciliar(nfe: NFeEntrada, usuario=None) -> dict:
+    """
+    Concilia os itens da nota. Devolve {"Idnfe", "status", "conciliados",
+    "pendentes", "itens": [...]} com o destino de cada linha (None = pendente).
+    """
+    nfe = NFeEntrada.objects.select_for_update().get(pk=nfe.pk)
+    if nfe.status not in STATUS_CONCILIAVEIS:
+        raise NFeNaoConciliavel(f"NF-e com status '{nfe.status}' não pode ser conciliada.")
+
+    itens = list(NFeItem.objects.filter(nfe=nfe).order_by("ordem"))
+    manuais = {
+        c.nfe_item_id: c
+        for c in NFeConciliacaoItem.objects.filter(nfe_item__nfe=nfe, origem_match="manual")
+    }
+    idx = _Indices(nfe, [it for it in itens if it.pk not in manuais])
+
+    resolvidos = {it.pk: idx.resolver(it) for it in itens if it.pk not in manuais}
+    skus = {r[2] for r in resolvidos.values() if r and r[2]}
+    produtos = {r[3] for r in resolvidos.values() if r and r[3]}
+    skus |= {m.Idprodutodetalhe_id for m in manuais.values() if m.Idpedidocompraitem_id and m.Idprodutodetalhe_id}
+    produtos |= {m.Idproduto_id for m in manuais.values() if m.Idpedidocompraitem_id and m.Idproduto_id}
+    filas_sku, filas_produto = _itens_pedido(nfe, skus, produtos)
+
+    # saldo já comprometido pelas linhas manuais não vai de novo para a alocação automática
+    entradas = {e[0]: e for fila in (*filas_sku.values(), *filas_produto.values()) for e in fila}
+    for it in itens:
+        manual = manuais.get(it.pk)
+        if manual is not None and manual.Idpedidocompraitem_id in entradas:
+            entradas[manual.Idpedidocompraitem_id][1] -= quantidade_convertida(it.qCom, manual.fator_unidade) or 0
+
+    novos, alterados, saida = [], [], []
+    for it in itens:
+        manual = manuais.get(it.pk)
+        if manual is not None:
+            destino = {
+                "tipo": manual.destino_tipo,
+                "origem": "manual",
+                "produtodetalhe_id": manual.Idprodutodetalhe_id,
+                "produto_id": manual.Idproduto_id,
+                "fator": manual.fator_unidade,
+                "pedidocompraitem_id": manual.Idpedidocompraitem_id,
+                "saldo_pedido_insuficiente": False,
+            }
+        elif resolvidos[it.pk] is None:
+            destino = None
+        else:
+            tipo, origem, sku_id, prod_id, fator = resolvidos[it.pk]
+            qtd = quantidade_convertida(it.qCom, fator)
+            pc_item = None
+            if qtd is not None:
+                pc_item = _alocar(filas_sku, sku_id, qtd) if sku_id else None
+                if pc_item is None and prod_id:
+                    pc_item = _alocar(filas_produto, prod_id, qtd)
+            # há pedido em aberto para o destino, mas nenhum item comporta a linha
+            insuficiente = qtd is not None and pc_item is None and (
+                (bool(sku_id) and _tem_saldo(filas_sku, sku_id)) or (bool(prod_id) and _tem_saldo(filas_produto, prod_id))
+            )
+            destino = {
+                "tipo": tipo,
+                "origem": origem,
+                "produtodetalhe_id": sku_id,
+                "produto_id": prod_id,
+                "fator": fator,
+                "pedidocompraitem_id": pc_item,
+                "saldo_pedido_insuficiente": insuficiente,
+            }
+            novos.append(NFeConciliacaoItem(
+                nfe_item=it,
+                destino_tipo=tipo,
+                Idprodutodetalhe_id=sku_id,
+                Idproduto_id=prod_id,
+                origem_match="auto",
+                fator_unidade=fator,
+                Idpedidocompraitem_id=pc_item,
+                usuario=usuario,
+            ))
+
+        if destino is not None:
+            destino["quantidade_fracionada"] = quantidade_convertida(it.qCom, destino["fator"]) is None
+        pendente = destino is None or destino["quantidade_fracionada"]
+        fator = destino["fator"] if destino else None
+        if it.pendente != pendente or it.fator_conversao != fator:
+            it.pendente = pendente
+            it.fator_conversao = fator
+            alterados.append(it)
+        saida.append({
+            "Idnfeitem": it.pk,
+            "ordem": it.ordem,
+            "cProd": it.cProd,
+            "xProd": it.xProd,
+            "cean": it.cean,
+            "qCom": it.qCom,
+            "destino": destino,
+            "pendente": pendente,
+        })
+
+    NFeConciliacaoItem.objects.filter(nfe_item__nfe=nfe, origem_match="auto").delete()
+    NFeConciliacaoItem.objects.bulk_create(novos, batch_size=1000)
+    if alterados:
+        NFeItem.objects.bulk_update(alterados, ["pendente", "fator_conversao"], batch_size=1000)
+
+    pendentes = sum(1 for s in saida if s["pendente"])
+    status_novo = "conciliada" if itens and not pendentes else "importada"
+    if nfe.status != status_novo:
+        NFeEntrada.objects.filter(pk=nfe.pk).update(status=status_novo)
+
+    return {
+        "Idnfe": nfe.pk,
+        "status": status_novo,
+        "conciliados": len(saida) - pendentes,
+        "pendentes": pendentes,
+        "itens": saida,
+    }
@@ -0,0 +1,144 @@
+# sysvar_app/nfe/nfe_ingestao.py
+"""
+Entrada de NF-e por XML: NFeEntrada + NFeItem a partir do parser em fluxo.
+
+O cabeçalho é gravado assim que o parser o entrega; os itens seguem em lotes
+de bulk_create enquanto o restante do documento ainda está sendo lido, e os
+totais/fingerprint fecham a nota no fim. A cópia do XML para NFeEntrada.xml
+passa por um arquivo temporário e é gravada em pedaços (UPDATE ... CONCAT),
+então nem ela junta o documento inteiro na memória. Tudo numa transação: XML
+inválido ou nota repetida não deixa nada gravado.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Concat
+
+from ..models import Fornecedor, ModeloDocumentoFiscal, NFeEntrada, NFeItem
+from .nfe_parser import FonteXML, NFeInvalida, ler_nfe
+
+TAMANHO_LOTE = 500
+
+_NAO_DIGITO = re.compile(r"\D")
+
+
+class NFeDuplicada(Exception):
+    def __init__(self, nfe):
+        self.nfe = nfe
+        super().__init__(f"NF-e {nfe.chave} já importada.")
+
+
+def so_digitos(v) -> str:
+    return _NAO_DIGITO.sub("", v or "")
+
+
+def _cnpj_formatado(d):
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+
+def fornecedores_por_cnpj(cnpjs) -> dict:
+    """{cnpj só dígitos: Fornecedor} em uma consulta (cadastro guarda com ou sem pontuação)."""
+    digitos = {so_digitos(c) for c in cnpjs}
+    digitos = {d for d in digitos if len(d) == 14}
+    if not digitos:
+        return {}
+    achados = {}
+    for f in Fornecedor.objects.filter(Cnpj__in=list(digitos) + [_cnpj_formatado(d) for d in digitos]).order_by("-pk"):
+        achados[so_digitos(f.Cnpj)] = f
+    return achados
+
+
+def chave_da_nota(cab) -> str:
+    chave = so_digitos(cab.get("chave"))
+    if len(chave) != 44:
+        raise NFeInvalida("Chave de acesso ausente ou inválida.")
+    return chave
+
+
+def campos_entrada(cab, chave, loja, fornecedor, modelo) -> dict:
+    """Campos de NFeEntrada a partir do cabeçalho lido pelo parser."""
+    return dict(
+        chave=chave,
+        numero=cab.get("numero"),
+        serie=cab.get("serie"),
+        dhEmi=cab.get("dhEmi"),
+        cnpj_emitente=so_digitos(cab.get("cnpj_emitente")) or None,
+        razao_emitente=cab.get("razao_emitente"),
+        Idfornecedor=fornecedor,
+        Idloja=loja,
+        tipo_nota="mercadoria",
+        origem="XML",
+        modelo=modelo,
+    )
+
+
+def _nova_entrada(cab, loja, fornecedor):
+    chave = chave_da_nota(cab)
+    existente = NFeEntrada.objects.filter(chave=chave).first()
+    if existente is not None:
+        raise NFeDuplicada(existente)
+
+    if fornecedor is None:
+        d = so_digitos(cab.get("cnpj_emitente"))
+        fornecedor = fornecedores_por_cnpj([d]).get(d)
+    modelo = None
+    if cab.get("modelo"):
+        modelo = ModeloDocumentoFiscal.objects.filter(codigo=cab["modelo"]).first()
+    try:
+        with transaction.atomic():
+            return NFeEntrada.objects.create(**campos_entrada(cab, chave, loja, fornecedor, modelo))
+    except IntegrityError:
+        # outra importação da mesma chave ganhou a corrida
+        raise NFeDuplicada(NFeEntrada.objects.filter(chave=chave).first() or NFeEntrada(chave=chave))
+
+
+def importar_xml(arquivo, loja, fornecedor=None, *, guardar_xml=True) -> NFeEntrada:
+    """
+    Importa uma NF-e de `arquivo` (binário) para a loja. Sem `fornecedor`, tenta
+    pelo CNPJ do emitente. Levanta NFeInvalida ou NFeDuplicada (por chave ou
+    pelo fingerprint do arquivo).
+    """
+    fonte = FonteXML(arquivo, guardar=guardar_xml)
+    nfe = None
+    totais = {}
+    lote = []
+    try:
+        with transaction.atomic():
+            for tipo, dados in ler_nfe(fonte):
+                if tipo == "item":
+                    lote.append(NFeItem(nfe=nfe, **dados))
+                    if len(lote) >= TAMANHO_LOTE:
+                        NFeItem.objects.bulk_create(lote)
+                        lote = []
+                elif tipo == "cabecalho":
+                    nfe = _nova_entrada(dados, loja, fornecedor)
+                else:
+                    totais = dados
+            if lote:
+                NFeItem.objects.bulk_create(lote)
+
+            igual = NFeEntrada.objects.filter(fingerprint=fonte.fingerprint).exclude(pk=nfe.pk).first()
+            if igual is not None:
+                raise NFeDuplicada(igual)
+
+            campos = dict(totais, fingerprint=fonte.fingerprint)
+            NFeEntrada.objects.filter(pk=nfe.pk).update(**campos)
+            for k, v in campos.items():
+                setattr(nfe, k, v)
+            _gravar_xml(nfe, fonte)
+    finally:
+        fonte.fechar()
+    return nfe
+
+
+def _gravar_xml(nfe, fonte):
+    """NFeEntrada.xml em pedaços, a partir da cópia em arquivo temporário da FonteXML."""
+    gravou = False
+    for parte in fonte.blocos_texto():
+        xml = Concat(F("xml"), Value(parte), output_field=TextField()) if gravou else Value(parte)
+        NFeEntrada.objects.filter(pk=nfe.pk).update(xml=xml)
+        gravou = True
+    if gravou:
+        # fica adiado na instância: lido do banco só se alguém acessar
+        nfe.__dict__.pop("xml", None)
@@ -0,0 +1,320 @@
+# sysvar_app/nfe/nfe_lancamento.py
+"""
+Lançamento (confirmação) de uma NF-e de entrada: estoque, movimentação e
+recebimento dos pedidos.
+
+Os destinos vêm da conciliação (nfe_conciliacao.conciliar, com os ajustes
+manuais do operador). Os deltas são somados em memória e gravados por conjunto:
+  - Estoque: bulk_create (ignore_conflicts) das linhas (loja, EAN) que faltam,
+    com saldo zero, e um único UPDATE ... CASE por bloco somando as quantidades;
+  - MovimentacaoProdutos (Tipo 'E') e RecebimentoPCItem em bulk_create;
+  - PedidoCompraItem.Qtd_recebida num UPDATE ... CASE por bloco.
+O número de comandos depende de quantos blocos de LOTE a nota ocupa, não do
+número de linhas. bulk_create/update não disparam sinais: matriz de estoque,
+matriz coleção x loja e saldo em pedido são marcados aqui.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..estoque.estoque_colest import marcar_matriz_colest
+from ..estoque.estoque_matriz import marcar_matriz_por_eans
+from ..models import (
+    Estoque,
+    FornecedorSkuMap,
+    MovimentacaoProdutos,
+    NFeConciliacaoItem,
+    NFeEntrada,
+    NFeItem,
+    PedidoCompraItem,
+    Produto,
+    ProdutoDetalhe,
+    RecebimentoPCItem,
+)
+from ..pedido_compra.pedido_compra_saldos import marcar_saldo
+from .nfe_conciliacao import STATUS_CONCILIAVEIS, STATUS_RECEBIVEIS, conciliar, quantidade_convertida
+
+LOTE = 500
+CENTAVO = Decimal("0.01")
+
+
+class NFeNaoLancavel(Exception):
+    def __init__(self, mensagem, *, faltantes=None, conflito=False):
+        super().__init__(mensagem)
+        self.faltantes = faltantes
+        self.conflito = conflito
+
+
+class NFeNaoCancelavel(Exception):
+    pass
+
+
+def _blocos(seq, n=LOTE):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+def _somar(qs, campo, chave, deltas):
+    """UPDATE qs SET campo = COALESCE(campo, 0) + CASE chave WHEN ... END, um comando por bloco."""
+    for bloco in _blocos(list(deltas.items())):
+        qs.filter(**{f"{chave}__in": [k for k, _ in bloco]}).update(**{
+            campo: Coalesce(F(campo), 0) + Case(
+                *[When(**{chave: k}, then=Value(q)) for k, q in bloco],
+                default=Value(0), output_field=IntegerField(),
+            )
+        })
+
+
+# -------------------------------------------------------------------
+# ajustes manuais (overrides)
+# -------------------------------------------------------------------
+def _decimal_positivo(v, padrao):
+    if v in (None, ""):
+        return padrao
+    try:
+        d = Decimal(str(v))
+    except InvalidOperation:
+        d = None
+    if d is None or d <= 0:
+        raise NFeNaoLancavel(f"Fator inválido: {v!r}.")
+    return d
+
+
+def _pedido_atende(pc, tipo, alvo, skus) -> bool:
+    """O item de pedido (sku_id, produto_id) recebe o destino? Mesma regra da conciliação automática."""
+    if pc is None:
+        return False
+    pc_sku, pc_produto = pc
+    if tipo == "sku":
+        return pc_sku == alvo or (pc_sku is None and pc_produto == skus.get(alvo))
+    return pc_sku is None and pc_produto == alvo
+
+
+def _aplicar_overrides(nfe, itens, overrides, usuario, salvar_vinculo):
+    """
+    overrides: {Idnfeitem: {tipo: 'sku'|'produto', produtodetalhe_id | produto_id,
+    fator (opcional), pedidocompraitem_id (opcional)}} -> NFeConciliacaoItem 'manual'.
+    Devolve os ids dos itens ajustados.
+    """
+    pedidos = {}
+    for chave, o in overrides.items():
+        try:
+            item_id = int(chave)
+        except (TypeError, ValueError):
+            item_id = None
+        if item_id not in itens:
+            raise NFeNaoLancavel(f"Item {chave} não pertence a esta NF-e.")
+        o = o or {}
+        tipo = o.get("tipo")
+        if tipo not in ("sku", "produto"):
+            raise NFeNaoLancavel(f"Item {item_id}: tipo deve ser 'sku' ou 'produto'.")
+        alvo = o.get("produtodetalhe_id") if tipo == "sku" else o.get("produto_id")
+        if not alvo:
+            campo = "produtodetalhe_id" if tipo == "sku" else "produto_id"
+            raise NFeNaoLancavel(f"Item {item_id}: informe '{campo}'.")
+        pedidos[item_id] = (tipo, alvo, _decimal_positivo(o.get("fator"), Decimal("1")),
+                            o.get("pedidocompraitem_id") or None)
+
+    skus = dict(
+        ProdutoDetalhe.objects.filter(pk__in={a for t, a, _, _ in pedidos.values() if t == "sku"})
+        .values_list("Idprodutodetalhe", "Idproduto_id")
+    )
+    produtos = set(
+        Produto.objects.filter(pk__in={a for t, a, _, _ in pedidos.values() if t == "produto"})
+        .values_list("Idproduto", flat=True)
+    )
+    # só itens recebíveis do fornecedor da nota, na loja da nota
+    pcs = {
+        pk: (sku_id, prod_id)
+        for pk, sku_id, prod_id in PedidoCompraItem.objects
+        .filter(
+            pk__in={pc for *_, pc in pedidos.values() if pc},
+            Idpedidocompra__Idloja_id=nfe.Idloja_id,
+            Idpedidocompra__Idfornecedor_id=nfe.Idfornecedor_id,
+            Idpedidocompra__Status__in=STATUS_RECEBIVEIS,
+        )
+        .values_list("Idpedidocompraitem", "Idprodutodetalhe_id", "Idproduto_id")
+    }
+
+    novos = []
+    for item_id, (tipo, alvo, fator, pc) in pedidos.items():
+        if tipo == "sku" and alvo not in skus:
+            raise NFeNaoLancavel(f"Item {item_id}: SKU {alvo} não encontrado.")
+        if tipo == "produto" and alvo not in produtos:
+            raise NFeNaoLancavel(f"Item {item_id}: produto {alvo} não encontrado.")
+        if pc and not _pedido_atende(pcs.get(pc), tipo, alvo, skus):
+            raise NFeNaoLancavel(
+                f"Item {item_id}: item de pedido {pc} não é um item em aberto deste fornecedor/loja "
+                f"para o mesmo produto/SKU."
+            )
+        novos.append(NFeConciliacaoItem(
+            nfe_item_id=item_id,
+            destino_tipo=tipo,
+            Idprodutodetalhe_id=alvo if tipo == "sku" else None,
+            Idproduto_id=skus[alvo] if tipo == "sku" else alvo,
+            origem_match="manual",
+            fator_unidade=fator,
+            salvar_vinculo=salvar_vinculo,
+            Idpedidocompraitem_id=pc,
+            usuario=usuario,
+        ))
+
+    NFeConciliacaoItem.objects.filter(nfe_item_id__in=list(pedidos)).delete()
+    NFeConciliacaoItem.objects.bulk_create(novos, batch_size=LOTE)
+    return set(pedidos)
+
+
+def _salvar_vinculos(nfe, itens, destinos):
+    """Upsert de FornecedorSkuMap (fornecedor, cProd) -> destino para as linhas informadas."""
+    mapas = {}
+    for item_id, d in destinos:
+        it = itens[item_id]
+        if it.cProd:
+            mapas[it.cProd] = FornecedorSkuMap(
+                Idfornecedor_id=nfe.Idfornecedor_id,
+                cprod_fornecedor=it.cProd,
+                ean_fornecedor=it.cean,
+                Idprodutodetalhe_id=d["produtodetalhe_id"] if d["tipo"] == "sku" else None,
+                Idproduto_id=d["produto_id"] if d["tipo"] == "produto" else None,
+                unid_fornecedor=it.uCom,
+                fator_conversao=d["fator"],
+                ativo=True,
+            )
+    if not mapas:
+        return
+    upsert = {"update_conflicts": True, "update_fields": [
+        "ean_fornecedor", "Idprodutodetalhe", "Idproduto", "unid_fornecedor", "fator_conversao", "ativo",
+    ]}
+    if connection.features.supports_update_conflicts_with_target:
+        upsert["unique_fields"] = ["Idfornecedor", "cprod_fornecedor"]
+    FornecedorSkuMap.objects.bulk_create(list(mapas.values()), batch_size=LOTE, **upsert)
+
+
+# -------------------------------------------------------------------
+# lançamento
+# -------------------------------------------------------------------
+@transaction.atomic
+def lancar(nfe: NFeEntrada, usuario=None, *, overrides=None, permitir_parcial=False,
+           salvar_vinculos=False) -> dict:
+    """
+    Confirma a nota: concilia (com os `overrides`), soma o estoque da loja,
+    grava movimentação e recebimentos e passa o status para 'lancada'.
+    Itens sem destino ou com quantidade convertida não inteira levantam
+    NFeNaoLancavel(faltantes=[...]), salvo com `permitir_parcial` (ficam de
+    fora do lançamento).
+    """
+    nfe = NFeEntrada.objects.select_for_update().get(pk=nfe.pk)
+    if nfe.status == "lancada":
+        raise NFeNaoLancavel("NF-e já lançada.", conflito=True)
+    if nfe.status not in STATUS_CONCILIAVEIS:
+        raise NFeNaoLancavel(f"NF-e com status '{nfe.status}' não pode ser lançada.")
+
+    itens = {it.pk: it for it in NFeItem.objects.filter(nfe=nfe)}
+    ajustados = set()
+    if overrides:
+        ajustados = _aplicar_overrides(nfe, itens, overrides, usuario, salvar_vinculos)
+    linhas = conciliar(nfe, usuario)["itens"]
+
+    faltantes = [
+        {"Idnfeitem": s["Idnfeitem"], "ordem": s["ordem"], "cProd": s["cProd"], "xProd": s["xProd"],
+         "motivo": "quantidade_fracionada" if s["destino"] else "sem_destino"}
+        for s in linhas if s["pendente"]
+    ]
+    if faltantes and not permitir_parcial:
+        raise NFeNaoLancavel(
+            "Há itens da NF-e sem produto/SKU de destino ou com quantidade convertida (qCom × fator) não inteira.",
+            faltantes=faltantes,
+        )
+
+    lancadas = [(s["Idnfeitem"], s["destino"]) for s in linhas if not s["pendente"]]
+    dados_sku = {
+        pk: (ean, cod)
+        for pk, ean, cod in ProdutoDetalhe.objects
+        .filter(pk__in={d["produtodetalhe_id"] for _, d in lancadas if d["tipo"] == "sku"})
+        .values_list("Idprodutodetalhe", "CodigodeBarra", "Codigoproduto")
+    }
+
+    documento = (nfe.numero or nfe.chave[25:34])[:20]
+    hoje = timezone.localdate()
+    por_ean, codigos = defaultdict(int), {}
+    por_pc = defaultdict(int)
+    movimentos, recebimentos = [], []
+    for item_id, d in lancadas:
+        it = itens[item_id]
+        qtd = quantidade_convertida(it.qCom, d["fator"])
+        sku = dados_sku.get(d["produtodetalhe_id"]) if d["tipo"] == "sku" else None
+        if sku is not None and qtd > 0:
+            ean, cod = sku
+            por_ean[ean] += qtd
+            codigos[ean] = cod
+            movimentos.append(MovimentacaoProdutos(
+                Idloja_id=nfe.Idloja_id,
+                Data_mov=hoje,
+                Documento=documento,
+                Tipo="E",
+                Qtd=qtd,
+                Valor=(it.vProd / qtd).quantize(CENTAVO),
+                CodigodeBarra=ean,
+                codigoproduto=cod,
+            ))
+        if d["pedidocompraitem_id"] and qtd > 0:
+            por_pc[d["pedidocompraitem_id"]] += qtd
+            recebimentos.append(RecebimentoPCItem(
+                Idpedidocompraitem_id=d["pedidocompraitem_id"],
+                nfe_item_id=item_id,
+                quantidade_atendida=qtd,
+                valor_atendido=it.vProd,
+            ))
+
+    if por_ean:
+        # linhas que faltam entram zeradas; a soma vem toda do UPDATE (sem perder entrada concorrente)
+        Estoque.objects.bulk_create(
+            [Estoque(Idloja_id=nfe.Idloja_id, CodigodeBarra=ean, codigoproduto=codigos[ean], Estoque=0)
+             for ean in por_ean],
+            batch_size=LOTE, ignore_conflicts=True,
+        )
+        _somar(Estoque.objects.filter(Idloja_id=nfe.Idloja_id), "Estoque", "CodigodeBarra", por_ean)
+        MovimentacaoProdutos.objects.bulk_create(movimentos, batch_size=LOTE)
+    produtos_pc = set()
+    if por_pc:
+        _somar(PedidoCompraItem.objects.all(), "Qtd_recebida", "Idpedidocompraitem", por_pc)
+        # saldo do produto do item de pedido de fato recebido
+        produtos_pc = set(
+            PedidoCompraItem.objects.filter(pk__in=list(por_pc)).values_list("Idproduto_id", flat=True)
+        )
+        RecebimentoPCItem.objects.bulk_create(recebimentos, batch_size=LOTE)
+    if salvar_vinculos and nfe.Idfornecedor_id:
+        _salvar_vinculos(nfe, itens, [(i, d) for i, d in lancadas if i in ajustados])
+
+    NFeEntrada.objects.filter(pk=nfe.pk).update(status="lancada")
+
+    # bulk_create/update não disparam sinais
+    marcar_matriz_por_eans(por_ean)
+    if por_ean:
+        marcar_matriz_colest()
+    marcar_saldo(*produtos_pc)
+
+    return {
+        "Idnfe": nfe.pk,
+        "status": "lancada",
+        "itens_criados": len(lancadas),
+        "estoque_atualizado_skus": len(por_ean),
+        "movimentacoes": len(movimentos),
+        "recebimentos": len(recebimentos),
+        "faltantes": faltantes,
+    }
+
+
+@transaction.atomic
+def cancelar_nfe(nfe: NFeEntrada) -> dict:
+    """Cancela a nota; nota já lançada não pode ser cancelada por aqui."""
+    nfe = NFeEntrada.objects.select_for_update().get(pk=nfe.pk)
+    if nfe.status == "lancada":
+        raise NFeNaoCancelavel("NF-e já lançada não pode ser cancelada.")
+    if nfe.status != "cancelada":
+        NFeEntrada.objects.filter(pk=nfe.pk).update(status="cancelada")
+    return {"Idnfe": nfe.pk, "status": "cancelada"}
@@ -0,0 +1,221 @@
+# sysvar_app/nfe/nfe_lote.py
+"""
+Importação de NF-e em lote (ZIP ou diretório de XMLs).
+
+Os arquivos são processados em blocos: o parse roda num pool de processos
+iniciados por spawn (analisar_xml não toca no banco; fork de um worker com
+threads e conexões abertas não é seguro), a deduplicação por chave e fingerprint é uma
+única consulta IN por bloco e as notas novas do bloco entram com um
+bulk_create de NFeEntrada e outro de NFeItem. Cada arquivo volta no relatório
+como criada, duplicada ou erro.
+"""
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from ..models import ModeloDocumentoFiscal, NFeEntrada, NFeItem
+from .nfe_ingestao import (
+    NFeDuplicada, campos_entrada, chave_da_nota, fornecedores_por_cnpj, importar_xml, so_digitos,
+)
+from .nfe_parser import NFeInvalida, analisar_xml_no_pool
+
+TAMANHO_BLOCO = 50
+LOTE_ITENS = 1000
+MAX_BYTES_XML = 20 * 1024 * 1024
+PROCESSOS_PADRAO = min(4, os.cpu_count() or 1)
+
+
+# -------------------------------------------------------------------
+# origem dos arquivos: (nome, função que devolve os bytes)
+# -------------------------------------------------------------------
+def arquivos_zip(arquivo):
+    """XMLs de um ZIP (caminho ou arquivo aberto); lidos só quando o bloco chega neles."""
+    z = zipfile.ZipFile(arquivo)
+    for info in z.infolist():
+        if info.is_dir() or not info.filename.lower().endswith(".xml"):
+            continue
+        if info.file_size > MAX_BYTES_XML:
+            yield info.filename, None
+            continue
+        yield info.filename, (lambda nome=info.filename: z.read(nome))
+
+
+def _ler_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return f.read()
+
+
+def arquivos_diretorio(caminho):
+    for raiz, _, nomes in os.walk(caminho):
+        for nome in sorted(nomes):
+            if not nome.lower().endswith(".xml"):
+                continue
+            completo = os.path.join(raiz, nome)
+            if os.path.getsize(completo) > MAX_BYTES_XML:
+                yield completo, None
+                continue
+            yield completo, (lambda p=completo: _ler_arquivo(p))
+
+
+# -------------------------------------------------------------------
+# parse (no pool)
+# -------------------------------------------------------------------
+def _com_chave(r):
+    if "erro" not in r:
+        try:
+            r["chave"] = chave_da_nota(r["cabecalho"])
+        except NFeInvalida as e:
+            return {"erro": str(e)}
+    return r
+
+
+def _parse(pool, blobs):
+    if pool is None:
+        return [_com_chave(analisar_xml_no_pool(b)) for b in blobs]
+    # um future por arquivo: falha do pool (processo morto, pickling) vira erro só daquele arquivo
+    out = []
+    for futuro in [pool.submit(analisar_xml_no_pool, b) for b in blobs]:
+        try:
+            r = futuro.result()
+        except Exception as e:
+            r = {"erro": f"Falha ao ler a NF-e: {e!r}."}
+        out.append(_com_chave(r))
+    return out
+
+
+# -------------------------------------------------------------------
+# gravação de um bloco
+# -------------------------------------------------------------------
+def _gravar_bloco(notas, loja, fornecedor):
+    """notas: [(linha do relatório, resultado do parse, bytes)] já sem duplicadas."""
+    if not notas:
+        return
+    fornecedores = {} if fornecedor else fornecedores_por_cnpj(r["cabecalho"].get("cnpj_emitente") for _, r, _ in notas)
+    modelos = {
+        m.codigo: m
+        for m in ModeloDocumentoFiscal.objects.filter(codigo__in={r["cabecalho"].get("modelo") for _, r, _ in notas} - {None})
+    }
+
+    with transaction.atomic():
+        entradas = []
+        for _, r, dados in notas:
+            cab = r["cabecalho"]
+            forn = fornecedor or fornecedores.get(so_digitos(cab.get("cnpj_emitente")))
+            e = NFeEntrada(**campos_entrada(cab, r["chave"], loja, forn, modelos.get(cab.get("modelo"))))
+            for k, v in r["totais"].items():
+                setattr(e, k, v)
+            e.fingerprint = r["fingerprint"]
+            e.xml = dados.decode("utf-8", errors="replace")
+            entradas.append(e)
+        NFeEntrada.objects.bulk_create(entradas)
+
+        # MySQL não devolve as PKs do bulk_create: relê pela chave (única)
+        ids = dict(NFeEntrada.objects.filter(chave__in=[r["chave"] for _, r, _ in notas]).values_list("chave", "pk"))
+        itens = [NFeItem(nfe_id=ids[r["chave"]], **it) for _, r, _ in notas for it in r["itens"]]
+        NFeItem.objects.bulk_create(itens, batch_size=LOTE_ITENS)
+
+    for linha, r, _ in notas:
+        linha.update(status="criada", Idnfe=ids[r["chave"]], itens=len(r["itens"]))
+
+
+def _gravar_um_a_um(notas, loja, fornecedor):
+    """Fallback quando o bloco colide com outra importação simultânea."""
+    for linha, _, dados in notas:
+        try:
+            nfe = importar_xml(io.BytesIO(dados), loja, fornecedor)
+            linha.update(status="criada", Idnfe=nfe.pk)
+        except NFeDuplicada as e:
+            linha.update(status="duplicada", Idnfe=e.nfe.pk)
+        except NFeInvalida as e:
+            linha.update(status="erro", detail=str(e))
+
+
+def _processar_bloco(bloco, pool, loja, fornecedor, relatorio):
+    linhas, blobs = [], []
+    for nome, ler in bloco:
+        linha = {"arquivo": nome}
+        relatorio.append(linha)
+        if ler is None:
+            linha.update(status="erro", detail="Arquivo grande demais.")
+            continue
+        try:
+            blobs.append(ler())
+        except (OSError, zipfile.BadZipFile) as e:
+            linha.update(status="erro", detail=f"Falha ao ler o arquivo: {e}.")
+            continue
+        linhas.append(linha)
+
+    validas = []
+    for linha, r, dados in zip(linhas, _parse(pool, blobs), blobs):
+        if "erro" in r:
+            linha.update(status="erro", detail=r["erro"])
+            continue
+        linha["chave"] = r["chave"]
+        validas.append((linha, r, dados))
+
+    # deduplicação do bloco inteiro numa consulta
+    existentes = {}
+    if validas:
+        for chave, fp, pk in NFeEntrada.objects.filter(
+            Q(chave__in=[r["chave"] for _, r, _ in validas]) | Q(fingerprint__in=[r["fingerprint"] for _, r, _ in validas])
+        ).values_list("chave", "fingerprint", "pk"):
+            existentes[chave] = pk
+            if fp:
+                existentes[fp] = pk
+
+    # repetida dentro do bloco aponta para a linha da primeira ocorrência
+    novas, primeiras, repetidas = [], {}, []
+    for linha, r, dados in validas:
+        pk = existentes.get(r["chave"]) or existentes.get(r["fingerprint"])
+        if pk is not None:
+            linha.update(status="duplicada", Idnfe=pk)
+            continue
+        primeira = primeiras.get(r["chave"]) or primeiras.get(r["fingerprint"])
+        if primeira is not None:
+            linha["status"] = "duplicada"
+            repetidas.append((linha, primeira))
+            continue
+        primeiras[r["chave"]] = primeiras[r["fingerprint"]] = linha
+        novas.append((linha, r, dados))
+
+    try:
+        _gravar_bloco(novas, loja, fornecedor)
+    except IntegrityError:
+        _gravar_um_a_um(novas, loja, fornecedor)
+    for linha, primeira in repetidas:
+        linha["Idnfe"] = primeira.get("Idnfe")
+
+
+def importar_lote(arquivos, loja, fornecedor=None, *, processos=None) -> dict:
+    """
+    Importa os XMLs de `arquivos` ((nome, leitor) de arquivos_zip/arquivos_diretorio).
+    `processos`: tamanho do pool de parse (padrão PROCESSOS_PADRAO; 0/1 = no próprio processo).
+    Devolve {"resumo": {criadas, duplicadas, erros}, "arquivos": [...]}.
+    """
+    relatorio = []
+    fluxo = iter(arquivos)
+    processos = PROCESSOS_PADRAO if processos is None else processos
+    pool = None
+    if processos > 1:
+        pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while True:
+            bloco = list(islice(fluxo, TAMANHO_BLOCO))
+            if not bloco:
+                break
+            _processar_bloco(bloco, pool, loja, fornecedor, relatorio)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    resumo = {"criadas": 0, "duplicadas": 0, "erros": 0}
+    chaves = {"criada": "criadas", "duplicada": "duplicadas", "erro": "erros"}
+    for linha in relatorio:
+        resumo[chaves[linha["status"]]] += 1
+    return {"resumo": resumo, "arquivos": relatorio}
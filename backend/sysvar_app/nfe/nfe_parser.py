@@ -0,0 +1,259 @@
+# sysvar_app/nfe/nfe_parser.py
+"""
+Leitura de NF-e (modelo 55, nfeProc ou NFe) em fluxo.
+
+O XML é lido com iterparse: cabeçalho, itens e totais saem como eventos à
+medida que o documento é percorrido, e cada bloco filho de infNFe (ide, emit,
+det, total, ...) é descartado da árvore assim que processado. A memória fica
+constante, seja a nota de 5 ou de 5.000 itens.
+"""
+import codecs
+import hashlib
+import io
+import tempfile
+from decimal import Decimal, InvalidOperation
+from xml.etree import ElementTree as ET
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+# blocos cujos filhos diretos podem ser descartados depois de lidos
+_CONTAINERS = {"nfeProc", "NFe", "infNFe"}
+
+# EAN ausente na NF-e
+_SEM_GTIN = {"", "SEM GTIN"}
+
+# cópia do XML para NFeEntrada.xml: em memória até este tamanho, depois em disco
+XML_EM_MEMORIA = 1024 * 1024
+# tamanho (em bytes lidos) de cada pedaço de texto devolvido por FonteXML.blocos_texto()
+BLOCO_TEXTO = 1024 * 1024
+
+
+class NFeInvalida(Exception):
+    pass
+
+
+def _tag(elem) -> str:
+    return elem.tag.rsplit("}", 1)[-1]
+
+
+def _filho(elem, nome):
+    for f in elem:
+        if _tag(f) == nome:
+            return f
+    return None
+
+
+def _texto(elem, nome):
+    f = _filho(elem, nome) if elem is not None else None
+    if f is None or f.text is None:
+        return None
+    return f.text.strip() or None
+
+
+def _decimal(elem, nome):
+    v = _texto(elem, nome)
+    if v is None:
+        return None
+    try:
+        d = Decimal(v)
+    except (InvalidOperation, ValueError):
+        d = None
+    if d is None or not d.is_finite():  # NaN/Infinity também são aceitos por Decimal()
+        raise NFeInvalida(f"Valor inválido em <{nome}>: {v!r}.")
+    return d
+
+
+def _data_emissao(ide):
+    # parse_* devolvem None para formato desconhecido e levantam ValueError
+    # para data inexistente (2025-02-30)
+    dh = _texto(ide, "dhEmi")
+    d = None if dh else _texto(ide, "dEmi")  # dEmi: layout 2.00
+    try:
+        if dh:
+            out = parse_datetime(dh)
+        elif d:
+            out = parse_date(d)
+            out = parse_datetime(f"{out.isoformat()}T00:00:00") if out else None
+        else:
+            return None
+    except ValueError:
+        out = None
+    if out is None:
+        raise NFeInvalida(f"Data de emissão inválida: {dh or d!r}.")
+    return out
+
+
+def _ordem(det) -> int:
+    n = det.get("nItem")
+    try:
+        return int(n or 0)
+    except ValueError:
+        raise NFeInvalida(f"Número de item inválido: {n!r}.")
+
+
+def _item(det) -> dict:
+    prod = _filho(det, "prod")
+    if prod is None:
+        raise NFeInvalida(f"Item {det.get('nItem')} sem <prod>.")
+    ean = _texto(prod, "cEAN") or ""
+    if ean.upper() in _SEM_GTIN:
+        ean = _texto(prod, "cEANTrib") or ""
+    return {
+        "ordem": _ordem(det),
+        "cProd": _texto(prod, "cProd") or "",
+        "xProd": (_texto(prod, "xProd") or "")[:255],
+        "cean": None if ean.upper() in _SEM_GTIN else ean,
+        "ncm": _texto(prod, "NCM"),
+        "cfop": _texto(prod, "CFOP"),
+        "uCom": _texto(prod, "uCom"),
+        "qCom": _decimal(prod, "qCom") or Decimal("0"),
+        "vUnCom": _decimal(prod, "vUnCom") or Decimal("0"),
+        "vProd": _decimal(prod, "vProd") or Decimal("0"),
+        "vDesc": _decimal(prod, "vDesc"),
+        "vFrete": _decimal(prod, "vFrete"),
+        "vOutro": _decimal(prod, "vOutro"),
+    }
+
+
+def _totais(icmstot) -> dict:
+    return {
+        "vProd": _decimal(icmstot, "vProd"),
+        "vDesc": _decimal(icmstot, "vDesc"),
+        "vFrete": _decimal(icmstot, "vFrete"),
+        "vOutro": _decimal(icmstot, "vOutro"),
+        "vIPI": _decimal(icmstot, "vIPI"),
+        "vICMSST": _decimal(icmstot, "vST"),
+        "vNF": _decimal(icmstot, "vNF"),
+    }
+
+
+def ler_nfe(fonte):
+    """
+    Lê a NF-e de `fonte` (caminho ou arquivo binário). Gera, na ordem do documento:
+      ("cabecalho", {chave, numero, serie, modelo, dhEmi, cnpj_emitente, razao_emitente})
+          antes do primeiro item;
+      ("item", {ordem, cProd, xProd, cean, ncm, cfop, uCom, qCom, vUnCom, vProd, vDesc, vFrete, vOutro})
+          um por <det>;
+      ("totais", {vProd, vDesc, vFrete, vOutro, vIPI, vICMSST, vNF}) ao fechar <ICMSTot>.
+    Levanta NFeInvalida para XML malformado.
+    """
+    cab = {}
+    cab_emitido = False
+    pilha = []
+    try:
+        for evento, elem in ET.iterparse(fonte, events=("start", "end")):
+            tag = _tag(elem)
+            if evento == "start":
+                if tag == "infNFe":
+                    id_ = elem.get("Id") or ""
+                    cab["chave"] = id_[3:] if id_.startswith("NFe") else id_
+                elif tag in ("det", "total") and not cab_emitido:
+                    cab_emitido = True
+                    yield "cabecalho", cab
+                pilha.append(elem)
+                continue
+
+            pilha.pop()
+            if tag == "ide":
+                cab.update(
+                    numero=_texto(elem, "nNF"),
+                    serie=_texto(elem, "serie"),
+                    modelo=_texto(elem, "mod"),
+                    dhEmi=_data_emissao(elem),
+                )
+            elif tag == "emit":
+                cab.update(
+                    cnpj_emitente=_texto(elem, "CNPJ") or _texto(elem, "CPF"),
+                    razao_emitente=(_texto(elem, "xNome") or "")[:120] or None,
+                )
+            elif tag == "det":
+                yield "item", _item(elem)
+            elif tag == "ICMSTot":
+                yield "totais", _totais(elem)
+            elif tag == "chNFe" and not cab.get("chave") and elem.text:
+                cab["chave"] = elem.text.strip()
+
+            if pilha and _tag(pilha[-1]) in _CONTAINERS:
+                elem.clear()
+                pilha[-1].remove(elem)
+    except ET.ParseError as e:
+        raise NFeInvalida(f"XML inválido: {e}.")
+
+    if not cab_emitido:
+        yield "cabecalho", cab
+
+
+class FonteXML:
+    """
+    Arquivo de entrada para ler_nfe(): calcula o SHA-256 (fingerprint) à medida
+    que o parser lê e, se pedido, copia os bytes para um SpooledTemporaryFile
+    (memória até XML_EM_MEMORIA, depois disco), de onde NFeEntrada.xml é
+    gravado em pedaços por blocos_texto().
+    """
+
+    def __init__(self, arquivo, guardar=False):
+        self._arquivo = arquivo
+        self._hash = hashlib.sha256()
+        self._copia = tempfile.SpooledTemporaryFile(max_size=XML_EM_MEMORIA) if guardar else None
+
+    def read(self, n=-1):
+        dados = self._arquivo.read(n)
+        self._hash.update(dados)
+        if self._copia is not None:
+            self._copia.write(dados)
+        return dados
+
+    @property
+    def fingerprint(self) -> str:
+        return self._hash.hexdigest()
+
+    def blocos_texto(self, tamanho=BLOCO_TEXTO):
+        """O XML guardado, decodificado em pedaços (UTF-8 partido entre pedaços é tratado)."""
+        if self._copia is None:
+            return
+        decodificador = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._copia.seek(0)
+        while True:
+            dados = self._copia.read(tamanho)
+            texto = decodificador.decode(dados, final=not dados)
+            if texto:
+                yield texto
+            if not dados:
+                return
+
+    def fechar(self):
+        if self._copia is not None:
+            self._copia.close()
+            self._copia = None
+
+
+def analisar_xml(dados: bytes) -> dict:
+    """
+    Lê uma NF-e já em memória (importação em lote, em processo separado):
+    {fingerprint, cabecalho, itens: [...], totais}. Não toca no banco.
+    """
+    fonte = FonteXML(io.BytesIO(dados))
+    cab, itens, totais = {}, [], {}
+    for tipo, d in ler_nfe(fonte):
+        if tipo == "item":
+            itens.append(d)
+        elif tipo == "cabecalho":
+            cab = d
+        else:
+            totais = d
+    return {"fingerprint": fonte.fingerprint, "cabecalho": cab, "itens": itens, "totais": totais}
+
+
+def analisar_xml_no_pool(dados: bytes) -> dict:
+    """
+    analisar_xml() para o pool de processos da importação em lote: NF-e
+    inválida (ou qualquer falha inesperada do parse) volta como {"erro": mensagem},
+    sem derrubar o bloco. Fica aqui, num módulo sem modelos, para o processo
+    filho (iniciado por spawn) não precisar do Django configurado.
+    """
+    try:
+        return analisar_xml(dados)
+    except NFeInvalida as e:
+        return {"erro": str(e)}
+    except Exception as e:
+        return {"erro": f"Falha ao ler a NF-e: {e!r}."}
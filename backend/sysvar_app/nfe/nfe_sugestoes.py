@@ -0,0 +1,271 @@
+# sysvar_app/nfe/nfe_sugestoes.py
+"""
+Sugestão de produtos para itens de NF-e sem conciliação (xProd -> Produto).
+
+Índice invertido por trigramas e tokens sobre Produto.Descricao,
+Desc_reduzida e referencia, mantido em memória por processo. A pontuação é o
+coeficiente de Dice dos trigramas, com bônus para tokens inteiros, para a
+referência citada no texto e para produtos que o fornecedor já vinculou em
+FornecedorSkuMap.
+
+Atualização incremental: gravações de Produto (sinais e o cadastro em lote)
+publicam, depois do COMMIT, uma nova versão no cache do Django junto com os
+ids alterados; cada processo reindexa só esses produtos numa cópia do índice
+(as postings tocadas são copiadas antes de mudar) e troca a referência, de
+modo que buscas em andamento seguem no índice antigo, que nunca é alterado.
+Se o processo ficou para trás mais do que as versões guardadas, reconstrói o
+índice inteiro.
+
+Sem cache compartilhado (transacoes.memoria_por_processo) as versões não
+passam de um worker para outro: o índice então é reconstruído quando fica mais
+velho que TTL_SEM_CACHE_COMPARTILHADO. Sugestão defasada por esse tempo só
+deixa de oferecer um produto recém-cadastrado/renomeado; nada é gravado a partir
+dela sem o operador escolher.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from ..models import FornecedorSkuMap, NFeItem, Produto
+from ..transacoes import ColetorPosCommit, memoria_por_processo
+
+CHAVE_VERSAO = 'nfe:sugestoes:versao'
+CHAVE_DELTA = 'nfe:sugestoes:delta:{}'
+TTL_DELTA = 24 * 60 * 60
+MAX_DELTAS = 200
+TTL_SEM_CACHE_COMPARTILHADO = 60
+
+TOP_K = 5
+SCORE_MINIMO = 0.2
+BONUS_TOKEN = 0.05
+BONUS_REFERENCIA = 0.5
+BONUS_FORNECEDOR = 0.15
+# trigramas presentes em mais que esta fração dos produtos não discriminam
+FRACAO_TRIGRAMA_COMUM = 0.2
+
+CAMPOS = ("Idproduto", "referencia", "Descricao", "Desc_reduzida")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# códigos citados no texto, com a pontuação das referências (01.02.03001)
+_CODIGO = re.compile(r"[a-z0-9][a-z0-9./-]*")
+
+_lock = threading.Lock()
+_estado = {'versao': None, 'indice': None, 'carregado_em': 0.0}
+
+
+def normalizar(texto) -> str:
+    t = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in t if not unicodedata.combining(c))
+
+
+def tokens(texto) -> set:
+    return {t for t in _TOKEN.findall(normalizar(texto)) if len(t) > 1}
+
+
+def codigos(texto) -> set:
+    return {c.rstrip("./-") for c in _CODIGO.findall(normalizar(texto))}
+
+
+def trigramas(toks) -> set:
+    out = set()
+    for t in toks:
+        p = f"  {t} "
+        out.update(p[i:i + 3] for i in range(len(p) - 2))
+    return out
+
+
+class IndiceProdutos:
+    """Índice invertido trigrama -> produtos, com atualização por produto."""
+
+    def __init__(self):
+        self.docs = {}  # id -> (referencia, descricao, referencia normalizada, tokens, trigramas)
+        self.por_trigrama = {}
+        # postings ainda divididas com o índice de onde este foi copiado
+        self._compartilhadas = set()
+
+    def _posting(self, t):
+        """Posting do trigrama para alteração (copiada se ainda for do índice de origem)."""
+        posting = self.por_trigrama.get(t)
+        if posting is None:
+            posting = self.por_trigrama[t] = set()
+        elif t in self._compartilhadas:
+            posting = self.por_trigrama[t] = set(posting)
+            self._compartilhadas.discard(t)
+        return posting
+
+    def _remover(self, pid):
+        doc = self.docs.pop(pid, None)
+        if doc is None:
+            return
+        for t in doc[4]:
+            posting = self._posting(t)
+            posting.discard(pid)
+            if not posting:
+                del self.por_trigrama[t]
+
+    def _incluir(self, pid, referencia, descricao, reduzida):
+        toks = tokens(descricao) | tokens(reduzida) | tokens(referencia)
+        tris = trigramas(toks)
+        ref = normalizar(referencia).strip()
+        self.docs[pid] = (referencia, descricao or reduzida or "", ref, toks, tris)
+        for t in tris:
+            self._posting(t).add(pid)
+
+    def carregar(self, ids=None):
+        """Indexa todos os produtos ativos (ids=None) ou reindexa só os ids informados."""
+        qs = Produto.objects.filter(Ativo=True)
+        if ids is not None:
+            ids = set(ids)
+            for pid in ids:
+                self._remover(pid)
+            qs = qs.filter(pk__in=ids)
+        for pid, ref, desc, red in qs.values_list(*CAMPOS).iterator(chunk_size=2000):
+            self._incluir(pid, ref, desc, red)
+
+    def atualizado(self, ids) -> "IndiceProdutos":
+        """Novo índice com os produtos `ids` relidos; este fica intacto para as buscas em andamento."""
+        novo = IndiceProdutos()
+        novo.docs = dict(self.docs)
+        novo.por_trigrama = dict(self.por_trigrama)
+        novo._compartilhadas = set(self.por_trigrama)
+        novo.carregar(ids)
+        return novo
+
+    def buscar(self, texto, k=TOP_K, vinculados=()):
+        """[(score, produto_id)] dos k melhores para o texto."""
+        toks = tokens(texto)
+        tris = trigramas(toks)
+        if not tris:
+            return []
+
+        limite = max(50, int(len(self.docs) * FRACAO_TRIGRAMA_COMUM))
+        uteis = [t for t in tris if 0 < len(self.por_trigrama.get(t, ())) <= limite]
+        if not uteis:
+            uteis = [t for t in tris if self.por_trigrama.get(t)]
+
+        acertos = defaultdict(int)
+        for t in uteis:
+            for pid in self.por_trigrama.get(t, ()):
+                acertos[pid] += 1
+
+        n_q = len(tris)
+        citados = codigos(texto)
+        pontuados = []
+        for pid, n in acertos.items():
+            _, _, ref, doc_toks, doc_tris = self.docs[pid]
+            score = 2.0 * n / (n_q + len(doc_tris))
+            score += BONUS_TOKEN * len(toks & doc_toks)
+            if ref and ref in citados:
+                score += BONUS_REFERENCIA
+            if pid in vinculados:
+                score += BONUS_FORNECEDOR
+            pontuados.append((score, pid))
+        return [(s, pid) for s, pid in heapq.nlargest(k, pontuados) if s >= SCORE_MINIMO]
+
+
+# -------------------------------------------------------------------
+# versão / deltas no cache
+# -------------------------------------------------------------------
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, 0, None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def _publicar(ids):
+    _versao()
+    versao = cache.incr(CHAVE_VERSAO)
+    cache.set(CHAVE_DELTA.format(versao), sorted(ids), TTL_DELTA)
+
+
+_coletor = ColetorPosCommit(_publicar)
+
+
+def marcar_produtos(*ids):
+    """Agenda a reindexação dos produtos em todos os processos depois do COMMIT."""
+    _coletor.marcar(*ids)
+
+
+def indice() -> IndiceProdutos:
+    versao = _versao()
+    with _lock:
+        atual = _estado['versao']
+        idx = _estado['indice']
+        if idx is not None and not memoria_por_processo() \
+                and time.monotonic() - _estado['carregado_em'] > TTL_SEM_CACHE_COMPARTILHADO:
+            idx = None  # outros workers podem ter alterado produtos sem que a versão daqui mude
+
+        if idx is not None and atual == versao:
+            return idx
+
+        alterados = None
+        if idx is not None and atual is not None and 0 < versao - atual <= MAX_DELTAS:
+            deltas = cache.get_many([CHAVE_DELTA.format(v) for v in range(atual + 1, versao + 1)])
+            if len(deltas) == versao - atual:
+                alterados = {pid for ids in deltas.values() for pid in ids}
+
+        if alterados is not None:
+            # cópia + troca de referência: quem está buscando no índice atual não o vê mudar
+            idx = idx.atualizado(alterados)
+        else:
+            idx = IndiceProdutos()
+            idx.carregar()
+            _estado['carregado_em'] = time.monotonic()
+        _estado['versao'] = versao
+        _estado['indice'] = idx
+        return idx
+
+
+# -------------------------------------------------------------------
+# sugestões
+# -------------------------------------------------------------------
+def _vinculados(fornecedor_id) -> set:
+    """Produtos já ligados ao fornecedor em FornecedorSkuMap (direto ou via SKU)."""
+    if not fornecedor_id:
+        return set()
+    vinculados = {
+        prod_id or sku_prod_id
+        for prod_id, sku_prod_id in FornecedorSkuMap.objects
+        .filter(Idfornecedor_id=fornecedor_id, ativo=True)
+        .values_list("Idproduto_id", "Idprodutodetalhe__Idproduto_id")
+    }
+    vinculados.discard(None)
+    return vinculados
+
+
+def _sugestoes(idx, texto, k, vinculados):
+    out = []
+    for score, pid in idx.buscar(texto, k, vinculados):
+        ref, desc = idx.docs[pid][:2]
+        out.append({
+            "produto_id": pid,
+            "referencia": ref,
+            "descricao": desc,
+            "score": round(score, 3),
+            "vinculado": pid in vinculados,
+        })
+    return out
+
+
+def sugerir(texto, k=TOP_K, fornecedor_id=None) -> list:
+    """Candidatos para uma descrição: [{produto_id, referencia, descricao, score, vinculado}]."""
+    return _sugestoes(indice(), texto, k, _vinculados(fornecedor_id))
+
+
+def sugerir_pendentes(nfe, k=TOP_K) -> list:
+    """Sugestões para cada item pendente da nota: [{Idnfeitem, ordem, cProd, xProd, sugestoes}]."""
+    idx = indice()
+    vinculados = _vinculados(nfe.Idfornecedor_id)
+    return [
+        {"Idnfeitem": pk, "ordem": ordem, "cProd": cprod, "xProd": xprod,
+         "sugestoes": _sugestoes(idx, xprod, k, vinculados)}
+        for pk, ordem, cprod, xprod in NFeItem.objects.filter(nfe=nfe, pendente=True)
+        .order_by("ordem").values_list("pk", "ordem", "cProd", "xProd")
+    ]
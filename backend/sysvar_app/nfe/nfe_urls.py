@@ -0,0 +1,13 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
+from .nfe_views import NFeEntradaViewSet
+
+router = DefaultRouter()
+
+router.register(r"nfe-entrada", NFeEntradaViewSet, basename="nfe-entrada")
+
+
+urlpatterns = [
+    path("", include(router.urls)),
+]
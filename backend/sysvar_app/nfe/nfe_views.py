@@ -0,0 +1,168 @@
+# sysvar_app/nfe/nfe_views.py
+import zipfile
+
+from django.db.models import Prefetch
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+
+from ..models import Fornecedor, Loja, NFeEntrada, NFeItem
+from ..serializers import NFeEntradaListSerializer, NFeEntradaSerializer
+from .nfe_conciliacao import NFeNaoConciliavel, conciliar
+from .nfe_ingestao import NFeDuplicada, importar_xml
+from .nfe_lancamento import NFeNaoCancelavel, NFeNaoLancavel, cancelar_nfe, lancar
+from .nfe_lote import arquivos_zip, importar_lote
+from .nfe_parser import NFeInvalida
+from .nfe_sugestoes import TOP_K, sugerir_pendentes
+
+MAX_SUGESTOES = 20
+
+
+def _ve_todas_as_lojas(user) -> bool:
+    return bool(user.is_staff or user.is_superuser or getattr(user, "type", None) == "Admin")
+
+
+class NFeEntradaViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    NF-e de entrada. Usuário comum só enxerga (e importa para) a própria loja.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    filterset_fields = ["Idloja", "Idfornecedor", "status"]
+
+    def get_queryset(self):
+        qs = NFeEntrada.objects.select_related("Idloja", "Idfornecedor").order_by("-Idnfe")
+        if self.action == "list":
+            qs = qs.defer("xml")
+        else:
+            qs = qs.prefetch_related(Prefetch("itens", queryset=NFeItem.objects.order_by("ordem")))
+        user = self.request.user
+        if not _ve_todas_as_lojas(user):
+            qs = qs.filter(Idloja_id=getattr(user, "Idloja_id", None))
+        return qs
+
+    def get_serializer_class(self):
+        return NFeEntradaListSerializer if self.action == "list" else NFeEntradaSerializer
+
+    def _destino_upload(self, request):
+        """(loja, fornecedor, None) ou (None, None, Response de erro)."""
+        loja = Loja.objects.filter(pk=request.data.get("Idloja") or getattr(request.user, "Idloja_id", None)).first()
+        if loja is None:
+            return None, None, Response({"detail": "Loja não encontrada."}, status=status.HTTP_400_BAD_REQUEST)
+        if not _ve_todas_as_lojas(request.user) and loja.pk != getattr(request.user, "Idloja_id", None):
+            return None, None, Response({"detail": "Sem permissão para importar nesta loja."},
+                                        status=status.HTTP_403_FORBIDDEN)
+
+        fornecedor = None
+        if request.data.get("Idfornecedor"):
+            fornecedor = Fornecedor.objects.filter(pk=request.data["Idfornecedor"]).first()
+            if fornecedor is None:
+                return None, None, Response({"detail": "Fornecedor não encontrado."},
+                                            status=status.HTTP_400_BAD_REQUEST)
+        return loja, fornecedor, None
+
+    @action(detail=False, methods=["post"], url_path="upload-xml", parser_classes=[MultiPartParser, FormParser])
+    def upload_xml(self, request):
+        """
+        Importa o XML de uma NF-e (multipart: xml=<arquivo>, Idloja, Idfornecedor opcional).
+        201 com a nota e os itens; 409 se a chave (ou o mesmo arquivo) já foi importada.
+        """
+        arquivo = request.FILES.get("xml") or request.FILES.get("arquivo")
+        if arquivo is None:
+            return Response({"detail": "Envie o arquivo XML no campo 'xml'."}, status=status.HTTP_400_BAD_REQUEST)
+        loja, fornecedor, erro = self._destino_upload(request)
+        if erro:
+            return erro
+
+        try:
+            nfe = importar_xml(arquivo, loja, fornecedor)
+        except NFeInvalida as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except NFeDuplicada as e:
+            return Response(
+                {"detail": str(e), "nfe": NFeEntradaListSerializer(e.nfe).data if e.nfe.pk else None},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        nfe = self.get_queryset().get(pk=nfe.pk)
+        return Response(NFeEntradaSerializer(nfe).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], url_path="upload-lote", parser_classes=[MultiPartParser, FormParser])
+    def upload_lote(self, request):
+        """
+        Importa um ZIP de XMLs (multipart: arquivo=<zip>, Idloja, Idfornecedor opcional).
+        Devolve o resumo e, por arquivo, criada/duplicada/erro.
+        """
+        arquivo = request.FILES.get("arquivo")
+        if arquivo is None:
+            return Response({"detail": "Envie o ZIP no campo 'arquivo'."}, status=status.HTTP_400_BAD_REQUEST)
+        loja, fornecedor, erro = self._destino_upload(request)
+        if erro:
+            return erro
+
+        try:
+            resultado = importar_lote(arquivos_zip(arquivo), loja, fornecedor)
+        except zipfile.BadZipFile:
+            return Response({"detail": "Arquivo não é um ZIP válido."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado)
+
+    @action(detail=True, methods=["post"])
+    def reconciliar(self, request, pk=None):
+        """
+        Concilia os itens com SKUs/produtos (mapa do fornecedor, EAN, EAN adicional)
+        e com itens de pedido em aberto. Itens conciliados à mão são mantidos.
+        """
+        nfe = self.get_object()
+        try:
+            return Response(conciliar(nfe, usuario=request.user))
+        except NFeNaoConciliavel as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+
+    @action(detail=True, methods=["get"])
+    def sugestoes(self, request, pk=None):
+        """
+        Candidatos por descrição (xProd) para os itens ainda pendentes de conciliação.
+        ?k=<n> candidatos por item (padrão 5, máximo 20).
+        """
+        try:
+            k = int(request.query_params.get("k") or TOP_K)
+        except ValueError:
+            return Response({"detail": "Parâmetro 'k' inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        nfe = self.get_object()
+        return Response({"Idnfe": nfe.pk, "itens": sugerir_pendentes(nfe, max(1, min(k, MAX_SUGESTOES)))})
+
+    @action(detail=True, methods=["post"])
+    def confirmar(self, request, pk=None):
+        """
+        Lança a nota: estoque da loja, movimentação (Tipo 'E') e recebimento dos pedidos.
+        Body: {overrides: {Idnfeitem: {tipo, produtodetalhe_id|produto_id, fator?,
+        pedidocompraitem_id?}}, permitir_parcial, save_vendor_map}.
+        400 com "faltantes" se houver item sem destino (ou com quantidade convertida
+        não inteira) e permitir_parcial for falso.
+        """
+        nfe = self.get_object()
+        overrides = request.data.get("overrides") or {}
+        if not isinstance(overrides, dict):
+            return Response({"detail": "'overrides' deve ser um objeto {Idnfeitem: destino}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            resultado = lancar(
+                nfe, request.user,
+                overrides=overrides,
+                permitir_parcial=bool(request.data.get("permitir_parcial")),
+                salvar_vinculos=bool(request.data.get("save_vendor_map")),
+            )
+        except NFeNaoLancavel as e:
+            corpo = {"detail": str(e)}
+            if e.faltantes is not None:
+                corpo["faltantes"] = e.faltantes
+            return Response(corpo, status=status.HTTP_409_CONFLICT if e.conflito else status.HTTP_400_BAD_REQUEST)
+        return Response(resultado)
+
+    @action(detail=True, methods=["post"])
+    def cancelar(self, request, pk=None):
+        """Cancela a nota ainda não lançada; 409 se já estiver lançada."""
+        try:
+            return Response(cancelar_nfe(self.get_object()))
+        except NFeNaoCancelavel as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
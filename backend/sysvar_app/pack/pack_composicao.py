@@ -0,0 +1,163 @@
+# sysvar_app/pack/pack_composicao.py
+"""
+Composição dos packs (pack -> {tamanho: qtd} e total de peças), mantida em
+memória por processo.
+
+Importações, gravações de itens de pedido e a explosão pack -> SKU consultam a
+composição o tempo todo; o mapa é carregado com uma única consulta e
+reaproveitado enquanto a versão guardada no cache do Django não mudar.
+Alterações em Pack/PackItem (sinais e as gravações em lote do PackSerializer)
+trocam a versão depois do COMMIT.
+
+Cada composição guarda o `atualizado_em` do pack: quem já tem a instância de
+Pack em mãos (serializers) passa por composicao(pack), que recarrega só aquele
+pack se a data não bater — sem depender de a versão já ter sido trocada.
+
+A memória só é usada com cache compartilhado (transacoes.memoria_por_processo);
+sem ele, e dentro da transação que acabou de alterar packs, a composição é lida
+do banco (o pack pedido ou, para os mapas, todos numa consulta).
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import PackItem
+from ..transacoes import ColetorPosCommit, memoria_por_processo
+
+CHAVE_VERSAO = 'pack:composicao:versao'
+
+_estado = {'versao': None, 'composicoes': {}, 'totais': {}}
+_lock = threading.Lock()
+
+
+class ComposicaoPack:
+    """Grade de um pack: quantidade por tamanho e total de peças."""
+
+    __slots__ = ('pack_id', 'atualizado_em', 'tamanhos', 'total')
+
+    def __init__(self, pack_id, atualizado_em, tamanhos):
+        self.pack_id = pack_id
+        self.atualizado_em = atualizado_em
+        self.tamanhos = tamanhos
+        self.total = sum(tamanhos.values())
+
+    def quantidade(self, n_packs) -> int:
+        """Total de peças de `n_packs` packs."""
+        return self.total * int(n_packs or 0)
+
+    def expandir(self, n_packs) -> dict:
+        """{tamanho_id: peças} para `n_packs` packs."""
+        n = int(n_packs or 0)
+        return {tamanho_id: qtd * n for tamanho_id, qtd in self.tamanhos.items()}
+
+    def __repr__(self):
+        return f"<ComposicaoPack {self.pack_id} {self.total} pç>"
+
+
+def _versao():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def _usar_memoria() -> bool:
+    # a versão só muda no COMMIT: a transação que alterou packs lê do banco
+    return memoria_por_processo() and not _coletor.pendente()
+
+
+def _carregar(pack_ids=None) -> dict:
+    qs = PackItem.objects.all()
+    if pack_ids is not None:
+        qs = qs.filter(pack_id__in=pack_ids)
+    tamanhos = defaultdict(dict)
+    datas = {}
+    for pack_id, atualizado_em, tamanho_id, qtd in qs.values_list('pack_id', 'pack__atualizado_em', 'tamanho_id', 'qtd'):
+        tamanhos[pack_id][tamanho_id] = int(qtd or 0)
+        datas[pack_id] = atualizado_em
+    return {pack_id: ComposicaoPack(pack_id, datas[pack_id], grade) for pack_id, grade in tamanhos.items()}
+
+
+def composicoes_do_banco(pack_ids=None) -> dict:
+    """{pack_id: ComposicaoPack} lido agora do banco, sem passar pela memória."""
+    return _carregar(pack_ids)
+
+
+def composicoes() -> dict:
+    """{pack_id: ComposicaoPack}. Pack sem itens não aparece no mapa."""
+    if not _usar_memoria():
+        return _carregar()
+    versao = _versao()
+    with _lock:
+        if _estado['versao'] == versao:
+            return _estado['composicoes']
+
+    carregadas = _carregar()
+    with _lock:
+        _estado['versao'] = versao
+        _estado['composicoes'] = carregadas
+        _estado['totais'] = {pack_id: c.total for pack_id, c in carregadas.items()}
+    return carregadas
+
+
+def composicao(pack):
+    """
+    ComposicaoPack de um pack (instância ou id), ou None se não tiver itens.
+    Com a instância, confere `atualizado_em` e recarrega o pack se divergir.
+    """
+    if pack is None:
+        return None
+    pack_id = getattr(pack, 'pk', pack)
+    if not _usar_memoria():
+        return _carregar([pack_id]).get(pack_id)
+    atual = composicoes().get(pack_id)
+    atualizado_em = getattr(pack, 'atualizado_em', None)
+    if atualizado_em is None or (atual is not None and atual.atualizado_em == atualizado_em):
+        return atual
+
+    atual = _carregar([pack_id]).get(pack_id)
+    if transaction.get_connection().in_atomic_block:
+        # pode ser leitura de uma gravação ainda não confirmada; não guarda
+        return atual
+    with _lock:
+        # cópia: o dicionário em uso por outras threads não muda de tamanho no meio de uma leitura
+        novas = dict(_estado['composicoes'])
+        novas.pop(pack_id, None)
+        if atual is not None:
+            novas[pack_id] = atual
+        _estado['composicoes'] = novas
+        _estado['totais'] = {pid: c.total for pid, c in novas.items()}
+    return atual
+
+
+def mapa_totais_packs() -> dict:
+    """{pack_id: total de peças}. Pack sem itens não aparece no mapa."""
+    if not _usar_memoria():
+        return {pack_id: c.total for pack_id, c in _carregar().items()}
+    composicoes()
+    with _lock:
+        return _estado['totais']
+
+
+def qtd_total_pack(pack, n_packs) -> int:
+    """Peças de `n_packs` packs (0 sem pack, sem n_packs ou pack sem itens)."""
+    c = composicao(pack)
+    if c is None or not n_packs:
+        return 0
+    return c.quantidade(n_packs)
+
+
+def invalidar_packs(*_):
+    cache.set(CHAVE_VERSAO, time.time_ns(), None)
+
+
+_coletor = ColetorPosCommit(invalidar_packs)
+
+
+def marcar_packs():
+    """Invalida o mapa em todos os processos depois do COMMIT."""
+    _coletor.marcar('packs')
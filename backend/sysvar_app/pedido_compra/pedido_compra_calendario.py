@@ -0,0 +1,87 @@
+# sysvar_app/pedido_compra/pedido_compra_calendario.py
+"""
+Calendário de recebimento: entregas programadas por dia, loja e fornecedor.
+
+PedidoCompraEntrega guarda cópia de loja, fornecedor e status do pedido
+(índices por loja/data/status e data/status), então o calendário de um mês
+para todas as lojas é uma única agregação sobre a tabela de entregas. A cópia
+é preenchida no pre_save da entrega e sincronizada quando o cabeçalho muda
+(sinais em sysvar_app/signals.py; rotinas com queryset.update() chamam
+sincronizar_entregas()).
+"""
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from ..models import Fornecedor, Loja, PedidoCompra, PedidoCompraEntrega
+from .pedido_compra_saldos import STATUS_EM_ABERTO
+
+
+def preencher_cabecalho(entrega: PedidoCompraEntrega):
+    """Copia loja/fornecedor/status do pedido para a entrega (antes de salvar)."""
+    pedido = entrega.pedido
+    entrega.Idloja_id = pedido.Idloja_id
+    entrega.Idfornecedor_id = pedido.Idfornecedor_id
+    entrega.status_pedido = pedido.Status
+
+
+def sincronizar_entregas(*pedidos):
+    """Reaplica loja/fornecedor/status dos pedidos em todas as suas entregas (um UPDATE)."""
+    pedidos = [p for p in pedidos if p]
+    if not pedidos:
+        return 0
+    cabecalho = PedidoCompra.objects.filter(pk=OuterRef("pedido_id"))
+    return PedidoCompraEntrega.objects.filter(pedido_id__in=pedidos).update(
+        Idloja_id=Subquery(cabecalho.values("Idloja_id")[:1]),
+        Idfornecedor_id=Subquery(cabecalho.values("Idfornecedor_id")[:1]),
+        status_pedido=Subquery(cabecalho.values("Status")[:1]),
+    )
+
+
+def calendario(de, ate, lojas=None, fornecedores=None, status=STATUS_EM_ABERTO) -> dict:
+    """
+    Quantidade prevista por (data, loja, fornecedor) entre `de` e `ate`,
+    mais o total por (data, loja).
+    """
+    qs = PedidoCompraEntrega.objects.filter(data_entrega__gte=de, data_entrega__lte=ate, status_pedido__in=status)
+    if lojas:
+        qs = qs.filter(Idloja_id__in=lojas)
+    if fornecedores:
+        qs = qs.filter(Idfornecedor_id__in=fornecedores)
+
+    linhas = list(
+        qs.values("data_entrega", "Idloja_id", "Idfornecedor_id")
+        .annotate(quantidade=Sum("quantidade_prevista"), pedidos=Count("pedido_id", distinct=True), entregas=Count("pk"))
+        .order_by("data_entrega", "Idloja_id", "Idfornecedor_id")
+    )
+
+    nomes_loja = dict(Loja.objects.filter(pk__in={l["Idloja_id"] for l in linhas}).values_list("pk", "nome_loja"))
+    nomes_forn = dict(
+        Fornecedor.objects.filter(pk__in={l["Idfornecedor_id"] for l in linhas}).values_list("pk", "Nome_fornecedor")
+    )
+
+    por_dia = defaultdict(int)
+    itens = []
+    for l in linhas:
+        qtd = l["quantidade"] or 0
+        por_dia[(l["data_entrega"], l["Idloja_id"])] += qtd
+        itens.append({
+            "data": l["data_entrega"],
+            "loja_id": l["Idloja_id"],
+            "loja_nome": nomes_loja.get(l["Idloja_id"], ""),
+            "fornecedor_id": l["Idfornecedor_id"],
+            "fornecedor_nome": nomes_forn.get(l["Idfornecedor_id"], ""),
+            "quantidade": qtd,
+            "pedidos": l["pedidos"],
+            "entregas": l["entregas"],
+        })
+
+    return {
+        "de": de,
+        "ate": ate,
+        "itens": itens,
+        "totais": [
+            {"data": d, "loja_id": loja, "loja_nome": nomes_loja.get(loja, ""), "quantidade": q}
+            for (d, loja), q in sorted(por_dia.items(), key=lambda kv: (kv[0][0], kv[0][1] or 0))
+        ],
+    }
@@ -0,0 +1,81 @@
+# sysvar_app/pedido_compra/pedido_compra_duplicacao.py
+"""
+Duplicação de pedidos de compra (PedidoCompraViewSet.duplicar).
+
+Os itens da origem são lidos uma vez com values() — sem carregar Produto, SKU
+ou Pack — e copiados para todos os destinos num único bulk_create. Cada
+destino (loja + datas) vira um pedido novo em AB.
+"""
+from decimal import Decimal
+
+from django.utils import timezone
+
+from ..models import PedidoCompra, PedidoCompraItem
+from .pedido_compra_saldos import marcar_saldo
+
+ZERO = Decimal("0.00")
+
+CAMPOS_ITEM = (
+    "Idproduto_id",
+    "Idprodutodetalhe_id",
+    "pack_id",
+    "Qtp_pc",
+    "valorunitario",
+    "Desconto",
+    "unid_compra",
+    "fator_conv",
+    "n_packs",
+    "qtd_total_pack",
+    "data_entrega_prevista",
+)
+
+
+def _itens_origem(origem: PedidoCompra):
+    itens = []
+    total = ZERO
+    for row in PedidoCompraItem.objects.filter(Idpedidocompra=origem).order_by("pk").values(*CAMPOS_ITEM):
+        row["Desconto"] = row["Desconto"] or Decimal("0")
+        row["fator_conv"] = row["fator_conv"] or Decimal("1")
+        total_item = row["Qtp_pc"] * row["valorunitario"] - row["Desconto"]
+        row["Total_item"] = total_item if total_item > 0 else ZERO
+        total += row["Total_item"]
+        itens.append(row)
+    return itens, total
+
+
+def duplicar_pedido(origem: PedidoCompra, destinos=None):
+    """
+    Cria um pedido por destino ({"loja": id, "Datapedido": date, "Dataentrega": date},
+    chaves opcionais) com cópia dos itens da origem. Sem destinos, uma cópia
+    para a mesma loja. Devolve (pedidos criados, itens copiados por pedido).
+    """
+    hoje = timezone.localdate()
+    destinos = destinos or [{}]
+    itens, total = _itens_origem(origem)
+
+    novos = []
+    for d in destinos:
+        novos.append(PedidoCompra.objects.create(
+            Idfornecedor_id=origem.Idfornecedor_id,
+            Idloja_id=d.get("loja") or origem.Idloja_id,
+            Datapedido=d.get("Datapedido") or hoje,
+            Dataentrega=d.get("Dataentrega", origem.Dataentrega),
+            Valorpedido=total,
+            Status=PedidoCompra.StatusChoices.AB,
+            Documento=None,
+            data_nf=None,
+            Chave=None,
+            tolerancia_qtd_percent=origem.tolerancia_qtd_percent,
+            tolerancia_preco_percent=origem.tolerancia_preco_percent,
+            tipo_pedido=origem.tipo_pedido,
+        ))
+
+    if itens:
+        PedidoCompraItem.objects.bulk_create(
+            [PedidoCompraItem(Idpedidocompra_id=novo.pk, Qtd_recebida=0, **row) for novo in novos for row in itens],
+            batch_size=1000,
+        )
+        # bulk_create não dispara os sinais do saldo em pedido
+        marcar_saldo(*{row["Idproduto_id"] for row in itens})
+
+    return novos, len(itens)
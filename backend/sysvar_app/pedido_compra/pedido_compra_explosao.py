@@ -0,0 +1,168 @@
+# sysvar_app/pedido_compra/pedido_compra_explosao.py
+"""
+Explosão dos itens de pack (pedidos de revenda) em SKUs.
+
+Cada item com pack e n_packs vira uma linha por tamanho da composição do pack
+(pack/pack_composicao.py), na cor do SKU informado no item — ou na única cor
+do produto, quando ele só tem uma. O SKU (ProdutoDetalhe) de cada
+produto/tamanho/cor é resolvido com uma consulta IN por lote de pedidos.
+
+O resultado pode ser gravado em PedidoCompraItemSku; pedidos já gravados são
+explodidos de novo sempre que o recálculo de totais (pedido_compra_totais)
+passa por eles e, depois do COMMIT, quando a composição de um pack que eles
+usam muda (marcar_explosoes_packs, chamado pelos sinais de Pack/PackItem).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from ..models import PedidoCompraItem, PedidoCompraItemSku, ProdutoDetalhe
+from ..pack.pack_composicao import composicoes, composicoes_do_banco
+from ..transacoes import ColetorPosCommit
+
+LOTE_PEDIDOS = 200
+
+
+def _explodir_lote(pedidos, comp):
+    itens = list(
+        PedidoCompraItem.objects
+        .filter(Idpedidocompra_id__in=pedidos, pack__isnull=False, n_packs__gt=0)
+        .order_by("Idpedidocompra_id", "pk")
+        .values_list("Idpedidocompraitem", "Idpedidocompra_id", "Idproduto_id",
+                     "Idprodutodetalhe_id", "pack_id", "n_packs", "Qtp_pc")
+    )
+    if not itens:
+        return [], []
+
+    cores_item = dict(
+        ProdutoDetalhe.objects
+        .filter(pk__in={it[3] for it in itens if it[3]})
+        .values_list("Idprodutodetalhe", "Idcor_id")
+    )
+    tamanhos = set()
+    for it in itens:
+        c = comp.get(it[4])
+        if c is not None:
+            tamanhos.update(c.tamanhos)
+
+    skus, cores_produto = {}, defaultdict(set)
+    for sku_id, ean, prod_id, tam_id, cor_id in (
+        ProdutoDetalhe.objects
+        .filter(Idproduto_id__in={it[2] for it in itens}, Idtamanho_id__in=tamanhos)
+        .values_list("Idprodutodetalhe", "CodigodeBarra", "Idproduto_id", "Idtamanho_id", "Idcor_id")
+    ):
+        skus[(prod_id, tam_id, cor_id)] = (sku_id, ean)
+        cores_produto[prod_id].add(cor_id)
+
+    linhas, pendencias = [], []
+    for item_id, pedido_id, prod_id, sku_item, pack_id, n_packs, qtd_item in itens:
+        c = comp.get(pack_id)
+        if c is None:
+            pendencias.append({"pedido": pedido_id, "item": item_id, "motivo": "Pack sem itens."})
+            continue
+
+        if sku_item:
+            cor = cores_item.get(sku_item)
+        elif len(cores_produto[prod_id]) == 1:
+            cor = next(iter(cores_produto[prod_id]))
+        else:
+            cor = None
+            pendencias.append({"pedido": pedido_id, "item": item_id,
+                               "motivo": "Cor não definida: informe o SKU do item (produto com várias cores)."})
+
+        sem_sku = []
+        for tam_id, qtd in c.expandir(n_packs).items():
+            sku_id, ean = skus.get((prod_id, tam_id, cor), (None, None)) if cor else (None, None)
+            if cor and sku_id is None:
+                sem_sku.append(tam_id)
+            linhas.append({
+                "pedido": pedido_id,
+                "item": item_id,
+                "produto": prod_id,
+                "tamanho": tam_id,
+                "cor": cor,
+                "sku": sku_id,
+                "ean": ean,
+                "quantidade": qtd,
+            })
+        if sem_sku:
+            pendencias.append({"pedido": pedido_id, "item": item_id, "tamanhos": sem_sku,
+                               "motivo": "SKU não cadastrado para tamanho/cor."})
+        if qtd_item is not None and c.quantidade(n_packs) != qtd_item:
+            pendencias.append({"pedido": pedido_id, "item": item_id,
+                               "motivo": f"Quantidade do item ({qtd_item}) difere da composição atual do pack "
+                                         f"({c.quantidade(n_packs)})."})
+    return linhas, pendencias
+
+
+def explodir_pedidos(pedidos, comp=None):
+    """
+    Explode os itens de pack dos pedidos (ids). Devolve (linhas, pendências);
+    linha = {pedido, item, produto, tamanho, cor, sku, ean, quantidade}.
+    `comp`: mapa {pack_id: ComposicaoPack} a usar (padrão: composicoes()).
+    """
+    pedidos = sorted({int(p) for p in pedidos if p})
+    if comp is None:
+        comp = composicoes()
+    linhas, pendencias = [], []
+    for i in range(0, len(pedidos), LOTE_PEDIDOS):
+        l, p = _explodir_lote(pedidos[i:i + LOTE_PEDIDOS], comp)
+        linhas += l
+        pendencias += p
+    return linhas, pendencias
+
+
+@transaction.atomic
+def gravar_explosao(pedidos, comp=None):
+    """Regrava PedidoCompraItemSku dos pedidos. Devolve (linhas, pendências) como explodir_pedidos()."""
+    pedidos = sorted({int(p) for p in pedidos if p})
+    linhas, pendencias = explodir_pedidos(pedidos, comp)
+    PedidoCompraItemSku.objects.filter(pedido_id__in=pedidos).delete()
+    PedidoCompraItemSku.objects.bulk_create(
+        [
+            PedidoCompraItemSku(
+                item_id=l["item"],
+                pedido_id=l["pedido"],
+                Idproduto_id=l["produto"],
+                Idtamanho_id=l["tamanho"],
+                Idcor_id=l["cor"],
+                Idprodutodetalhe_id=l["sku"],
+                quantidade=l["quantidade"],
+            )
+            for l in linhas
+        ],
+        batch_size=1000,
+    )
+    return linhas, pendencias
+
+
+def atualizar_explosoes(pedidos):
+    """Explode de novo só os pedidos que já têm explosão gravada."""
+    gravados = set(
+        PedidoCompraItemSku.objects.filter(pedido_id__in=pedidos)
+        .order_by().values_list("pedido_id", flat=True).distinct()
+    )
+    if gravados:
+        gravar_explosao(gravados)
+
+
+def atualizar_explosoes_packs(pack_ids):
+    """Explode de novo os pedidos com explosão gravada que usam estes packs."""
+    pedidos = sorted(
+        PedidoCompraItemSku.objects.filter(item__pack_id__in=pack_ids)
+        .order_by().values_list("pedido_id", flat=True).distinct()
+    )
+    if not pedidos:
+        return
+    # composição lida agora: a versão da memória pode ainda não ter sido trocada
+    comp = composicoes_do_banco()
+    for i in range(0, len(pedidos), LOTE_PEDIDOS):
+        gravar_explosao(pedidos[i:i + LOTE_PEDIDOS], comp)
+
+
+_coletor = ColetorPosCommit(atualizar_explosoes_packs)
+
+
+def marcar_explosoes_packs(*pack_ids):
+    """Agenda, para depois do COMMIT, a nova explosão dos pedidos que usam os packs."""
+    _coletor.marcar(*pack_ids)
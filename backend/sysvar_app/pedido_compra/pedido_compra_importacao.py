@@ -0,0 +1,300 @@
+# sysvar_app/pedido_compra/pedido_compra_importacao.py
+"""
+Importação de itens de pedido de compra em massa (CSV ou JSON).
+
+As linhas são lidas em fluxo e processadas em blocos: cada bloco resolve
+produtos, SKUs e packs com poucas consultas IN, valida em memória com as mesmas
+regras de PedidoCompraItemSerializer e grava com bulk_create. Packs são
+expandidos pelo mapa pack -> total de peças (pack/pack_composicao.py).
+Total e parcelas do pedido são recalculados uma vez, no COMMIT.
+"""
+import csv
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from ..models import PedidoCompra, PedidoCompraItem, Produto, ProdutoDetalhe
+from ..pack.pack_composicao import mapa_totais_packs
+from .pedido_compra_saldos import marcar_saldo
+from .pedido_compra_totais import marcar_pedidos
+
+ZERO = Decimal("0")
+UM = Decimal("1")
+TAMANHO_BLOCO = 1000
+
+# nome aceito na planilha/JSON -> campo do item
+ALIASES = {
+    "idproduto": "produto",
+    "produto": "produto",
+    "referencia": "referencia",
+    "idprodutodetalhe": "sku",
+    "sku": "sku",
+    "ean": "ean",
+    "ean13": "ean",
+    "codigodebarra": "ean",
+    "pack": "pack",
+    "n_packs": "n_packs",
+    "qtp_pc": "qtd",
+    "qtd": "qtd",
+    "quantidade": "qtd",
+    "valorunitario": "valorunitario",
+    "preco": "valorunitario",
+    "desconto": "desconto",
+    "unid_compra": "unid_compra",
+    "fator_conv": "fator_conv",
+    "data_entrega_prevista": "data_entrega_prevista",
+}
+
+
+# -------------------------------------------------------------------
+# leitura
+# -------------------------------------------------------------------
+def _normalizar(linha: dict) -> dict:
+    out = {}
+    for k, v in linha.items():
+        campo = ALIASES.get(str(k or "").strip().lower())
+        if campo is None:
+            continue
+        if isinstance(v, str):
+            v = v.strip()
+        if v in ("", None):
+            continue
+        out[campo] = v
+    return out
+
+
+def ler_csv(arquivo):
+    """Gera (nº da linha, dict) de um CSV (separador ',' ou ';'), sem carregar o arquivo inteiro."""
+    texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+    amostra = texto.readline()
+    dialeto = ";" if amostra.count(";") > amostra.count(",") else ","
+    cabecalho = next(csv.reader([amostra], delimiter=dialeto), [])
+    leitor = csv.DictReader(texto, fieldnames=cabecalho, delimiter=dialeto)
+    for linha in leitor:
+        yield leitor.line_num + 1, linha
+
+
+def ler_json(itens):
+    for n, linha in enumerate(itens, start=1):
+        yield n, linha
+
+
+# -------------------------------------------------------------------
+# conversões
+# -------------------------------------------------------------------
+def _decimal(v):
+    if isinstance(v, Decimal):
+        return v
+    if isinstance(v, (int, float)):
+        return Decimal(str(v))
+    s = str(v).strip()
+    if "," in s:
+        # 1.234,56 -> 1234.56
+        s = s.replace(".", "").replace(",", ".")
+    return Decimal(s)
+
+
+def _inteiro(v):
+    d = _decimal(v)
+    if d != d.to_integral_value():
+        raise InvalidOperation
+    return int(d)
+
+
+def _id(v):
+    try:
+        return _inteiro(v)
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+# -------------------------------------------------------------------
+# resolução em bloco
+# -------------------------------------------------------------------
+def _resolver(bloco):
+    prod_ids, refs, sku_ids, eans = set(), set(), set(), set()
+    for _, d in bloco:
+        if "produto" in d:
+            prod_ids.add(_id(d["produto"]))
+        elif "referencia" in d:
+            refs.add(str(d["referencia"]))
+        if "sku" in d:
+            sku_ids.add(_id(d["sku"]))
+        elif "ean" in d:
+            eans.add(str(d["ean"]))
+    prod_ids.discard(None)
+    sku_ids.discard(None)
+
+    campos = ("Idproduto", "referencia", "Tipoproduto", "Ativo")
+    produtos, por_ref = {}, {}
+    if prod_ids:
+        for p in Produto.objects.filter(pk__in=prod_ids).values(*campos):
+            produtos[p["Idproduto"]] = p
+    if refs:
+        for p in Produto.objects.filter(referencia__in=refs).values(*campos):
+            produtos[p["Idproduto"]] = p
+            por_ref[p["referencia"]] = p
+
+    skus, por_ean = {}, {}
+    campos_sku = ("Idprodutodetalhe", "CodigodeBarra", "Idproduto_id")
+    if sku_ids:
+        for s in ProdutoDetalhe.objects.filter(pk__in=sku_ids).values(*campos_sku):
+            skus[s["Idprodutodetalhe"]] = s
+    if eans:
+        for s in ProdutoDetalhe.objects.filter(CodigodeBarra__in=eans).values(*campos_sku):
+            por_ean[s["CodigodeBarra"]] = s
+    return produtos, por_ref, skus, por_ean
+
+
+def _validar(pedido, d, produtos, por_ref, skus, por_ean, totais_packs):
+    """Devolve (kwargs do PedidoCompraItem, None) ou (None, erros)."""
+    erros = {}
+
+    if "produto" in d:
+        prod = produtos.get(_id(d["produto"]))
+    elif "referencia" in d:
+        prod = por_ref.get(str(d["referencia"]))
+    else:
+        return None, {"Idproduto": "Informe o produto (Idproduto ou referencia)."}
+    if prod is None:
+        return None, {"Idproduto": "Produto não encontrado."}
+    if prod["Ativo"] is False:
+        return None, {"Idproduto": "Produto inativo."}
+
+    tipo_prod = (prod["Tipoproduto"] or "").strip()
+    tipo_ped = (pedido.tipo_pedido or "").strip().lower()
+    if tipo_ped == PedidoCompra.TipoPedido.REVENDA and tipo_prod != "1":
+        return None, {"Idproduto": "Somente produtos de REVenda neste pedido."}
+    if tipo_ped == PedidoCompra.TipoPedido.CONSUMO and tipo_prod != "2":
+        return None, {"Idproduto": "Somente produtos de USO/CONSUMO neste pedido."}
+
+    sku = None
+    if "sku" in d:
+        sku = skus.get(_id(d["sku"]))
+        if sku is None:
+            erros["Idprodutodetalhe"] = "SKU não encontrado."
+    elif "ean" in d:
+        sku = por_ean.get(str(d["ean"]))
+        if sku is None:
+            erros["Idprodutodetalhe"] = f"EAN {d['ean']} não encontrado."
+    if sku and sku["Idproduto_id"] != prod["Idproduto"]:
+        erros["Idprodutodetalhe"] = "SKU não pertence ao Produto informado."
+
+    try:
+        pu = _decimal(d["valorunitario"]) if "valorunitario" in d else None
+        if pu is None:
+            erros["valorunitario"] = "Preço unitário é obrigatório."
+        elif pu < ZERO:
+            erros["valorunitario"] = "Preço unitário não pode ser negativo."
+    except (InvalidOperation, ValueError):
+        erros["valorunitario"] = "Valor inválido."
+    try:
+        desc = _decimal(d.get("desconto", ZERO))
+        if desc < ZERO:
+            erros["Desconto"] = "Desconto não pode ser negativo."
+    except (InvalidOperation, ValueError):
+        erros["Desconto"] = "Valor inválido."
+    try:
+        fator = _decimal(d.get("fator_conv", UM))
+        if fator <= ZERO:
+            erros["fator_conv"] = "Fator de conversão deve ser > 0."
+    except (InvalidOperation, ValueError):
+        erros["fator_conv"] = "Valor inválido."
+
+    pack_id = n_packs = qtd_pack = None
+    if tipo_ped == PedidoCompra.TipoPedido.REVENDA:
+        pack_id = _id(d.get("pack"))
+        n_packs = _id(d.get("n_packs"))
+        if pack_id is None:
+            erros["pack"] = "Pack é obrigatório para pedido de revenda."
+        elif not totais_packs.get(pack_id):
+            erros["pack"] = "Pack não encontrado ou sem itens."
+        if not n_packs or n_packs <= 0:
+            erros["n_packs"] = "Número de packs deve ser > 0 para revenda."
+        if not erros.get("pack") and not erros.get("n_packs"):
+            qtd = qtd_pack = totais_packs[pack_id] * n_packs
+    else:
+        qtd = _id(d.get("qtd"))
+        if qtd is None or qtd <= 0:
+            erros["Qtp_pc"] = "Quantidade é obrigatória para uso/consumo."
+
+    entrega = d.get("data_entrega_prevista")
+    if entrega is not None and not isinstance(entrega, date):
+        try:
+            entrega = date.fromisoformat(str(entrega))
+        except ValueError:
+            erros["data_entrega_prevista"] = "Data inválida (use AAAA-MM-DD)."
+
+    if erros:
+        return None, erros
+
+    bruto = Decimal(qtd) * pu
+    if desc > bruto and bruto > ZERO:
+        return None, {"Desconto": "Desconto não pode exceder o total bruto do item."}
+    total = bruto - desc
+
+    return {
+        "Idpedidocompra_id": pedido.pk,
+        "Idproduto_id": prod["Idproduto"],
+        "Idprodutodetalhe_id": sku["Idprodutodetalhe"] if sku else None,
+        "Qtp_pc": qtd,
+        "valorunitario": pu,
+        "Desconto": desc,
+        "Total_item": total if total > ZERO else ZERO,
+        "unid_compra": d.get("unid_compra"),
+        "fator_conv": fator,
+        "pack_id": pack_id,
+        "n_packs": n_packs,
+        "qtd_total_pack": qtd_pack,
+        "data_entrega_prevista": entrega,
+    }, None
+
+
+# -------------------------------------------------------------------
+# importação
+# -------------------------------------------------------------------
+def importar_itens(pedido: PedidoCompra, linhas, *, parcial=False) -> dict:
+    """
+    Importa (nº da linha, dict) para o pedido. Sem `parcial`, qualquer erro
+    desfaz a importação inteira; com `parcial`, grava as linhas válidas.
+    """
+    totais_packs = mapa_totais_packs()
+    resumo = {"pedido": pedido.pk, "linhas": 0, "criados": 0, "quantidade": 0, "valor": ZERO, "erros": []}
+    fluxo = iter(linhas)
+
+    with transaction.atomic():
+        while True:
+            bloco = [(n, _normalizar(d) if isinstance(d, dict) else None) for n, d in islice(fluxo, TAMANHO_BLOCO)]
+            if not bloco:
+                break
+            resumo["linhas"] += len(bloco)
+            validos = [(n, d) for n, d in bloco if d is not None]
+            resumo["erros"].extend({"linha": n, "erros": {"detail": "Linha inválida."}} for n, d in bloco if d is None)
+
+            mapas = _resolver(validos)
+            novos = []
+            for n, d in validos:
+                kwargs, erros = _validar(pedido, d, *mapas, totais_packs)
+                if erros:
+                    resumo["erros"].append({"linha": n, "erros": erros})
+                    continue
+                novos.append(PedidoCompraItem(**kwargs))
+                resumo["quantidade"] += kwargs["Qtp_pc"]
+                resumo["valor"] += kwargs["Total_item"]
+
+            if novos and (parcial or not resumo["erros"]):
+                PedidoCompraItem.objects.bulk_create(novos, batch_size=TAMANHO_BLOCO)
+                resumo["criados"] += len(novos)
+                # bulk_create não dispara os sinais do saldo em pedido
+                marcar_saldo(*{it.Idproduto_id for it in novos})
+
+        if resumo["erros"] and not parcial:
+            transaction.set_rollback(True)
+            resumo.update(criados=0, quantidade=0, valor=ZERO)
+        elif resumo["criados"]:
+            marcar_pedidos(pedido.pk)
+
+    return resumo
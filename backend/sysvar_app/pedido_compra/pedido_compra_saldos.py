@@ -0,0 +1,167 @@
+# sysvar_app/pedido_compra/pedido_compra_saldos.py
+"""
+Manutenção de SaldoPedidoCompra (quanto de cada SKU ainda está em pedido, por loja).
+
+O saldo é recalculado por produto: apaga as linhas dos produtos marcados e
+regrava a partir dos itens de pedidos em aberto e dos recebimentos. Gravações
+por save()/delete() de PedidoCompra, PedidoCompraItem e RecebimentoPCItem são
+cobertas pelos sinais em sysvar_app/signals.py; rotinas com bulk_create/update
+devem chamar marcar_saldo() ou marcar_saldo_pedidos().
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from ..models import (
+    PedidoCompra,
+    PedidoCompraItem,
+    Produto,
+    ProdutoDetalhe,
+    RecebimentoPCItem,
+    SaldoPedidoCompra,
+)
+from ..transacoes import ColetorPosCommit
+
+ZERO = Decimal("0")
+CENTAVO = Decimal("0.01")
+
+# pedidos cujo saldo ainda pode chegar
+STATUS_EM_ABERTO = (
+    PedidoCompra.StatusChoices.AB,
+    PedidoCompra.StatusChoices.AP,
+    PedidoCompra.StatusChoices.RC,
+    PedidoCompra.StatusChoices.PA,
+)
+
+LOTE_PRODUTOS = 500
+
+
+def _recalcular(produtos):
+    with transaction.atomic():
+        # trava os produtos (em ordem de pk) antes de apagar/regravar: recálculos
+        # concorrentes do mesmo produto não intercalam, e a linha sem SKU não
+        # duplica (no MySQL o UNIQUE aceita Idprodutodetalhe NULL repetido)
+        list(Produto.objects.select_for_update().filter(pk__in=produtos)
+             .order_by("pk").values_list("pk", flat=True))
+        SaldoPedidoCompra.objects.filter(Idproduto_id__in=produtos).delete()
+
+        itens = list(
+            PedidoCompraItem.objects
+            .filter(Idproduto_id__in=produtos, Idpedidocompra__Status__in=STATUS_EM_ABERTO)
+            .values_list(
+                "Idpedidocompraitem", "Idpedidocompra_id", "Idpedidocompra__Idloja_id",
+                "Idproduto_id", "Idproduto__referencia", "Idprodutodetalhe_id",
+                "Qtp_pc", "Qtd_recebida", "Total_item",
+            )
+        )
+        if not itens:
+            return 0
+
+        recebidos = dict(
+            RecebimentoPCItem.objects
+            .filter(Idpedidocompraitem_id__in=[it[0] for it in itens])
+            .values("Idpedidocompraitem_id")
+            .annotate(q=Sum("quantidade_atendida"))
+            .order_by()
+            .values_list("Idpedidocompraitem_id", "q")
+        )
+        eans = dict(
+            ProdutoDetalhe.objects
+            .filter(pk__in={it[5] for it in itens if it[5]})
+            .values_list("Idprodutodetalhe", "CodigodeBarra")
+        )
+
+        acum = defaultdict(lambda: {"qtd_pedida": 0, "qtd_recebida": 0, "qtd_pendente": 0,
+                                    "valor_pedido": ZERO, "valor_pendente": ZERO, "pedidos": set()})
+        refs = {}
+        for item_id, pedido_id, loja_id, prod_id, ref, sku_id, qtd, qtd_rec, total in itens:
+            qtd = qtd or 0
+            total = total or ZERO
+            # Qtd_recebida do item ou o que os recebimentos lançaram, o que for maior
+            rec = max(int(qtd_rec or 0), int(recebidos.get(item_id) or 0))
+            pendente = max(qtd - rec, 0)
+
+            chave = (loja_id, prod_id, sku_id)
+            refs[chave] = ref or ""
+            a = acum[chave]
+            a["qtd_pedida"] += qtd
+            a["qtd_recebida"] += rec
+            a["qtd_pendente"] += pendente
+            a["valor_pedido"] += total
+            if qtd > 0:
+                a["valor_pendente"] += total * pendente / qtd
+            a["pedidos"].add(pedido_id)
+
+        linhas = [
+            SaldoPedidoCompra(
+                Idloja_id=loja_id,
+                Idproduto_id=prod_id,
+                Idprodutodetalhe_id=sku_id,
+                referencia=refs[(loja_id, prod_id, sku_id)],
+                ean=eans.get(sku_id, ""),
+                qtd_pedida=a["qtd_pedida"],
+                qtd_recebida=a["qtd_recebida"],
+                qtd_pendente=a["qtd_pendente"],
+                valor_pedido=a["valor_pedido"].quantize(CENTAVO),
+                valor_pendente=a["valor_pendente"].quantize(CENTAVO),
+                pedidos=len(a["pedidos"]),
+            )
+            for (loja_id, prod_id, sku_id), a in acum.items()
+        ]
+        SaldoPedidoCompra.objects.bulk_create(linhas, batch_size=1000)
+        return len(linhas)
+
+
+def atualizar_saldos(produtos) -> int:
+    """Recalcula o saldo dos produtos informados (ids). Devolve as linhas gravadas."""
+    produtos = sorted({int(p) for p in produtos if p})
+    total = 0
+    for i in range(0, len(produtos), LOTE_PRODUTOS):
+        total += _recalcular(produtos[i:i + LOTE_PRODUTOS])
+    return total
+
+
+_coletor = ColetorPosCommit(atualizar_saldos)
+
+
+def marcar_saldo(*produtos):
+    """Agenda o recálculo do saldo dos produtos para depois do COMMIT."""
+    _coletor.marcar(*produtos)
+
+
+def marcar_saldo_pedidos(*pedidos):
+    """Marca todos os produtos dos pedidos informados."""
+    pedidos = [p for p in pedidos if p]
+    if not pedidos:
+        return
+    produtos = (PedidoCompraItem.objects
+                .filter(Idpedidocompra_id__in=pedidos)
+                .values_list("Idproduto_id", flat=True)
+                .distinct())
+    marcar_saldo(*produtos)
+
+
+def em_pedido_da_referencia(referencia, lojas=None, so_skus_ativos=True):
+    """
+    Saldo pendente de uma referência para a matriz de estoque, numa consulta:
+    ({(loja_id, cor_id, tamanho_id): qtd}, {loja_id: qtd das linhas sem SKU}).
+    """
+    qs = SaldoPedidoCompra.objects.filter(referencia=referencia, qtd_pendente__gt=0)
+    if lojas:
+        qs = qs.filter(Idloja_id__in=lojas)
+    if so_skus_ativos:
+        qs = qs.exclude(Idprodutodetalhe__Ativo=False)
+    celulas = {}
+    sem_sku = defaultdict(int)
+    for loja_id, sku_id, cor_id, tam_id, qtd in qs.values_list(
+        "Idloja_id", "Idprodutodetalhe_id", "Idprodutodetalhe__Idcor_id", "Idprodutodetalhe__Idtamanho_id",
+        "qtd_pendente",
+    ):
+        if sku_id is None:
+            sem_sku[loja_id] += qtd
+        else:
+            chave = (loja_id, cor_id, tam_id)
+            celulas[chave] = celulas.get(chave, 0) + qtd
+    return celulas, dict(sem_sku)
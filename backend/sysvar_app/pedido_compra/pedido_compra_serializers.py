@@ -2,8 +2,7 @@
 
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import transaction
-from django.db.models import Sum, F
-from django.utils import timezone
+from django.db.models import Sum
 from rest_framework import serializers
 
 from ..models import (
@@ -12,9 +11,9 @@ from ..models import (
     PedidoCompraEntrega,
     Produto,
     PedidoCompraParcela,
-    FormaPagamento,
-    FormaPagamentoParcela,
 )
+from ..pack.pack_composicao import composicao, qtd_total_pack
+from .pedido_compra_totais import marcar_pedidos
 
 ZERO = Decimal("0")
 UM = Decimal("1")
@@ -152,6 +151,8 @@ class PedidoCompraItemSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError({"pack": "Pack é obrigatório para pedido de revenda."})
                 if not n_packs or int(n_packs) <= 0:
                     raise serializers.ValidationError({"n_packs": "Número de packs deve ser > 0 para revenda."})
+                if composicao(pack) is None:
+                    raise serializers.ValidationError({"pack": "Pack não encontrado ou sem itens."})
             else:
                 q_in = attrs.get("Qtp_pc", getattr(self.instance, "Qtp_pc", None))
                 if q_in is None or int(q_in) <= 0:
@@ -173,7 +174,7 @@ class PedidoCompraItemSerializer(serializers.ModelSerializer):
         return attrs
 
     # ---------------------------
-    # CÁLCULOS + PARCELAS AUTO
+    # CÁLCULOS
     # ---------------------------
     def _quantize(self, v: Decimal) -> Decimal:
         return (v or ZERO).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
@@ -188,79 +189,7 @@ class PedidoCompraItemSerializer(serializers.ModelSerializer):
     def _calc_qty_from_pack(self, pack, n_packs: int) -> int:
         if not pack or not n_packs:
             return None
-        soma_pack = sum(pi.qtd for pi in pack.itens.all())
-        return int(soma_pack) * int(n_packs)
-
-    def _regen_parcelas_if_needed(self, pedido: PedidoCompra):
-        if not pedido or pedido.Status != PedidoCompra.StatusChoices.AB:
-            return
-        if not pedido.condicao_pagamento:
-            return
-        try:
-            forma = FormaPagamento.objects.get(codigo=pedido.condicao_pagamento)
-        except FormaPagamento.DoesNotExist:
-            return
-
-        PedidoCompraParcela.objects.filter(pedido=pedido).delete()
-
-        total = pedido.Valorpedido or ZERO
-        base_dt = pedido.Datapedido or timezone.localdate()
-
-        defs = list(
-            FormaPagamentoParcela.objects.filter(forma=forma)
-            .order_by("ordem")
-            .values("ordem", "dias", "percentual", "valor_fixo")
-        )
-        if not defs:
-            defs = [{"ordem": 1, "dias": 0, "percentual": Decimal("100"), "valor_fixo": Decimal("0")}]
-
-        valores = []
-        for d in defs:
-            perc = Decimal(str(d.get("percentual") or "0"))
-            fixo = Decimal(str(d.get("valor_fixo") or "0"))
-            if perc > 0:
-                val = self._quantize(total * (perc / Decimal("100")))
-            elif fixo > 0:
-                val = self._quantize(fixo)
-            else:
-                val = ZERO
-            valores.append(val)
-
-        if total > ZERO and valores:
-            diff = self._quantize(total - sum(valores))
-            valores[-1] = self._quantize(valores[-1] + diff)
-
-        linhas = []
-        for i, d in enumerate(defs):
-            prazo = int(d.get("dias") or 0)
-            venc = base_dt + timezone.timedelta(days=prazo)
-            linhas.append(PedidoCompraParcela(
-                pedido=pedido,
-                parcela=int(d.get("ordem") or (i + 1)),
-                prazo_dias=prazo,
-                vencimento=venc,
-                valor=valores[i],
-                forma=forma.codigo,
-                observacao=None,
-            ))
-
-        if linhas:
-            PedidoCompraParcela.objects.bulk_create(linhas)
-
-        pedido.parcelas = len(linhas)
-        pedido.condicao_pagamento_detalhe = forma.descricao
-        pedido.save(update_fields=["parcelas", "condicao_pagamento_detalhe"])
-
-    def _refresh_header_total_and_parcelas(self, pedido_id):
-        total = (
-            PedidoCompraItem.objects.filter(Idpedidocompra_id=pedido_id)
-            .aggregate(s=Sum(F("Qtp_pc") * F("valorunitario") - F("Desconto")))["s"] or ZERO
-        )
-        from ..models import PedidoCompra as PC
-        PC.objects.filter(pk=pedido_id).update(Valorpedido=total)
-
-        pedido = PC.objects.select_related().get(pk=pedido_id)
-        self._regen_parcelas_if_needed(pedido)
+        return qtd_total_pack(pack, n_packs)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -282,7 +211,8 @@ class PedidoCompraItemSerializer(serializers.ModelSerializer):
         validated_data["Total_item"] = self._calc_total(q, pu, desc)
 
         obj = super().create(validated_data)
-        self._refresh_header_total_and_parcelas(obj.Idpedidocompra_id)
+        # total + parcelas recalculados uma vez por pedido, no COMMIT
+        marcar_pedidos(obj.Idpedidocompra_id)
         return obj
 
     @transaction.atomic
@@ -305,7 +235,8 @@ class PedidoCompraItemSerializer(serializers.ModelSerializer):
         validated_data["Total_item"] = self._calc_total(q, pu, desc)
 
         obj = super().update(instance, validated_data)
-        self._refresh_header_total_and_parcelas(obj.Idpedidocompra_id)
+        # total + parcelas recalculados uma vez por pedido, no COMMIT
+        marcar_pedidos(obj.Idpedidocompra_id)
         return obj
 
 
@@ -418,18 +349,11 @@ class PedidoCompraDetailSerializer(serializers.ModelSerializer):
             validated_data["Valorpedido"] = ZERO
         return super().create(validated_data)
 
-    def _recalc_valorpedido(self, pedido: PedidoCompra):
-        total = (
-            PedidoCompraItem.objects.filter(Idpedidocompra=pedido)
-            .aggregate(s=Sum(F("Qtp_pc") * F("valorunitario") - F("Desconto")))["s"] or ZERO
-        )
-        if pedido.Valorpedido != total:
-            PedidoCompra.objects.filter(pk=pedido.pk).update(Valorpedido=total)
-
     @transaction.atomic
     def update(self, instance, validated_data):
         obj = super().update(instance, validated_data)
-        self._recalc_valorpedido(obj)
+        # total e parcelas (a condição pode ter mudado) depois do COMMIT
+        marcar_pedidos(obj.pk)
         return obj
 
 
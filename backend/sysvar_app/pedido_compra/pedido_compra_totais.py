@@ -0,0 +1,122 @@
+# sysvar_app/pedido_compra/pedido_compra_totais.py
+"""
+Recálculo do cabeçalho (Valorpedido) e das parcelas dos pedidos de compra.
+
+Gravar um item só marca o pedido (marcar_pedidos); o total e as parcelas são
+recalculados uma única vez por pedido depois do COMMIT, juntos para todos os
+pedidos tocados na transação. Assim digitar/importar 200 itens num mesmo
+atomic() custa um recálculo, não 200.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from ..forma_pagamentos.forma_pagamentos_plano import planos
+from ..models import PedidoCompra, PedidoCompraItem, PedidoCompraParcela
+from ..transacoes import ColetorPosCommit
+from .pedido_compra_explosao import atualizar_explosoes
+
+ZERO = Decimal("0")
+
+
+def totais_por_pedido(ids) -> dict:
+    """{Idpedidocompra: soma(Qtp_pc * valorunitario - Desconto)} em uma query (sem itens = 0)."""
+    linhas = (
+        PedidoCompraItem.objects.filter(Idpedidocompra_id__in=ids)
+        .values("Idpedidocompra_id")
+        .annotate(s=Sum(F("Qtp_pc") * F("valorunitario") - F("Desconto")))
+        .order_by()
+    )
+    totais = {pid: ZERO for pid in ids}
+    for row in linhas:
+        totais[row["Idpedidocompra_id"]] = row["s"] or ZERO
+    return totais
+
+
+def regerar_parcelas(pedidos) -> list:
+    """
+    Regera as parcelas dos pedidos em AB com condição de pagamento cadastrada:
+    um DELETE e um bulk_create para o lote inteiro, a partir dos planos
+    compilados (forma_pagamentos_plano). Ajusta `parcelas` e
+    `condicao_pagamento_detalhe` nas instâncias e devolve as que mudaram.
+    """
+    compilados = planos()
+    alvo = [
+        p for p in pedidos
+        if p.Status == PedidoCompra.StatusChoices.AB and p.condicao_pagamento in compilados
+    ]
+    if not alvo:
+        return []
+
+    PedidoCompraParcela.objects.filter(pedido__in=alvo).delete()
+
+    hoje = timezone.localdate()
+    linhas = []
+    for pedido in alvo:
+        pl = compilados[pedido.condicao_pagamento]
+        valores = pl.dividir(pedido.Valorpedido or ZERO)
+        vencimentos = pl.vencimentos(pedido.Datapedido or hoje)
+        for (ordem, dias, _, _), valor, venc in zip(pl.parcelas, valores, vencimentos):
+            linhas.append(PedidoCompraParcela(
+                pedido=pedido,
+                parcela=ordem,
+                prazo_dias=dias,
+                vencimento=venc,
+                valor=valor,
+                forma=pl.codigo,
+                observacao=None,
+            ))
+        pedido.parcelas = len(pl.parcelas)
+        pedido.condicao_pagamento_detalhe = pl.descricao
+
+    if linhas:
+        PedidoCompraParcela.objects.bulk_create(linhas)
+    return alvo
+
+
+@transaction.atomic
+def recalcular_pedidos(ids):
+    """
+    Recalcula Valorpedido e regera as parcelas (quando aplicável) de vários
+    pedidos; a explosão em SKUs, se gravada, acompanha.
+    """
+    ids = {int(i) for i in ids}
+    if not ids:
+        return
+    totais = totais_por_pedido(ids)
+    pedidos = list(PedidoCompra.objects.filter(pk__in=ids))
+    alterados = []
+    for pedido in pedidos:
+        total = totais[pedido.pk]
+        if pedido.Valorpedido != total:
+            pedido.Valorpedido = total
+            alterados.append(pedido)
+
+    regerados = regerar_parcelas(pedidos)
+    campos = ["Valorpedido"]
+    if regerados:
+        campos += ["parcelas", "condicao_pagamento_detalhe"]
+    por_pk = {p.pk: p for p in alterados + regerados}
+    if por_pk:
+        PedidoCompra.objects.bulk_update(list(por_pk.values()), campos)
+    atualizar_explosoes(ids)
+
+
+def reaplicar_plano(pedidos, pl):
+    """Aplica o plano `pl` a vários pedidos em AB: parcelas regeradas e cabeçalho gravado em lote."""
+    for pedido in pedidos:
+        pedido.condicao_pagamento = pl.codigo
+    regerados = regerar_parcelas(pedidos)
+    if regerados:
+        PedidoCompra.objects.bulk_update(regerados, ["condicao_pagamento", "condicao_pagamento_detalhe", "parcelas"])
+    return regerados
+
+
+_coletor = ColetorPosCommit(recalcular_pedidos)
+
+
+def marcar_pedidos(*ids):
+    """Agenda o recálculo dos pedidos para depois do COMMIT (uma vez por pedido)."""
+    _coletor.marcar(*ids)
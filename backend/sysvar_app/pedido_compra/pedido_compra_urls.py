@@ -6,6 +6,7 @@ from .pedido_compra_views import (
     PedidoCompraItemViewSet,
     PedidoCompraEntregaViewSet,
     PedidoCompraParcelaViewSet,
+    SaldoPedidoCompraViewSet,
 )
 
 router = DefaultRouter()
@@ -14,6 +15,7 @@ router.register(r"pedidos-compra", PedidoCompraViewSet, basename="pedido-compra"
 router.register(r"pedidos-compra-itens", PedidoCompraItemViewSet, basename="pedido-compra-item")
 router.register(r"pedidos-compra-entregas", PedidoCompraEntregaViewSet, basename="pedido-compra-entrega")
 router.register(r'pedidos-compra-parcelas', PedidoCompraParcelaViewSet, basename='pedido-compra-parcelas')  # ⬅️ rota
+router.register(r"pedidos-compra-saldos", SaldoPedidoCompraViewSet, basename="pedido-compra-saldo")
 
 
 urlpatterns = [
@@ -1,11 +1,15 @@
-from datetime import timedelta
-from decimal import Decimal, ROUND_HALF_UP
+import csv
+import json
+from decimal import Decimal
 
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, F
+from django.utils.dateparse import parse_date
+from django.db.models import F, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, permissions, status, mixins
 from rest_framework.decorators import action
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 import django_filters
 
@@ -15,7 +19,8 @@ from ..models import (
     PedidoCompraEntrega,
     PedidoCompraParcela,
     FormaPagamento,
-    FormaPagamentoParcela,
+    Loja,
+    SaldoPedidoCompra,
 )
 
 from .pedido_compra_serializers import (
@@ -25,6 +30,13 @@ from .pedido_compra_serializers import (
     PedidoCompraEntregaSerializer,
     PedidoCompraParcelaSerializer,
 )
+from ..forma_pagamentos.forma_pagamentos_plano import compilar_forma, plano
+from .pedido_compra_calendario import calendario, sincronizar_entregas
+from .pedido_compra_duplicacao import duplicar_pedido
+from .pedido_compra_explosao import explodir_pedidos, gravar_explosao
+from .pedido_compra_importacao import importar_itens, ler_csv, ler_json
+from .pedido_compra_saldos import marcar_saldo_pedidos
+from .pedido_compra_totais import marcar_pedidos, reaplicar_plano
 
 # =========================
 # [AUDITORIA] helpers
@@ -91,88 +103,33 @@ TRANSICOES = {
 # =========================
 # FUNÇÕES GLOBAIS (reuso)
 # =========================
-def _quantize(v: Decimal) -> Decimal:
-    return (v or Decimal("0")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-def aplicar_forma_pagamento(pedido: PedidoCompra, forma: FormaPagamento):
-    pedido.condicao_pagamento = forma.codigo
-    pedido.condicao_pagamento_detalhe = forma.descricao
-    pedido.parcelas = forma.num_parcelas
+def aplicar_plano(pedido: PedidoCompra, pl):
+    """Grava a condição de pagamento do plano compilado no pedido e recria as parcelas."""
+    pedido.condicao_pagamento = pl.codigo
+    pedido.condicao_pagamento_detalhe = pl.descricao
+    pedido.parcelas = pl.num_parcelas
     pedido.save(update_fields=["condicao_pagamento", "condicao_pagamento_detalhe", "parcelas"])
 
     PedidoCompraParcela.objects.filter(pedido=pedido).delete()
 
-    total = pedido.Valorpedido or Decimal("0")
-    base_dt = pedido.Datapedido or timezone.localdate()
-
-    defs = list(
-        FormaPagamentoParcela.objects
-        .filter(forma=forma)
-        .order_by("ordem")
-        .values("ordem", "dias", "percentual", "valor_fixo")
-    )
-    if not defs:
-        defs = [{"ordem": 1, "dias": 0, "percentual": Decimal("100"), "valor_fixo": Decimal("0")}]
-
-    valores = []
-    for d in defs:
-        perc = Decimal(str(d.get("percentual") or "0"))
-        fixo = Decimal(str(d.get("valor_fixo") or "0"))
-        if perc > 0:
-            val = _quantize(total * (perc / Decimal("100")))
-        elif fixo > 0:
-            val = _quantize(fixo)
-        else:
-            val = Decimal("0.00")
-        valores.append(val)
-
-    if total > 0 and valores:
-        diff = _quantize(total - sum(valores))
-        valores[-1] = _quantize(valores[-1] + diff)
-
-    linhas = []
-    for i, d in enumerate(defs):
-        prazo = int(d.get("dias") or 0)
-        venc = base_dt + timedelta(days=prazo)
-        linhas.append(PedidoCompraParcela(
+    valores = pl.dividir(pedido.Valorpedido or Decimal("0"))
+    vencimentos = pl.vencimentos(pedido.Datapedido or timezone.localdate())
+    PedidoCompraParcela.objects.bulk_create([
+        PedidoCompraParcela(
             pedido=pedido,
-            parcela=int(d.get("ordem") or (i + 1)),
-            prazo_dias=prazo,
+            parcela=ordem,
+            prazo_dias=dias,
             vencimento=venc,
-            valor=valores[i],
-            forma=forma.codigo,
+            valor=valor,
+            forma=pl.codigo,
             observacao=None,
-        ))
-    if linhas:
-        PedidoCompraParcela.objects.bulk_create(linhas)
-
-def regen_parcelas_if_needed(pedido: PedidoCompra, *, request=None, motivo: str | None = None):
-    if not pedido or pedido.Status != PedidoCompra.StatusChoices.AB:
-        return
-    if not pedido.condicao_pagamento:
-        return
-    try:
-        forma = FormaPagamento.objects.get(codigo=pedido.condicao_pagamento)
-    except FormaPagamento.DoesNotExist:
-        return
-
-    soma_antes = (PedidoCompraParcela.objects
-                  .filter(pedido=pedido).aggregate(s=Sum("valor"))["s"] or Decimal("0.00"))
-
-    aplicar_forma_pagamento(pedido, forma)
-
-    soma_depois = (PedidoCompraParcela.objects
-                   .filter(pedido=pedido).aggregate(s=Sum("valor"))["s"] or Decimal("0.00"))
+        )
+        for (ordem, dias, _, _), valor, venc in zip(pl.parcelas, valores, vencimentos)
+    ])
 
-    _audit_pc(
-        request=request,
-        pedido_or_id=pedido,
-        action="regen_parcelas_auto",
-        before={"soma_parcelas": float(soma_antes)},
-        after={"soma_parcelas": float(soma_depois), "valorpedido": float(pedido.Valorpedido or 0)},
-        reason=motivo or "Total do pedido alterado com Status=AB",
-        extra={"condicao_pagamento": pedido.condicao_pagamento}
-    )
+def aplicar_forma_pagamento(pedido: PedidoCompra, forma: FormaPagamento):
+    # a forma acabou de ser lida: compila a partir dela, não da memória do processo
+    aplicar_plano(pedido, compilar_forma(forma))
 
 
 # =========================
@@ -230,11 +187,67 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
     ordering_fields = ["Datapedido", "Dataentrega", "Idpedidocompra", "Valorpedido"]
     ordering = ["-Datapedido", "Idpedidocompra"]
 
+    # campos de PedidoCompraItemSerializer; do produto só a descrição
+    CAMPOS_ITEM_DETALHE = (
+        "Idpedidocompraitem", "Idpedidocompra", "Idproduto", "Qtp_pc", "valorunitario", "Desconto",
+        "Total_item", "Qtd_recebida", "unid_compra", "fator_conv", "Idprodutodetalhe", "pack",
+        "n_packs", "qtd_total_pack", "data_cadastro", "Idproduto__Descricao",
+    )
+
+    # projeção da listagem (mesmas chaves de PedidoCompraListSerializer)
+    CAMPOS_LISTA = (
+        "Idpedidocompra", "Documento", "Datapedido", "Dataentrega", "Status", "Valorpedido",
+        "condicao_pagamento", "condicao_pagamento_detalhe", "parcelas", "tipo_pedido",
+    )
+
     def get_serializer_class(self):
         if self.action in ("list",):
             return PedidoCompraListSerializer
         return super().get_serializer_class()
 
+    def _com_relacoes(self, qs):
+        """Itens (com a descrição do produto), entregas e parcelas em três consultas fixas."""
+        return qs.prefetch_related(
+            Prefetch(
+                "pedidocompraitem_set",
+                queryset=PedidoCompraItem.objects.select_related("Idproduto")
+                .only(*self.CAMPOS_ITEM_DETALHE).order_by("pk"),
+            ),
+            Prefetch("entregas", queryset=PedidoCompraEntrega.objects.order_by("data_entrega", "pk")),
+            Prefetch("parcelas_rel", queryset=PedidoCompraParcela.objects.order_by("parcela")),
+        )
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in ("retrieve", "update", "partial_update"):
+            qs = self._com_relacoes(qs)
+        return qs
+
+    def _detalhe(self, pedido_id, request, **kwargs):
+        """Recarrega o pedido com as relações pré-carregadas e devolve o detalhe."""
+        pedido = self._com_relacoes(self.queryset).get(pk=pedido_id)
+        ser = PedidoCompraDetailSerializer(pedido, context={"request": request})
+        return Response(ser.data, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # values(): sem instanciar modelos nem chamar get_tipo_pedido_display por linha
+        qs = self.filter_queryset(self.get_queryset()).values(
+            *self.CAMPOS_LISTA,
+            fornecedor_nome=F("Idfornecedor__Nome_fornecedor"),
+            loja_nome=F("Idloja__nome_loja"),
+        )
+        rotulos = dict(PedidoCompra.TipoPedido.choices)
+
+        def linha(r):
+            r["Valorpedido"] = None if r["Valorpedido"] is None else f"{r['Valorpedido']:.2f}"
+            r["tipo_pedido_display"] = rotulos.get(r["tipo_pedido"], r["tipo_pedido"])
+            return r
+
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            return self.get_paginated_response([linha(r) for r in page])
+        return Response([linha(r) for r in qs])
+
     def _pode_mudar(self, de, para) -> bool:
         if de is None:
             return True
@@ -246,7 +259,6 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
     @transaction.atomic
     @action(detail=True, methods=["post"])
     def aprovar(self, request, pk=None):
-        from .pedido_compra_serializers import PedidoCompraDetailSerializer
         pedido: PedidoCompra = self.get_object()
 
         if not self._pode_mudar(pedido.Status, STATUS_APROVADO):
@@ -286,13 +298,106 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
             reason=(request.data or {}).get("motivo") or None
         )
 
-        ser = PedidoCompraDetailSerializer(pedido, context={"request": request})
-        return Response(ser.data)
+        return self._detalhe(pedido.pk, request)
+
+    ACOES_LOTE = {
+        "aprovar": STATUS_APROVADO,
+        "cancelar": STATUS_CANCELADO,
+        "reabrir": STATUS_ABERTO,
+    }
+
+    def _erros_aprovacao(self, pedidos):
+        """Regras de aprovar() para vários pedidos, com duas consultas agrupadas."""
+        ids = [p.pk for p in pedidos]
+        com_itens = set(
+            PedidoCompraItem.objects.filter(Idpedidocompra_id__in=ids)
+            .values_list("Idpedidocompra_id", flat=True).distinct()
+        )
+        somas = dict(
+            PedidoCompraParcela.objects.filter(pedido_id__in=ids)
+            .values("pedido_id").annotate(s=Sum("valor")).order_by()
+            .values_list("pedido_id", "s")
+        )
+        erros = {}
+        for p in pedidos:
+            if p.pk not in com_itens:
+                erros[p.pk] = "Não é possível aprovar um pedido sem itens."
+            elif not p.condicao_pagamento:
+                erros[p.pk] = "Defina a forma de pagamento antes de aprovar."
+            elif (p.Valorpedido or Decimal("0.00")).quantize(Decimal("0.01")) != (somas.get(p.pk) or Decimal("0.00")).quantize(Decimal("0.01")):
+                erros[p.pk] = "Parcelas não somam ao Valorpedido."
+        return erros
+
+    @transaction.atomic
+    @action(detail=False, methods=["post"], url_path="transicao-lote")
+    def transicao_lote(self, request):
+        """
+        aprovar/cancelar/reabrir vários pedidos numa chamada.
+        Body: {"acao": "aprovar"|"cancelar"|"reabrir", "pedidos": [ids], "motivo": "..."}
+        Pedidos que não passam nas regras ficam de fora e voltam em "erros";
+        os demais mudam de status com um único UPDATE.
+        """
+        data = request.data or {}
+        acao = data.get("acao")
+        ids = data.get("pedidos")
+        if acao not in self.ACOES_LOTE:
+            return Response({"detail": "acao deve ser aprovar, cancelar ou reabrir."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(ids, list) or not ids:
+            return Response({"detail": "Informe a lista 'pedidos'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = {int(i) for i in ids}
+        except (TypeError, ValueError):
+            return Response({"detail": "'pedidos' deve conter apenas ids numéricos."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        destino = self.ACOES_LOTE[acao]
+        pedidos = list(
+            PedidoCompra.objects.select_for_update()
+            .filter(pk__in=ids)
+            .only("Idpedidocompra", "Status", "Datapedido", "Valorpedido", "condicao_pagamento")
+        )
+        erros = {pk: "Pedido não encontrado." for pk in ids - {p.pk for p in pedidos}}
+        validos = []
+        for p in pedidos:
+            if not self._pode_mudar(p.Status, destino):
+                erros[p.pk] = f"Transição não permitida: {p.Status or 'None'} → {destino}."
+            else:
+                validos.append(p)
+        if acao == "aprovar" and validos:
+            erros.update(self._erros_aprovacao(validos))
+            validos = [p for p in validos if p.pk not in erros]
+
+        if validos:
+            campos = {"Status": destino}
+            if acao == "aprovar":
+                campos["Datapedido"] = Coalesce(F("Datapedido"), Value(self._agora_data()))
+            PedidoCompra.objects.filter(pk__in=[p.pk for p in validos]).update(**campos)
+            # update() não dispara o post_save que mantém o saldo em pedido e o calendário
+            marcar_saldo_pedidos(*[p.pk for p in validos])
+            sincronizar_entregas(*[p.pk for p in validos])
+
+            motivo = data.get("motivo") or None
+            hoje = str(self._agora_data())
+            for p in validos:
+                before = {"Status": p.Status}
+                after = {"Status": destino}
+                if acao == "aprovar":
+                    before["Datapedido"] = str(p.Datapedido or "")
+                    after["Datapedido"] = str(p.Datapedido or hoje)
+                _audit_pc(request=request, pedido_or_id=p, action=acao, before=before, after=after,
+                          reason=motivo, extra={"lote": True})
+
+        return Response({
+            "acao": acao,
+            "status": destino,
+            "alterados": sorted(p.pk for p in validos),
+            "erros": [{"pedido": pk, "detail": msg} for pk, msg in sorted(erros.items())],
+        })
 
     @transaction.atomic
     @action(detail=True, methods=["post"])
     def cancelar(self, request, pk=None):
-        from .pedido_compra_serializers import PedidoCompraDetailSerializer
         pedido: PedidoCompra = self.get_object()
 
         if not self._pode_mudar(pedido.Status, STATUS_CANCELADO):
@@ -316,13 +421,11 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
             reason=motivo or None
         )
 
-        ser = PedidoCompraDetailSerializer(pedido, context={"request": request})
-        return Response(ser.data)
+        return self._detalhe(pedido.pk, request)
 
     @transaction.atomic
     @action(detail=True, methods=["post"])
     def reabrir(self, request, pk=None):
-        from .pedido_compra_serializers import PedidoCompraDetailSerializer
         pedido: PedidoCompra = self.get_object()
 
         if not self._pode_mudar(pedido.Status, STATUS_ABERTO):
@@ -344,85 +447,89 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
             reason=(request.data or {}).get("motivo") or None
         )
 
-        ser = PedidoCompraDetailSerializer(pedido, context={"request": request})
-        return Response(ser.data)
+        return self._detalhe(pedido.pk, request)
+
+    def _destinos_duplicacao(self, bruto):
+        """Valida a lista de destinos de duplicar(); devolve (destinos, erros)."""
+        if not isinstance(bruto, list):
+            return None, ["'destinos' deve ser uma lista."]
+        destinos, erros = [], []
+        for i, d in enumerate(bruto, start=1):
+            if not isinstance(d, dict):
+                erros.append(f"destino {i}: formato inválido.")
+                continue
+            dest = {}
+            if d.get("loja") not in (None, ""):
+                try:
+                    dest["loja"] = int(d["loja"])
+                except (TypeError, ValueError):
+                    erros.append(f"destino {i}: loja inválida.")
+            for campo in ("Datapedido", "Dataentrega"):
+                if campo in d:
+                    valor = parse_date(str(d[campo])) if d[campo] else None
+                    if d[campo] and valor is None:
+                        erros.append(f"destino {i}: {campo} inválida (use AAAA-MM-DD).")
+                    dest[campo] = valor
+            destinos.append(dest)
+
+        lojas = {d["loja"] for d in destinos if "loja" in d}
+        faltando = lojas - set(Loja.objects.filter(pk__in=lojas).values_list("pk", flat=True))
+        erros += [f"Loja {l} não encontrada." for l in sorted(faltando)]
+        return destinos, erros
 
     @transaction.atomic
     @action(detail=True, methods=["post"])
     def duplicar(self, request, pk=None):
-        from .pedido_compra_serializers import PedidoCompraDetailSerializer
+        """
+        Duplica o pedido. Sem corpo: uma cópia para a mesma loja (devolve o detalhe).
+        Com {"destinos": [{"loja": id, "Datapedido": "AAAA-MM-DD", "Dataentrega": "AAAA-MM-DD"}, ...]}:
+        um pedido por destino, todos os itens copiados num único INSERT em lote.
+        """
         pedido: PedidoCompra = self.get_object()
 
-        novo = PedidoCompra.objects.create(
-            Idfornecedor=pedido.Idfornecedor,
-            Idloja=pedido.Idloja,
-            Datapedido=timezone.localdate(),
-            Dataentrega=pedido.Dataentrega,
-            Valorpedido=Decimal("0.00"),
-            Status=STATUS_ABERTO,
-            Documento=None,
-            data_nf=None,
-            Chave=None,
-            tolerancia_qtd_percent=pedido.tolerancia_qtd_percent,
-            tolerancia_preco_percent=pedido.tolerancia_preco_percent,
-            tipo_pedido=pedido.tipo_pedido,
-        )
-
-        itens = PedidoCompraItem.objects.filter(Idpedidocompra=pedido)
-
-        novos_itens = []
-        total = Decimal("0.00")
-        for src in itens:
-            q = src.Qtp_pc
-            pu = src.valorunitario
-            desc = src.Desconto or Decimal("0")
-            total_item = q * pu - desc
-            if total_item < 0:
-                total_item = Decimal("0.00")
-
-            novos_itens.append(
-                PedidoCompraItem(
-                    Idpedidocompra=novo,
-                    Idproduto=src.Idproduto,
-                    Qtp_pc=q,
-                    valorunitario=pu,
-                    Desconto=desc,
-                    Total_item=total_item,
-                    Qtd_recebida=0,
-                    unid_compra=src.unid_compra,
-                    fator_conv=src.fator_conv or Decimal("1"),
-                    Idprodutodetalhe=src.Idprodutodetalhe,
-                    pack=src.pack,
-                    n_packs=src.n_packs,
-                    qtd_total_pack=src.qtd_total_pack,
-                    data_entrega_prevista=src.data_entrega_prevista,
-                )
-            )
-            total += total_item
-
-        if novos_itens:
-            PedidoCompraItem.objects.bulk_create(novos_itens)
+        data = request.data or {}
+        multiplos = "destinos" in data
+        destinos = None
+        if multiplos:
+            destinos, erros = self._destinos_duplicacao(data.get("destinos"))
+            if erros or not destinos:
+                return Response({"detail": erros or ["Informe ao menos um destino."]},
+                                status=status.HTTP_400_BAD_REQUEST)
 
-        if total != novo.Valorpedido:
-            PedidoCompra.objects.filter(pk=novo.pk).update(Valorpedido=total)
+        novos, n_itens = duplicar_pedido(pedido, destinos)
 
-        _audit_pc(
-            request=request,
-            pedido_or_id=novo,
-            action="duplicar",
-            before=None,
-            after={"Valorpedido": float(total), "itens": len(novos_itens)},
-            reason=f"Duplicado do pedido {pedido.Idpedidocompra}",
-            extra={"source_id": pedido.Idpedidocompra}
-        )
+        for novo in novos:
+            _audit_pc(
+                request=request,
+                pedido_or_id=novo,
+                action="duplicar",
+                before=None,
+                after={"Valorpedido": float(novo.Valorpedido), "itens": n_itens},
+                reason=f"Duplicado do pedido {pedido.Idpedidocompra}",
+                extra={"source_id": pedido.Idpedidocompra}
+            )
 
-        ser = PedidoCompraDetailSerializer(novo, context={"request": request})
-        return Response(ser.data, status=status.HTTP_201_CREATED)
+        if not multiplos:
+            return self._detalhe(novos[0].pk, request, status=status.HTTP_201_CREATED)
+
+        return Response({
+            "origem": pedido.Idpedidocompra,
+            "itens_por_pedido": n_itens,
+            "pedidos": [
+                {
+                    "Idpedidocompra": n.Idpedidocompra,
+                    "Idloja": n.Idloja_id,
+                    "Datapedido": n.Datapedido,
+                    "Dataentrega": n.Dataentrega,
+                    "Valorpedido": n.Valorpedido,
+                }
+                for n in novos
+            ],
+        }, status=status.HTTP_201_CREATED)
 
     @transaction.atomic
     @action(detail=True, methods=["post"], url_path="set-forma-pagamento")
     def set_forma_pagamento(self, request, pk=None):
-        from .pedido_compra_serializers import PedidoCompraDetailSerializer
         pedido: PedidoCompra = self.get_object()
         data = request.data or {}
 
@@ -470,8 +577,126 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
             reason=data.get("motivo") or None
         )
 
-        ser = PedidoCompraDetailSerializer(pedido, context={"request": request})
-        return Response(ser.data, status=status.HTTP_200_OK)
+        return self._detalhe(pedido.pk, request, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], url_path="importar-itens")
+    def importar_itens(self, request, pk=None):
+        """
+        Importa itens em massa. Aceita multipart com 'arquivo' (.csv ou .json)
+        ou JSON {"itens": [...]}. Colunas: Idproduto|referencia, Idprodutodetalhe|ean,
+        pack, n_packs, Qtp_pc, valorunitario, Desconto, unid_compra, fator_conv,
+        data_entrega_prevista. Com parcial=true grava só as linhas válidas.
+        """
+        pedido: PedidoCompra = self.get_object()
+        if pedido.Status != PedidoCompra.StatusChoices.AB:
+            return Response({"detail": f"Pedido em estado '{pedido.Status}': edição de itens bloqueada."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = request.data
+        arquivo = request.FILES.get("arquivo")
+        if arquivo is not None:
+            if arquivo.name.lower().endswith(".json"):
+                try:
+                    conteudo = json.load(arquivo)
+                except ValueError:
+                    return Response({"detail": "JSON inválido."}, status=status.HTTP_400_BAD_REQUEST)
+                itens = conteudo.get("itens") if isinstance(conteudo, dict) else conteudo
+                linhas = ler_json(itens if isinstance(itens, list) else [])
+            else:
+                linhas = ler_csv(arquivo)
+        elif isinstance(data, list) or isinstance(data.get("itens"), list):
+            linhas = ler_json(data if isinstance(data, list) else data["itens"])
+        else:
+            return Response({"detail": "Envie 'arquivo' (CSV/JSON) ou a lista 'itens'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        parcial_raw = request.query_params.get("parcial") or (data.get("parcial") if hasattr(data, "get") else None)
+        parcial = str(parcial_raw).strip().lower() in {"1", "true", "sim"}
+        try:
+            resumo = importar_itens(pedido, linhas, parcial=parcial)
+        except (UnicodeDecodeError, csv.Error):
+            return Response({"detail": "Arquivo CSV ilegível (use UTF-8)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if resumo["criados"]:
+            _audit_pc(
+                request=request,
+                pedido_or_id=pedido,
+                action="importar_itens",
+                after={"criados": resumo["criados"], "quantidade": resumo["quantidade"], "valor": float(resumo["valor"])},
+                reason="Importação de itens em massa",
+                extra={"linhas": resumo["linhas"], "erros": len(resumo["erros"])},
+            )
+
+        http = status.HTTP_201_CREATED if resumo["criados"] else status.HTTP_400_BAD_REQUEST
+        return Response(resumo, status=http)
+
+    @transaction.atomic
+    @action(detail=False, methods=["post"], url_path="reaplicar-forma-pagamento")
+    def reaplicar_forma_pagamento(self, request):
+        """
+        Troca a forma de pagamento de vários pedidos em AB de uma vez.
+        Body: {"codigo": "<nova forma>", "pedidos": [ids]} ou {"codigo": ..., "codigo_atual": "<forma antiga>"}.
+        """
+        data = request.data or {}
+        pl = plano(data.get("codigo"))
+        if pl is None:
+            return Response({"detail": f"Forma com código '{data.get('codigo')}' não encontrada."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        qs = PedidoCompra.objects.filter(Status=STATUS_ABERTO)
+        if isinstance(data.get("pedidos"), list) and data["pedidos"]:
+            qs = qs.filter(pk__in=data["pedidos"])
+        elif data.get("codigo_atual"):
+            qs = qs.filter(condicao_pagamento=data["codigo_atual"])
+        else:
+            return Response({"detail": "Informe 'pedidos' ou 'codigo_atual'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        pedidos = list(qs.select_for_update())
+        anteriores = {p.pk: p.condicao_pagamento for p in pedidos}
+        reaplicar_plano(pedidos, pl)
+
+        motivo = data.get("motivo") or None
+        for p in pedidos:
+            _audit_pc(
+                request=request,
+                pedido_or_id=p,
+                action="set_forma_pagamento",
+                before={"condicao_pagamento": anteriores[p.pk]},
+                after={"condicao_pagamento": pl.codigo, "parcelas": p.parcelas},
+                reason=motivo or "Reaplicação de forma de pagamento em massa",
+            )
+
+        return Response({"codigo": pl.codigo, "pedidos": len(pedidos), "ids": [p.pk for p in pedidos]})
+
+    @action(detail=True, methods=["get"])
+    def explosao(self, request, pk=None):
+        """Itens de pack do pedido explodidos em SKUs (tamanho x cor), sem gravar."""
+        pedido = self.get_object()
+        linhas, pendencias = explodir_pedidos([pedido.pk])
+        return Response({"pedido": pedido.pk, "linhas": linhas, "pendencias": pendencias})
+
+    @action(detail=False, methods=["post"])
+    def explodir(self, request):
+        """
+        Explode os itens de pack de vários pedidos.
+        Body: {"pedidos": [ids], "gravar": true|false}. Com "gravar", o resultado
+        substitui o que houver em PedidoCompraItemSku para esses pedidos.
+        """
+        data = request.data or {}
+        ids = data.get("pedidos")
+        if not isinstance(ids, list) or not ids:
+            return Response({"detail": "Informe a lista 'pedidos'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = {int(i) for i in ids}
+        except (TypeError, ValueError):
+            return Response({"detail": "'pedidos' deve conter apenas ids numéricos."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ids = set(PedidoCompra.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+        gravar = str(data.get("gravar", "")).lower() in ("1", "true", "sim")
+        linhas, pendencias = (gravar_explosao if gravar else explodir_pedidos)(ids)
+        return Response({"pedidos": sorted(ids), "gravado": gravar, "linhas": linhas, "pendencias": pendencias})
 
 
 class PedidoCompraItemViewSet(viewsets.ModelViewSet):
@@ -486,11 +711,85 @@ class PedidoCompraItemViewSet(viewsets.ModelViewSet):
             qs = qs.filter(Idpedidocompra_id=pedido_id)
         return qs
 
+    @transaction.atomic
+    @action(detail=False, methods=["post"], url_path="bulk-upsert")
+    def bulk_upsert(self, request):
+        """
+        Cria/atualiza vários itens de um pedido numa só transação.
+        Body: {"pedido": <id>, "itens": [{...}, ...]} — item com "Idpedidocompraitem" é atualizado.
+        Tudo ou nada: com qualquer erro de validação nada é gravado. Total e
+        parcelas do pedido são recalculados uma única vez, no COMMIT.
+        """
+        data = request.data or {}
+        pedido_id = data.get("pedido")
+        itens = data.get("itens")
+        if not pedido_id or not isinstance(itens, list) or not itens:
+            return Response({"detail": "Informe 'pedido' e a lista 'itens'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            pedido = PedidoCompra.objects.select_for_update().get(pk=pedido_id)
+        except (PedidoCompra.DoesNotExist, ValueError, TypeError):
+            return Response({"detail": "Pedido não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        if pedido.Status != PedidoCompra.StatusChoices.AB:
+            return Response({"detail": f"Pedido em estado '{pedido.Status}': edição de itens bloqueada."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ids = [it.get("Idpedidocompraitem") for it in itens if isinstance(it, dict) and it.get("Idpedidocompraitem")]
+        existentes = {
+            obj.pk: obj
+            for obj in PedidoCompraItem.objects.select_related("Idpedidocompra", "Idproduto", "pack")
+            .filter(Idpedidocompra=pedido, pk__in=ids)
+        }
+
+        serializers_ok, erros = [], []
+        for linha, item in enumerate(itens, start=1):
+            if not isinstance(item, dict):
+                erros.append({"linha": linha, "erros": {"detail": "Item inválido."}})
+                continue
+            item_id = item.get("Idpedidocompraitem")
+            instance = None
+            if item_id:
+                instance = existentes.get(int(item_id)) if str(item_id).isdigit() else None
+                if instance is None:
+                    erros.append({"linha": linha, "erros": {"Idpedidocompraitem": "Item não encontrado neste pedido."}})
+                    continue
+            payload = {**item, "Idpedidocompra": pedido.pk}
+            ser = PedidoCompraItemSerializer(instance, data=payload, partial=instance is not None,
+                                             context=self.get_serializer_context())
+            if ser.is_valid():
+                serializers_ok.append(ser)
+            else:
+                erros.append({"linha": linha, "erros": ser.errors})
+
+        if erros:
+            return Response({"detail": "Nenhum item gravado.", "erros": erros},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        criados = sum(1 for ser in serializers_ok if ser.instance is None)
+        salvos = [ser.save() for ser in serializers_ok]
+
+        _audit_pc(
+            request=request,
+            pedido_or_id=pedido,
+            action="bulk_upsert_itens",
+            after={"criados": criados, "atualizados": len(salvos) - criados},
+            reason="Gravação de itens em lote"
+        )
+
+        return Response({
+            "pedido": pedido.pk,
+            "criados": criados,
+            "atualizados": len(salvos) - criados,
+            "itens": PedidoCompraItemSerializer(salvos, many=True).data,
+        })
+
     @transaction.atomic
     def destroy(self, request, *args, **kwargs):
         """
         Só permite exclusão quando o pedido está em AB.
-        Se excluir, recalcula total e (se houver forma) regenera parcelas.
+        Se excluir, marca o pedido: total e parcelas são recalculados depois do
+        COMMIT (pedido_compra_totais), como na gravação de itens.
         """
         instance: PedidoCompraItem = self.get_object()
         pedido = instance.Idpedidocompra  # objeto já carregado via select_related?
@@ -514,20 +813,7 @@ class PedidoCompraItemViewSet(viewsets.ModelViewSet):
         )
 
         response = super().destroy(request, *args, **kwargs)
-
-        total = (
-            PedidoCompraItem.objects.filter(Idpedidocompra_id=pedido_id)
-            .aggregate(s=Sum(F("Qtp_pc") * F("valorunitario") - F("Desconto")))["s"] or Decimal("0.00")
-        )
-        PedidoCompra.objects.filter(pk=pedido_id).update(Valorpedido=total)
-
-        try:
-            pedido = PedidoCompra.objects.get(pk=pedido_id)
-            if pedido.Status == PedidoCompra.StatusChoices.AB and pedido.condicao_pagamento:
-                regen_parcelas_if_needed(pedido, request=request, motivo="Regerado após exclusão de item")
-        except PedidoCompra.DoesNotExist:
-            pass
-
+        marcar_pedidos(pedido_id)
         return response
 
 
@@ -543,6 +829,38 @@ class PedidoCompraEntregaViewSet(viewsets.ModelViewSet):
             qs = qs.filter(pedido_id=pedido_id)
         return qs
 
+    MAX_DIAS_CALENDARIO = 93
+
+    @action(detail=False, methods=["get"])
+    def calendario(self, request):
+        """
+        Calendário de recebimento: GET /api/pedidos-compra-entregas/calendario/?de=AAAA-MM-DD&ate=AAAA-MM-DD
+        Filtros opcionais: loja, fornecedor, status (listas separadas por vírgula; status padrão = pedidos em aberto).
+        """
+        qp = request.query_params
+        de = parse_date(qp.get("de") or "")
+        ate = parse_date(qp.get("ate") or "")
+        if not de or not ate or ate < de:
+            return Response({"detail": "Informe 'de' e 'ate' (AAAA-MM-DD), com de <= ate."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if (ate - de).days >= self.MAX_DIAS_CALENDARIO:
+            return Response({"detail": f"Período máximo de {self.MAX_DIAS_CALENDARIO} dias."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        def lista(nome):
+            return [v.strip() for v in (qp.get(nome) or "").split(",") if v.strip()]
+
+        try:
+            lojas = [int(v) for v in lista("loja")]
+            fornecedores = [int(v) for v in lista("fornecedor")]
+        except ValueError:
+            return Response({"detail": "loja/fornecedor devem ser numéricos."}, status=status.HTTP_400_BAD_REQUEST)
+
+        kwargs = {"lojas": lojas, "fornecedores": fornecedores}
+        if lista("status"):
+            kwargs["status"] = [s.upper() for s in lista("status")]
+        return Response(calendario(de, ate, **kwargs))
+
 
 class PedidoCompraParcelaViewSet(mixins.ListModelMixin,
                                  mixins.RetrieveModelMixin,
@@ -558,3 +876,78 @@ class PedidoCompraParcelaViewSet(mixins.ListModelMixin,
         if pedido_id:
             qs = qs.filter(pedido_id=pedido_id)
         return qs
+
+
+class SaldoPedidoCompraPaginacao(LimitOffsetPagination):
+    default_limit = 500
+    max_limit = 5000
+
+
+class SaldoPedidoCompraViewSet(viewsets.ViewSet):
+    """
+    Saldo em pedido por (loja, produto, SKU) — GET /api/pedidos-compra-saldos/
+    Filtros: loja, produto, referencia, ean (aceitam lista separada por vírgula)
+    e pendente=false para incluir linhas já totalmente recebidas.
+    Paginado por limit/offset: {count, next, previous, results}.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SaldoPedidoCompraPaginacao
+
+    CAMPOS = (
+        "Idloja_id", "Idproduto_id", "Idprodutodetalhe_id", "referencia", "ean",
+        "qtd_pedida", "qtd_recebida", "qtd_pendente", "valor_pedido", "valor_pendente",
+        "pedidos", "atualizado_em",
+    )
+
+    @staticmethod
+    def _lista(valor):
+        return [v.strip() for v in (valor or "").split(",") if v.strip()]
+
+    def list(self, request):
+        qp = request.query_params
+        qs = SaldoPedidoCompra.objects.all()
+
+        try:
+            lojas = [int(v) for v in self._lista(qp.get("loja"))]
+            produtos = [int(v) for v in self._lista(qp.get("produto"))]
+        except ValueError:
+            return Response({"detail": "loja/produto devem ser numéricos."}, status=status.HTTP_400_BAD_REQUEST)
+        referencias = self._lista(qp.get("referencia"))
+        eans = self._lista(qp.get("ean"))
+
+        if not (lojas or produtos or referencias or eans):
+            return Response({"detail": "Informe ao menos um filtro: loja, produto, referencia ou ean."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if lojas:
+            qs = qs.filter(Idloja_id__in=lojas)
+        if produtos:
+            qs = qs.filter(Idproduto_id__in=produtos)
+        if referencias:
+            qs = qs.filter(referencia__in=referencias)
+        if eans:
+            qs = qs.filter(ean__in=eans)
+        if (qp.get("pendente") or "true").strip().lower() not in {"false", "0"}:
+            qs = qs.filter(qtd_pendente__gt=0)
+
+        paginador = self.pagination_class()
+        pagina = paginador.paginate_queryset(
+            qs.order_by("referencia", "Idloja_id", "ean", "Idsaldopc").values(*self.CAMPOS), request, view=self
+        )
+        linhas = [
+            {
+                "loja_id": r["Idloja_id"],
+                "produto_id": r["Idproduto_id"],
+                "produtodetalhe_id": r["Idprodutodetalhe_id"],
+                "referencia": r["referencia"],
+                "ean": r["ean"],
+                "qtd_pedida": r["qtd_pedida"],
+                "qtd_recebida": r["qtd_recebida"],
+                "qtd_pendente": r["qtd_pendente"],
+                "valor_pedido": r["valor_pedido"],
+                "valor_pendente": r["valor_pendente"],
+                "pedidos": r["pedidos"],
+                "atualizado_em": r["atualizado_em"],
+            }
+            for r in pagina
+        ]
+        return paginador.get_paginated_response(linhas)
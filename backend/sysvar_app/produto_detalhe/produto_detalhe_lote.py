@@ -0,0 +1,121 @@
+# sysvar_app/produto_detalhe/produto_detalhe_lote.py
+"""
+Criação de SKUs em lote (POST /api/produtos-detalhes/batch-create/).
+
+Tudo é feito por conjunto: cores e tamanhos em uma consulta cada, uma única
+reserva de EANs para o bloco inteiro, e SKUs / itens de tabela de preço /
+estoque zerado gravados com bulk_create / bulk_update.
+"""
+from django.db import connection, transaction
+
+from ..codigos.codigos_ean import sequencia_ean
+from ..estoque.estoque_colest import marcar_matriz_colest
+from ..estoque.estoque_matriz import marcar_matriz, marcar_matriz_por_eans
+from ..models import Cor, Estoque, ProdutoDetalhe, TabelaPrecoItem, Tamanho
+
+TAMANHO_LOTE = 1000
+
+
+def _as_int(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def criar_skus_em_lote(produto, tabela, lojas, itens, preco_padrao) -> dict:
+    cod_prod = getattr(produto, 'referencia', None) or str(produto.pk)
+    errors = []
+
+    # 1) cores/tamanhos: uma consulta cada
+    cores = Cor.objects.in_bulk({_as_int(i.get('cor_id')) for i in itens} - {None})
+    tamanhos = Tamanho.objects.in_bulk({_as_int(i.get('tamanho_id')) for i in itens} - {None})
+
+    validos = []  # (idx, cor, tamanho, preco, ean13 informado ou '')
+    for idx, item in enumerate(itens, start=1):
+        cor_id = item.get('cor_id')
+        tam_id = item.get('tamanho_id')
+        if not cor_id or not tam_id:
+            errors.append({'index': idx, 'detail': 'cor_id e tamanho_id são obrigatórios.'})
+            continue
+        cor = cores.get(_as_int(cor_id))
+        if cor is None:
+            errors.append({'index': idx, 'detail': f'Cor {cor_id} inexistente.'})
+            continue
+        tamanho = tamanhos.get(_as_int(tam_id))
+        if tamanho is None:
+            errors.append({'index': idx, 'detail': f'Tamanho {tam_id} inexistente.'})
+            continue
+        validos.append((idx, cor, tamanho, item.get('preco', preco_padrao), (item.get('ean13') or '').strip()))
+
+    detalhes_resp = []
+
+    # 2) EANs para os itens sem ean13 informado, reservados antes da transação
+    #    (se ela falhar, os números voltam para a sequência)
+    with sequencia_ean.reservar_eans(sum(1 for v in validos if not v[4])) as gerados, transaction.atomic():
+        gerados = iter(gerados)
+        linhas = [(idx, cor, tam, preco, ean or next(gerados)) for idx, cor, tam, preco, ean in validos]
+
+        # o último item com o mesmo EAN prevalece (como no get_or_create/update_or_create sequencial)
+        por_ean = {ean: (cor, tam, preco) for _, cor, tam, preco, ean in linhas}
+
+        # 3) SKUs: cria os novos, atualiza só os que mudaram
+        existentes = ProdutoDetalhe.objects.in_bulk(list(por_ean), field_name='CodigodeBarra')
+        novos, alterados = [], []
+        for ean, (cor, tam, _) in por_ean.items():
+            pd = existentes.get(ean)
+            if pd is None:
+                novos.append(ProdutoDetalhe(
+                    CodigodeBarra=ean, Idproduto=produto, Idcor=cor, Idtamanho=tam,
+                    Codigoproduto=cod_prod, Ativo=True,
+                ))
+                continue
+            alvo = (produto.pk, cor.pk, tam.pk, cod_prod, True)
+            if (pd.Idproduto_id, pd.Idcor_id, pd.Idtamanho_id, pd.Codigoproduto, pd.Ativo) != alvo:
+                pd.Idproduto_id, pd.Idcor_id, pd.Idtamanho_id, pd.Codigoproduto, pd.Ativo = alvo
+                alterados.append(pd)
+
+        ProdutoDetalhe.objects.bulk_create(novos, batch_size=TAMANHO_LOTE)
+        if alterados:
+            ProdutoDetalhe.objects.bulk_update(
+                alterados, ['Idproduto', 'Idcor', 'Idtamanho', 'Codigoproduto', 'Ativo'], batch_size=TAMANHO_LOTE
+            )
+        created, updated = len(novos), len(alterados)
+
+        # 4) preços: upsert pela chave única (codigodebarra, idtabela)
+        upsert = {'update_conflicts': True, 'update_fields': ['codigoproduto', 'preco']}
+        if connection.features.supports_update_conflicts_with_target:
+            upsert['unique_fields'] = ['codigodebarra', 'idtabela']
+        TabelaPrecoItem.objects.bulk_create(
+            [TabelaPrecoItem(codigodebarra=ean, idtabela=tabela, codigoproduto=cod_prod, preco=preco)
+             for ean, (_, _, preco) in por_ean.items()],
+            batch_size=TAMANHO_LOTE, **upsert,
+        )
+
+        # 5) estoque zerado por loja; linhas já existentes ficam como estão
+        if lojas:
+            Estoque.objects.bulk_create(
+                [Estoque(Idloja=lj, CodigodeBarra=ean, codigoproduto=cod_prod, Estoque=0)
+                 for ean in por_ean for lj in lojas],
+                batch_size=TAMANHO_LOTE, ignore_conflicts=True,
+            )
+
+        # bulk_* não dispara sinais
+        marcar_matriz(cod_prod)
+        marcar_matriz_por_eans([pd.CodigodeBarra for pd in alterados])
+        marcar_matriz_colest()
+
+    for _, cor, tam, preco, ean in linhas:
+        detalhes_resp.append({
+            'ean13': ean,
+            'cor': {'id': cor.pk, 'descricao': cor.Descricao},
+            'tamanho': {'id': tam.pk, 'descricao': tam.Descricao, 'tamanho': getattr(tam, 'Tamanho', None)},
+            'preco': float(preco),
+        })
+
+    return {
+        'created': created,
+        'updated': updated,
+        'detalhes': detalhes_resp,
+        'errors': errors,
+    }
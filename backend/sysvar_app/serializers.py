@@ -11,6 +11,9 @@ from .models import (
     Colecao, Familia, Grupo, Subgrupo, Unidade, Codigos, Tabelapreco, Ncm,
     TabelaPrecoItem,
     NFeEntrada, NFeItem, FornecedorSkuMap, Nat_Lancamento, ModeloDocumentoFiscal, Pack, PackItem)
+from .codigos.codigos_contadores import mapa_contadores
+from .codigos.codigos_referencia import reservar_referencias
+from .pack.pack_composicao import marcar_packs
 
 # =============================
 # USER (para /api/users/)
@@ -151,9 +154,10 @@ class ColecaoSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         codigo = (instance.Codigo or '').strip()
         estacao = (instance.Estacao or '').strip()
-        cod = Codigos.objects.filter(colecao=codigo, estacao=estacao).first()
-        if cod:
-            data['Contador'] = int(cod.valor_var)
+        # mapa em memória (uma consulta por versão), evita N+1 na listagem
+        contador = mapa_contadores().get((codigo, estacao))
+        if contador is not None:
+            data['Contador'] = int(contador)
         return data
 
 
@@ -216,62 +220,58 @@ class ProdutoSerializer(serializers.ModelSerializer):
             'Desc_reduzida': {'required': False, 'allow_blank': True, 'allow_null': True},
         }
 
-    def create(self, validated_data):
-        tipoproduto = validated_data.get('Tipoproduto')
-        estacao_req = (validated_data.pop('estacao', '') or '').strip()
+    @staticmethod
+    def resolver_chave_referencia(validated_data, estacao_req=''):
+        """Valida coleção/estação/grupo e devolve (colecao, estacao, grupo) do contador de referência."""
         colecao_codigo = (validated_data.get('colecao') or '').strip()
         grupo_codigo = (validated_data.get('grupo') or '').strip()
 
-        if tipoproduto != '1':
-            validated_data['colecao'] = None
-            validated_data['grupo'] = None
-            validated_data['subgrupo'] = None
-            validated_data['referencia'] = None
-            return super().create(validated_data)
-
         if not colecao_codigo or not grupo_codigo:
             raise serializers.ValidationError("Para Tipoproduto='1', informe 'colecao' e 'grupo'.")
 
         qs = Colecao.objects.filter(Codigo=colecao_codigo)
-        if not qs.exists():
-            raise serializers.ValidationError("Coleção informada não existe.")
         if estacao_req:
             qs = qs.filter(Estacao=estacao_req)
-        if not qs.exists():
-            raise serializers.ValidationError("A combinação de 'colecao' e 'estacao' não existe.")
-        if qs.count() > 1:
+        estacoes = list(qs.values_list('Estacao', flat=True)[:2])
+        if not estacoes:
+            if estacao_req and Colecao.objects.filter(Codigo=colecao_codigo).exists():
+                raise serializers.ValidationError("A combinação de 'colecao' e 'estacao' não existe.")
+            raise serializers.ValidationError("Coleção informada não existe.")
+        if len(estacoes) > 1:
             raise serializers.ValidationError("Coleção com mesmo código tem múltiplas estações. Informe o campo 'estacao' (ex.: '01' ou '02').")
 
-        col = qs.first()
-        estacao_codigo = (col.Estacao or '').strip()
+        estacao_codigo = (estacoes[0] or '').strip()
         if not estacao_codigo:
             raise serializers.ValidationError("Coleção encontrada não possui 'Estacao' definida.")
+        return colecao_codigo, estacao_codigo, grupo_codigo
 
-        with transaction.atomic():
-            cod_row = (Codigos.objects
-                       .select_for_update()
-                       .filter(colecao=colecao_codigo, estacao=estacao_codigo)
-                       .first())
-            if cod_row is None:
-                cod_row = Codigos.objects.create(
-                    colecao=colecao_codigo,
-                    estacao=estacao_codigo,
-                    valor_var=0
-                )
-            try:
-                atual = int(cod_row.valor_var)
-            except (TypeError, ValueError):
-                atual = 0
+    def reservar_referencia(self):
+        """
+        Reserva a referência antes da transação de criação, para não segurar o
+        contador Codigos(colecao, estacao) enquanto o produto é gravado.
+        """
+        data = self.validated_data
+        if data.get('Tipoproduto') != '1' or data.get('referencia'):
+            return
+        chave = self.resolver_chave_referencia(data, (data.get('estacao') or '').strip())
+        data['referencia'] = reservar_referencias(*chave, qtd=1)[0]
+
+    def create(self, validated_data):
+        tipoproduto = validated_data.get('Tipoproduto')
+        estacao_req = (validated_data.pop('estacao', '') or '').strip()
 
-            proximo = atual + 1
-            cod_row.valor_var = proximo
-            cod_row.save()
+        if tipoproduto != '1':
+            validated_data['colecao'] = None
+            validated_data['grupo'] = None
+            validated_data['subgrupo'] = None
+            validated_data['referencia'] = None
+            return super().create(validated_data)
 
-            referencia = f"{colecao_codigo}.{estacao_codigo}.{grupo_codigo}{proximo:03d}"
-            validated_data['referencia'] = referencia
+        if not validated_data.get('referencia'):
+            chave = self.resolver_chave_referencia(validated_data, estacao_req)
+            validated_data['referencia'] = reservar_referencias(*chave, qtd=1)[0]
 
-            produto = super().create(validated_data)
-        return produto
+        return super().create(validated_data)
 
     def update(self, instance, validated_data):
         """
@@ -373,6 +373,16 @@ class NFeEntradaSerializer(serializers.ModelSerializer):
         read_only_fields = ['Idnfe', 'data_cadastro', 'status']
 
 
+class NFeEntradaListSerializer(serializers.ModelSerializer):
+    """Listagem: sem o XML e sem os itens."""
+    loja_nome = serializers.CharField(source='Idloja.nome_loja', read_only=True)
+    fornecedor_nome = serializers.CharField(source='Idfornecedor.Nome_fornecedor', read_only=True)
+
+    class Meta:
+        model = NFeEntrada
+        exclude = ['xml']
+
+
 class TabelaPrecoItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = TabelaPrecoItem
@@ -426,38 +436,58 @@ class PackSerializer(serializers.ModelSerializer):
                 )
         return data
 
+    def _itens_por_tamanho(self, itens_data) -> dict:
+        """{tamanho_id: qtd}; tamanho repetido no payload vale a primeira ocorrência."""
+        por_tamanho = {}
+        for it in itens_data:
+            por_tamanho.setdefault(int(self._pk(it.get("tamanho"))), it.get("qtd", 0))
+        return por_tamanho
+
     @transaction.atomic
     def create(self, validated_data):
         itens_data = validated_data.pop("itens", [])
         pack = Pack.objects.create(**validated_data)
 
-        seen = set()
-        for it in itens_data:
-            tid = int(self._pk(it.get("tamanho")))
-            if tid in seen:
-                continue
-            seen.add(tid)
-            PackItem.objects.create(pack=pack, tamanho_id=tid, qtd=it.get("qtd", 0))
+        PackItem.objects.bulk_create([
+            PackItem(pack=pack, tamanho_id=tid, qtd=qtd)
+            for tid, qtd in self._itens_por_tamanho(itens_data).items()
+        ])
+        # bulk_create não dispara os sinais de PackItem
+        marcar_packs()
         return pack
 
     @transaction.atomic
     def update(self, instance, validated_data):
         itens_data = validated_data.pop("itens", None)
 
+        if itens_data is not None:
+            novos = self._itens_por_tamanho(itens_data)
+            atuais = {pi.tamanho_id: pi for pi in PackItem.objects.filter(pack=instance)}
+
+            remover = [pi.pk for tid, pi in atuais.items() if tid not in novos]
+            alterar = []
+            for tid, qtd in novos.items():
+                pi = atuais.get(tid)
+                if pi is not None and pi.qtd != qtd:
+                    pi.qtd = qtd
+                    alterar.append(pi)
+            incluir = [PackItem(pack=instance, tamanho_id=tid, qtd=qtd) for tid, qtd in novos.items() if tid not in atuais]
+
+            if remover:
+                PackItem.objects.filter(pk__in=remover).delete()
+            if alterar:
+                PackItem.objects.bulk_update(alterar, ["qtd"])
+            if incluir:
+                PackItem.objects.bulk_create(incluir)
+            # o prefetch da view ainda tem os itens antigos
+            if hasattr(instance, "_prefetched_objects_cache"):
+                instance._prefetched_objects_cache.pop("itens", None)
+
         for attr, val in validated_data.items():
             setattr(instance, attr, val)
+        # grava por último e sempre: atualizado_em é a chave da composição em cache
         instance.save()
-
-        if itens_data is not None:
-            instance.itens.all().delete()
-            seen = set()
-            for it in itens_data:
-                tid = int(self._pk(it.get("tamanho")))
-                if tid in seen:
-                    continue
-                seen.add(tid)
-                PackItem.objects.create(pack=instance, tamanho_id=tid, qtd=it.get("qtd", 0))
-
+        marcar_packs()
         return instance
     
 class ProdutoUsoConsumoSerializer(serializers.ModelSerializer):
@@ -0,0 +1,212 @@
+# sysvar_app/signals.py
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .codigos.codigos_contadores import marcar_contadores
+from .estoque.estoque_colest import marcar_matriz_colest
+from .estoque.estoque_matriz import marcar_matriz, marcar_matriz_por_eans
+from .forma_pagamentos.forma_pagamentos_plano import marcar_planos
+from .models import (
+    Codigos, Colecao, Cor, Estoque, EstoqueMatrizReferencia, FormaPagamento, FormaPagamentoParcela, Loja, Pack,
+    PackItem, PedidoCompra, PedidoCompraEntrega, PedidoCompraItem, Produto, ProdutoDetalhe, RecebimentoPCItem, Tamanho, TabelaPrecoItem,
+)
+from .nfe.nfe_sugestoes import marcar_produtos
+from .pack.pack_composicao import marcar_packs
+from .pedido_compra.pedido_compra_calendario import preencher_cabecalho, sincronizar_entregas
+from .pedido_compra.pedido_compra_explosao import marcar_explosoes_packs
+from .pedido_compra.pedido_compra_saldos import marcar_saldo, marcar_saldo_pedidos
+
+
+# -------------------------------------------------------------------
+# Cubo EstoqueMatrizReferencia
+# -------------------------------------------------------------------
+@receiver(post_init, sender=Estoque)
+def _estoque_guardar_chave(sender, instance, **kwargs):
+    # __dict__: campo adiado (only/defer) não deve disparar consulta no post_init
+    d = instance.__dict__
+    instance._matriz_chave_original = (d.get('codigoproduto'), d.get('Idloja_id'))
+
+
+@receiver(post_save, sender=Estoque)
+@receiver(post_delete, sender=Estoque)
+def _estoque_marcar_matriz(sender, instance, **kwargs):
+    marcar_matriz(instance.codigoproduto, instance.Idloja_id)
+    original = getattr(instance, '_matriz_chave_original', None)
+    # None = campo não carregado na instância original (only/defer)
+    if original and None not in original and original != (instance.codigoproduto, instance.Idloja_id):
+        marcar_matriz(*original)
+    instance._matriz_chave_original = (instance.codigoproduto, instance.Idloja_id)
+
+
+@receiver(post_init, sender=ProdutoDetalhe)
+def _sku_guardar_ean(sender, instance, **kwargs):
+    instance._matriz_ean_original = instance.__dict__.get('CodigodeBarra')
+
+
+@receiver(post_save, sender=ProdutoDetalhe)
+@receiver(post_delete, sender=ProdutoDetalhe)
+def _sku_marcar_matriz(sender, instance, **kwargs):
+    # cor/tamanho/Ativo do SKU mudam a célula de todas as lojas que têm o EAN
+    marcar_matriz_por_eans({instance.CodigodeBarra, getattr(instance, '_matriz_ean_original', None)})
+    instance._matriz_ean_original = instance.CodigodeBarra
+
+
+# rótulos denormalizados dos eixos
+@receiver(post_save, sender=Loja)
+def _loja_rotulo_matriz(sender, instance, created, **kwargs):
+    if created:
+        return
+    (EstoqueMatrizReferencia.objects
+     .filter(Idloja_id=instance.pk).exclude(loja_nome=instance.nome_loja or '')
+     .update(loja_nome=instance.nome_loja or ''))
+
+
+@receiver(post_save, sender=Cor)
+def _cor_rotulo_matriz(sender, instance, created, **kwargs):
+    if created:
+        return
+    (EstoqueMatrizReferencia.objects
+     .filter(Idcor_id=instance.pk).exclude(cor_descricao=instance.Descricao or '')
+     .update(cor_descricao=instance.Descricao or ''))
+
+
+@receiver(post_save, sender=Tamanho)
+def _tamanho_rotulo_matriz(sender, instance, created, **kwargs):
+    if created:
+        return
+    (EstoqueMatrizReferencia.objects
+     .filter(Idtamanho_id=instance.pk)
+     .update(tamanho_sigla=instance.Tamanho or '', tamanho_descricao=instance.Descricao or ''))
+
+
+# -------------------------------------------------------------------
+# Cache da matriz Coleção/Estação x Loja
+# -------------------------------------------------------------------
+@receiver(post_save, sender=Estoque)
+@receiver(post_delete, sender=Estoque)
+@receiver(post_save, sender=TabelaPrecoItem)
+@receiver(post_delete, sender=TabelaPrecoItem)
+@receiver(post_save, sender=Colecao)
+@receiver(post_delete, sender=Colecao)
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=ProdutoDetalhe)
+@receiver(post_delete, sender=ProdutoDetalhe)
+@receiver(post_save, sender=Loja)
+@receiver(post_delete, sender=Loja)
+def _invalidar_matriz_colest(sender, **kwargs):
+    marcar_matriz_colest()
+
+
+# -------------------------------------------------------------------
+# Mapa de contadores (colecao, estacao) -> valor_var
+# -------------------------------------------------------------------
+@receiver(post_save, sender=Codigos)
+@receiver(post_delete, sender=Codigos)
+def _invalidar_contadores(sender, **kwargs):
+    marcar_contadores()
+
+
+# -------------------------------------------------------------------
+# Composição dos packs
+# -------------------------------------------------------------------
+@receiver(post_save, sender=Pack)
+@receiver(post_delete, sender=Pack)
+def _invalidar_packs(sender, instance, created=False, **kwargs):
+    marcar_packs()
+    if not created:
+        # o PackSerializer grava o pack depois dos itens (bulk, sem sinal)
+        marcar_explosoes_packs(instance.pk)
+
+
+@receiver(post_save, sender=PackItem)
+@receiver(post_delete, sender=PackItem)
+def _pack_item_alterado(sender, instance, **kwargs):
+    # atualizado_em do pack acompanha os itens (chave da composição em cache)
+    Pack.objects.filter(pk=instance.pack_id).update(atualizado_em=timezone.now())
+    marcar_packs()
+    marcar_explosoes_packs(instance.pack_id)
+
+
+# -------------------------------------------------------------------
+# Índice de sugestões de produto para itens de NF-e
+# -------------------------------------------------------------------
+_CAMPOS_SUGESTAO = {'Descricao', 'Desc_reduzida', 'referencia', 'Ativo'}
+
+
+@receiver(post_save, sender=Produto)
+def _produto_marcar_sugestoes(sender, instance, created, **kwargs):
+    if created or _CAMPOS_SUGESTAO & instance.campos_alterados().keys():
+        marcar_produtos(instance.pk)
+
+
+@receiver(post_delete, sender=Produto)
+def _produto_remover_sugestoes(sender, instance, **kwargs):
+    marcar_produtos(instance.pk)
+
+
+# -------------------------------------------------------------------
+# Saldo em pedido (SaldoPedidoCompra)
+# -------------------------------------------------------------------
+@receiver(post_init, sender=PedidoCompraItem)
+def _pc_item_guardar_produto(sender, instance, **kwargs):
+    instance._saldo_produto_original = instance.__dict__.get('Idproduto_id')
+
+
+@receiver(post_save, sender=PedidoCompraItem)
+@receiver(post_delete, sender=PedidoCompraItem)
+def _pc_item_marcar_saldo(sender, instance, **kwargs):
+    marcar_saldo(instance.Idproduto_id, getattr(instance, '_saldo_produto_original', None))
+    instance._saldo_produto_original = instance.Idproduto_id
+
+
+@receiver(post_save, sender=PedidoCompra)
+def _pc_marcar_saldo(sender, instance, created, **kwargs):
+    # status/loja do cabeçalho mudam o saldo de todos os itens
+    if not created:
+        marcar_saldo_pedidos(instance.pk)
+
+
+@receiver(post_save, sender=RecebimentoPCItem)
+@receiver(post_delete, sender=RecebimentoPCItem)
+def _recebimento_marcar_saldo(sender, instance, **kwargs):
+    marcar_saldo(*PedidoCompraItem.objects.filter(pk=instance.Idpedidocompraitem_id).values_list('Idproduto_id', flat=True))
+
+
+# -------------------------------------------------------------------
+# Planos de pagamento compilados
+# -------------------------------------------------------------------
+@receiver(post_save, sender=FormaPagamento)
+@receiver(post_delete, sender=FormaPagamento)
+@receiver(post_save, sender=FormaPagamentoParcela)
+@receiver(post_delete, sender=FormaPagamentoParcela)
+def _invalidar_planos(sender, **kwargs):
+    marcar_planos()
+
+
+# -------------------------------------------------------------------
+# Calendário de recebimento (cabeçalho copiado em PedidoCompraEntrega)
+# -------------------------------------------------------------------
+def _cabecalho_entrega(pedido):
+    # __dict__: campo adiado (only/defer) não deve disparar consulta no post_init
+    d = pedido.__dict__
+    return (d.get('Idloja_id'), d.get('Idfornecedor_id'), d.get('Status'))
+
+
+@receiver(post_init, sender=PedidoCompra)
+def _pc_guardar_cabecalho(sender, instance, **kwargs):
+    instance._cabecalho_entrega_original = _cabecalho_entrega(instance)
+
+
+@receiver(post_save, sender=PedidoCompra)
+def _pc_sincronizar_entregas(sender, instance, created, **kwargs):
+    atual = _cabecalho_entrega(instance)
+    if not created and atual != getattr(instance, '_cabecalho_entrega_original', None):
+        sincronizar_entregas(instance.pk)
+    instance._cabecalho_entrega_original = atual
+
+
+@receiver(pre_save, sender=PedidoCompraEntrega)
+def _entrega_preencher_cabecalho(sender, instance, **kwargs):
+    preencher_cabecalho(instance)
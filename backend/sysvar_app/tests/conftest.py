@@ -1,10 +1,14 @@
+from datetime import date
+
 import pytest
 from django.utils import timezone
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
 
-from core.models import (  # ajuste o import do seu app se não for "core"
+from sysvar_app.models import (
     Loja, Fornecedor, Grade, Tamanho, Cor, Produto, ProdutoDetalhe,
+    FormaPagamento, FormaPagamentoParcela, PedidoCompra, PedidoCompraItem, Pack, PackItem,
+    NFeEntrada, NFeItem,
 )
 
 @pytest.fixture
@@ -175,3 +179,58 @@ def make_xml():
 </nfeProc>
 """
     return _build_xml
+
+
+@pytest.fixture
+def forma_30_60(db):
+    f = FormaPagamento.objects.create(codigo="30/60", descricao="30/60 dias", num_parcelas=2)
+    FormaPagamentoParcela.objects.create(forma=f, ordem=1, dias=30)
+    FormaPagamentoParcela.objects.create(forma=f, ordem=2, dias=60)
+    return f
+
+
+@pytest.fixture
+def pedido(db, loja1, fornecedor):
+    return PedidoCompra.objects.create(
+        Idfornecedor=fornecedor, Idloja=loja1, Valorpedido=0, Datapedido=date(2026, 1, 10)
+    )
+
+
+@pytest.fixture
+def make_item():
+    # item de pedido de compra; Total_item como o serializer grava
+    def _item(pedido, produto, qtd, valor, desconto=0, **extra):
+        return PedidoCompraItem.objects.create(
+            Idpedidocompra=pedido, Idproduto=produto, Qtp_pc=qtd, valorunitario=valor,
+            Desconto=desconto, Total_item=qtd * valor - desconto, **extra
+        )
+    return _item
+
+
+@pytest.fixture
+def pack_pmg(db, grade_ptmg):
+    # 1 P + 2 M + 1 G
+    grade, (tP, tM, tG) = grade_ptmg
+    pack = Pack.objects.create(nome="PMG", grade=grade)
+    for tam, qtd in ((tP, 1), (tM, 2), (tG, 1)):
+        PackItem.objects.create(pack=pack, tamanho=tam, qtd=qtd)
+    pack.refresh_from_db()
+    return pack
+
+
+@pytest.fixture
+def nfe(db, loja1, fornecedor):
+    return NFeEntrada.objects.create(
+        chave="35260111111111000155550010000001231000001234", numero="123", serie="1",
+        Idloja=loja1, Idfornecedor=fornecedor, cnpj_emitente="11111111000155", origem="XML",
+    )
+
+
+@pytest.fixture
+def make_nfe_item():
+    def _item(nfe, ordem, qcom, cprod=None, cean=None, vuncom=10):
+        return NFeItem.objects.create(
+            nfe=nfe, ordem=ordem, cProd=cprod or f"VEN-{ordem}", xProd=f"Item {ordem}",
+            qCom=qcom, vUnCom=vuncom, vProd=qcom * vuncom, cean=cean,
+        )
+    return _item
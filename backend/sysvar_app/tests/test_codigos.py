@@ -0,0 +1,143 @@
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from sysvar_app.models import Codigos, CodigosFaixaLivre
+from sysvar_app.codigos import codigos_contadores
+from sysvar_app.codigos.codigos_contadores import mapa_contadores
+from sysvar_app.codigos.codigos_ean import SequenciaEAN, eans_da_sequencia
+from sysvar_app.codigos.codigos_referencia import reservar_referencias
+
+pytestmark = pytest.mark.django_db
+
+
+def _dv_ean13(corpo):
+    soma = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(corpo))
+    return str((10 - soma % 10) % 10)
+
+
+def test_eans_da_sequencia_digito_verificador():
+    eans = eans_da_sequencia([1, 42, 99999, 100001])
+    assert [e[:12] for e in eans] == ["789123400001", "789123400042", "789123499999", "789123400001"]
+    assert all(e[12] == _dv_ean13(e[:12]) for e in eans)
+
+
+def test_reserva_pula_ean_ja_cadastrado(sku_existente):
+    sku_existente.CodigodeBarra = eans_da_sequencia([1])[0]
+    sku_existente.save()
+    seq = SequenciaEAN(bloco=5)
+
+    assert seq.proximos_eans(2) == eans_da_sequencia([2, 3])
+    # um único UPDATE no contador trouxe o bloco inteiro
+    assert Codigos.objects.get(colecao="EA", estacao="13").valor_var == 5
+
+
+def test_reservar_eans_devolve_numeros_com_excecao():
+    seq = SequenciaEAN(bloco=3)
+    with pytest.raises(RuntimeError):
+        with seq.reservar_eans(2) as eans:
+            assert eans == eans_da_sequencia([1, 2])
+            raise RuntimeError("rollback")
+    assert seq.proximos_eans(3) == eans_da_sequencia([1, 2, 3])
+
+
+def test_bloco_fica_reservado_no_banco_em_nome_do_processo():
+    seq = SequenciaEAN(bloco=10)
+    seq.reservar(3)
+
+    faixa = CodigosFaixaLivre.objects.get(colecao="EA", estacao="13")
+    assert (faixa.inicio, faixa.fim, faixa.reservado_por) == (1, 10, seq._dono)
+    assert faixa.reservado_ate > timezone.now()
+
+    # outro processo não toca numa reserva válida
+    outro = SequenciaEAN(bloco=10)
+    assert outro.reservar(1) == [11]
+
+
+def test_reserva_vencida_de_processo_morto_volta_a_ser_servida():
+    morto = SequenciaEAN(bloco=10)
+    morto.reservar(3)  # 1..3 servidos, 4..10 ainda no pool quando o processo "morre"
+    CodigosFaixaLivre.objects.filter(reservado_por=morto._dono).update(
+        reservado_ate=timezone.now() - timedelta(seconds=1)
+    )
+
+    novo = SequenciaEAN(bloco=10)
+    # os servidos que não viraram ProdutoDetalhe voltam também; nenhum número se perde
+    assert novo.reservar(10) == list(range(1, 11))
+    assert Codigos.objects.get(colecao="EA", estacao="13").valor_var == 10
+
+
+def test_processo_com_reserva_vencida_descarta_o_pool():
+    seq = SequenciaEAN(bloco=10)
+    seq.reservar(1)
+    CodigosFaixaLivre.objects.filter(reservado_por=seq._dono).update(
+        reservado_ate=timezone.now() - timedelta(seconds=1)
+    )
+    seq._renovar_em = None  # força a renovação na próxima reserva
+
+    # 2..10 podem ter sido assumidos por outro processo: não serve o 2 do pool,
+    # libera a faixa vencida e a busca de novo no banco
+    assert seq.reservar(1) == [1]
+    faixa = CodigosFaixaLivre.objects.get(colecao="EA", estacao="13")
+    assert (faixa.inicio, faixa.fim, faixa.reservado_por) == (1, 10, seq._dono)
+    assert faixa.reservado_ate > timezone.now()
+    assert Codigos.objects.get(colecao="EA", estacao="13").valor_var == 10
+
+
+def test_devolver_ao_banco_libera_o_pool():
+    seq = SequenciaEAN(bloco=10)
+    seq.reservar(4)
+    seq.devolver_ao_banco()
+
+    faixas = list(CodigosFaixaLivre.objects.values_list("inicio", "fim", "reservado_por"))
+    assert faixas == [(5, 10, "")]
+    assert SequenciaEAN(bloco=10).reservar(2) == [5, 6]
+
+
+def test_referencias_consecutivas_sem_repetir_entre_reservas():
+    primeiras = reservar_referencias("01", "02", "03", qtd=3)
+    seguinte = reservar_referencias("01", "02", "03")
+
+    assert primeiras == ["01.02.03001", "01.02.03002", "01.02.03003"]
+    assert seguinte == ["01.02.03004"]
+    assert Codigos.objects.get(colecao="01", estacao="02").valor_var == 4
+    # contador de outra (coleção, estação) é independente
+    assert reservar_referencias("01", "03", "03") == ["01.03.03001"]
+
+
+@pytest.fixture
+def contadores_zerados():
+    cache.delete(codigos_contadores.CHAVE_VERSAO)
+    codigos_contadores._estado.update(versao=None, mapa={})
+
+
+def test_mapa_contadores_em_memoria_com_cache_compartilhado(
+    settings, contadores_zerados, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    settings.CACHE_MEMORIA_PROCESSO = True
+    with django_capture_on_commit_callbacks(execute=True):
+        Codigos.objects.create(colecao="01", estacao="02", valor_var=7)
+
+    assert mapa_contadores() == {("01", "02"): 7}
+    with django_assert_num_queries(0):
+        assert mapa_contadores() == {("01", "02"): 7}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Codigos.objects.filter(colecao="01").update(valor_var=8)
+        codigos_contadores.marcar_contadores()
+        # antes do COMMIT a própria transação lê do banco
+        assert mapa_contadores() == {("01", "02"): 8}
+    assert mapa_contadores() == {("01", "02"): 8}
+
+
+def test_mapa_contadores_sem_cache_compartilhado_le_do_banco(settings, contadores_zerados, django_assert_num_queries):
+    settings.CACHE_MEMORIA_PROCESSO = False
+    Codigos.objects.create(colecao="01", estacao="02", valor_var=7)
+    mapa_contadores()
+
+    # outro worker alterou o contador: a versão local não muda, mas o mapa não fica velho
+    Codigos.objects.filter(colecao="01").update(valor_var=9)
+    with django_assert_num_queries(1):
+        assert mapa_contadores() == {("01", "02"): 9}
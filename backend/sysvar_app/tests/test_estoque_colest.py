@@ -0,0 +1,105 @@
+import pytest
+from datetime import date
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from sysvar_app.estoque import estoque_colest
+from sysvar_app.estoque.estoque_colest import aquecer_matriz_colest, combinacoes_frequentes, matriz_colest
+from sysvar_app.models import Colecao, Estoque, Loja, Produto, Tabelapreco, TabelaPrecoItem
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpo(settings):
+    settings.CACHE_MEMORIA_PROCESSO = True
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def tabela(db):
+    return Tabelapreco.objects.create(
+        NomeTabela="Varejo", DataInicio=date(2026, 1, 1), DataFim=date(2026, 12, 31), Promocao="NAO"
+    )
+
+
+@pytest.fixture
+def estoque(loja1, sku_existente, tabela):
+    Produto.objects.filter(pk=sku_existente.Idproduto_id).update(colecao="01")
+    Colecao.objects.create(Descricao="Verão 26", Codigo="01", Estacao="02")
+    TabelaPrecoItem.objects.create(
+        codigoproduto=sku_existente.Codigoproduto, codigodebarra=sku_existente.CodigodeBarra,
+        preco=10, idtabela=tabela,
+    )
+    return Estoque.objects.create(
+        CodigodeBarra=sku_existente.CodigodeBarra, codigoproduto=sku_existente.Codigoproduto,
+        Idloja=loja1, Estoque=3,
+    )
+
+
+def _matriz(tabela):
+    return matriz_colest(["01"], [], tabela.pk, "true")
+
+
+def test_segunda_consulta_vem_do_cache(estoque, tabela, django_assert_num_queries):
+    # sem nome_loja cai no apelido
+    Loja.objects.filter(pk=estoque.Idloja_id).update(nome_loja="")
+
+    out = _matriz(tabela)
+    assert out["matriz"]["totais"]["geral"] == {"itens": 3, "valor": 30.0}
+    assert out["eixos"]["lojas"] == [{"id": estoque.Idloja_id, "nome": "LJ01"}]
+
+    with django_assert_num_queries(0):
+        assert _matriz(tabela) == out
+    assert combinacoes_frequentes() == [(("01",), (), tabela.pk, "true")]
+
+
+def test_gravacao_de_estoque_invalida_depois_do_commit(estoque, tabela, django_capture_on_commit_callbacks):
+    assert _matriz(tabela)["matriz"]["totais"]["geral"]["itens"] == 3
+
+    with django_capture_on_commit_callbacks(execute=True):
+        estoque.Estoque = 7
+        estoque.save()
+
+    assert _matriz(tabela)["matriz"]["totais"]["geral"]["itens"] == 7
+
+
+def test_sem_cache_compartilhado_resultado_expira(estoque, tabela, settings, monkeypatch):
+    settings.CACHE_MEMORIA_PROCESSO = False
+    monkeypatch.setattr(estoque_colest, "TTL_SEM_CACHE_COMPARTILHADO", 0)  # 0 = expira na hora
+
+    _matriz(tabela)
+    Estoque.objects.filter(pk=estoque.pk).update(Estoque=9)  # sem sinal: como se fosse outro worker
+    assert _matriz(tabela)["matriz"]["totais"]["geral"]["itens"] == 9
+
+
+def test_aquecimento_das_combinacoes_mais_consultadas(estoque, tabela, django_capture_on_commit_callbacks,
+                                                      django_assert_num_queries):
+    _matriz(tabela)
+    _matriz(tabela)
+    matriz_colest(["01"], [estoque.Idloja_id], tabela.pk, "true")
+    assert combinacoes_frequentes()[0] == (("01",), (), tabela.pk, "true")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        estoque.Estoque = 5
+        estoque.save()
+
+    assert aquecer_matriz_colest(combinacoes_frequentes()) == 2
+    assert aquecer_matriz_colest(combinacoes_frequentes()) == 0
+    with django_assert_num_queries(0):
+        assert _matriz(tabela)["matriz"]["totais"]["geral"]["itens"] == 5
+
+
+def test_comando_exige_cache_compartilhado(estoque, tabela, settings, tmp_path, capsys):
+    with pytest.raises(CommandError, match="não é compartilhado"):
+        call_command("aquecer_matriz_colest", tabela=[tabela.pk])
+
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": str(tmp_path)}
+    }
+    call_command("aquecer_matriz_colest", tabela=[tabela.pk])
+    assert "OK: 1 combinação(ões) calculada(s)" in capsys.readouterr().out
@@ -0,0 +1,70 @@
+import pytest
+from django.urls import reverse
+
+from sysvar_app.models import Estoque, EstoqueMatrizReferencia, ProdutoDetalhe
+from sysvar_app.estoque.estoque_matriz import atualizar_matriz_referencias
+
+pytestmark = pytest.mark.django_db
+
+
+def _estoque(sku, loja, qtd, reserva=0):
+    return Estoque.objects.create(
+        CodigodeBarra=sku.CodigodeBarra, codigoproduto=sku.Codigoproduto, Idloja=loja, Estoque=qtd, reserva=reserva
+    )
+
+
+def test_cubo_uma_celula_por_loja_e_separa_sku_inativo(loja1, loja2, sku_existente):
+    _estoque(sku_existente, loja1, 5, reserva=1)
+    _estoque(sku_existente, loja2, 3)
+
+    assert atualizar_matriz_referencias([sku_existente.Codigoproduto]) == 2
+    celulas = EstoqueMatrizReferencia.objects.filter(referencia=sku_existente.Codigoproduto)
+    por_loja = {c.Idloja_id: (c.estoque, c.reserva, c.estoque_total, c.skus_ativos) for c in celulas}
+    assert por_loja == {loja1.pk: (5, 1, 5, 1), loja2.pk: (3, 0, 3, 1)}
+
+    sku_existente.Ativo = False
+    sku_existente.save()
+    atualizar_matriz_referencias([sku_existente.Codigoproduto], lojas=[loja1.pk])
+    cel = EstoqueMatrizReferencia.objects.get(referencia=sku_existente.Codigoproduto, Idloja=loja1)
+    assert (cel.estoque, cel.estoque_total, cel.skus_ativos) == (0, 5, 0)
+
+
+def test_sinal_atualiza_cubo_depois_do_commit(loja1, sku_existente, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        est = _estoque(sku_existente, loja1, 4)
+    assert EstoqueMatrizReferencia.objects.get(referencia=sku_existente.Codigoproduto).estoque == 4
+
+    with django_capture_on_commit_callbacks(execute=True):
+        est.Estoque = 10
+        est.save()
+    assert EstoqueMatrizReferencia.objects.get(referencia=sku_existente.Codigoproduto).estoque == 10
+
+
+def test_matriz_referencia_le_o_cubo(api_client, admin_user, loja1, sku_existente):
+    _estoque(sku_existente, loja1, 6, reserva=2)
+    atualizar_matriz_referencias([sku_existente.Codigoproduto])
+
+    api_client.force_authenticate(user=admin_user)
+    resp = api_client.get(reverse("estoques-matriz-referencia"), {"ref": sku_existente.Codigoproduto})
+
+    assert resp.status_code == 200
+    assert resp.data["resumo"] == {"estoque": 6, "reserva": 2, "disponivel": 4}
+    loja = resp.data["matriz"]["por_loja"][0]
+    assert loja["loja_id"] == loja1.pk
+    assert loja["cores"][0]["tamanhos"][str(sku_existente.Idtamanho_id)] == 6
+    assert "em_pedido" not in resp.data
+
+
+def test_matriz_referencia_sem_estoque_404(api_client, admin_user, produto_revenda):
+    api_client.force_authenticate(user=admin_user)
+    resp = api_client.get(reverse("estoques-matriz-referencia"), {"ref": produto_revenda.referencia})
+    assert resp.status_code == 404
+
+
+def test_instancias_com_campos_adiados_nao_consultam_no_post_init(loja1, sku_existente, django_assert_num_queries):
+    _estoque(sku_existente, loja1, 2)
+
+    with django_assert_num_queries(1):
+        assert len(list(Estoque.objects.only("pk"))) == 1
+    with django_assert_num_queries(1):
+        assert len(list(ProdutoDetalhe.objects.only("pk"))) == 1
@@ -0,0 +1,94 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from sysvar_app.forma_pagamentos import forma_pagamentos_plano
+from sysvar_app.forma_pagamentos.forma_pagamentos_plano import PlanoPagamento, compilar_forma, planos
+from sysvar_app.models import FormaPagamento, FormaPagamentoParcela, PedidoCompra, PedidoCompraParcela
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def memoria(settings):
+    settings.CACHE_MEMORIA_PROCESSO = True
+    cache.delete(forma_pagamentos_plano.CHAVE_VERSAO)
+    forma_pagamentos_plano._estado.update(versao=None, planos={})
+
+
+@pytest.fixture
+def forma_3x(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        f = FormaPagamento.objects.create(codigo="30/60/90", descricao="3x", num_parcelas=3)
+        for ordem in (1, 2, 3):
+            FormaPagamentoParcela.objects.create(forma=f, ordem=ordem, dias=30 * ordem, percentual=Decimal("33.33"))
+    return f
+
+
+def test_dividir_joga_o_arredondamento_na_ultima_parcela():
+    pl = PlanoPagamento(1, "3X", "3x", 3, [(1, 30, Decimal("33.33"), None)] * 3)
+    assert pl.dividir(Decimal("100.01")) == [Decimal("33.33"), Decimal("33.33"), Decimal("33.35")]
+
+    # percentual tem precedência; sem percentual vale o valor fixo
+    misto = PlanoPagamento(2, "ENT", "entrada + saldo", 2, [(1, 0, None, Decimal("20")), (2, 30, Decimal("80"), None)])
+    assert misto.dividir(Decimal("150.00")) == [Decimal("20.00"), Decimal("130.00")]
+
+    avista = PlanoPagamento(3, "AV", "à vista", 1, [])
+    assert (avista.prazos, avista.dividir(Decimal("9.99"))) == ((0,), [Decimal("9.99")])
+
+
+def test_compilar_forma_le_do_banco(forma_3x):
+    pl = compilar_forma(forma_3x)
+
+    assert (pl.codigo, pl.num_parcelas, pl.prazos) == ("30/60/90", 3, (30, 60, 90))
+    assert pl.parcelas[0][2] == Decimal("0.3333")
+    assert pl.vencimentos(date(2026, 1, 31)) == [date(2026, 3, 2), date(2026, 4, 1), date(2026, 5, 1)]
+
+
+def test_planos_em_memoria_e_invalidados_no_commit(forma_3x, django_assert_num_queries,
+                                                   django_capture_on_commit_callbacks):
+    assert planos()["30/60/90"].prazos == (30, 60, 90)
+    with django_assert_num_queries(0):
+        assert "30/60/90" in planos()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        FormaPagamentoParcela.objects.filter(forma=forma_3x, ordem=3).update(dias=120)
+        forma_pagamentos_plano.marcar_planos()
+        # antes do COMMIT a própria transação compila do banco
+        assert planos()["30/60/90"].prazos == (30, 60, 120)
+    assert planos()["30/60/90"].prazos == (30, 60, 120)
+
+
+def test_reaplicar_forma_pagamento_nos_pedidos_em_aberto(api_client, admin_user, loja1, fornecedor, forma_30_60,
+                                                         forma_3x):
+    def _pedido(status, total):
+        return PedidoCompra.objects.create(
+            Idfornecedor=fornecedor, Idloja=loja1, Valorpedido=total, Datapedido=date(2026, 1, 10),
+            Status=status, condicao_pagamento=forma_30_60.codigo,
+        )
+
+    abertos = [_pedido("AB", Decimal("100.01")), _pedido("AB", Decimal("60.00"))]
+    aprovado = _pedido("AP", Decimal("90.00"))
+    api_client.force_authenticate(user=admin_user)
+    url = reverse("pedido-compra-reaplicar-forma-pagamento")
+
+    resp = api_client.post(url, {"codigo": forma_3x.codigo, "codigo_atual": forma_30_60.codigo}, format="json")
+
+    assert resp.status_code == 200, resp.data
+    assert sorted(resp.data["ids"]) == sorted(p.pk for p in abertos)
+    for p in abertos:
+        p.refresh_from_db()
+        assert (p.condicao_pagamento, p.parcelas, p.condicao_pagamento_detalhe) == ("30/60/90", 3, "3x")
+    valores = list(
+        PedidoCompraParcela.objects.filter(pedido=abertos[0]).order_by("parcela").values_list("valor", flat=True)
+    )
+    assert valores == [Decimal("33.33"), Decimal("33.33"), Decimal("33.35")]
+    aprovado.refresh_from_db()
+    assert aprovado.condicao_pagamento == forma_30_60.codigo
+    assert not PedidoCompraParcela.objects.filter(pedido=aprovado).exists()
+
+    assert api_client.post(url, {"codigo": "NAOEXISTE", "codigo_atual": "30/60"}, format="json").status_code == 400
+    assert api_client.post(url, {"codigo": forma_3x.codigo}, format="json").status_code == 400
@@ -0,0 +1,112 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from sysvar_app.models import (
+    FornecedorSkuMap, NFeConciliacaoItem, NFeEntrada, PedidoCompra, ProdutoEAN,
+)
+from sysvar_app.nfe.nfe_conciliacao import NFeNaoConciliavel, conciliar
+
+pytestmark = pytest.mark.django_db
+
+
+def _destinos(resultado):
+    return {it["ordem"]: it["destino"] for it in resultado["itens"]}
+
+
+def _pedido_aprovado(loja, fornecedor, data):
+    return PedidoCompra.objects.create(
+        Idfornecedor=fornecedor, Idloja=loja, Valorpedido=0, Datapedido=data, Status=PedidoCompra.StatusChoices.AP
+    )
+
+
+def test_resolve_por_mapa_ean_e_ean_adicional(nfe, fornecedor, produto_revenda, sku_existente, make_nfe_item):
+    FornecedorSkuMap.objects.create(
+        Idfornecedor=fornecedor, cprod_fornecedor="CX-6", Idprodutodetalhe=sku_existente, fator_conversao=6
+    )
+    ProdutoEAN.objects.create(Idprodutodetalhe=sku_existente, ean="7890000000017")
+    make_nfe_item(nfe, 1, Decimal("2"), cprod="CX-6")
+    make_nfe_item(nfe, 2, Decimal("1"), cean=sku_existente.CodigodeBarra)
+    make_nfe_item(nfe, 3, Decimal("1"), cean="7890000000017")
+    make_nfe_item(nfe, 4, Decimal("1"), cean="7899999999999")
+
+    res = conciliar(nfe)
+
+    d = _destinos(res)
+    assert (d[1]["origem"], d[1]["produtodetalhe_id"], d[1]["fator"]) == ("mapa_cprod", sku_existente.pk, 6)
+    assert (d[2]["origem"], d[2]["produto_id"]) == ("ean", produto_revenda.pk)
+    assert d[3]["origem"] == "ean_adicional"
+    assert d[4] is None
+    assert (res["status"], res["conciliados"], res["pendentes"]) == ("importada", 3, 1)
+    assert nfe.itens.get(ordem=1).fator_conversao == 6
+
+
+def test_todas_conciliadas_muda_status_e_bloqueia_lancada(nfe, sku_existente, make_nfe_item):
+    make_nfe_item(nfe, 1, Decimal("1"), cean=sku_existente.CodigodeBarra)
+    assert conciliar(nfe)["status"] == "conciliada"
+    assert NFeEntrada.objects.get(pk=nfe.pk).status == "conciliada"
+
+    NFeEntrada.objects.filter(pk=nfe.pk).update(status="lancada")
+    with pytest.raises(NFeNaoConciliavel):
+        conciliar(nfe)
+
+
+def test_aloca_no_item_de_pedido_que_cobre_a_linha(nfe, loja1, fornecedor, sku_existente, make_item, make_nfe_item):
+    antigo = _pedido_aprovado(loja1, fornecedor, date(2026, 1, 1))
+    novo = _pedido_aprovado(loja1, fornecedor, date(2026, 2, 1))
+    pequeno = make_item(antigo, sku_existente.Idproduto, 2, Decimal("10"), Idprodutodetalhe=sku_existente)
+    grande = make_item(novo, sku_existente.Idproduto, 10, Decimal("10"), Idprodutodetalhe=sku_existente)
+    make_nfe_item(nfe, 1, Decimal("5"), cean=sku_existente.CodigodeBarra)
+    make_nfe_item(nfe, 2, Decimal("2"), cean=sku_existente.CodigodeBarra)
+    make_nfe_item(nfe, 3, Decimal("4"), cean=sku_existente.CodigodeBarra)
+
+    d = _destinos(conciliar(nfe))
+
+    # o item mais antigo não comporta 5: vai para o mais novo, não estoura o antigo
+    assert d[1]["pedidocompraitem_id"] == grande.pk
+    assert d[2]["pedidocompraitem_id"] == pequeno.pk
+    # sobram 5 no grande, que comporta os 4
+    assert d[3]["pedidocompraitem_id"] == grande.pk
+    assert not any(x["saldo_pedido_insuficiente"] for x in d.values())
+
+
+def test_saldo_insuficiente_e_linha_manual_descontada(nfe, loja1, fornecedor, sku_existente, make_item, make_nfe_item):
+    pc = _pedido_aprovado(loja1, fornecedor, date(2026, 1, 1))
+    item_pc = make_item(pc, sku_existente.Idproduto, 10, Decimal("10"), Idprodutodetalhe=sku_existente)
+    manual = make_nfe_item(nfe, 1, Decimal("8"), cprod="AVULSO")
+    make_nfe_item(nfe, 2, Decimal("5"), cean=sku_existente.CodigodeBarra)
+    NFeConciliacaoItem.objects.create(
+        nfe_item=manual, destino_tipo="sku", Idprodutodetalhe=sku_existente, Idproduto=sku_existente.Idproduto,
+        origem_match="manual", Idpedidocompraitem=item_pc,
+    )
+
+    d = _destinos(conciliar(nfe))
+
+    assert (d[1]["origem"], d[1]["pedidocompraitem_id"]) == ("manual", item_pc.pk)
+    # 8 dos 10 já estão com a linha manual: os 5 não cabem
+    assert d[2]["pedidocompraitem_id"] is None
+    assert d[2]["saldo_pedido_insuficiente"] is True
+
+    # reconciliar preserva a manual e regrava só as automáticas
+    conciliar(nfe)
+    assert list(NFeConciliacaoItem.objects.filter(nfe_item__nfe=nfe).order_by("nfe_item__ordem")
+                .values_list("origem_match", flat=True)) == ["manual", "auto"]
+
+
+def test_quantidade_convertida_fracionada_fica_pendente(nfe, loja1, fornecedor, sku_existente, make_item,
+                                                        make_nfe_item):
+    item_pc = make_item(_pedido_aprovado(loja1, fornecedor, date(2026, 1, 2)), sku_existente.Idproduto, 10,
+                        Decimal("10"), Idprodutodetalhe=sku_existente)
+    it = make_nfe_item(nfe, 1, Decimal("2.5"), cean=sku_existente.CodigodeBarra)
+
+    res = conciliar(nfe)
+
+    linha = res["itens"][0]
+    # o destino é mantido para o operador corrigir o fator; nada é alocado no pedido
+    assert (linha["destino"]["produtodetalhe_id"], linha["destino"]["quantidade_fracionada"]) == (sku_existente.pk, True)
+    assert linha["destino"]["pedidocompraitem_id"] is None
+    assert (linha["pendente"], res["status"], res["pendentes"]) == (True, "importada", 1)
+    it.refresh_from_db()
+    assert it.pendente
+    assert item_pc.pk not in NFeConciliacaoItem.objects.values_list("Idpedidocompraitem_id", flat=True)
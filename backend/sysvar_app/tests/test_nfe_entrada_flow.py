@@ -6,7 +6,7 @@ import pytest
 from django.urls import reverse
 from rest_framework import status
 
-from core.models import (  # ajuste o import do seu app se não for "core"
+from sysvar_app.models import (
     NFeEntrada, FornecedorSkuMap, Estoque, MovimentacaoProdutos, ProdutoDetalhe, Produto
 )
 
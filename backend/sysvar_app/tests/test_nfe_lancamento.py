@@ -0,0 +1,122 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from sysvar_app.models import (
+    Estoque, Fornecedor, FornecedorSkuMap, MovimentacaoProdutos, NFeEntrada, PedidoCompra, PedidoCompraItem,
+    ProdutoDetalhe, RecebimentoPCItem, SaldoPedidoCompra,
+)
+from sysvar_app.nfe.nfe_lancamento import NFeNaoCancelavel, NFeNaoLancavel, cancelar_nfe, lancar
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def sku_m(produto_revenda, grade_ptmg, cor_preta):
+    return ProdutoDetalhe.objects.create(
+        Idproduto=produto_revenda, Idtamanho=grade_ptmg[1][1], Idcor=cor_preta, CodigodeBarra="7891234000024",
+        Codigoproduto=produto_revenda.referencia, Item=0,
+    )
+
+
+def _pedido_aprovado(loja, fornecedor):
+    return PedidoCompra.objects.create(
+        Idfornecedor=fornecedor, Idloja=loja, Valorpedido=0, Datapedido=date(2026, 1, 1),
+        Status=PedidoCompra.StatusChoices.AP,
+    )
+
+
+def _estoque(loja, sku):
+    return Estoque.objects.filter(Idloja=loja, CodigodeBarra=sku.CodigodeBarra).values_list("Estoque", flat=True).first()
+
+
+def test_lanca_estoque_movimentos_e_recebimento(nfe, loja1, fornecedor, sku_existente, sku_m, make_item,
+                                                make_nfe_item, django_capture_on_commit_callbacks):
+    Estoque.objects.create(Idloja=loja1, CodigodeBarra=sku_existente.CodigodeBarra,
+                           codigoproduto=sku_existente.Codigoproduto, Estoque=3)
+    FornecedorSkuMap.objects.create(
+        Idfornecedor=fornecedor, cprod_fornecedor="CX-6", Idprodutodetalhe=sku_existente, fator_conversao=6
+    )
+    item_pc = make_item(_pedido_aprovado(loja1, fornecedor), sku_m.Idproduto, 10, Decimal("10"), Idprodutodetalhe=sku_m)
+    make_nfe_item(nfe, 1, Decimal("2"), cprod="CX-6", vuncom=60)
+    make_nfe_item(nfe, 2, Decimal("4"), cean=sku_m.CodigodeBarra)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        res = lancar(nfe)
+
+    assert (res["status"], res["movimentacoes"], res["recebimentos"], res["faltantes"]) == ("lancada", 2, 1, [])
+    assert _estoque(loja1, sku_existente) == 15
+    assert _estoque(loja1, sku_m) == 4  # linha de estoque criada pelo lançamento
+    mov = MovimentacaoProdutos.objects.get(CodigodeBarra=sku_existente.CodigodeBarra)
+    assert (mov.Tipo, mov.Qtd, mov.Valor, mov.Documento) == ("E", 12, Decimal("10.00"), "123")
+    item_pc.refresh_from_db()
+    assert item_pc.Qtd_recebida == 4
+    assert RecebimentoPCItem.objects.get(Idpedidocompraitem=item_pc).quantidade_atendida == 4
+    assert SaldoPedidoCompra.objects.get(Idprodutodetalhe=sku_m).qtd_pendente == 6
+
+    with pytest.raises(NFeNaoLancavel) as exc:
+        lancar(nfe)
+    assert exc.value.conflito
+    with pytest.raises(NFeNaoCancelavel):
+        cancelar_nfe(nfe)
+
+
+def test_itens_sem_destino(nfe, loja1, sku_existente, make_nfe_item):
+    make_nfe_item(nfe, 1, Decimal("1"), cean=sku_existente.CodigodeBarra)
+    faltando = make_nfe_item(nfe, 2, Decimal("1"), cprod="DESCONHECIDO")
+
+    with pytest.raises(NFeNaoLancavel) as exc:
+        lancar(nfe)
+    assert [(f["Idnfeitem"], f["motivo"]) for f in exc.value.faltantes] == [(faltando.pk, "sem_destino")]
+    assert NFeEntrada.objects.get(pk=nfe.pk).status != "lancada"
+    assert _estoque(loja1, sku_existente) is None
+
+    res = lancar(nfe, permitir_parcial=True)
+    assert (res["status"], res["itens_criados"], len(res["faltantes"])) == ("lancada", 1, 1)
+    assert _estoque(loja1, sku_existente) == 1
+
+
+def test_quantidade_convertida_fracionada_nao_e_truncada(nfe, loja1, sku_existente, make_nfe_item):
+    it = make_nfe_item(nfe, 1, Decimal("2.5"), cean=sku_existente.CodigodeBarra)
+
+    with pytest.raises(NFeNaoLancavel) as exc:
+        lancar(nfe)
+    assert [(f["Idnfeitem"], f["motivo"]) for f in exc.value.faltantes] == [(it.pk, "quantidade_fracionada")]
+    assert _estoque(loja1, sku_existente) is None
+
+    # fator corrigido (caixa com 6): 2,5 × 6 = 15
+    res = lancar(nfe, overrides={it.pk: {"tipo": "sku", "produtodetalhe_id": sku_existente.pk, "fator": "6"}})
+    assert res["status"] == "lancada"
+    assert _estoque(loja1, sku_existente) == 15
+
+
+def test_override_com_item_de_pedido_de_outro_fornecedor_e_recusado(nfe, loja1, sku_existente, make_item,
+                                                                      make_nfe_item):
+    outro = Fornecedor.objects.create(Nome_fornecedor="Outro", Apelido="OUT", Cnpj="22.222.222/0001-22")
+    alheio = make_item(_pedido_aprovado(loja1, outro), sku_existente.Idproduto, 5, Decimal("10"),
+                       Idprodutodetalhe=sku_existente)
+    it = make_nfe_item(nfe, 1, Decimal("1"), cprod="SEM-MAPA")
+    overrides = {it.pk: {"tipo": "sku", "produtodetalhe_id": sku_existente.pk, "pedidocompraitem_id": alheio.pk}}
+
+    with pytest.raises(NFeNaoLancavel, match="não é um item em aberto"):
+        lancar(nfe, overrides=overrides)
+    assert PedidoCompraItem.objects.get(pk=alheio.pk).Qtd_recebida == 0
+
+
+def test_override_salva_vinculo_do_fornecedor(nfe, loja1, fornecedor, sku_existente, make_nfe_item):
+    it = make_nfe_item(nfe, 1, Decimal("2"), cprod="FD-12")
+
+    res = lancar(nfe, overrides={str(it.pk): {"tipo": "sku", "produtodetalhe_id": sku_existente.pk, "fator": "12"}},
+                 salvar_vinculos=True)
+
+    assert res["status"] == "lancada"
+    assert _estoque(loja1, sku_existente) == 24
+    mapa = FornecedorSkuMap.objects.get(Idfornecedor=fornecedor, cprod_fornecedor="FD-12")
+    assert (mapa.Idprodutodetalhe_id, mapa.fator_conversao) == (sku_existente.pk, 12)
+
+
+def test_cancelar_nota_nao_lancada(nfe):
+    assert cancelar_nfe(nfe) == {"Idnfe": nfe.pk, "status": "cancelada"}
+    with pytest.raises(NFeNaoLancavel):
+        lancar(nfe)
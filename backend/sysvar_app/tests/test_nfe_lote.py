@@ -0,0 +1,120 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from sysvar_app.models import NFeEntrada, NFeItem
+from sysvar_app.nfe import nfe_lote, nfe_parser
+from sysvar_app.nfe.nfe_ingestao import importar_xml
+from sysvar_app.nfe.nfe_lote import arquivos_diretorio, arquivos_zip, importar_lote
+
+pytestmark = pytest.mark.django_db
+
+CHAVE = "352601111111110001555500100000{:04d}1000001234"
+
+
+@pytest.fixture
+def xml_nota(make_xml):
+    def _xml(n, n_itens=2):
+        itens = [
+            {"nItem": i, "cProd": f"VEN-{i}", "xProd": f"Item {i}", "qCom": "1.0000",
+             "vUnCom": "10.00", "vProd": "10.00"}
+            for i in range(1, n_itens + 1)
+        ]
+        total = f"{10 * n_itens}.00"
+        return make_xml(CHAVE.format(n), "11111111000155", str(n), "1", itens, {"vProd": total, "vNF": total}).encode()
+    return _xml
+
+
+def _zip(arquivos):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for nome, dados in arquivos:
+            z.writestr(nome, dados)
+    buf.seek(0)
+    return buf
+
+
+def test_zip_classifica_cada_arquivo(xml_nota, loja1, fornecedor):
+    ja_importada = importar_xml(io.BytesIO(xml_nota(3)), loja1)
+    arquivo = _zip([
+        ("a.xml", xml_nota(1)),
+        ("b.xml", xml_nota(2, n_itens=3)),
+        ("a-copia.xml", xml_nota(1)),
+        ("c.xml", xml_nota(3)),
+        ("quebrado.xml", b"<nfeProc><NFe>"),
+        ("leia-me.txt", b"ignorado"),
+    ])
+
+    rel = importar_lote(arquivos_zip(arquivo), loja1, processos=0)
+
+    assert rel["resumo"] == {"criadas": 2, "duplicadas": 2, "erros": 1}
+    por_nome = {l["arquivo"]: l for l in rel["arquivos"]}
+    a = NFeEntrada.objects.get(chave=CHAVE.format(1))
+    assert (por_nome["a.xml"]["status"], por_nome["a.xml"]["Idnfe"], por_nome["a.xml"]["itens"]) == ("criada", a.pk, 2)
+    # repetida no mesmo lote aponta para a nota gravada pela primeira ocorrência
+    assert (por_nome["a-copia.xml"]["status"], por_nome["a-copia.xml"]["Idnfe"]) == ("duplicada", a.pk)
+    assert (por_nome["c.xml"]["status"], por_nome["c.xml"]["Idnfe"]) == ("duplicada", ja_importada.pk)
+    assert por_nome["quebrado.xml"]["status"] == "erro"
+    assert "leia-me.txt" not in por_nome
+
+    b = NFeEntrada.objects.get(chave=CHAVE.format(2))
+    assert (b.Idfornecedor_id, b.xml, b.fingerprint is not None) == (fornecedor.pk, xml_nota(2, n_itens=3).decode(), True)
+    assert NFeItem.objects.filter(nfe=b).count() == 3
+
+
+def test_arquivo_grande_demais_nao_e_lido(xml_nota, loja1, monkeypatch):
+    monkeypatch.setattr(nfe_lote, "MAX_BYTES_XML", 100)
+    rel = importar_lote(arquivos_zip(_zip([("a.xml", xml_nota(1))])), loja1, processos=0)
+
+    assert rel["arquivos"] == [{"arquivo": "a.xml", "status": "erro", "detail": "Arquivo grande demais."}]
+    assert not NFeEntrada.objects.exists()
+
+
+def test_diretorio_com_pool_de_processos(xml_nota, loja1, tmp_path, monkeypatch):
+    monkeypatch.setattr(nfe_lote, "TAMANHO_BLOCO", 2)
+    for n in range(1, 4):
+        (tmp_path / f"{n}.xml").write_bytes(xml_nota(n))
+
+    rel = importar_lote(arquivos_diretorio(str(tmp_path)), loja1, processos=2)
+
+    assert rel["resumo"] == {"criadas": 3, "duplicadas": 0, "erros": 0}
+    assert NFeItem.objects.filter(nfe__Idloja=loja1).count() == 6
+
+
+def test_falha_inesperada_no_parse_vira_erro_do_arquivo(xml_nota, loja1, monkeypatch):
+    analisar = nfe_parser.analisar_xml
+
+    def analisar_com_falha(dados):
+        if b"Item 2" in dados:
+            raise RecursionError("profundidade máxima")
+        return analisar(dados)
+
+    monkeypatch.setattr(nfe_parser, "analisar_xml", analisar_com_falha)
+    arquivo = _zip([("a.xml", xml_nota(1, n_itens=1)), ("ruim.xml", xml_nota(2)), ("c.xml", xml_nota(3, n_itens=1))])
+
+    rel = importar_lote(arquivos_zip(arquivo), loja1, processos=0)
+
+    assert rel["resumo"] == {"criadas": 2, "duplicadas": 0, "erros": 1}
+    ruim = rel["arquivos"][1]
+    assert (ruim["arquivo"], ruim["status"]) == ("ruim.xml", "erro")
+    assert "RecursionError" in ruim["detail"]
+
+
+def test_falha_do_pool_afeta_so_o_arquivo(xml_nota, loja1, monkeypatch):
+    def no_pool(dados):
+        if b"Item 2" in dados:
+            raise BrokenProcessPool("processo filho morreu")
+        return nfe_parser.analisar_xml_no_pool(dados)
+
+    monkeypatch.setattr(nfe_lote, "ProcessPoolExecutor", lambda **kw: ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(nfe_lote, "analisar_xml_no_pool", no_pool)
+    arquivo = _zip([("a.xml", xml_nota(1, n_itens=1)), ("ruim.xml", xml_nota(2)), ("c.xml", xml_nota(3, n_itens=1))])
+
+    rel = importar_lote(arquivos_zip(arquivo), loja1, processos=2)
+
+    assert [l["status"] for l in rel["arquivos"]] == ["criada", "erro", "criada"]
+    assert "processo filho morreu" in rel["arquivos"][1]["detail"]
+    assert NFeEntrada.objects.count() == 2
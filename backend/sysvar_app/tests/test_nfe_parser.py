@@ -0,0 +1,112 @@
+import hashlib
+import io
+import re
+from decimal import Decimal
+
+import pytest
+
+from sysvar_app.models import NFeEntrada, NFeItem
+from sysvar_app.nfe.nfe_ingestao import NFeDuplicada, importar_xml
+from sysvar_app.nfe.nfe_parser import FonteXML, NFeInvalida, analisar_xml, ler_nfe
+
+CHAVE = "35260111111111000155550010000001231000001234"
+
+
+@pytest.fixture
+def xml_nota(make_xml):
+    def _xml(chave=CHAVE, n_itens=2, xprod="Camiseta"):
+        itens = [
+            {"nItem": i, "cProd": f"VEN-{i}", "xProd": f"{xprod} {i}", "qCom": "2.0000",
+             "vUnCom": "10.00", "vProd": "20.00", "ean": "SEM GTIN"}
+            for i in range(1, n_itens + 1)
+        ]
+        total = f"{20 * n_itens}.00"
+        return make_xml(chave, "11111111000155", "123", "1", itens, {"vProd": total, "vNF": total}).encode()
+    return _xml
+
+
+def test_ler_nfe_eventos_na_ordem(xml_nota):
+    eventos = list(ler_nfe(io.BytesIO(xml_nota(n_itens=3))))
+
+    assert [tipo for tipo, _ in eventos] == ["cabecalho", "item", "item", "item", "totais"]
+    cab = eventos[0][1]
+    assert (cab["chave"], cab["numero"], cab["serie"], cab["cnpj_emitente"]) == (CHAVE, "123", "1", "11111111000155")
+    item = eventos[1][1]
+    assert (item["ordem"], item["cProd"], item["qCom"], item["vProd"]) == (1, "VEN-1", Decimal("2"), Decimal("20.00"))
+    assert item["cean"] is None
+    assert eventos[-1][1]["vNF"] == Decimal("60.00")
+
+
+def test_xml_malformado():
+    with pytest.raises(NFeInvalida):
+        analisar_xml(b"<nfeProc><NFe><infNFe>")
+
+
+@pytest.mark.parametrize("trocar", [
+    (b'nItem="1"', b'nItem="primeiro"'),
+    (b"<qCom>2.0000</qCom>", b"<qCom>NaN</qCom>"),
+    (b"<vUnCom>10.00</vUnCom>", b"<vUnCom>1,50</vUnCom>"),
+])
+def test_valor_invalido_no_item(xml_nota, trocar):
+    with pytest.raises(NFeInvalida):
+        analisar_xml(xml_nota(n_itens=1).replace(*trocar))
+
+
+@pytest.mark.parametrize("data", [b"ontem", b"2025-02-30T10:00:00-03:00"])
+def test_data_de_emissao_invalida(xml_nota, data):
+    dados = re.sub(rb"<dhEmi>[^<]*</dhEmi>", b"<dhEmi>" + data + b"</dhEmi>", xml_nota(n_itens=1))
+    with pytest.raises(NFeInvalida, match="Data de emissão"):
+        analisar_xml(dados)
+
+
+def test_blocos_texto_nao_partem_caracteres(xml_nota):
+    dados = xml_nota(xprod="Calção açaí ÇÃÕ")
+    fonte = FonteXML(io.BytesIO(dados), guardar=True)
+    analisado = list(ler_nfe(fonte))
+
+    # blocos de 7 bytes: os caracteres de 2 bytes caem divididos entre blocos
+    assert "".join(fonte.blocos_texto(tamanho=7)) == dados.decode()
+    assert analisado[1][1]["xProd"] == "Calção açaí ÇÃÕ 1"
+    fonte.fechar()
+    assert list(fonte.blocos_texto()) == []
+
+
+@pytest.mark.django_db
+def test_importar_xml_grava_itens_totais_e_xml_em_pedacos(xml_nota, loja1, fornecedor, monkeypatch):
+    dados = xml_nota(n_itens=3, xprod="Calção açaí")
+    monkeypatch.setattr(FonteXML.blocos_texto, "__defaults__", (5,))
+
+    nfe = importar_xml(io.BytesIO(dados), loja1)
+
+    nfe = NFeEntrada.objects.get(pk=nfe.pk)
+    assert nfe.xml == dados.decode()
+    assert (nfe.Idfornecedor_id, nfe.vNF, len(nfe.fingerprint)) == (fornecedor.pk, Decimal("60.00"), 64)
+    assert list(NFeItem.objects.filter(nfe=nfe).order_by("ordem").values_list("ordem", flat=True)) == [1, 2, 3]
+
+
+@pytest.mark.django_db
+def test_importar_xml_duplicada_pela_chave(xml_nota, loja1):
+    dados = xml_nota()
+    original = importar_xml(io.BytesIO(dados), loja1, guardar_xml=False)
+    assert NFeEntrada.objects.get(pk=original.pk).xml is None
+
+    with pytest.raises(NFeDuplicada) as exc:
+        importar_xml(io.BytesIO(dados), loja1)
+    assert exc.value.nfe.pk == original.pk
+
+
+
+@pytest.mark.django_db
+def test_importar_xml_duplicada_pelo_fingerprint(xml_nota, loja1):
+    dados = xml_nota()
+    # mesmo conteúdo já registrado sob outra chave
+    manual = NFeEntrada.objects.create(
+        chave=CHAVE[:-1] + "5", Idloja=loja1, fingerprint=hashlib.sha256(dados).hexdigest()
+    )
+
+    with pytest.raises(NFeDuplicada) as exc:
+        importar_xml(io.BytesIO(dados), loja1)
+
+    assert exc.value.nfe.pk == manual.pk
+    assert not NFeEntrada.objects.filter(chave=CHAVE).exists()
+    assert not NFeItem.objects.exists()
@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+
+from sysvar_app.models import FornecedorSkuMap, Produto
+from sysvar_app.nfe import nfe_sugestoes
+from sysvar_app.nfe.nfe_sugestoes import IndiceProdutos, indice, sugerir, sugerir_pendentes
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def indice_limpo(settings):
+    # memória por processo ligada, como com um cache compartilhado
+    settings.CACHE_MEMORIA_PROCESSO = True
+    cache.delete(nfe_sugestoes.CHAVE_VERSAO)
+    nfe_sugestoes._estado.update(versao=None, indice=None, carregado_em=0.0)
+
+
+def _produto(referencia, descricao, **extra):
+    campos = dict(
+        Tipoproduto="1", Descricao=descricao, Desc_reduzida=descricao[:20], referencia=referencia,
+        classificacao_fiscal="61046200", unidade="UN", grupo="01", subgrupo="Básico", familia="Casual",
+        grade="P-M-G", colecao="0101", Material="ALG",
+    )
+    campos.update(extra)
+    return Produto.objects.create(**campos)
+
+
+@pytest.fixture
+def catalogo(produto_revenda):
+    return {
+        "blusa": produto_revenda,
+        "calca": _produto("01.02.01001", "Calça Jeans Skinny"),
+        "camisa": _produto("01.03.01001", "Camisa Social Manga Longa"),
+        "inativa": _produto("01.04.01001", "Calça Jeans Reta", Ativo=False),
+    }
+
+
+def test_sugere_por_descricao_sem_acentos_e_ignora_inativos(catalogo):
+    ids = [s["produto_id"] for s in sugerir("CALCA JEANS SKINNY AZUL 38")]
+
+    assert ids[0] == catalogo["calca"].pk
+    assert catalogo["inativa"].pk not in ids
+
+
+def test_bonus_de_referencia_e_de_vinculo_do_fornecedor(catalogo, fornecedor):
+    assert sugerir("peca 01.03.01001")[0]["produto_id"] == catalogo["camisa"].pk
+
+    FornecedorSkuMap.objects.create(Idfornecedor=fornecedor, cprod_fornecedor="X1", Idproduto=catalogo["blusa"])
+    sem = {s["produto_id"]: s for s in sugerir("blusa", fornecedor_id=None)}
+    com = {s["produto_id"]: s for s in sugerir("blusa", fornecedor_id=fornecedor.pk)}
+    pid = catalogo["blusa"].pk
+    assert com[pid]["vinculado"] and not sem[pid]["vinculado"]
+    assert com[pid]["score"] > sem[pid]["score"]
+
+
+def test_atualizado_nao_altera_o_indice_original(catalogo):
+    original = IndiceProdutos()
+    original.carregar()
+    posting_calca = set(original.por_trigrama[" ca"])
+
+    Produto.objects.filter(pk=catalogo["calca"].pk).update(Descricao="Bermuda Sarja")
+    novo = original.atualizado([catalogo["calca"].pk])
+
+    # buscas em andamento no índice antigo seguem vendo o produto como estava
+    assert original.por_trigrama[" ca"] == posting_calca
+    assert original.docs[catalogo["calca"].pk][1] == "Calça Jeans Skinny"
+    assert novo.buscar("bermuda sarja")[0][1] == catalogo["calca"].pk
+    assert not original.buscar("bermuda sarja")
+
+
+def test_renomear_produto_reindexa_depois_do_commit(catalogo, django_capture_on_commit_callbacks):
+    antes = indice()
+    assert not antes.buscar("bermuda sarja")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        calca = Produto.objects.get(pk=catalogo["calca"].pk)
+        calca.Descricao = "Bermuda Sarja"
+        calca.save()
+
+    depois = indice()
+    assert depois is not antes
+    assert depois.buscar("bermuda sarja")[0][1] == calca.pk
+
+
+def test_sugestoes_dos_itens_pendentes(catalogo, nfe, make_nfe_item):
+    make_nfe_item(nfe, 1, Decimal("1"))
+    item = make_nfe_item(nfe, 2, Decimal("1"))
+    item.xProd = "CAMISA SOCIAL ML BRANCA"
+    item.save()
+    nfe.itens.filter(ordem=1).update(pendente=False)
+
+    saida = sugerir_pendentes(nfe)
+
+    assert [s["ordem"] for s in saida] == [2]
+    assert saida[0]["sugestoes"][0]["produto_id"] == catalogo["camisa"].pk
@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from sysvar_app.models import Grade, Pack, PackItem, Tamanho
+from sysvar_app.pack import pack_composicao
+from sysvar_app.pack.pack_composicao import composicao, composicoes, mapa_totais_packs, qtd_total_pack
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def memoria(settings):
+    # memória por processo ligada, como com um cache compartilhado
+    settings.CACHE_MEMORIA_PROCESSO = True
+    cache.delete(pack_composicao.CHAVE_VERSAO)
+    pack_composicao._estado.update(versao=None, composicoes={}, totais={})
+
+
+def test_composicao_e_expansao(pack_pmg, grade_ptmg):
+    _, (tP, tM, tG) = grade_ptmg
+    c = composicao(pack_pmg)
+
+    assert c.tamanhos == {tP.pk: 1, tM.pk: 2, tG.pk: 1}
+    assert c.quantidade(3) == 12
+    assert c.expandir(3) == {tP.pk: 3, tM.pk: 6, tG.pk: 3}
+    assert mapa_totais_packs() == {pack_pmg.pk: 4}
+    assert qtd_total_pack(pack_pmg.pk, 2) == 8
+    assert qtd_total_pack(pack_pmg.pk, 0) == 0
+
+
+def test_pack_sem_itens_fica_fora_do_mapa(grade_ptmg):
+    vazio = Pack.objects.create(nome="vazio", grade=grade_ptmg[0])
+    assert composicao(vazio) is None
+    assert vazio.pk not in composicoes()
+
+
+def test_instancia_mais_nova_recarrega_o_pack(pack_pmg, grade_ptmg):
+    _, (tP, _, _) = grade_ptmg
+    assert composicao(pack_pmg).total == 4
+
+    # alteração sem sinais: a versão do mapa não muda, só o atualizado_em do pack
+    PackItem.objects.filter(pack=pack_pmg, tamanho=tP).update(qtd=5)
+    Pack.objects.filter(pk=pack_pmg.pk).update(atualizado_em=pack_pmg.atualizado_em + timedelta(seconds=1))
+    pack_pmg.refresh_from_db()
+
+    assert composicao(pack_pmg).total == 8
+
+
+def test_sinal_troca_a_versao_depois_do_commit(pack_pmg, grade_ptmg, django_capture_on_commit_callbacks):
+    _, (tP, _, _) = grade_ptmg
+    assert composicoes()[pack_pmg.pk].total == 4
+
+    with django_capture_on_commit_callbacks(execute=True):
+        item = PackItem.objects.get(pack=pack_pmg, tamanho=tP)
+        item.qtd = 3
+        item.save()
+        # antes do COMMIT a transação que alterou lê do banco
+        assert composicoes()[pack_pmg.pk].total == 6
+
+    assert composicoes()[pack_pmg.pk].total == 6
+    assert mapa_totais_packs()[pack_pmg.pk] == 6
+
+
+def test_serializer_regrava_so_a_diferenca(api_client, admin_user, pack_pmg, grade_ptmg,
+                                          django_capture_on_commit_callbacks):
+    grade, (tP, tM, tG) = grade_ptmg
+    ids_antes = dict(PackItem.objects.filter(pack=pack_pmg).values_list("tamanho_id", "pk"))
+    api_client.force_authenticate(user=admin_user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.put(
+            reverse("packs-detail", args=[pack_pmg.pk]),
+            {"nome": "PMG", "grade": grade.pk, "itens": [{"tamanho": tP.pk, "qtd": 2}, {"tamanho": tG.pk, "qtd": 1}]},
+            format="json",
+        )
+
+    assert resp.status_code == 200
+    assert sorted((i["tamanho"], i["qtd"]) for i in resp.data["itens"]) == sorted([(tP.pk, 2), (tG.pk, 1)])
+    depois = dict(PackItem.objects.filter(pack=pack_pmg).values_list("tamanho_id", "pk"))
+    # P alterado e G mantido nas mesmas linhas; M removido
+    assert depois == {tP.pk: ids_antes[tP.pk], tG.pk: ids_antes[tG.pk]}
+    assert composicoes()[pack_pmg.pk].total == 3
+
+
+def test_serializer_recusa_tamanho_de_outra_grade(api_client, admin_user, pack_pmg):
+    outra = Grade.objects.create(Descricao="Numérica", Status="A")
+    t38 = Tamanho.objects.create(idgrade=outra, Tamanho="38", Descricao="38", Status="A")
+    api_client.force_authenticate(user=admin_user)
+
+    resp = api_client.patch(
+        reverse("packs-detail", args=[pack_pmg.pk]), {"itens": [{"tamanho": t38.pk, "qtd": 1}]}, format="json"
+    )
+
+    assert resp.status_code == 400
+    assert composicao(pack_pmg).total == 4
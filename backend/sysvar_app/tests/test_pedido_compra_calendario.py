@@ -0,0 +1,117 @@
+from datetime import date
+from importlib import import_module
+
+import pytest
+from django.apps import apps
+from django.urls import reverse
+
+from sysvar_app.models import Fornecedor, PedidoCompra, PedidoCompraEntrega
+from sysvar_app.pedido_compra.pedido_compra_calendario import calendario, sincronizar_entregas
+
+pytestmark = pytest.mark.django_db
+
+DIA1, DIA2 = date(2026, 3, 2), date(2026, 3, 3)
+
+
+@pytest.fixture
+def cliente(api_client, admin_user):
+    api_client.force_authenticate(user=admin_user)
+    return api_client
+
+
+@pytest.fixture
+def fornecedor2(db):
+    return Fornecedor.objects.create(Nome_fornecedor="Fornecedor Y", Apelido="FORY", Cnpj="22.222.222/0001-22")
+
+
+def _novo(loja, fornecedor, **campos):
+    return PedidoCompra.objects.create(Idfornecedor=fornecedor, Idloja=loja, Valorpedido=0, **campos)
+
+
+def _entrega(pedido, data, qtd):
+    return PedidoCompraEntrega.objects.create(pedido=pedido, data_entrega=data, quantidade_prevista=qtd)
+
+
+def _cabecalho(entrega):
+    entrega.refresh_from_db()
+    return entrega.Idloja_id, entrega.Idfornecedor_id, entrega.status_pedido
+
+
+def test_agrega_por_dia_loja_e_fornecedor(pedido, loja1, loja2, fornecedor, fornecedor2):
+    outro = _novo(loja1, fornecedor)
+    _entrega(pedido, DIA1, 10)
+    _entrega(pedido, DIA1, 5)
+    _entrega(outro, DIA1, 2)
+    _entrega(_novo(loja1, fornecedor2), DIA1, 4)
+    _entrega(_novo(loja2, fornecedor), DIA2, 7)
+    _entrega(_novo(loja1, fornecedor, Status=PedidoCompra.StatusChoices.CA), DIA1, 99)
+    _entrega(pedido, date(2026, 4, 1), 50)  # fora do período
+
+    out = calendario(DIA1, DIA2)
+
+    assert [(i["data"], i["loja_nome"], i["fornecedor_nome"], i["quantidade"], i["pedidos"], i["entregas"])
+            for i in out["itens"]] == [
+        (DIA1, "Loja 1", "Fornecedor X", 17, 2, 3),
+        (DIA1, "Loja 1", "Fornecedor Y", 4, 1, 1),
+        (DIA2, "Loja 2", "Fornecedor X", 7, 1, 1),
+    ]
+    assert [(t["data"], t["loja_id"], t["quantidade"]) for t in out["totais"]] == [
+        (DIA1, loja1.pk, 21),
+        (DIA2, loja2.pk, 7),
+    ]
+
+    assert [i["quantidade"] for i in calendario(DIA1, DIA2, status=["CA"])["itens"]] == [99]
+    so_y = calendario(DIA1, DIA2, lojas=[loja1.pk], fornecedores=[fornecedor2.pk])
+    assert [(i["fornecedor_id"], i["quantidade"]) for i in so_y["itens"]] == [(fornecedor2.pk, 4)]
+
+
+def test_endpoint_do_calendario(cliente, pedido, loja1, fornecedor):
+    _entrega(pedido, DIA1, 3)
+    url = reverse("pedido-compra-entrega-calendario")
+
+    resp = cliente.get(url, {"de": "2026-03-01", "ate": "2026-03-31", "loja": str(loja1.pk)})
+    assert resp.status_code == 200, resp.data
+    assert [(i["fornecedor_id"], i["quantidade"]) for i in resp.data["itens"]] == [(fornecedor.pk, 3)]
+
+    assert cliente.get(url, {"de": "2026-03-02", "ate": "2026-03-01"}).status_code == 400
+    assert cliente.get(url, {"de": "2026-01-01", "ate": "2026-06-30"}).status_code == 400
+    assert cliente.get(url, {"de": "2026-03-01", "ate": "2026-03-31", "loja": "x"}).status_code == 400
+
+
+def test_entrega_acompanha_o_cabecalho_do_pedido(pedido, loja1, loja2, fornecedor):
+    entrega = _entrega(pedido, DIA1, 10)
+    assert _cabecalho(entrega) == (loja1.pk, fornecedor.pk, "AB")
+
+    pedido.Idloja = loja2
+    pedido.Status = PedidoCompra.StatusChoices.AP
+    pedido.save()
+    assert _cabecalho(entrega) == (loja2.pk, fornecedor.pk, "AP")
+
+    # update() não passa pelo post_save: quem usa chama sincronizar_entregas
+    PedidoCompra.objects.filter(pk=pedido.pk).update(Status=PedidoCompra.StatusChoices.RC)
+    assert sincronizar_entregas(pedido.pk) == 1
+    assert _cabecalho(entrega) == (loja2.pk, fornecedor.pk, "RC")
+
+
+def test_cancelamento_em_lote_tira_a_entrega_do_calendario(cliente, pedido):
+    entrega = _entrega(pedido, DIA1, 10)
+    assert calendario(DIA1, DIA1)["itens"][0]["quantidade"] == 10
+
+    resp = cliente.post(reverse("pedido-compra-transicao-lote"),
+                        {"acao": "cancelar", "pedidos": [pedido.pk]}, format="json")
+    assert resp.status_code == 200, resp.data
+
+    assert _cabecalho(entrega)[2] == "CA"
+    assert calendario(DIA1, DIA1)["itens"] == []
+
+
+def test_migracao_preenche_entregas_existentes(pedido, loja1, fornecedor):
+    entrega = _entrega(pedido, DIA1, 10)
+    PedidoCompraEntrega.objects.update(Idloja=None, Idfornecedor=None, status_pedido=None)  # como antes da 0015
+    assert calendario(DIA1, DIA1)["itens"] == []
+
+    migracao = import_module("sysvar_app.migrations.0015_pedidocompraentrega_calendario")
+    migracao.preencher_cabecalho(apps, None)
+
+    assert _cabecalho(entrega) == (loja1.pk, fornecedor.pk, "AB")
+    assert calendario(DIA1, DIA1)["totais"][0]["quantidade"] == 10
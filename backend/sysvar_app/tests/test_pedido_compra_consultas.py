@@ -0,0 +1,73 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from sysvar_app.models import PedidoCompra, PedidoCompraEntrega
+from sysvar_app.pedido_compra.pedido_compra_serializers import PedidoCompraListSerializer
+from sysvar_app.pedido_compra.pedido_compra_totais import recalcular_pedidos
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def cliente(api_client, admin_user):
+    api_client.force_authenticate(user=admin_user)
+    return api_client
+
+
+def _pedido_completo(pedido, produto, forma, make_item, n_itens):
+    novo = PedidoCompra.objects.create(
+        Idfornecedor_id=pedido.Idfornecedor_id, Idloja_id=pedido.Idloja_id, Valorpedido=0,
+        Datapedido=date(2026, 1, 10), condicao_pagamento=forma.codigo, tipo_pedido=PedidoCompra.TipoPedido.CONSUMO,
+    )
+    for i in range(n_itens):
+        make_item(novo, produto, i + 1, Decimal("10.00"))
+    for dia in (1, 15):
+        PedidoCompraEntrega.objects.create(pedido=novo, data_entrega=date(2026, 2, dia), quantidade_prevista=1)
+    recalcular_pedidos([novo.pk])
+    return novo
+
+
+def _consultas(cliente, url):
+    with CaptureQueriesContext(connection) as ctx:
+        resp = cliente.get(url)
+    assert resp.status_code == 200, resp.data
+    return len(ctx), resp
+
+
+def test_detalhe_em_consultas_fixas(cliente, pedido, produto_revenda, forma_30_60, make_item):
+    pequeno = _pedido_completo(pedido, produto_revenda, forma_30_60, make_item, 1)
+    grande = _pedido_completo(pedido, produto_revenda, forma_30_60, make_item, 6)
+
+    n_pequeno, _ = _consultas(cliente, reverse("pedido-compra-detail", args=[pequeno.pk]))
+    n_grande, resp = _consultas(cliente, reverse("pedido-compra-detail", args=[grande.pk]))
+
+    # pedido + itens (com produto) + entregas + parcelas
+    assert n_pequeno == n_grande == 4
+    assert [i["produto_desc"] for i in resp.data["itens"]] == [produto_revenda.Descricao] * 6
+    assert len(resp.data["entregas"]) == 2
+    assert resp.data["fornecedor_nome"] == "Fornecedor X"
+
+
+def test_lista_em_consultas_fixas_e_mesmo_formato_do_serializer(cliente, pedido, produto_revenda, forma_30_60,
+                                                                make_item):
+    url = reverse("pedido-compra-list")
+    n_um, _ = _consultas(cliente, url)
+    for n in range(4):
+        _pedido_completo(pedido, produto_revenda, forma_30_60, make_item, n + 1)
+    n_cinco, resp = _consultas(cliente, url)
+
+    assert n_um == n_cinco == 1  # uma consulta com values() e JOIN de fornecedor/loja
+    linhas = resp.json()
+    assert len(linhas) == 5
+
+    # o que o PedidoCompraListSerializer devolvia antes da projeção com values()
+    qs = PedidoCompra.objects.select_related("Idfornecedor", "Idloja").order_by("-Datapedido", "Idpedidocompra")
+    antes = json.loads(JSONRenderer().render(PedidoCompraListSerializer(qs, many=True).data))
+    assert linhas == antes
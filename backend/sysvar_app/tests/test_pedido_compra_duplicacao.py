@@ -0,0 +1,61 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from sysvar_app.models import PedidoCompra, PedidoCompraItem, SaldoPedidoCompra
+
+pytestmark = pytest.mark.django_db
+
+CAMPOS = ("Idproduto_id", "Idprodutodetalhe_id", "pack_id", "n_packs", "qtd_total_pack", "Qtp_pc", "valorunitario",
+          "Desconto", "Total_item", "Qtd_recebida", "data_entrega_prevista")
+
+
+@pytest.fixture
+def cliente(api_client, admin_user):
+    api_client.force_authenticate(user=admin_user)
+    return api_client
+
+
+def _itens(pedido):
+    return list(PedidoCompraItem.objects.filter(Idpedidocompra=pedido).order_by("pk").values_list(*CAMPOS))
+
+
+def test_duplicar_para_varias_lojas(cliente, pedido, loja1, loja2, produto_revenda, sku_existente, pack_pmg, make_item,
+                                    django_capture_on_commit_callbacks):
+    make_item(pedido, produto_revenda, 12, Decimal("10.00"), Decimal("2.00"), pack=pack_pmg, n_packs=3,
+              qtd_total_pack=12, data_entrega_prevista=date(2026, 2, 20))
+    make_item(pedido, produto_revenda, 5, Decimal("8.00"), Idprodutodetalhe=sku_existente, Qtd_recebida=5)
+    PedidoCompra.objects.filter(pk=pedido.pk).update(Status=PedidoCompra.StatusChoices.AP, Valorpedido=Decimal("158"))
+    origem = _itens(pedido)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = cliente.post(reverse("pedido-compra-duplicar", args=[pedido.pk]), {"destinos": [
+            {"loja": loja1.pk, "Datapedido": "2026-03-01", "Dataentrega": "2026-03-20"},
+            {"loja": loja2.pk},
+        ]}, format="json")
+
+    assert resp.status_code == 201, resp.data
+    assert (resp.data["origem"], resp.data["itens_por_pedido"]) == (pedido.pk, 2)
+    novos = PedidoCompra.objects.filter(pk__in=[p["Idpedidocompra"] for p in resp.data["pedidos"]]).order_by("pk")
+    assert [(n.Idloja_id, n.Status, n.Valorpedido) for n in novos] == [
+        (loja1.pk, "AB", Decimal("158.00")), (loja2.pk, "AB", Decimal("158.00")),
+    ]
+    assert (novos[0].Datapedido, novos[0].Dataentrega) == (date(2026, 3, 1), date(2026, 3, 20))
+    for novo in novos:
+        # mesmos itens (pack incluído), sem o recebido da origem
+        assert _itens(novo) == [linha[:9] + (0,) + linha[10:] for linha in origem]
+
+    saldos = SaldoPedidoCompra.objects.filter(Idprodutodetalhe=sku_existente)
+    assert {s.Idloja_id: s.qtd_pendente for s in saldos} == {loja1.pk: 5, loja2.pk: 5}
+
+
+def test_destino_invalido_400(cliente, pedido):
+    url = reverse("pedido-compra-duplicar", args=[pedido.pk])
+
+    resp = cliente.post(url, {"destinos": [{"loja": 999999}, {"Datapedido": "01/03/2026"}]}, format="json")
+    assert resp.status_code == 400
+    assert resp.data["detail"] == ["destino 2: Datapedido inválida (use AAAA-MM-DD).", "Loja 999999 não encontrada."]
+    assert cliente.post(url, {"destinos": []}, format="json").status_code == 400
+    assert PedidoCompra.objects.count() == 1
@@ -0,0 +1,100 @@
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from sysvar_app.models import Cor, PackItem, PedidoCompraItemSku, ProdutoDetalhe
+from sysvar_app.pedido_compra.pedido_compra_explosao import explodir_pedidos, gravar_explosao
+
+pytestmark = pytest.mark.django_db
+
+
+def _sku(produto, tamanho, cor, ean):
+    return ProdutoDetalhe.objects.create(
+        Idproduto=produto, Idtamanho=tamanho, Idcor=cor, CodigodeBarra=ean,
+        Codigoproduto=produto.referencia, Item=0,
+    )
+
+
+@pytest.fixture
+def skus_pretos(produto_revenda, grade_ptmg, cor_preta, sku_existente):
+    _, (tP, tM, tG) = grade_ptmg
+    return {
+        tP.pk: sku_existente,
+        tM.pk: _sku(produto_revenda, tM, cor_preta, "7891234000024"),
+        tG.pk: _sku(produto_revenda, tG, cor_preta, "7891234000031"),
+    }
+
+
+def _item_pack(make_item, pedido, produto, pack, n_packs, qtd=None, **extra):
+    return make_item(pedido, produto, qtd if qtd is not None else 4 * n_packs, Decimal("10.00"),
+                     pack=pack, n_packs=n_packs, **extra)
+
+
+def test_explode_pack_na_cor_unica_do_produto(pedido, produto_revenda, pack_pmg, skus_pretos, make_item):
+    item = _item_pack(make_item, pedido, produto_revenda, pack_pmg, 2)
+
+    linhas, pendencias = explodir_pedidos([pedido.pk])
+
+    assert pendencias == []
+    assert {l["tamanho"]: (l["sku"], l["ean"], l["quantidade"]) for l in linhas} == {
+        tam: (sku.pk, sku.CodigodeBarra, qtd)
+        for (tam, sku), qtd in zip(skus_pretos.items(), (2, 4, 2))
+    }
+    assert {l["item"] for l in linhas} == {item.pk}
+
+
+def test_pendencias_de_cor_sku_e_quantidade(pedido, produto_revenda, pack_pmg, grade_ptmg, cor_preta,
+                                            sku_existente, make_item):
+    _, (tP, tM, tG) = grade_ptmg
+    branca = Cor.objects.create(Descricao="Branco", Codigo="002", Cor="#fff", Status="A")
+    _sku(produto_revenda, tM, branca, "7891234000048")
+    # produto com duas cores e item sem SKU: cor indefinida
+    sem_cor = _item_pack(make_item, pedido, produto_revenda, pack_pmg, 1)
+    # cor pelo SKU do item, mas só o P preto existe; quantidade não bate com a composição
+    sem_sku = _item_pack(make_item, pedido, produto_revenda, pack_pmg, 1, qtd=5, Idprodutodetalhe=sku_existente)
+
+    _, pendencias = explodir_pedidos([pedido.pk])
+
+    motivos = {p["item"]: [] for p in pendencias}
+    for p in pendencias:
+        motivos[p["item"]].append(p["motivo"])
+    assert motivos[sem_cor.pk] == ["Cor não definida: informe o SKU do item (produto com várias cores)."]
+    assert motivos[sem_sku.pk] == [
+        "SKU não cadastrado para tamanho/cor.",
+        "Quantidade do item (5) difere da composição atual do pack (4).",
+    ]
+    faltando = next(p for p in pendencias if "tamanhos" in p)
+    assert sorted(faltando["tamanhos"]) == sorted([tM.pk, tG.pk])
+
+
+def test_edicao_do_pack_reexplode_pedidos_gravados(pedido, produto_revenda, pack_pmg, grade_ptmg, skus_pretos,
+                                                   make_item, django_capture_on_commit_callbacks):
+    _, (tP, _, _) = grade_ptmg
+    _item_pack(make_item, pedido, produto_revenda, pack_pmg, 2)
+    gravar_explosao([pedido.pk])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        item = PackItem.objects.get(pack=pack_pmg, tamanho=tP)
+        item.qtd = 3
+        item.save()
+
+    gravadas = dict(PedidoCompraItemSku.objects.filter(pedido=pedido).values_list("Idtamanho_id", "quantidade"))
+    assert gravadas[tP.pk] == 6
+
+
+def test_endpoint_explodir_grava(api_client, admin_user, pedido, produto_revenda, pack_pmg, skus_pretos, make_item):
+    _item_pack(make_item, pedido, produto_revenda, pack_pmg, 1)
+    api_client.force_authenticate(user=admin_user)
+
+    resp = api_client.get(reverse("pedido-compra-explosao", args=[pedido.pk]))
+    assert resp.status_code == 200
+    assert len(resp.data["linhas"]) == 3
+    assert not PedidoCompraItemSku.objects.exists()
+
+    resp = api_client.post(reverse("pedido-compra-explodir"), {"pedidos": [pedido.pk], "gravar": True}, format="json")
+    assert resp.status_code == 200
+    assert PedidoCompraItemSku.objects.filter(pedido=pedido).count() == 3
+
+    resp = api_client.post(reverse("pedido-compra-explodir"), {"pedidos": ["x"]}, format="json")
+    assert resp.status_code == 400
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from sysvar_app.models import PedidoCompraItem
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def url(pedido):
+    return reverse("pedido-compra-importar-itens", args=[pedido.pk])
+
+
+def test_importa_csv_expande_pack_e_recalcula_no_commit(
+    api_client, admin_user, pedido, produto_revenda, sku_existente, pack_pmg, url,
+    django_capture_on_commit_callbacks,
+):
+    csv = (
+        "referencia;ean;pack;n_packs;valorunitario;desconto\n"
+        f"{produto_revenda.referencia};{sku_existente.CodigodeBarra};{pack_pmg.pk};1;10,50;1\n"
+        f"{produto_revenda.referencia};;{pack_pmg.pk};2;20;\n"
+    ).encode()
+    api_client.force_authenticate(user=admin_user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.post(url, {"arquivo": SimpleUploadedFile("itens.csv", csv)}, format="multipart")
+
+    assert resp.status_code == 201, resp.data
+    assert (resp.data["linhas"], resp.data["criados"], resp.data["quantidade"]) == (2, 2, 12)
+    itens = list(PedidoCompraItem.objects.filter(Idpedidocompra=pedido).order_by("pk")
+                 .values_list("Idprodutodetalhe_id", "n_packs", "Qtp_pc", "Total_item"))
+    assert itens == [(sku_existente.pk, 1, 4, Decimal("41.00")), (None, 2, 8, Decimal("160.00"))]
+    pedido.refresh_from_db()
+    assert pedido.Valorpedido == Decimal("201.00")
+
+
+def test_erro_desfaz_tudo_sem_parcial(api_client, admin_user, pedido, produto_revenda, pack_pmg, url):
+    itens = [
+        {"Idproduto": produto_revenda.pk, "pack": pack_pmg.pk, "n_packs": 1, "valorunitario": "5"},
+        {"referencia": "99.99.99999", "pack": pack_pmg.pk, "n_packs": 1, "valorunitario": "5"},
+        {"Idproduto": produto_revenda.pk, "valorunitario": "5"},
+    ]
+    api_client.force_authenticate(user=admin_user)
+
+    resp = api_client.post(url, {"itens": itens}, format="json")
+    assert resp.status_code == 400
+    assert {e["linha"]: list(e["erros"]) for e in resp.data["erros"]} == {2: ["Idproduto"], 3: ["pack", "n_packs"]}
+    assert not PedidoCompraItem.objects.filter(Idpedidocompra=pedido).exists()
+
+    resp = api_client.post(url + "?parcial=true", {"itens": itens}, format="json")
+    assert resp.status_code == 201
+    assert resp.data["criados"] == 1
+    assert PedidoCompraItem.objects.filter(Idpedidocompra=pedido).count() == 1
@@ -0,0 +1,87 @@
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from sysvar_app.models import Estoque, PedidoCompra, RecebimentoPCItem, SaldoPedidoCompra
+from sysvar_app.estoque.estoque_matriz import atualizar_matriz_referencias
+from sysvar_app.pedido_compra.pedido_compra_saldos import atualizar_saldos
+
+pytestmark = pytest.mark.django_db
+
+
+def _saldos(produto):
+    return {
+        (s.Idloja_id, s.Idprodutodetalhe_id): (s.qtd_pedida, s.qtd_recebida, s.qtd_pendente, s.valor_pendente)
+        for s in SaldoPedidoCompra.objects.filter(Idproduto=produto)
+    }
+
+
+def test_saldo_por_sku_e_linha_sem_sku_sem_duplicar(pedido, produto_revenda, sku_existente, make_item):
+    make_item(pedido, produto_revenda, 4, Decimal("10.00"), Idprodutodetalhe=sku_existente)
+    make_item(pedido, produto_revenda, 2, Decimal("10.00"))
+    make_item(pedido, produto_revenda, 3, Decimal("10.00"))
+
+    assert atualizar_saldos([produto_revenda.pk]) == 2
+    assert atualizar_saldos([produto_revenda.pk]) == 2  # regravar não duplica a linha sem SKU
+    assert _saldos(produto_revenda) == {
+        (pedido.Idloja_id, sku_existente.pk): (4, 0, 4, Decimal("40.00")),
+        (pedido.Idloja_id, None): (5, 0, 5, Decimal("50.00")),
+    }
+
+
+def test_recebimento_reduz_pendente_e_pedido_cancelado_sai(
+    pedido, produto_revenda, make_item, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        item = make_item(pedido, produto_revenda, 5, Decimal("8.00"))
+    assert _saldos(produto_revenda) == {(pedido.Idloja_id, None): (5, 0, 5, Decimal("40.00"))}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        RecebimentoPCItem.objects.create(Idpedidocompraitem=item, quantidade_atendida=2, valor_atendido=16)
+    assert _saldos(produto_revenda) == {(pedido.Idloja_id, None): (5, 2, 3, Decimal("24.00"))}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        pedido.Status = PedidoCompra.StatusChoices.CA
+        pedido.save()
+    assert _saldos(produto_revenda) == {}
+
+
+def test_endpoint_saldos_paginado(api_client, admin_user, pedido, produto_revenda, sku_existente, make_item):
+    make_item(pedido, produto_revenda, 4, Decimal("10.00"), Idprodutodetalhe=sku_existente)
+    make_item(pedido, produto_revenda, 2, Decimal("10.00"))
+    atualizar_saldos([produto_revenda.pk])
+
+    api_client.force_authenticate(user=admin_user)
+    resp = api_client.get(reverse("pedido-compra-saldo-list"), {"produto": produto_revenda.pk, "limit": 1})
+
+    assert resp.status_code == 200
+    assert resp.data["count"] == 2
+    assert len(resp.data["results"]) == 1
+    assert resp.data["next"]
+
+    resp = api_client.get(reverse("pedido-compra-saldo-list"), {"loja": "x"})
+    assert resp.status_code == 400
+
+
+def test_matriz_referencia_com_em_pedido(api_client, admin_user, pedido, produto_revenda, sku_existente, make_item):
+    Estoque.objects.create(
+        CodigodeBarra=sku_existente.CodigodeBarra, codigoproduto=sku_existente.Codigoproduto,
+        Idloja=pedido.Idloja, Estoque=1,
+    )
+    atualizar_matriz_referencias([sku_existente.Codigoproduto])
+    make_item(pedido, produto_revenda, 4, Decimal("10.00"), Idprodutodetalhe=sku_existente)
+    make_item(pedido, produto_revenda, 2, Decimal("10.00"))
+    atualizar_saldos([produto_revenda.pk])
+
+    api_client.force_authenticate(user=admin_user)
+    resp = api_client.get(
+        reverse("estoques-matriz-referencia"), {"ref": sku_existente.Codigoproduto, "em_pedido": "true"}
+    )
+
+    assert resp.status_code == 200
+    assert resp.data["resumo"]["em_pedido"] == 6
+    loja = resp.data["em_pedido"]["por_loja"][0]
+    assert loja["loja_id"] == pedido.Idloja_id
+    assert loja["cores"] == [{"cor_id": sku_existente.Idcor_id, "tamanhos": {str(sku_existente.Idtamanho_id): 4}}]
+    assert (loja["sem_sku"], loja["total_loja"]) == (2, 6)
@@ -0,0 +1,97 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.db import transaction
+from django.urls import reverse
+
+from sysvar_app.models import PedidoCompra, PedidoCompraParcela
+from sysvar_app.pedido_compra import pedido_compra_totais
+from sysvar_app.pedido_compra.pedido_compra_totais import marcar_pedidos, recalcular_pedidos
+
+pytestmark = pytest.mark.django_db
+
+
+def test_recalcula_total_e_regera_parcelas(pedido, produto_revenda, forma_30_60, make_item):
+    pedido.condicao_pagamento = forma_30_60.codigo
+    pedido.save()
+    make_item(pedido, produto_revenda, 3, Decimal("10.00"), Decimal("1.00"))
+    make_item(pedido, produto_revenda, 2, Decimal("35.01"))
+
+    recalcular_pedidos([pedido.pk])
+
+    pedido.refresh_from_db()
+    assert pedido.Valorpedido == Decimal("99.02")
+    assert pedido.parcelas == 2
+    parcelas = list(PedidoCompraParcela.objects.filter(pedido=pedido).order_by("parcela"))
+    assert [p.vencimento for p in parcelas] == [date(2026, 2, 9), date(2026, 3, 11)]
+    assert sum(p.valor for p in parcelas) == Decimal("99.02")
+
+
+def test_pedido_fora_de_ab_mantem_parcelas(pedido, produto_revenda, forma_30_60, make_item):
+    pedido.condicao_pagamento = forma_30_60.codigo
+    pedido.Status = PedidoCompra.StatusChoices.AP
+    pedido.save()
+    make_item(pedido, produto_revenda, 1, Decimal("50.00"))
+
+    recalcular_pedidos([pedido.pk])
+
+    pedido.refresh_from_db()
+    assert pedido.Valorpedido == Decimal("50.00")
+    assert not PedidoCompraParcela.objects.filter(pedido=pedido).exists()
+
+
+def test_marcar_varias_vezes_recalcula_uma_vez_apos_commit(
+    pedido, produto_revenda, make_item, monkeypatch, django_capture_on_commit_callbacks
+):
+    lotes = []
+    original = pedido_compra_totais._coletor._processar
+    monkeypatch.setattr(pedido_compra_totais._coletor, "_processar", lambda ids: (lotes.append(set(ids)), original(ids)))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            for _ in range(3):
+                make_item(pedido, produto_revenda, 1, Decimal("5.00"))
+                marcar_pedidos(pedido.pk)
+            pedido.refresh_from_db()
+            assert pedido.Valorpedido == 0  # nada recalculado antes do COMMIT
+
+    assert lotes == [{pedido.pk}]
+    pedido.refresh_from_db()
+    assert pedido.Valorpedido == Decimal("15.00")
+
+
+def test_exclusao_de_item_recalcula_pelo_coletor(
+    api_client, admin_user, pedido, produto_revenda, forma_30_60, make_item, django_capture_on_commit_callbacks
+):
+    pedido.condicao_pagamento = forma_30_60.codigo
+    pedido.save()
+    fica = make_item(pedido, produto_revenda, 3, Decimal("10.00"), Decimal("1.00"))
+    sai = make_item(pedido, produto_revenda, 2, Decimal("35.01"))
+    api_client.force_authenticate(user=admin_user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.delete(reverse("pedido-compra-item-detail", args=[sai.pk]))
+
+    assert resp.status_code == 204
+    pedido.refresh_from_db()
+    assert pedido.Valorpedido == fica.Total_item == Decimal("29.00")
+    assert sum(PedidoCompraParcela.objects.filter(pedido=pedido).values_list("valor", flat=True)) == Decimal("29.00")
+
+
+def test_edicao_do_cabecalho_recalcula_pelo_coletor(
+    api_client, admin_user, pedido, produto_revenda, forma_30_60, make_item, django_capture_on_commit_callbacks
+):
+    make_item(pedido, produto_revenda, 4, Decimal("12.50"))
+    api_client.force_authenticate(user=admin_user)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.patch(
+            reverse("pedido-compra-detail", args=[pedido.pk]),
+            {"condicao_pagamento": forma_30_60.codigo}, format="json",
+        )
+
+    assert resp.status_code == 200, resp.data
+    pedido.refresh_from_db()
+    assert (pedido.Valorpedido, pedido.parcelas) == (Decimal("50.00"), 2)
+    assert PedidoCompraParcela.objects.filter(pedido=pedido).count() == 2
@@ -0,0 +1,90 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from sysvar_app.models import PedidoCompra, PedidoCompraEntrega, SaldoPedidoCompra
+from sysvar_app.pedido_compra.pedido_compra_totais import recalcular_pedidos
+
+pytestmark = pytest.mark.django_db
+
+URL = "pedido-compra-transicao-lote"
+
+
+@pytest.fixture
+def cliente(api_client, admin_user):
+    api_client.force_authenticate(user=admin_user)
+    return api_client
+
+
+def _lote(cliente, acao, pedidos):
+    return cliente.post(reverse(URL), {"acao": acao, "pedidos": pedidos, "motivo": "lote"}, format="json")
+
+
+def _novo(pedido, **campos):
+    return PedidoCompra.objects.create(
+        Idfornecedor_id=pedido.Idfornecedor_id, Idloja_id=pedido.Idloja_id, Valorpedido=0, **campos
+    )
+
+
+def test_aprovar_em_lote_relata_cada_pedido(cliente, pedido, produto_revenda, forma_30_60, make_item):
+    pronto = _novo(pedido, condicao_pagamento=forma_30_60.codigo)  # sem Datapedido
+    make_item(pronto, produto_revenda, 5, Decimal("10.00"))
+    recalcular_pedidos([pronto.pk])
+    entrega = PedidoCompraEntrega.objects.create(pedido=pronto, data_entrega=date(2026, 3, 1), quantidade_prevista=5)
+    sem_itens = _novo(pedido, condicao_pagamento=forma_30_60.codigo)
+    sem_forma = _novo(pedido)
+    make_item(sem_forma, produto_revenda, 1, Decimal("10.00"))
+    aprovado = _novo(pedido, Status=PedidoCompra.StatusChoices.AP)
+
+    resp = _lote(cliente, "aprovar", [pronto.pk, sem_itens.pk, sem_forma.pk, aprovado.pk, 999999])
+
+    assert resp.status_code == 200, resp.data
+    assert (resp.data["status"], resp.data["alterados"]) == ("AP", [pronto.pk])
+    assert resp.data["erros"] == [
+        {"pedido": sem_itens.pk, "detail": "Não é possível aprovar um pedido sem itens."},
+        {"pedido": sem_forma.pk, "detail": "Defina a forma de pagamento antes de aprovar."},
+        {"pedido": aprovado.pk, "detail": "Transição não permitida: AP → AP."},
+        {"pedido": 999999, "detail": "Pedido não encontrado."},
+    ]
+    pronto.refresh_from_db()
+    assert (pronto.Status, pronto.Datapedido) == ("AP", timezone.localdate())
+    entrega.refresh_from_db()
+    assert entrega.status_pedido == "AP"  # update() em lote sincroniza o calendário
+    assert PedidoCompra.objects.get(pk=sem_itens.pk).Status == "AB"
+
+
+def test_cancelar_e_reabrir_atualizam_saldo_e_entregas(cliente, pedido, produto_revenda, sku_existente, make_item,
+                                                       django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        make_item(pedido, produto_revenda, 4, Decimal("10.00"), Idprodutodetalhe=sku_existente)
+        entrega = PedidoCompraEntrega.objects.create(pedido=pedido, data_entrega=date(2026, 2, 1), quantidade_prevista=4)
+    assert SaldoPedidoCompra.objects.get(Idprodutodetalhe=sku_existente).qtd_pendente == 4
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = _lote(cliente, "cancelar", [pedido.pk])
+    assert resp.data["alterados"] == [pedido.pk]
+    assert not SaldoPedidoCompra.objects.filter(Idproduto=produto_revenda).exists()
+    entrega.refresh_from_db()
+    assert entrega.status_pedido == "CA"
+
+    resp = _lote(cliente, "aprovar", [pedido.pk])
+    assert resp.data["erros"] == [{"pedido": pedido.pk, "detail": "Transição não permitida: CA → AP."}]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = _lote(cliente, "reabrir", [pedido.pk])
+    assert (resp.data["alterados"], resp.data["erros"]) == ([pedido.pk], [])
+    assert SaldoPedidoCompra.objects.get(Idprodutodetalhe=sku_existente).qtd_pendente == 4
+    entrega.refresh_from_db()
+    assert entrega.status_pedido == "AB"
+
+
+@pytest.mark.parametrize("corpo", [
+    {"acao": "encerrar", "pedidos": [1]},
+    {"acao": "aprovar", "pedidos": []},
+    {"acao": "aprovar", "pedidos": ["um"]},
+])
+def test_requisicao_invalida_400(cliente, corpo):
+    assert cliente.post(reverse(URL), corpo, format="json").status_code == 400
@@ -0,0 +1,85 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from sysvar_app.codigos.codigos_ean import FaixaEANEsgotada, sequencia_ean
+from sysvar_app.models import Cor, Estoque, ProdutoDetalhe, Tabelapreco, TabelaPrecoItem
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def tabela(db):
+    return Tabelapreco.objects.create(
+        NomeTabela="Varejo", DataInicio=date(2026, 1, 1), DataFim=date(2026, 12, 31), Promocao="NAO"
+    )
+
+
+@pytest.fixture
+def lote(api_client, admin_user, produto_revenda, tabela):
+    api_client.force_authenticate(user=admin_user)
+
+    def _post(itens, lojas=()):
+        return api_client.post(reverse("produtos-detalhes-batch-create"), {
+            "product_id": produto_revenda.pk, "tabela_preco_id": tabela.pk, "preco_padrao": "59.90",
+            "lojas": list(lojas), "itens": itens,
+        }, format="json")
+    return _post
+
+
+def test_cria_skus_precos_e_estoque_zerado(lote, produto_revenda, tabela, grade_ptmg, cor_preta, loja1, loja2):
+    _, (tP, tM, tG) = grade_ptmg
+    resp = lote([
+        {"cor_id": cor_preta.pk, "tamanho_id": tP.pk},
+        {"cor_id": cor_preta.pk, "tamanho_id": tM.pk, "ean13": "7890000000101"},
+        {"cor_id": cor_preta.pk, "tamanho_id": tG.pk, "preco": "69.90"},
+        {"cor_id": 999999, "tamanho_id": tG.pk},
+    ], lojas=[loja1.pk, loja2.pk])
+
+    assert resp.status_code == 200, resp.data
+    assert (resp.data["created"], resp.data["updated"]) == (3, 0)
+    assert resp.data["errors"] == [{"index": 4, "detail": "Cor 999999 inexistente."}]
+    eans = [d["ean13"] for d in resp.data["detalhes"]]
+    assert eans[1] == "7890000000101"
+    assert len(set(eans)) == 3
+    assert all(e.startswith("7891234") and len(e) == 13 for e in (eans[0], eans[2]))  # reservados na sequência
+
+    skus = ProdutoDetalhe.objects.filter(CodigodeBarra__in=eans)
+    assert {(s.Idtamanho_id, s.Codigoproduto, s.Ativo) for s in skus} == {
+        (t.pk, produto_revenda.referencia, True) for t in (tP, tM, tG)
+    }
+    precos = dict(TabelaPrecoItem.objects.filter(idtabela=tabela).values_list("codigodebarra", "preco"))
+    assert precos == {eans[0]: Decimal("59.90"), eans[1]: Decimal("59.90"), eans[2]: Decimal("69.90")}
+    assert Estoque.objects.filter(CodigodeBarra__in=eans, Estoque=0).count() == 6
+
+
+def test_ean_existente_atualiza_sku_e_preco_sem_mexer_no_estoque(lote, tabela, sku_existente, grade_ptmg, loja1):
+    _, (_, tM, _) = grade_ptmg
+    ean = sku_existente.CodigodeBarra
+    ProdutoDetalhe.objects.filter(pk=sku_existente.pk).update(Ativo=False)
+    TabelaPrecoItem.objects.create(codigodebarra=ean, idtabela=tabela, codigoproduto="x", preco=10)
+    Estoque.objects.create(CodigodeBarra=ean, codigoproduto=sku_existente.Codigoproduto, Idloja=loja1, Estoque=5)
+    branca = Cor.objects.create(Descricao="Branco", Codigo="002", Cor="#fff", Status="A")
+
+    resp = lote([{"cor_id": branca.pk, "tamanho_id": tM.pk, "ean13": ean, "preco": "45.00"}], lojas=[loja1.pk])
+
+    assert (resp.data["created"], resp.data["updated"]) == (0, 1)
+    sku_existente.refresh_from_db()
+    assert (sku_existente.Idcor_id, sku_existente.Idtamanho_id, sku_existente.Ativo) == (branca.pk, tM.pk, True)
+    item = TabelaPrecoItem.objects.get(codigodebarra=ean, idtabela=tabela)
+    assert (item.preco, item.codigoproduto) == (Decimal("45.00"), sku_existente.Codigoproduto)
+    assert Estoque.objects.get(CodigodeBarra=ean, Idloja=loja1).Estoque == 5
+
+
+def test_faixa_de_ean_esgotada_409(lote, grade_ptmg, cor_preta, monkeypatch):
+    def esgotada(qtd):
+        raise FaixaEANEsgotada("Não há mais EANs livres na faixa 789.1234.xxxxx.")
+
+    monkeypatch.setattr(sequencia_ean, "reservar_eans", esgotada)
+    resp = lote([{"cor_id": cor_preta.pk, "tamanho_id": grade_ptmg[1][0].pk}])
+
+    assert resp.status_code == 409
+    assert "EANs livres" in resp.data["detail"]
+    assert not ProdutoDetalhe.objects.exists()
@@ -0,0 +1,58 @@
+import pytest
+from django.urls import reverse
+
+from auditoria.models import AuditLog
+from sysvar_app.models import Codigos, Colecao, Produto
+
+pytestmark = pytest.mark.django_db
+
+
+def _produto(descricao):
+    return {"Descricao": descricao, "Desc_reduzida": descricao[:10], "classificacao_fiscal": "61046200", "unidade": "UN"}
+
+
+@pytest.fixture
+def cliente(api_client, admin_user):
+    Colecao.objects.create(Descricao="Verão 25", Codigo="25", Estacao="01")
+    api_client.force_authenticate(user=admin_user)
+    return api_client
+
+
+def test_lote_reserva_referencias_consecutivas(cliente, django_capture_on_commit_callbacks):
+    url = reverse("produtos-batch-create")
+    corpo = {"colecao": "25", "grupo": "04", "produtos": [_produto("Blusa A"), _produto("Blusa B"), _produto("Saia")]}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = cliente.post(url, corpo, format="json")
+
+    assert resp.status_code == 201, resp.data
+    assert [p["referencia"] for p in resp.data] == ["25.01.04001", "25.01.04002", "25.01.04003"]
+    # PKs relidas do banco depois do bulk_create
+    por_ref = dict(Produto.objects.values_list("referencia", "Idproduto"))
+    assert [p["Idproduto"] for p in resp.data] == [por_ref[p["referencia"]] for p in resp.data]
+    assert {(p["Descricao"], p["Tipoproduto"], p["colecao"], p["grupo"]) for p in resp.data} == {
+        ("Blusa A", "1", "25", "04"), ("Blusa B", "1", "25", "04"), ("Saia", "1", "25", "04"),
+    }
+    assert Codigos.objects.get(colecao="25", estacao="01").valor_var == 3
+    assert AuditLog.objects.filter(model="Produto", action="create").count() == 3
+
+    # cadastro unitário e outro lote seguem o mesmo contador
+    unit = cliente.post(reverse("produtos-list"), {**_produto("Vestido"), "Tipoproduto": "1", "colecao": "25",
+                                                    "grupo": "04"}, format="json")
+    assert unit.status_code == 201, unit.data
+    assert unit.data["referencia"] == "25.01.04004"
+    resp = cliente.post(url, {**corpo, "produtos": [_produto("Short")]}, format="json")
+    assert [p["referencia"] for p in resp.data] == ["25.01.04005"]
+
+
+def test_lote_invalido_nao_reserva(cliente):
+    url = reverse("produtos-batch-create")
+
+    assert cliente.post(url, {"colecao": "25", "grupo": "04", "produtos": []}, format="json").status_code == 400
+    resp = cliente.post(url, {"colecao": "99", "grupo": "04", "produtos": [_produto("Blusa")]}, format="json")
+    assert resp.status_code == 400
+    resp = cliente.post(url, {"colecao": "25", "grupo": "04", "produtos": [{"Descricao": "sem unidade"}]},
+                        format="json")
+    assert resp.status_code == 400
+    assert not Produto.objects.exists()
+    assert not Codigos.objects.filter(colecao="25").exists()
@@ -0,0 +1,52 @@
+import pytest
+
+from sysvar_app.models import Produto
+
+pytestmark = pytest.mark.django_db
+
+
+def test_criacao_registra_campos_preenchidos(produto_revenda):
+    criados = produto_revenda.alteracoes_salvas
+    assert criados["Descricao"] == [None, "Blusa Básica"]
+    assert "inativado_por" not in criados  # None fica de fora
+    assert produto_revenda.campos_alterados() == {}
+
+
+def test_diff_pelo_nome_do_campo(produto_revenda, admin_user):
+    produto_revenda.Ativo = False
+    produto_revenda.inativado_por = admin_user
+    produto_revenda.save()
+
+    assert produto_revenda.alteracoes_salvas == {
+        "Ativo": [True, False],
+        "inativado_por": [None, admin_user.pk],
+    }
+    assert produto_revenda.campos_alterados() == {}
+
+
+def test_update_fields_mantem_o_resto_pendente(produto_revenda):
+    produto_revenda.Descricao = "Blusa Nova"
+    produto_revenda.Desc_reduzida = "Nova"
+    produto_revenda.save(update_fields=["Descricao"])
+
+    assert produto_revenda.alteracoes_salvas == {"Descricao": ["Blusa Básica", "Blusa Nova"]}
+    assert produto_revenda.campos_alterados() == {"Desc_reduzida": ["Blusa", "Nova"]}
+
+
+def test_refresh_parcial_descarta_so_os_campos_relidos(produto_revenda):
+    produto_revenda.Descricao = "Rascunho"
+    produto_revenda.Desc_reduzida = "Rasc"
+    produto_revenda.refresh_from_db(fields=["Descricao"])
+
+    assert produto_revenda.Descricao == "Blusa Básica"
+    assert produto_revenda.campos_alterados() == {"Desc_reduzida": ["Blusa", "Rasc"]}
+
+    produto_revenda.refresh_from_db()
+    assert produto_revenda.campos_alterados() == {}
+
+
+def test_campo_adiado_lido_depois_nao_gera_diff(produto_revenda):
+    p = Produto.objects.defer("Descricao").get(pk=produto_revenda.pk)
+    p.Desc_reduzida = "Outra"
+    assert p.Descricao == "Blusa Básica"  # leitura do adiado faz refresh_from_db(fields=[...])
+    assert p.campos_alterados() == {"Desc_reduzida": ["Blusa", "Outra"]}
@@ -0,0 +1,68 @@
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+# backends cujo conteúdo fica restrito ao processo
+_CACHES_LOCAIS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def cache_compartilhado() -> bool:
+    """O cache default é visto por todos os processos (Redis, Memcached, banco, arquivo)?"""
+    return settings.CACHES['default']['BACKEND'] not in _CACHES_LOCAIS
+
+
+def memoria_por_processo() -> bool:
+    """
+    Pode-se guardar estruturas em memória do processo, invalidadas por uma
+    versão no cache do Django? Só se o cache for compartilhado entre os
+    workers: com LocMem cada processo teria a própria versão e nunca veria a
+    invalidação feita pelos outros. settings.CACHE_MEMORIA_PROCESSO força
+    (True, ex.: um único worker) ou desliga (False); None decide pelo BACKEND.
+    """
+    forcado = getattr(settings, 'CACHE_MEMORIA_PROCESSO', None)
+    if forcado is not None:
+        return bool(forcado)
+    return cache_compartilhado()
+
+
+class ColetorPosCommit:
+    """
+    Acumula chaves durante a transação corrente e processa todas de uma vez
+    depois do COMMIT (em autocommit, processa na hora).
+
+    Se a transação sofrer rollback as chaves ficam pendentes e são processadas
+    junto com o próximo commit — reprocessar uma chave é sempre seguro.
+    """
+
+    def __init__(self, processar):
+        self._processar = processar
+        self._local = threading.local()
+
+    def _pendentes(self) -> set:
+        pend = getattr(self._local, "pendentes", None)
+        if pend is None:
+            pend = self._local.pendentes = set()
+        return pend
+
+    def pendente(self) -> bool:
+        """Há chaves marcadas nesta thread à espera do COMMIT?"""
+        return bool(getattr(self._local, "pendentes", None))
+
+    def marcar(self, *chaves):
+        chaves = [c for c in chaves if c is not None]
+        if not chaves:
+            return
+        self._pendentes().update(chaves)
+        transaction.on_commit(self.descarregar)
+
+    def descarregar(self):
+        pend = self._pendentes()
+        if not pend:
+            return
+        chaves = set(pend)
+        pend.clear()
+        self._processar(chaves)
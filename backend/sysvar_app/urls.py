@@ -61,4 +61,5 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('api/', include('sysvar_app.pedido_compra.pedido_compra_urls')),
     path('api/', include('sysvar_app.forma_pagamentos.forma_pagamentos_urls')),
+    path('api/', include('sysvar_app.nfe.nfe_urls')),
 ]
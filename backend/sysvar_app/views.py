@@ -1,6 +1,5 @@
 # views.py
 from decimal import Decimal
-from xml.etree import ElementTree as ET
 
 from django.http import JsonResponse
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, filters as df
@@ -8,29 +7,35 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import viewsets, filters, status, permissions
 from rest_framework.response import Response
-from django.db import transaction, connection
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from django.db.models import (
-    F, Value, Subquery, OuterRef, IntegerField, DecimalField, CharField,
-    Case, When, Sum, Aggregate, Func, fields, Q
+    F, IntegerField, DecimalField, CharField,
+    Case, When, Aggregate, Func, Q
 )
-from django.db.models.functions import Coalesce, Cast
+from django.db.models.functions import Cast
 from collections import defaultdict
 from typing import Dict, Tuple
-from django.db import connection
 from rest_framework.views import APIView
 
 # >>> AUDITORIA <<<
-from auditoria.utils import write_audit, snapshot_instance
+from auditoria.utils import write_audit
 
 from .models import (
-    Loja, Cliente, Produto, ProdutoDetalhe, Estoque, Fornecedor, Vendedor, Funcionarios, Grade, Tamanho, Cor,
+    Loja, Cliente, Produto, ProdutoDetalhe, Estoque, EstoqueMatrizReferencia, Fornecedor, Vendedor, Funcionarios, Grade, Tamanho, Cor,
     Colecao, Familia, Unidade, Grupo, Subgrupo, Codigos, Tabelapreco, Ncm, TabelaPrecoItem,
     # modelos fiscais / compras
     NFeEntrada, NFeItem, FornecedorSkuMap, MovimentacaoProdutos, Nat_Lancamento, ModeloDocumentoFiscal, Pack, PackItem
 )
+from .codigos.codigos_ean import FaixaEANEsgotada, sequencia_ean
+from .codigos.codigos_referencia import reservar_referencias
+from .estoque.estoque_colest import matriz_colest
+from .estoque.estoque_matriz import marcar_matriz
+from .nfe.nfe_sugestoes import marcar_produtos
+from .pedido_compra.pedido_compra_saldos import em_pedido_da_referencia
+from .produto_detalhe.produto_detalhe_lote import criar_skus_em_lote
 from .serializers import (
     UserSerializer, LojaSerializer, ClienteSerializer, ProdutoSerializer, ProdutoDetalheSerializer, EstoqueSerializer,
     FornecedorSerializer, VendedorSerializer, FuncionariosSerializer, GradeSerializer, TamanhoSerializer, CorSerializer,
@@ -296,7 +301,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     def _audit_status_change(self, request, instance, old_status, new_status, reason=None, verb='status'):
         """Tenta registrar auditoria; ignora silenciosamente se utilitário não existir."""
         try:
-            from auditoria.utils import write_audit, snapshot_instance
+            from auditoria.utils import write_audit
         except Exception:
             return
         try:
@@ -343,6 +348,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
             # cascata: desativar SKUs
             ProdutoDetalhe.objects.filter(Idproduto=produto, Ativo=True).update(Ativo=False)
+            marcar_matriz(produto.referencia)
 
             # auditoria
             self._audit_status_change(request, produto, True, False, motivo, verb='inativar')
@@ -466,6 +472,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
         if reativar_skus:
             ProdutoDetalhe.objects.filter(Idproduto=produto, Ativo=False).update(Ativo=True)
+            marcar_matriz(produto.referencia)
 
         # auditoria amigável
         self._audit_status_change(request, produto, False, True, request.data.get('motivo'), verb='ativar_por_referencia')
@@ -477,6 +484,58 @@ class ProdutoViewSet(viewsets.ModelViewSet):
             'skus_reativados': bool(reativar_skus),
         }, status=200)
 
+    @action(detail=False, methods=['post'], url_path='batch-create')
+    def batch_create(self, request):
+        """
+        Cria N produtos (Tipoproduto='1') de uma mesma coleção/estação/grupo,
+        com N referências consecutivas reservadas num único UPDATE do contador.
+        POST /api/produtos/batch-create/
+        body: { "colecao":"25", "estacao":"01", "grupo":"04", "produtos":[{...campos do produto...}, ...] }
+        """
+        data = request.data or {}
+        produtos = data.get('produtos') or []
+        if not isinstance(produtos, list) or not produtos:
+            return Response({'detail': 'produtos deve ser uma lista não vazia.'}, status=400)
+
+        comuns = {
+            'Tipoproduto': '1',
+            'colecao': data.get('colecao'),
+            'grupo': data.get('grupo'),
+        }
+        ser = self.get_serializer(data=[{**p, **comuns} for p in produtos], many=True)
+        ser.is_valid(raise_exception=True)
+
+        chave = ProdutoSerializer.resolver_chave_referencia(comuns, (data.get('estacao') or '').strip())
+        # reservado fora da transação: o contador fica travado só durante o UPDATE
+        referencias = reservar_referencias(*chave, qtd=len(produtos))
+
+        novos = []
+        for vd, ref in zip(ser.validated_data, referencias):
+            vd = dict(vd)
+            vd.pop('estacao', None)
+            novos.append(Produto(**vd, referencia=ref))
+
+        with transaction.atomic():
+            Produto.objects.bulk_create(novos, batch_size=500)
+            # bulk_create não devolve PK no MySQL; relê pela referência (única)
+            criados = list(Produto.objects.filter(referencia__in=referencias).order_by('referencia'))
+            # bulk_create não dispara post_save: índice de sugestões da NF-e
+            marcar_produtos(*(p.pk for p in criados))
+            for produto in criados:
+                try:
+                    write_audit(
+                        request=request,
+                        model_name="Produto",
+                        object_id=produto.pk,
+                        action="create",
+                        changes=produto.campos_preenchidos(),
+                        reason="Criação de produto em lote via API",
+                    )
+                except Exception:
+                    pass
+
+        return Response(self.get_serializer(criados, many=True).data, status=status.HTTP_201_CREATED)
+
     # ---------- Queryset ----------
     def get_queryset(self):
         """
@@ -551,6 +610,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
         # cascata: se acabou de desativar, desativar SKUs
         if old_status and not now_active:
             ProdutoDetalhe.objects.filter(Idproduto=instance, Ativo=True).update(Ativo=False)
+            marcar_matriz(instance.referencia)
 
         # auditoria de mudança de status
         if new_status is not None and old_status != now_active:
@@ -563,22 +623,22 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Auditoria consolidada (única)."""
         try:
-            from auditoria.utils import write_audit, snapshot_instance
+            from auditoria.utils import write_audit
         except Exception:
             instance = serializer.save()
             return
 
+        # referência reservada antes da transação (contador travado só pelo UPDATE)
+        serializer.reservar_referencia()
         with transaction.atomic():
             instance = serializer.save()
-            after = snapshot_instance(instance)
             try:
                 write_audit(
                     request=self.request,
                     model_name="Produto",
                     object_id=getattr(instance, "Idproduto", getattr(instance, "pk", None)),
                     action="create",
-                    before=None,
-                    after=after,
+                    changes=instance.alteracoes_salvas,
                     reason="Criação de produto via API",
                 )
             except Exception:
@@ -586,18 +646,14 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            from auditoria.utils import write_audit, snapshot_instance
+            from auditoria.utils import write_audit
         except Exception:
             serializer.save()
             return
 
         with transaction.atomic():
-            # snapshot antes
-            inst_before = serializer.instance
-            before = snapshot_instance(inst_before)
-
+            # Produto rastreia os campos alterados (auditoria/rastreio.py): só o diff vai para o log
             instance = serializer.save()
-            after = snapshot_instance(instance)
 
             try:
                 write_audit(
@@ -605,8 +661,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
                     model_name="Produto",
                     object_id=getattr(instance, "Idproduto", getattr(instance, "pk", None)),
                     action="update",
-                    before=before,
-                    after=after,
+                    changes=instance.alteracoes_salvas,
                     reason="Atualização de produto via API",
                 )
             except Exception:
@@ -804,24 +859,11 @@ class ProdutoDetalheViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'itens deve ser uma lista não vazia.'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        prefixo_pais = '789'
-        prefixo_empresa = '1234'
-
-        def dv_ean13(base12: str) -> str:
-            soma = 0
-            for i, ch in enumerate(base12):
-                dig = int(ch)
-                soma += dig * (3 if (i + 1) % 2 == 0 else 1)
-            resto = soma % 10
-            return str((10 - resto) % 10)
-
         try:
             produto = Produto.objects.get(pk=product_id)
         except Produto.DoesNotExist:
             return Response({'detail': 'Produto não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
 
-        cod_prod = getattr(produto, 'referencia', None) or str(getattr(produto, 'Idproduto', product_id))
-
         try:
             tabela = Tabelapreco.objects.get(pk=tabela_preco_id)
         except Tabelapreco.DoesNotExist:
@@ -831,105 +873,11 @@ class ProdutoDetalheViewSet(viewsets.ModelViewSet):
         if lojas_ids:
             lojas = list(Loja.objects.filter(pk__in=lojas_ids))
 
-        created, updated = 0, 0
-        detalhes_resp = []
-        errors = []
-
-        with transaction.atomic():
-            row_cod, _ = Codigos.objects.select_for_update().get_or_create(
-                colecao='EA', estacao='13', defaults={'valor_var': 0}
-            )
-
-            for idx, item in enumerate(itens, start=1):
-                cor_id = item.get('cor_id')
-                tam_id = item.get('tamanho_id')
-                preco_item = item.get('preco', preco_padrao)
-                ean13 = (item.get('ean13') or '').strip()
-
-                if not cor_id or not tam_id:
-                    errors.append({'index': idx, 'detail': 'cor_id e tamanho_id são obrigatórios.'})
-                    continue
-
-                try:
-                    cor = Cor.objects.get(pk=cor_id)
-                except Cor.DoesNotExist:
-                    errors.append({'index': idx, 'detail': f'Cor {cor_id} inexistente.'})
-                    continue
-
-                try:
-                    tamanho = Tamanho.objects.get(pk=tam_id)
-                except Tamanho.DoesNotExist:
-                    errors.append({'index': idx, 'detail': f'Tamanho {tam_id} inexistente.'})
-                    continue
-
-                if not ean13:
-                    row_cod.valor_var = int(row_cod.valor_var) + 1
-                    row_cod.save(update_fields=['valor_var'])
-                    seq5 = str(row_cod.valor_var % 100000).zfill(5)
-                    base12 = f'{prefixo_pais}{prefixo_empresa}{seq5}'
-                    ean13 = base12 + dv_ean13(base12)
-
-                pd, created_pd = ProdutoDetalhe.objects.get_or_create(
-                    CodigodeBarra=ean13,
-                    defaults={
-                        'Idproduto': produto,
-                        'Idcor': cor,
-                        'Idtamanho': tamanho,
-                        'Codigoproduto': cod_prod,
-                        'Ativo': True,
-                    }
-                )
-
-                if not created_pd:
-                    changed = False
-                    if pd.Idproduto_id != produto.pk:
-                        pd.Idproduto = produto
-                        changed = True
-                    if pd.Idcor_id != cor.pk:
-                        pd.Idcor = cor
-                        changed = True
-                    if pd.Idtamanho_id != tamanho.pk:
-                        pd.Idtamanho = tamanho
-                        changed = True
-                    if pd.Codigoproduto != cod_prod:
-                        pd.Codigoproduto = cod_prod
-                        changed = True
-                    if not pd.Ativo:
-                        pd.Ativo = True
-                        changed = True
-                    if changed:
-                        pd.save()
-                        updated += 1
-                else:
-                    created += 1
-
-                TabelaPrecoItem.objects.update_or_create(
-                    codigodebarra=ean13,
-                    idtabela=tabela,
-                    defaults={'codigoproduto': cod_prod, 'preco': preco_item}
-                )
-
-                if lojas:
-                    for lj in lojas:
-                        Estoque.objects.get_or_create(
-                            Idloja=lj,
-                            CodigodeBarra=ean13,
-                            defaults={'codigoproduto': cod_prod, 'Estoque': 0}
-                        )
-
-                detalhes_resp.append({
-                    'ean13': ean13,
-                    'cor': {'id': cor.pk, 'descricao': cor.Descricao},
-                    'tamanho': {'id': tamanho.pk, 'descricao': tamanho.Descricao, 'tamanho': getattr(tamanho, 'Tamanho', None)},
-                    'preco': float(preco_item)
-                })
-
-        return Response({
-            'created': created,
-            'updated': updated,
-            'detalhes': detalhes_resp,
-            'errors': errors
-        }, status=status.HTTP_200_OK)
+        try:
+            resultado = criar_skus_em_lote(produto, tabela, lojas, itens, preco_padrao)
+        except FaixaEANEsgotada as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(resultado, status=status.HTTP_200_OK)
 
 
 class EstoqueViewSet(viewsets.ModelViewSet):
@@ -958,98 +906,79 @@ class EstoqueViewSet(viewsets.ModelViewSet):
                 return Response({'detail': 'Parâmetro "lojas" inválido (use IDs separados por vírgula).'}, status=400)
 
         incluir_inativos = (str(request.query_params.get('incluir_inativos') or '').lower() in {'1', 'true', 'sim'})
+        incluir_em_pedido = (str(request.query_params.get('em_pedido') or '').lower() in {'1', 'true', 'sim'})
 
         # PRE-CHECK: Se a referência existe em Produto e está inativa, bloquear consulta
         prod = Produto.objects.filter(referencia=ref).only('Idproduto', 'Ativo').first()
         if prod is not None and not bool(getattr(prod, 'Ativo', False)):
             return Response({'detail': 'Referência inativada — sem consulta de estoque.'}, status=409)
 
-        # 1) Começa pelo ESTOQUE (referência existente no estoque)
-        rows_base = Estoque.objects.filter(codigoproduto=ref)
+        # 1) Lê o cubo pré-calculado (sysvar_app/estoque/estoque_matriz.py)
+        celulas_qs = EstoqueMatrizReferencia.objects.filter(referencia=ref)
         if loja_ids:
-            rows_base = rows_base.filter(Idloja_id__in=loja_ids)
-
-        # opcional: excluir SKUs inativos em ProdutoDetalhe
-        if not incluir_inativos:
-            ativos_eans = ProdutoDetalhe.objects.filter(Ativo=True).values('CodigodeBarra')
-            rows_base = rows_base.filter(CodigodeBarra__in=ativos_eans)
-
-        if not rows_base.exists():
-            # Observação: se Produto não existe, mantemos a mensagem de "não encontrada no estoque"
-            return Response({'detail': 'Referência não encontrada no estoque.'}, status=404)
-
-        # 2) Anota cor/tamanho via ProdutoDetalhe (por EAN)
-        rows = (
-            rows_base.annotate(
-                cor_id=Subquery(
-                    ProdutoDetalhe.objects
-                    .filter(CodigodeBarra=OuterRef('CodigodeBarra'))
-                    .values('Idcor')[:1]
-                ),
-                tam_id=Subquery(
-                    ProdutoDetalhe.objects
-                    .filter(CodigodeBarra=OuterRef('CodigodeBarra'))
-                    .values('Idtamanho')[:1]
-                ),
-            )
-            .exclude(cor_id__isnull=True)
-            .exclude(tam_id__isnull=True)
-        )
-
-        if not rows.exists():
+            celulas_qs = celulas_qs.filter(Idloja_id__in=loja_ids)
+        if incluir_inativos:
+            campo_est, campo_res = 'estoque_total', 'reserva_total'
+        else:
+            # opcional: excluir SKUs inativos em ProdutoDetalhe
+            campo_est, campo_res = 'estoque', 'reserva'
+            celulas_qs = celulas_qs.filter(skus_ativos__gt=0)
+
+        celulas = list(celulas_qs.values(
+            'Idloja_id', 'Idcor_id', 'Idtamanho_id',
+            'loja_nome', 'cor_descricao', 'tamanho_sigla', 'tamanho_descricao',
+            campo_est, campo_res,
+        ))
+
+        if not celulas:
+            # distingue "sem estoque" de "estoque sem SKU mapeado (cor/tamanho)"
+            rows_base = Estoque.objects.filter(codigoproduto=ref)
+            if loja_ids:
+                rows_base = rows_base.filter(Idloja_id__in=loja_ids)
+            if not incluir_inativos:
+                ativos_eans = ProdutoDetalhe.objects.filter(Ativo=True).values('CodigodeBarra')
+                rows_base = rows_base.filter(CodigodeBarra__in=ativos_eans)
+            if not rows_base.exists():
+                # Observação: se Produto não existe, mantemos a mensagem de "não encontrada no estoque"
+                return Response({'detail': 'Referência não encontrada no estoque.'}, status=404)
             return Response({'detail': 'Não há SKUs mapeados (cor/tamanho) para esta referência.'}, status=404)
 
-        agg = (
-            rows.values('Idloja_id', 'cor_id', 'tam_id')
-            .annotate(estoque=Coalesce(Sum('Estoque'), Value(0)),
-                      reserva=Coalesce(Sum('reserva'), Value(0)))
-        )
-
-        # 3) Eixos (lojas/cores/tamanhos)
-        loja_ids_set = set(agg.values_list('Idloja_id', flat=True))
-        cor_ids_set = set(agg.values_list('cor_id', flat=True))
-        tam_ids_set = set(agg.values_list('tam_id', flat=True))
-
-        lojas = list(Loja.objects.filter(pk__in=loja_ids_set).values('Idloja', 'nome_loja'))
-        cores = list(Cor.objects.filter(pk__in=cor_ids_set).values('Idcor', 'Descricao'))
-        tams = list(Tamanho.objects.filter(pk__in=tam_ids_set).values('Idtamanho', 'Tamanho', 'Descricao'))
+        # 2) Eixos (lojas/cores/tamanhos)
+        lojas = {c['Idloja_id']: c['loja_nome'] for c in celulas}
+        cores = {c['Idcor_id']: c['cor_descricao'] for c in celulas}
+        tams = {c['Idtamanho_id']: (c['tamanho_sigla'], c['tamanho_descricao']) for c in celulas}
 
         ordem_tam = {'PP': 1, 'P': 2, 'M': 3, 'G': 4, 'GG': 5}
 
-        def tam_key(t):
-            sigla = (t.get('Tamanho') or t.get('Descricao') or '').upper()
+        def tam_key(tid):
+            sigla = (tams[tid][0] or tams[tid][1] or '').upper()
             return (ordem_tam.get(sigla, 999), sigla)
 
-        lojas_sorted = sorted(lojas, key=lambda l: (l.get('nome_loja') or '').upper())
-        cores_sorted = sorted(cores, key=lambda c: (c.get('Descricao') or '').upper())
-        tams_sorted = sorted(tams, key=tam_key)
+        loja_ids_sorted = sorted(lojas, key=lambda lid: (lojas[lid] or '').upper())
+        cor_ids_sorted = sorted(cores, key=lambda cid: (cores[cid] or '').upper())
+        tam_ids_sorted = sorted(tams, key=tam_key)
 
-        tam_ids_sorted = [t['Idtamanho'] for t in tams_sorted]
-        cor_ids_sorted = [c['Idcor'] for c in cores_sorted]
-
-        # 4) Monta a matriz
+        # 3) Monta a matriz
         base_tams_zero = {str(tid): 0 for tid in tam_ids_sorted}
         por_loja = {}
         total_geral_estoque = 0
         total_geral_reserva = 0
 
-        for row in agg:
+        for row in celulas:
             lid = row['Idloja_id']
-            cid = row['cor_id']
-            tid = row['tam_id']
-            est = int(row['estoque'] or 0)
-            res = int(row['reserva'] or 0)
+            cid = row['Idcor_id']
+            tid = row['Idtamanho_id']
+            est = int(row[campo_est] or 0)
+            res = int(row[campo_res] or 0)
 
             if lid not in por_loja:
-                por_loja[lid] = {'cores': {}, 'total_loja': 0, 'total_loja_reserva': 0}
+                por_loja[lid] = {'cores': {}, 'total_loja': 0}
             if cid not in por_loja[lid]['cores']:
-                por_loja[lid]['cores'][cid] = {'tamanhos': dict(base_tams_zero), 'total_cor': 0, 'total_cor_reserva': 0}
+                por_loja[lid]['cores'][cid] = {'tamanhos': dict(base_tams_zero), 'total_cor': 0}
 
             por_loja[lid]['cores'][cid]['tamanhos'][str(tid)] += est
             por_loja[lid]['cores'][cid]['total_cor'] += est
-            por_loja[lid]['cores'][cid]['total_cor_reserva'] += res
             por_loja[lid]['total_loja'] += est
-            por_loja[lid]['total_loja_reserva'] += res
 
             total_geral_estoque += est
             total_geral_reserva += res
@@ -1071,9 +1000,9 @@ class EstoqueViewSet(viewsets.ModelViewSet):
                 "disponivel": max(int(total_geral_estoque) - int(total_geral_reserva), 0),
             },
             "eixos": {
-                "lojas": [{"id": l['Idloja'], "nome": l['nome_loja']} for l in lojas_sorted],
-                "cores": [{"id": c['Idcor'], "nome": c['Descricao']} for c in cores_sorted],
-                "tamanhos": [{"id": t['Idtamanho'], "sigla": t['Tamanho'], "descricao": t['Descricao']} for t in tams_sorted],
+                "lojas": [{"id": lid, "nome": lojas[lid]} for lid in loja_ids_sorted],
+                "cores": [{"id": cid, "nome": cores[cid]} for cid in cor_ids_sorted],
+                "tamanhos": [{"id": tid, "sigla": tams[tid][0], "descricao": tams[tid][1]} for tid in tam_ids_sorted],
             },
             "matriz": {
                 "por_loja": [
@@ -1082,25 +1011,44 @@ class EstoqueViewSet(viewsets.ModelViewSet):
                         "cores": [
                             {
                                 "cor_id": cid,
-                                "tamanhos": {
-                                    str(tid): por_loja[lid]['cores'][cid]['tamanhos'].get(str(tid), 0)
-                                    for tid in tam_ids_sorted
-                                },
+                                "tamanhos": por_loja[lid]['cores'][cid]['tamanhos'],
                                 "total_cor": por_loja[lid]['cores'][cid]['total_cor'],
                             }
                             for cid in cor_ids_sorted if cid in por_loja[lid]['cores']
                         ],
                         "total_loja": por_loja[lid]['total_loja'],
                     }
-                    for lid in [l['Idloja'] for l in lojas_sorted] if lid in por_loja
+                    for lid in loja_ids_sorted
                 ],
                 "totais": {
-                    "por_cor": {str(cid): totals_por_cor[str(cid)] for cid in cor_ids_sorted},
-                    "por_tamanho": {str(tid): totals_por_tam[str(tid)] for tid in tam_ids_sorted},
+                    "por_cor": totals_por_cor,
+                    "por_tamanho": totals_por_tam,
                     "geral": int(total_geral_estoque),
                 }
             }
         }
+
+        # 4) Saldo em pedido (SaldoPedidoCompra) nas mesmas células, se pedido
+        if incluir_em_pedido:
+            em_pedido, sem_sku = em_pedido_da_referencia(ref, loja_ids, so_skus_ativos=not incluir_inativos)
+            por_loja_pc = defaultdict(lambda: defaultdict(dict))
+            for (lid, cid, tid), qt in em_pedido.items():
+                por_loja_pc[lid][cid][str(tid)] = qt
+            payload["resumo"]["em_pedido"] = sum(em_pedido.values()) + sum(sem_sku.values())
+            payload["em_pedido"] = {
+                "por_loja": [
+                    {
+                        "loja_id": lid,
+                        "cores": [{"cor_id": cid, "tamanhos": tams_pc} for cid, tams_pc in cores_pc.items()],
+                        "sem_sku": sem_sku.get(lid, 0),
+                        "total_loja": sum(sum(t.values()) for t in cores_pc.values()) + sem_sku.get(lid, 0),
+                    }
+                    for lid, cores_pc in por_loja_pc.items()
+                ] + [
+                    {"loja_id": lid, "cores": [], "sem_sku": qt, "total_loja": qt}
+                    for lid, qt in sem_sku.items() if lid not in por_loja_pc
+                ],
+            }
         return Response(payload, status=200)
 
 
@@ -1230,27 +1178,11 @@ class CodigosViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='ean-next')
     def ean_next(self, request):
-        prefixo_pais = '789'
-        prefixo_empresa = '1234'
-
-        def dv_ean13(base12: str) -> str:
-            soma = 0
-            for i, ch in enumerate(base12):
-                dig = int(ch)
-                soma += dig * (3 if (i + 1) % 2 == 0 else 1)
-            resto = soma % 10
-            return str((10 - resto) % 10)
-
-        with transaction.atomic():
-            row, _ = Codigos.objects.select_for_update().get_or_create(
-                colecao='EA', estacao='13', defaults={'valor_var': 0}
-            )
-            row.valor_var = int(row.valor_var) + 1
-            row.save(update_fields=['valor_var'])
-
-            seq5 = str(row.valor_var % 100000).zfill(5)
-            base12 = f'{prefixo_pais}{prefixo_empresa}{seq5}'
-            ean13 = base12 + dv_ean13(base12)
+        # servido do bloco reservado por este processo (sysvar_app/codigos/codigos_ean.py)
+        try:
+            ean13 = sequencia_ean.proximos_eans(1)[0]
+        except FaixaEANEsgotada as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
 
         return Response({'ean13': ean13}, status=status.HTTP_200_OK)
 
@@ -1382,179 +1314,16 @@ class MatrizColEstView(APIView):
         if not colecoes:
             return Response({'detail': 'Parâmetro "colecoes" é obrigatório (ex.: ?colecoes=25,26).'}, status=400)
 
-        ativo = (request.query_params.get('ativo') or 'true').strip().lower()
-        ativo_where = ''
-        if ativo in {'true', '1', ''}:
-            ativo_where = 'AND p.Ativo = 1'
-            ativo_out = 'true'
-        elif ativo in {'false', '0'}:
-            ativo_where = 'AND p.Ativo = 0'
-            ativo_out = 'false'
-        else:
-            ativo_out = 'all'
-
-        # --- 2) SQL dinâmico (com sysvar_app_* e GROUP BY por Idcolecao) ---
-        params = []
-        sql = [
-            "SELECT",
-            "  e.Idloja_id                               AS loja_id,",
-            "  COALESCE(l.nome_loja, l.Apelido_loja, CONCAT('Loja ', e.Idloja_id)) AS loja_nome,",
-            "  c.Idcolecao                               AS colecao_id,",
-            "  c.Codigo                                  AS colecao_codigo,",
-            "  c.Descricao                               AS colecao_descricao,",
-            "  c.Estacao                                 AS colecao_estacao,",
-            "  CAST(SUM(e.Estoque) AS DECIMAL(18,6))     AS itens,",
-            "  CAST(SUM(e.Estoque * COALESCE(tpi.preco, 0)) AS DECIMAL(24,6)) AS valor",
-            "FROM sysvar_app_estoque e",
-            "JOIN sysvar_app_produtodetalhe pd",
-            "  ON pd.CodigodeBarra = e.CodigodeBarra",
-            "JOIN sysvar_app_produto p",
-            "  ON p.Idproduto = pd.Idproduto_id",
-            "JOIN sysvar_app_colecao c",
-            "  ON c.Codigo = p.colecao",
-            "LEFT JOIN sysvar_app_tabelaprecoitem tpi",
-            "  ON tpi.codigodebarra = e.CodigodeBarra AND tpi.idtabela_id = %s",
-            "JOIN sysvar_app_loja l",
-            "  ON l.Idloja = e.Idloja_id",
-            "WHERE c.Codigo IN (" + ", ".join(["%s"] * len(colecoes)) + ")",
-        ]
-        params.append(int(tabela_preco_id))
-        params.extend(colecoes)
-
-        if ativo_where:
-            sql.append(ativo_where)
-        if lojas:
-            sql.append("AND e.Idloja_id IN (" + ", ".join(["%s"] * len(lojas)) + ")")
-            params.extend(lojas)
-
-        sql.extend([
-            "GROUP BY e.Idloja_id, c.Idcolecao",
-            "ORDER BY e.Idloja_id, c.Codigo, c.Estacao"
-        ])
-        sql = "\n".join(sql)
-
-        # --- 3) Executa e carrega em memória ---
-        with connection.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-        if not rows:
-            return self._empty_response(colecoes, tabela_preco_id, ativo_out)
-
-        # Índices do SELECT
-        IDX_LOJA_ID = 0
-        IDX_LOJA_NOME = 1
-        IDX_COLECAO_ID = 2
-        IDX_COLECAO_CODIGO = 3
-        IDX_COLECAO_DESC = 4
-        IDX_COLECAO_EST = 5
-        IDX_ITENS = 6
-        IDX_VALOR = 7
-
-        # --- 4) Montagem da matriz ---
-        lojas_ordem = []
-        loja_set = set()
-        colest_cols_map = {}  # key = colecao_id
-        por_loja = {}         # loja_id -> { 'nome':..., 'colest': {colecao_id: {itens, valor}}, totals... }
-        total_por_colest = {} # colecao_id -> {itens, valor}
-        geral_itens = 0
-        geral_valor = 0.0
-
-        for r in rows:
-            loja_id = int(r[IDX_LOJA_ID])
-            loja_nome = r[IDX_LOJA_NOME] or f"Loja {loja_id}"
-            colecao_id = int(r[IDX_COLECAO_ID])
-            colecao_codigo = str(r[IDX_COLECAO_CODIGO])
-            colecao_desc = r[IDX_COLECAO_DESC]
-            colecao_est = str(r[IDX_COLECAO_EST]) if r[IDX_COLECAO_EST] is not None else None
-            itens = float(r[IDX_ITENS] or 0)
-            valor = float(r[IDX_VALOR] or 0)
-
-            if loja_id not in loja_set:
-                loja_set.add(loja_id)
-                lojas_ordem.append((loja_id, loja_nome))
-                por_loja[loja_id] = {
-                    "nome": loja_nome,
-                    "colest": {},
-                    "total_itens": 0.0,
-                    "total_valor": 0.0,
-                }
-
-            # coluna (agora é Idcolecao)
-            if colecao_id not in colest_cols_map:
-                rotulo = colecao_desc or f"Código {colecao_codigo}"
-                colest_cols_map[colecao_id] = {
-                    "colecao_id": colecao_id,
-                    "codigo": colecao_codigo,
-                    "estacao": colecao_est,
-                    "rotulo": rotulo,
-                    "key": str(colecao_id),
-                }
+        try:
+            tabela_preco_id = int(tabela_preco_id)
+        except (TypeError, ValueError):
+            return Response({'detail': 'Parâmetro "tabela_preco_id" inválido.'}, status=400)
 
-            # acumula por loja/coluna
-            slot = por_loja[loja_id]["colest"].get(colecao_id)
-            if slot:
-                slot["itens"] += itens
-                slot["valor"] += valor
-            else:
-                por_loja[loja_id]["colest"][colecao_id] = {"itens": itens, "valor": valor}
-
-            por_loja[loja_id]["total_itens"] += itens
-            por_loja[loja_id]["total_valor"] += valor
-
-            tcol = total_por_colest.get(colecao_id)
-            if tcol:
-                tcol["itens"] += itens
-                tcol["valor"] += valor
-            else:
-                total_por_colest[colecao_id] = {"itens": itens, "valor": valor}
-
-            geral_itens += itens
-            geral_valor += valor
-
-        # --- 5) Eixos/labels ---
-        lojas_axis = [{"id": lid, "nome": nome} for (lid, nome) in sorted(lojas_ordem, key=lambda x: x[0])]
-        colest_axis = [colest_cols_map[k] for k in sorted(colest_cols_map.keys())]
-
-        # --- 6) Saída formatada ---
-        por_loja_list = []
-        for lid, nome in sorted(lojas_ordem, key=lambda x: x[0]):
-            colest_fmt = {str(cid): {
-                "itens": round(v["itens"], 0),
-                "valor": round(v["valor"], 2),
-            } for cid, v in por_loja[lid]["colest"].items()}
-            por_loja_list.append({
-                "loja_id": lid,
-                "loja_nome": nome,
-                "colest": colest_fmt,  # chave = Idcolecao em string
-                "total_itens": round(por_loja[lid]["total_itens"], 0),
-                "total_valor": round(por_loja[lid]["total_valor"], 2),
-            })
+        # --- 2) Resultado (cache por combinação — sysvar_app/estoque/estoque_colest.py) ---
+        out = matriz_colest(colecoes, lojas, tabela_preco_id, request.query_params.get('ativo'))
 
-        totais_por_colest_fmt = {str(cid): {
-            "itens": round(v["itens"], 0),
-            "valor": round(v["valor"], 2),
-        } for cid, v in total_por_colest.items()}
-
-        out = {
-            "meta": {
-                "colecoes": colecoes,
-                "tabela_preco_id": int(tabela_preco_id),
-                "ativo": "true" if ativo_where == 'AND p.Ativo = 1' else ("false" if ativo_where == 'AND p.Ativo = 0' else "all"),
-                "moeda": "BRL",
-            },
-            "eixos": {
-                "lojas": lojas_axis,
-                "colest": colest_axis,  # cada item tem {colecao_id, codigo, estacao, rotulo, key}
-            },
-            "matriz": {
-                "por_loja": por_loja_list,
-                "totais": {
-                    "por_colest": totais_por_colest_fmt,
-                    "geral": {"itens": round(geral_itens, 0), "valor": round(geral_valor, 2)},
-                }
-            }
-        }
+        # o cache é chaveado pelas coleções ordenadas; devolve na ordem pedida
+        out = {**out, "meta": {**out["meta"], "colecoes": colecoes}}
         return Response(out, status=200)
 
     # --------- helpers ---------
@@ -1573,21 +1342,6 @@ class MatrizColEstView(APIView):
                 out.append(int(x))
         return out
 
-    def _empty_response(self, colecoes, tabela_preco_id, ativo_out):
-        return Response({
-            "meta": {
-                "colecoes": colecoes,
-                "tabela_preco_id": int(tabela_preco_id),
-                "ativo": ativo_out,
-                "moeda": "BRL",
-            },
-            "eixos": {"lojas": [], "colest": []},
-            "matriz": {
-                "por_loja": [],
-                "totais": {"por_colest": {}, "geral": {"itens": 0, "valor": 0.00}}
-            }
-        }, status=200)
-
 # --- NOVO: PackViewSet ---
 
 class IsPackWriteForStaff(permissions.BasePermission):
@@ -52,6 +52,7 @@ REST_FRAMEWORK = {
 # === Middleware (com CORS no topo) ===
 MIDDLEWARE = [
     "auditoria.middleware.RequestIDMiddleware",  # antes de middleware que use request_id
+    "auditoria.middleware.AuditBufferMiddleware",  # grava a auditoria do request em lote
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # tem que vir antes de CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -99,6 +100,36 @@ DATABASES = {
     }
 }
 
+# === Cache ===
+# Em produção com mais de um worker use um cache compartilhado (ex.: Redis),
+# senão a invalidação das matrizes de estoque fica restrita a cada processo.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='sysvar'),
+    }
+}
+
+# Memória por processo (planos de pagamento, composição dos packs, índice de
+# sugestões da NF-e) é invalidada por versão no cache acima, então só vale com
+# cache compartilhado. Vazio = decide pelo BACKEND; True força (um único
+# worker, runserver); False desliga.
+CACHE_MEMORIA_PROCESSO = config(
+    'CACHE_MEMORIA_PROCESSO', default='',
+    cast=lambda v: None if v in (None, '') else str(v).lower() in ('1', 'true', 'sim', 'yes'),
+)
+
+# === Códigos ===
+# quantos números do contador de EAN cada processo reserva por vez
+EAN_BLOCO_RESERVA = config('EAN_BLOCO_RESERVA', default=20, cast=int)
+# segundos que o bloco de um processo fica reservado em CodigosFaixaLivre sem ser
+# renovado; vencido (processo morto), volta a ser livre para os outros
+EAN_RESERVA_VALIDADE = config('EAN_RESERVA_VALIDADE', default=900, cast=int)
+
+# === Auditoria ===
+# True: o lote de auditoria do request é gravado por uma thread em segundo plano
+AUDIT_ASYNC = config('AUDIT_ASYNC', default=False, cast=bool)
+
 # === Idioma e Fuso horário ===
 LANGUAGE_CODE = config('LANGUAGE_CODE', default='pt-br')
 TIME_ZONE = config('TIME_ZONE', default='America/Sao_Paulo')